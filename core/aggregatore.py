@@ -0,0 +1,280 @@
+"""
+Aggregazione statistica di molti run (migliaia) in memoria costante.
+
+Ogni distribuzione è tenuta in uno SketchQuantili: un istogramma per serie di valori, ciascuno con la
+propria larghezza di classe, aggiornati a blocchi con np.bincount. Quando in una serie arriva un valore
+oltre l'ultima classe la larghezza di quella serie raddoppia fondendo le classi a coppie, quindi la memoria
+non dipende dal numero di run e i quantili hanno un errore massimo di una classe: al più 1/1024 di
+(massimo osservato - basso) della serie per le distribuzioni dei run e delle bobine (2048 classi), 1/256
+per le bande del peso cumulato (512 classi per istante). Gli sketch con larghezza fissa (scostamento della
+grammatura, indice di qualità) hanno l'errore di una classe sull'intervallo previsto.
+
+AggregatoreMultiRun raccoglie:
+  - tempo perso per tipo di evento, tempo perso totale e tonnellate per run
+  - tonnellate prodotte per ordine, per prodotto
+  - scostamento percentuale della grammatura delle bobine dal target e indice di qualità
+  - bande di percentili del peso cumulato nel tempo (un istogramma per istante della griglia)
+
+I run si aggiungono da un ArchivioRisultati (core.archivio), leggendo il memmap a blocchi, oppure uno
+alla volta da una MacchinaContinua a fine run. I grafici a ventaglio e il riepilogo JSON sono in
+ReportStatistica (grafico_ventaglio, grafico_distribuzioni, json_multirun).
+
+Avvio: python -m core.aggregatore archivio_base --uscita riepilogo.json --grafici multirun
+"""
+import argparse
+import json
+import logging
+
+import numpy as np
+
+from core.archivio import TIPI_EVENTO, ArchivioRisultati, peso_per_ordine
+from core.batch import kpi_macchina
+from core.console import configura_output
+from core.reportstatistica import ReportStatistica
+
+logger = logging.getLogger("core.aggregatore")
+
+PERCENTILI = (5, 25, 50, 75, 95)
+
+
+class SketchQuantili:
+    """
+    Istogrammi di n_serie serie di valori >= basso con n_bin classi; ogni serie ha la sua larghezza
+    di classe. I valori sotto basso finiscono nella prima classe (minimo e massimo sono comunque esatti).
+    """
+    def __init__(self, n_serie, basso=0.0, larghezza=None, n_bin=2048):
+        self.basso = basso
+        # per serie; None: fissata dal primo blocco di valori della serie (NaN finché non arriva)
+        self.larghezza = np.full(n_serie, np.nan if larghezza is None else float(larghezza))
+        self.n_bin = n_bin
+        self.conteggi = np.zeros((n_serie, n_bin), dtype=np.int64)
+        self.somma = np.zeros(n_serie)
+        self.minimo = np.full(n_serie, np.inf)
+        self.massimo = np.full(n_serie, -np.inf)
+
+    @property
+    def n(self):
+        return self.conteggi.sum(axis=1)
+
+    def aggiungi(self, valori):
+        """Aggiunge un blocco di valori di forma (righe, n_serie); i NaN sono ignorati."""
+        valori = np.asarray(valori, dtype=float).reshape(-1, self.conteggi.shape[0])
+        validi = ~np.isnan(valori)
+        if not validi.any():
+            return
+        self.somma += np.where(validi, valori, 0).sum(axis=0)
+        self.minimo = np.fmin(self.minimo, np.nanmin(np.where(validi, valori, np.inf), axis=0))
+        self.massimo = np.fmax(self.massimo, np.nanmax(np.where(validi, valori, -np.inf), axis=0))
+        massimo = np.where(validi, valori - self.basso, -np.inf).max(axis=0)
+        nuove = np.isnan(self.larghezza) & validi.any(axis=0)
+        # potenza di due: i raddoppi successivi restano allineati
+        self.larghezza[nuove] = 2.0 ** np.ceil(np.log2(np.maximum(massimo[nuove], 1e-9) / self.n_bin * 1.0001))
+        while True:
+            oltre = np.flatnonzero(massimo >= self.larghezza * self.n_bin)
+            if not len(oltre):
+                break
+            self._raddoppia(oltre)
+        serie = np.broadcast_to(np.arange(self.conteggi.shape[0]), valori.shape)[validi]
+        classi = np.clip(((valori[validi] - self.basso) / self.larghezza[serie]).astype(np.int64), 0, self.n_bin - 1)
+        self.conteggi += np.bincount(serie * self.n_bin + classi,
+                                     minlength=self.conteggi.size).reshape(self.conteggi.shape)
+
+    def _raddoppia(self, righe):
+        """Raddoppia la larghezza delle serie `righe` fondendo le classi a coppie."""
+        fuse = self.conteggi[righe, 0::2] + self.conteggi[righe, 1::2]
+        self.conteggi[righe] = 0
+        self.conteggi[righe, :fuse.shape[1]] = fuse
+        self.larghezza[righe] *= 2
+
+    def media(self):
+        n = self.n
+        return np.divide(self.somma, n, out=np.full(len(n), np.nan), where=n > 0)
+
+    def quantili(self, q):
+        """Quantili (0-1) per serie, interpolati linearmente nella classe: matrice (n_serie, len(q))."""
+        q = np.atleast_1d(q)
+        cumulati = self.conteggi.cumsum(axis=1)
+        n = cumulati[:, -1]
+        risultato = np.full((len(n), len(q)), np.nan)
+        for j, quantile in enumerate(q):
+            obiettivo = quantile * n
+            classe = np.minimum((cumulati < obiettivo[:, None]).sum(axis=1), self.n_bin - 1)
+            precedenti = np.where(classe > 0, cumulati[np.arange(len(n)), classe - 1], 0)
+            nella_classe = self.conteggi[np.arange(len(n)), classe]
+            frazione = np.divide(obiettivo - precedenti, nella_classe,
+                                 out=np.zeros(len(n)), where=nella_classe > 0)
+            valore = self.basso + (classe + frazione) * self.larghezza
+            risultato[:, j] = np.where(n > 0, np.clip(valore, self.minimo, self.massimo), np.nan)
+        return risultato
+
+    def istogramma(self, serie=0, classi=None):
+        """
+        Conteggi e bordi delle classi di una serie, dalla prima all'ultima classe non vuota.
+        classi limita il numero di classi fondendo quelle adiacenti (per i grafici).
+        """
+        conteggi = self.conteggi[serie]
+        if not conteggi.any():
+            return conteggi[:0], np.array([self.basso])
+        occupate = np.flatnonzero(conteggi)
+        inizio, fine = int(occupate[0]), int(occupate[-1]) + 1
+        fattore = -(-(fine - inizio) // classi) if classi else 1
+        conteggi = np.pad(conteggi[inizio:fine], (0, -(fine - inizio) % fattore))
+        conteggi = conteggi.reshape(-1, fattore).sum(axis=1)
+        bordi = self.basso + (inizio + np.arange(len(conteggi) + 1) * fattore) * self.larghezza[serie]
+        return conteggi, bordi
+
+    def riepilogo(self, serie=0, percentili=PERCENTILI):
+        n = int(self.n[serie])
+        if not n:
+            return {"n": 0}
+        quantili = self.quantili(np.array(percentili) / 100)[serie]
+        return {
+            "n": n, "media": float(self.media()[serie]),
+            "min": float(self.minimo[serie]), "max": float(self.massimo[serie]),
+            "percentili": {f"p{p}": float(v) for p, v in zip(percentili, quantili)},
+        }
+
+
+class AggregatoreMultiRun:
+    """
+    Distribuzioni dei risultati di molti run. durata_ore e passo_serie (secondi) definiscono la griglia
+    del peso cumulato: dopo la fine di un run vale il peso finale, oltre durata_ore il run è troncato.
+    """
+    KPI = ("tempo_perso", "tempo_simulato", "peso_totale_t", "percentuale_produzione")
+
+    def __init__(self, durata_ore=72, passo_serie=60):
+        self.passo_serie = passo_serie
+        self.punti = int(durata_ore * 3600 // passo_serie) + 1
+        self.n_run = 0
+        self.run_completati = 0
+        self.kpi = SketchQuantili(len(self.KPI))
+        self.tempo_perso_per_evento = SketchQuantili(len(TIPI_EVENTO))
+        self.peso_ordine = {}                       # prodotto -> SketchQuantili delle tonnellate per ordine
+        self.scostamento_grammatura = SketchQuantili(1, basso=-25.0, larghezza=50 / 2048)   # % dal target
+        self.indice_qualita = SketchQuantili(1, basso=0.0, larghezza=1 / 2048)
+        self.serie = SketchQuantili(self.punti, n_bin=512)
+
+    def aggiungi_macchina(self, macchina, kpi=None):
+        """Aggiunge un run concluso; kpi (da kpi_macchina) evita di ricalcolarli."""
+        kpi = kpi_macchina(macchina) if kpi is None else kpi
+        perso = np.array([[kpi["tempo_perso_per_evento"].get(tipo, 0) for tipo in TIPI_EVENTO]], dtype=float)
+        bobine = macchina.log_bobine
+        ottenuta = np.array([bobina["grammatura ottenuta"] for bobina in bobine], dtype=float)
+        target = np.array([bobina["grammatura target"] for bobina in bobine], dtype=float)
+        prodotti = np.array([ordine.prodotto for ordine in macchina.programma.lista_ordini])
+        passo = self.passo_serie // macchina.tick_reale
+        self._aggiungi_blocco(
+            kpi=np.array([[kpi[chiave] for chiave in self.KPI]], dtype=float),
+            completati=int(kpi["completata"]),
+            perso=perso,
+            peso_ordini=peso_per_ordine(macchina),
+            prodotti_ordini=prodotti[:len(macchina.bobine_tot_prodotte)],
+            scostamento=(ottenuta - target) / target * 100,
+            qualita=np.array([bobina["indice_qualita"] for bobina in bobine], dtype=float),
+            serie=np.array(macchina.tracker_simulazione.y[::passo], dtype=float)[None, :],
+        )
+
+    def aggiungi_archivio(self, archivio, blocco=1000):
+        """Aggiunge i run scritti di un ArchivioRisultati, leggendo le colonne a blocchi di righe."""
+        if archivio.serie is not None and archivio.passo_serie != self.passo_serie:
+            raise ValueError(f"Passo delle serie dell'archivio ({archivio.passo_serie}s) diverso da {self.passo_serie}s")
+        for inizio in range(0, archivio.n_run, blocco):
+            righe = slice(inizio, inizio + blocco)
+            kpi = archivio.kpi[righe]
+            scritti = kpi["scritto"]
+            kpi = kpi[scritti]
+            perso = kpi["tempo_perso_per_evento"]
+            argomenti = {
+                "kpi": np.column_stack([kpi[chiave] for chiave in self.KPI]),
+                "completati": int(kpi["completata"].sum()),
+                "perso": np.column_stack([perso[tipo] for tipo in TIPI_EVENTO]),
+            }
+            if archivio.bobine is not None:
+                bobine = archivio.bobine[righe][scritti]
+                valide = np.arange(bobine.shape[1]) < kpi["bobine_archiviate"][:, None]
+                bobine = bobine[valide]
+                argomenti["scostamento"] = ((bobine["grammatura_ottenuta"] - bobine["grammatura_target"])
+                                            / bobine["grammatura_target"] * 100)
+                argomenti["qualita"] = bobine["indice_qualita"]
+            if archivio.ordini is not None:
+                ordini = archivio.ordini[righe][scritti]
+                ordini = ordini[np.arange(ordini.shape[1]) < kpi["ordini_archiviati"][:, None]]
+                argomenti["peso_ordini"] = ordini["peso_prodotto_t"]
+                argomenti["prodotti_ordini"] = ordini["prodotto"].astype(str)
+            if archivio.serie is not None:
+                argomenti["serie"] = archivio.serie[righe][scritti]
+            self._aggiungi_blocco(**argomenti)
+
+    def _aggiungi_blocco(self, kpi, completati, perso, peso_ordini=None, prodotti_ordini=None,
+                         scostamento=None, qualita=None, serie=None):
+        self.n_run += len(kpi)
+        self.run_completati += completati
+        self.kpi.aggiungi(kpi)
+        self.tempo_perso_per_evento.aggiungi(perso)
+        if peso_ordini is not None:
+            for prodotto in np.unique(prodotti_ordini):
+                sketch = self.peso_ordine.setdefault(str(prodotto), SketchQuantili(1))
+                sketch.aggiungi(peso_ordini[prodotti_ordini == prodotto])
+        if scostamento is not None:
+            self.scostamento_grammatura.aggiungi(scostamento)
+            self.indice_qualita.aggiungi(qualita)
+        if serie is not None:
+            self.serie.aggiungi(self._su_griglia(serie))
+
+    def _su_griglia(self, serie):
+        """Porta le serie sulla griglia: tronca, e dopo la fine del run (NaN o punti mancanti) ripete l'ultimo valore."""
+        griglia = np.full((len(serie), self.punti), np.nan)
+        punti = min(self.punti, serie.shape[1])
+        griglia[:, :punti] = serie[:, :punti]
+        validi = ~np.isnan(griglia)
+        ultimo = np.maximum.accumulate(np.where(validi, np.arange(self.punti), 0), axis=1)
+        return griglia[np.arange(len(griglia))[:, None], ultimo]
+
+    def bande_serie(self, percentili=PERCENTILI):
+        """Tempi (ore) e matrice (punti, percentili) del peso cumulato in tonnellate."""
+        ore = np.arange(self.punti) * self.passo_serie / 3600
+        return ore, self.serie.quantili(np.array(percentili) / 100)
+
+    def riepilogo(self, percentili=PERCENTILI, punti_bande=49):
+        """Riepilogo compatto (serializzabile in JSON); le bande sono ridotte a punti_bande istanti."""
+        ore, bande = self.bande_serie(percentili)
+        campioni = np.unique(np.linspace(0, self.punti - 1, punti_bande).astype(int))
+        return {
+            "n_run": self.n_run,
+            "run_completati": self.run_completati,
+            "kpi": {chiave: self.kpi.riepilogo(i, percentili) for i, chiave in enumerate(self.KPI)},
+            "tempo_perso_per_evento": {tipo: self.tempo_perso_per_evento.riepilogo(i, percentili)
+                                       for i, tipo in enumerate(TIPI_EVENTO)},
+            "tonnellate_per_ordine": {prodotto: sketch.riepilogo(0, percentili)
+                                      for prodotto, sketch in sorted(self.peso_ordine.items())},
+            "scostamento_grammatura_percentuale": self.scostamento_grammatura.riepilogo(0, percentili),
+            "indice_qualita": self.indice_qualita.riepilogo(0, percentili),
+            "peso_cumulato_t": {
+                "ore": [round(float(ora), 3) for ora in ore[campioni]],
+                **{f"p{p}": [round(float(v), 3) for v in bande[campioni, j]] for j, p in enumerate(percentili)},
+            },
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report statistico di un archivio di run")
+    parser.add_argument("archivio", help="cartella di un ArchivioRisultati (python -m core.batch ... --archivio)")
+    parser.add_argument("--uscita", default="riepilogo_multirun.json", help="file JSON del riepilogo")
+    parser.add_argument("--grafici", default=None, help="prefisso dei file PNG (ventaglio e distribuzioni)")
+    parser.add_argument("--durata-ore", type=float, default=None, help="orizzonte delle bande (default: serie dell'archivio)")
+    argomenti = parser.parse_args()
+    configura_output("console")
+    archivio = ArchivioRisultati(argomenti.archivio)
+    durata = argomenti.durata_ore or (archivio.meta["punti_serie"] - 1) * archivio.passo_serie / 3600 or 72
+    aggregatore = AggregatoreMultiRun(durata, archivio.passo_serie)
+    aggregatore.aggiungi_archivio(archivio)
+    with open(argomenti.uscita, "w") as f:
+        json.dump(ReportStatistica.json_multirun(aggregatore), f, indent=2)
+    if argomenti.grafici:
+        ReportStatistica.grafico_ventaglio(aggregatore, f"{argomenti.grafici}_ventaglio.png")
+        ReportStatistica.grafico_distribuzioni(aggregatore, f"{argomenti.grafici}_distribuzioni.png")
+    logger.info("Riepilogo di %d run salvato in %s", aggregatore.n_run, argomenti.uscita)
+
+
+if __name__ == "__main__":
+    main()
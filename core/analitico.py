@@ -0,0 +1,424 @@
+"""
+Stima analitica (senza simulazione) di disponibilità, tempo perso per tipo di evento e tonnellate
+per ordine.
+
+Gli stessi parametri che guidano la simulazione definiscono un processo semi-Markov:
+    - per ogni ordine velocità tela e tick per bobina seguono da grammatura e larghezza (come
+      ProgrammaProduzione e Bobina); il peso della bobina è proporzionale alla grammatura ottenuta,
+      normale attorno al target con la sigma di sigma_grammatura_solo_eff: numero di bobine e peso
+      dell'ordine sono quelli della prima bobina che porta il peso oltre il target;
+    - guasti, rotture carta e rotture feltro sono prove di Bernoulli per tick (calcolo_probabilita_per_tick)
+      eseguite in ogni tick di marcia;
+    - pulizia (8 h) e lama crespatura (22-27 h) sono timer sul tempo di marcia che fermano la macchina
+      allo scadere; il feltro che entra in fascia critica viene cambiato al cambio bobina successivo;
+    - ogni fermo dura tick * ceil(durata / tick); dopo un fermo che non è un cambio bobina segue con
+      probabilità fissa una pulizia extra, che riarma anche il timer della pulizia.
+
+I conteggi attesi dei timer sommano le probabilità di passaggio P(S_k <= T) dei tempi di rinnovo,
+le prove di Bernoulli il numero atteso di successi prima di n insuccessi, l'usura del feltro
+l'occupazione attesa delle fasce di usura partendo da usura iniziale uniforme (come Feltro).
+La sigma della grammatura di un ordine dipende dalle efficienze estratte all'avvio dell'ordine: bobine
+e peso sono mediati con una quadratura di Gauss sulla distribuzione dell'inefficienza media (momenti
+dai cumulanti delle singole efficienze, feltro con l'occupazione attesa delle fasce). Il calcolo
+richiede circa un millisecondo; valida_monte_carlo() lo confronta con un batch di simulazioni.
+
+Avvio: python -m core.analitico scenari/base.toml --semi 100
+"""
+import argparse
+import json
+import logging
+import math
+
+import numpy as np
+
+from core.batch import esegui_batch
+from core.console import configura_output
+from core.evento import PARAMETRI_EVENTI_DEFAULT, calcolo_probabilita_per_tick
+from core.feltro import Feltro, calcolo_probabilita_rottura_per_tick
+from core.macchinacontinua import COEFF_SIGMA, ESPONENTE_SIGMA, PESI_EFFICIENZE
+from core.programmaproduzione import RICETTE_DEFAULT, trova_ricetta, velocita_teorica
+from core.scenario import carica_scenario
+
+logger = logging.getLogger("core.analitico")
+
+LUNGHEZZA_BOBINA = 50000   # m, come MacchinaContinua.setup_bobina
+# Fasce di usura del feltro (da Feltro.FASCE) in ordine crescente: (inizio, fine, probabilità di rottura % sulla vita)
+_CRESCENTI = Feltro.FASCE[::-1]
+FASCE_FELTRO = tuple(
+    (fascia[0], successiva[0] if successiva else 1.0, fascia[3])
+    for fascia, successiva in zip(_CRESCENTI, _CRESCENTI[1:] + (None,))
+)
+_EFFICIENZE_FASCE = tuple(fascia[2] for fascia in _CRESCENTI)   # efficienza del feltro per fascia
+PUNTI_USURA = 200          # punti di integrazione sull'usura iniziale uniforme
+PUNTI_SIGMA = 4            # nodi di quadratura sulla sigma della grammatura di un ordine
+
+
+def durata_media(distribuzione):
+    """Valore atteso della durata (secondi interi) estratta da campiona_durata."""
+    tipo = distribuzione["distribuzione"]
+    if tipo == "uniforme":
+        return (distribuzione["min"] + distribuzione["max"]) / 2
+    if tipo == "normale":
+        return distribuzione["media"]
+    return distribuzione["valore"]
+
+
+def perdita_attesa(durata, tick_reale, fissa=False):
+    """
+    Tempo perso atteso per un fermo di durata media data: il fermo occupa ceil(durata/tick) tick.
+    Per durate casuali intere il resto modulo tick è circa uniforme, quindi l'arrotondamento vale (tick-1)/2.
+    """
+    if fissa:
+        return tick_reale * math.ceil(durata / tick_reale)
+    return durata + (tick_reale - 1) / 2
+
+
+def rinnovi_discreti(orizzonte, valori):
+    """
+    Numero atteso di rinnovi in [0, orizzonte] per intervalli equiprobabili tra `valori`, partendo da un
+    ciclo nuovo: somma su k di P(S_k <= orizzonte), con la legge di S_k ottenuta per convoluzione.
+    """
+    valori = np.asarray(valori, dtype=int)
+    if valori.min() <= 0:
+        raise ValueError("Gli intervalli di rinnovo devono essere positivi")
+    passo = math.gcd(*valori.tolist())
+    pmf = np.bincount(valori // passo) / len(valori)
+    somma = np.array([1.0])
+    limite = int(orizzonte // passo)
+    attesi = 0.0
+    while True:
+        somma = np.convolve(somma, pmf)[:limite + 1]
+        probabilita = somma.sum()
+        if probabilita < 1e-12:
+            return attesi
+        attesi += probabilita
+
+
+def rinnovi_troncati(orizzonte, intervallo, tasso_reset):
+    """
+    Numero atteso di scadenze di un timer di durata `intervallo` che viene riarmato anche da reset di
+    Poisson (tasso per secondo). La k-esima scadenza avviene a k*intervallo più l'eccesso X_k dovuto ai reset,
+    somma composta geometrica di esponenziali troncate: X_k vale 0 con probabilità q^k, altrimenti è
+    approssimato con una normale di pari media e varianza condizionate.
+    """
+    if tasso_reset <= 0:
+        return float(orizzonte // intervallo)
+    q = math.exp(-tasso_reset * intervallo)                    # nessun reset in un intervallo intero
+    media_tronc = 1 / tasso_reset - intervallo * q / (1 - q)   # esponenziale troncata a `intervallo`
+    secondo_tronc = (2 / tasso_reset ** 2 * (1 - q * (1 + tasso_reset * intervallo)) - intervallo ** 2 * q) / (1 - q)
+    media_g, varianza_g = (1 - q) / q, (1 - q) / q ** 2        # reset prima della scadenza (geometrica)
+    media_x = media_g * media_tronc
+    varianza_x = media_g * (secondo_tronc - media_tronc ** 2) + varianza_g * media_tronc ** 2
+    attesi, k = 0.0, 1
+    while k * intervallo <= orizzonte:
+        p_zero = q ** k
+        margine = orizzonte - k * intervallo
+        media_c = k * media_x / (1 - p_zero)
+        varianza_c = max((k * varianza_x + (k * media_x) ** 2) / (1 - p_zero) - media_c ** 2, 1e-9)
+        normale = 0.5 * (1 + math.erf((margine - media_c) / math.sqrt(2 * varianza_c)))
+        attesi += p_zero + (1 - p_zero) * normale
+        k += 1
+    return attesi
+
+
+def _momenti(cumulanti):
+    """Momenti grezzi 1..n dai cumulanti 1..n (ricorsione m_n = Σ C(n-1, k-1) κ_k m_(n-k))."""
+    momenti = [1.0]
+    for n in range(1, len(cumulanti) + 1):
+        momenti.append(sum(math.comb(n - 1, k - 1) * cumulanti[k - 1] * momenti[n - k] for k in range(1, n + 1)))
+    return momenti[1:]
+
+
+def _cumulanti(momenti):
+    """Cumulanti 1..n dai momenti grezzi 1..n (inversa di _momenti)."""
+    cumulanti = []
+    for n in range(1, len(momenti) + 1):
+        cumulanti.append(momenti[n - 1] - sum(math.comb(n - 1, k - 1) * cumulanti[k - 1] * momenti[n - k - 1]
+                                              for k in range(1, n)))
+    return cumulanti
+
+
+# cumulanti 1..2·PUNTI_SIGMA di |z| (z normale standard) e di U(0, 0.4) (1 - efficienza della raffinazione)
+_POTENZE = np.arange(1, 2 * PUNTI_SIGMA + 1)
+_CUMULANTI_SEMINORMALE = np.array(_cumulanti([2 ** (k / 2) * math.gamma((k + 1) / 2) / math.sqrt(math.pi)
+                                              for k in _POTENZE]))
+_CUMULANTI_RAFFINAZIONE = np.array(_cumulanti([0.4 ** k / (k + 1) for k in _POTENZE]))
+
+
+def momenti_inefficienza(additivi, sigma_velocita, sigma_efficienza, fasce_feltro):
+    """
+    Momenti grezzi 1..2·PUNTI_SIGMA di 1 - media ponderata delle efficienze di un ordine con `additivi` additivi:
+    efficienze estratte come ProgrammaProduzione.imposta_parametri_per_ordine (1 - gauss_riflessa =
+    sigma·|z|, raffinazione uniforme in [0.6, 1]) e feltro con le probabilità fasce_feltro
+    [(efficienza, probabilità)]. Le componenti sono indipendenti: i cumulanti della somma pesata si sommano.
+    """
+    velocita = _CUMULANTI_SEMINORMALE * sigma_velocita ** _POTENZE
+    processo = _CUMULANTI_SEMINORMALE * sigma_efficienza ** _POTENZE
+    componenti = [   # (peso, cumulanti di 1 - efficienza)
+        (PESI_EFFICIENZE.get("velocita tela", 1), velocita),
+        (PESI_EFFICIENZE.get("concentrazione impasto %", 1), processo),
+        (PESI_EFFICIENZE.get("grado raffinazione", 1), _CUMULANTI_RAFFINAZIONE),
+        (PESI_EFFICIENZE.get("temperatura cappa", 1), processo),
+    ] + [
+        (PESI_EFFICIENZE.get(f"additivo_{j}", 1), processo) for j in range(additivi)
+    ] + [
+        (PESI_EFFICIENZE.get("feltro", 3),
+         np.array(_cumulanti([sum(p * (1 - e) ** k for e, p in fasce_feltro) for k in _POTENZE]))),
+    ]
+    totale = sum(peso for peso, _ in componenti)
+    cumulanti = sum(kappa * (peso / totale) ** _POTENZE for peso, kappa in componenti)
+    return _momenti(cumulanti.tolist())
+
+
+def quadratura(momenti, punti):
+    """
+    Nodi e pesi di Gauss per la distribuzione con i momenti grezzi 1..2·punti dati:
+    Cholesky della matrice di Hankel e autovalori della matrice di Jacobi (Golub-Welsch).
+    I momenti vengono scalati sulla media per il condizionamento.
+    """
+    scala = momenti[0]
+    m = np.array([1.0] + [mk / scala ** k for k, mk in enumerate(momenti, 1)])
+    hankel = np.array([[m[i + j] for j in range(punti + 1)] for i in range(punti + 1)])
+    r = np.linalg.cholesky(hankel).T
+    alfa = [r[j, j + 1] / r[j, j] - (r[j - 1, j] / r[j - 1, j - 1] if j > 0 else 0) for j in range(punti)]
+    beta = [r[j + 1, j + 1] / r[j, j] for j in range(punti - 1)]
+    nodi, vettori = np.linalg.eigh(np.diag(alfa) + np.diag(beta, 1) + np.diag(beta, -1))
+    return nodi * scala, vettori[0] ** 2
+
+
+def _phi(x):
+    return 0.5 * (1 + math.erf(x / math.sqrt(2)))
+
+
+def produzione_ordine(ordine, larghezza, tick_reale, sigma_grammatura=0.0):
+    """
+    Bobine, tick di marcia e peso atteso di un ordine. Con sigma_grammatura > 0 il peso della bobina
+    è normale (grammatura ottenuta ~ N(target, sigma)): l'ordine si chiude alla prima bobina con peso
+    cumulato S_n >= target, quindi E[bobine] = Σ_n P(S_n < target); l'ultimo incremento non è contato
+    quando già il peso prima dell'ultimo tick raggiunge il target (ProgrammaProduzione.aggiorna_produzione).
+    """
+    velocita, _ = velocita_teorica(ordine.grammatura_target, larghezza)
+    delta_lunghezza = round(velocita, 2) * 0.85 * tick_reale
+    tick_per_bobina = math.ceil(LUNGHEZZA_BOBINA / delta_lunghezza)
+    delta_peso = delta_lunghezza * ordine.grammatura_target * larghezza / 1000
+    peso_bobina = tick_per_bobina * delta_peso
+    target = ordine.peso_target
+    if sigma_grammatura <= 0:
+        bobine = max(1, math.ceil(target / peso_bobina))
+        peso = bobine * peso_bobina
+        if peso - delta_peso >= target:
+            peso -= delta_peso
+    else:
+        scarto = peso_bobina * sigma_grammatura / ordine.grammatura_target   # deviazione del peso di una bobina
+        ultimo = 1 - 1 / tick_per_bobina
+        # fino a n bobine (8 deviazioni sotto il target) l'ordine è certamente aperto: P(S_n < target) = 1
+        n = max(0, math.floor((target - 8 * scarto * math.sqrt(target / peso_bobina)) / peso_bobina))
+        bobine, p_tolto, p_sotto = float(n), 0.0, 1.0      # p_sotto = P(S_n < target)
+        while p_sotto > 1e-12:
+            bobine += p_sotto
+            # bobina n+1 ultima e con l'ultimo incremento escluso: S_n < target <= S_n + (1 - 1/k) W
+            p_ultimo_sotto = _phi((target - peso_bobina * (n + ultimo)) / (scarto * math.sqrt(n + ultimo ** 2)))
+            p_tolto += p_sotto - p_ultimo_sotto
+            n += 1
+            p_sotto = _phi((target - n * peso_bobina) / (scarto * math.sqrt(n)))
+        peso = bobine * peso_bobina - p_tolto * delta_peso
+    return {
+        "prodotto": ordine.prodotto,
+        "bobine": bobine,
+        "tick_per_bobina": tick_per_bobina,
+        "tempo_marcia": bobine * (tick_per_bobina + 1) * tick_reale,   # +1: tick di bobina completata
+        "peso_t": peso / 1000,
+    }
+
+
+def occupazione_fasce(orizzonte, ore_vita, usura_iniziale=None):
+    """
+    Tempo atteso (s) trascorso in ciascuna fascia di usura nei primi `orizzonte` secondi di marcia e
+    probabilità che il feltro raggiunga la fascia critica (cambio al cambio bobina successivo).
+    Con usura_iniziale None l'usura parte uniforme in [0, 1) come in Feltro.__init__.
+    Dopo il cambio il feltro nuovo resta in fascia eccellente per il resto dell'orizzonte.
+    """
+    vita = ore_vita * 3600
+    if usura_iniziale is None:
+        usure = (np.arange(PUNTI_USURA) + 0.5) / PUNTI_USURA
+    else:
+        usure = np.array([float(usura_iniziale)])
+    arrivo_critica = np.maximum(0.0, (FASCE_FELTRO[-1][0] - usure) * vita)      # tempo per arrivare a 0.9
+    fine_vecchio = np.minimum(orizzonte, arrivo_critica)
+    tempi = []
+    for inizio, fine, _ in FASCE_FELTRO[:-1]:
+        entrata = np.clip((inizio - usure) * vita, 0.0, None)
+        uscita = np.clip((fine - usure) * vita, 0.0, None)
+        tempi.append(np.clip(np.minimum(uscita, fine_vecchio) - entrata, 0.0, None).mean())
+    cambio = arrivo_critica < orizzonte
+    tempi[0] += np.where(cambio, orizzonte - arrivo_critica, 0.0).mean()
+    return tempi, float(cambio.mean())
+
+
+def stima(ordini, scenario=None, usura_iniziale=None):
+    """
+    Stima analitica per una lista di Ordine con i parametri dello scenario (default: quelli predefiniti).
+    Restituisce tempi attesi (s), disponibilità, conteggi e tempo perso per tipo di evento, peso per ordine.
+    Il feltro segue la politica originale (cambio in fascia critica al cambio bobina), qualunque sia
+    la politica_feltro dello scenario.
+    """
+    tick = scenario.tick_reale if scenario is not None else 5
+    larghezza = scenario.larghezza_macchina if scenario is not None else 2.75
+    parametri = scenario.eventi if scenario is not None else PARAMETRI_EVENTI_DEFAULT
+    ore_vita_min = scenario.ore_vita_feltro_min if scenario is not None else Feltro.MIN_ORE_VITA
+    ore_vita_max = scenario.ore_vita_feltro_max if scenario is not None else Feltro.MAX_ORE_VITA
+    ore_vita = (ore_vita_min + ore_vita_max) / 2
+    ricette = scenario.ricette if scenario is not None else RICETTE_DEFAULT
+    sigma_velocita = scenario.sigma_velocita if scenario is not None else 0.10
+    sigma_efficienza = scenario.sigma_efficienza if scenario is not None else 0.05
+
+    # dispersione della grammatura: fasce del feltro occupate durante la marcia a grammatura target
+    marcia_nominale = sum(produzione_ordine(ordine, larghezza, tick)["tempo_marcia"] for ordine in ordini)
+    tempi_nominali, _ = occupazione_fasce(marcia_nominale, ore_vita, usura_iniziale)
+    fasce = [(efficienza, t / max(sum(tempi_nominali), 1e-9))
+             for t, efficienza in zip(tempi_nominali, _EFFICIENZE_FASCE)]
+    produzione, quadrature = [], {}
+    for ordine in ordini:
+        # media sulla sigma dell'ordine: quadratura sulla distribuzione dell'inefficienza media
+        additivi = len(trova_ricetta(ordine.prodotto, ricette)["additivi"])
+        if additivi not in quadrature:
+            quadrature[additivi] = quadratura(
+                momenti_inefficienza(additivi, sigma_velocita, sigma_efficienza, fasce), PUNTI_SIGMA)
+        nodi, pesi = quadrature[additivi]
+        stime = [produzione_ordine(ordine, larghezza, tick,
+                                   ordine.grammatura_target * COEFF_SIGMA * max(nodo, 0) ** ESPONENTE_SIGMA)
+                 for nodo in nodi]
+        produzione.append({**stime[0], **{chiave: sum(w * s[chiave] for w, s in zip(pesi, stime))
+                                          for chiave in ("bobine", "tempo_marcia", "peso_t")}})
+    tempo_marcia = sum(p["tempo_marcia"] for p in produzione)
+    tick_marcia = tempo_marcia / tick
+    bobine = sum(p["bobine"] for p in produzione)
+    n_ordini = len(ordini)
+    # il feltro arrivato in fascia critica attende in media mezza bobina prima del cambio
+    attesa = tick * sum(p["bobine"] * (p["tick_per_bobina"] + 1) for p in produzione) / bobine / 2
+
+    p_guasto = calcolo_probabilita_per_tick(tick, parametri["guasto macchina"]["probabilita"],
+                                            parametri["guasto macchina"]["periodo_sec"])
+    p_rottura = calcolo_probabilita_per_tick(tick, parametri["rottura carta"]["probabilita"],
+                                             parametri["rottura carta"]["periodo_sec"])
+    tempi_fascia, p_cambio_feltro = occupazione_fasce(tempo_marcia, ore_vita, usura_iniziale)
+    p_feltro = [calcolo_probabilita_rottura_per_tick(tick, prob, ore_vita * 3600) for _, _, prob in FASCE_FELTRO]
+    # tempo in fascia critica: dall'arrivo a 0.9 al cambio bobina successivo
+    tempi_fascia.append(p_cambio_feltro * attesa)
+
+    extra = parametri["pulizia macchina extra"]
+    p_extra = extra["probabilita"] / 100
+    media_extra = durata_media(extra["durata"])
+    pulizia = parametri["pulizia macchina"]
+    lama = parametri["cambio lama crespatura"]
+    ore_lama = np.arange(lama["intervallo_ore_min"], lama["intervallo_ore_max"] + 1) * 3600
+
+    # Fermi casuali: numero atteso di successi nelle prove di Bernoulli dei tick di marcia
+    p_feltro_medio = sum(t * p for t, p in zip(tempi_fascia, p_feltro)) / max(tempo_marcia, 1)
+    p_qualsiasi = 1 - (1 - p_guasto) * (1 - p_rottura) * (1 - p_feltro_medio)
+    n_guasto = tick_marcia * p_guasto / (1 - p_qualsiasi)
+    n_rottura = tick_marcia * p_rottura / (1 - p_qualsiasi)
+    n_feltro_casuale = tick_marcia * p_feltro_medio / (1 - p_qualsiasi)
+    n_casuali = n_guasto + n_rottura + n_feltro_casuale
+    n_lama = rinnovi_discreti(tempo_marcia, ore_lama)
+    # pulizia: il timer riparte anche dopo ogni pulizia extra, che segue fermi casuali, lama e cambi produzione
+    tasso_extra = p_extra * (n_casuali + n_lama + n_ordini - 1) / max(tempo_marcia, 1)
+    n_pulizia = rinnovi_troncati(tempo_marcia, pulizia["intervallo_sec"], tasso_extra)
+
+    n_feltro_programmato = p_cambio_feltro
+    n_fermi_con_extra = n_casuali + n_pulizia + n_lama + n_ordini   # tutti i fermi tranne i cambi bobina
+    n_extra = p_extra * n_fermi_con_extra
+    media = {tipo: durata_media(valori["durata"]) for tipo, valori in parametri.items() if "durata" in valori}
+    # al cambio bobina il feltro in fascia critica viene sostituito: il fermo vale la durata del cambio feltro
+    cambi_bobina_semplici = max(0.0, bobine - n_ordini - n_feltro_programmato)
+    perso = {
+        "cambio bobina": cambi_bobina_semplici * perdita_attesa(media["cambio bobina"], tick, fissa=True),
+        "cambio produzione": (n_ordini - 1) * perdita_attesa(media["cambio produzione"], tick),
+        "guasto macchina": n_guasto * perdita_attesa(media["guasto macchina"], tick),
+        "rottura carta": n_rottura * perdita_attesa(media["rottura carta"], tick),
+        "cambio feltro": (n_feltro_programmato + n_feltro_casuale) * perdita_attesa(media["cambio feltro"], tick),
+        "pulizia macchina": n_pulizia * perdita_attesa(media["pulizia macchina"], tick),
+        "cambio lama crespatura": n_lama * perdita_attesa(media["cambio lama crespatura"], tick),
+        # l'ultimo cambio produzione (e la sua pulizia extra) chiude la simulazione: non viene scontato
+        "pulizia macchina extra": p_extra * (n_fermi_con_extra - 1) * media_extra,
+    }
+    tempo_perso = sum(perso.values())
+    # il tick in cui scatta un fermo casuale o temporizzato non produce e non è conteggiato come perso
+    tempo_simulato = tempo_marcia + tempo_perso + (n_casuali + n_pulizia + n_lama) * tick
+    return {
+        "tempo_marcia": tempo_marcia,
+        "tempo_perso": tempo_perso,
+        "tempo_simulato": tempo_simulato,
+        "disponibilita": 1 - tempo_perso / tempo_simulato,
+        "peso_totale_t": sum(p["peso_t"] for p in produzione),
+        "bobine_totali": bobine,
+        "tempo_perso_per_evento": perso,
+        "eventi_attesi": {
+            "cambio bobina": bobine - n_ordini,
+            "cambio produzione": n_ordini,
+            "guasto macchina": n_guasto,
+            "rottura carta": n_rottura,
+            "cambio feltro": n_feltro_programmato + n_feltro_casuale,
+            "pulizia macchina": n_pulizia,
+            "cambio lama crespatura": n_lama,
+            "pulizia macchina extra": n_extra,
+        },
+        "ordini": produzione,
+    }
+
+
+def valida_monte_carlo(scenario, semi=range(100), processi=None):
+    """
+    Confronta la stima analitica con la media di un batch di simulazioni dello scenario, che deve
+    avere ordini espliciti. Per ogni KPI: valore analitico, media e errore standard Monte Carlo, scarto in errori standard.
+    Restano approssimati l'efficienza del feltro (occupazione media delle fasce sull'orizzonte, non per
+    ordine) e i fermi a timer: con 200 semi su scenari da 3-4 ordini gli scarti restano entro circa
+    1.5 errori standard, ma con molti più semi i piccoli bias diventano visibili.
+    """
+    if not scenario.ordini:
+        raise ValueError("La validazione richiede uno scenario con ordini espliciti")
+    analitico = stima(scenario.genera_ordini(), scenario)
+    risultati = esegui_batch(scenario, semi=list(semi), processi=processi)
+
+    def riga(valore, campioni):
+        campioni = np.asarray(campioni, dtype=float)
+        errore = campioni.std(ddof=1) / math.sqrt(len(campioni)) if len(campioni) > 1 else 0.0
+        return {
+            "analitico": valore, "monte_carlo": float(campioni.mean()), "errore_standard": errore,
+            "scarto_in_errori": (valore - campioni.mean()) / errore if errore else None,
+        }
+
+    confronto = {
+        chiave: riga(analitico[chiave], [r[chiave] for r in risultati])
+        for chiave in ("tempo_perso", "tempo_simulato", "peso_totale_t", "bobine_totali")
+    }
+    confronto["disponibilita"] = riga(analitico["disponibilita"],
+                                      [1 - r["tempo_perso"] / r["tempo_simulato"] for r in risultati])
+    confronto["tempo_perso_per_evento"] = {
+        tipo: riga(valore, [r["tempo_perso_per_evento"].get(tipo, 0) for r in risultati])
+        for tipo, valore in analitico["tempo_perso_per_evento"].items()
+    }
+    confronto["eventi_attesi"] = {
+        tipo: riga(valore, [r["eventi"].get(tipo, 0) for r in risultati])
+        for tipo, valore in analitico["eventi_attesi"].items()
+    }
+    return confronto
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stima analitica di disponibilità e tempo perso")
+    parser.add_argument("scenario", help="file scenario con ordini espliciti")
+    parser.add_argument("--semi", type=int, default=0, help="run Monte Carlo per la validazione (0 = solo stima)")
+    parser.add_argument("--processi", type=int, default=None)
+    argomenti = parser.parse_args()
+    configura_output("console")
+    scenario = carica_scenario(argomenti.scenario)
+    if argomenti.semi:
+        risultato = valida_monte_carlo(scenario, range(argomenti.semi), argomenti.processi)
+    else:
+        risultato = stima(scenario.genera_ordini(), scenario)
+    logger.info("%s", json.dumps(risultato, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+Archivio dei risultati di un batch su file mappati in memoria (numpy memmap).
+
+Il processo principale crea una cartella con array .npy preallocati, una riga per run:
+  kpi.npy     KPI a schema fisso (record numpy), con tempo perso e numero di eventi per tipo
+  serie.npy   (opzionale) peso cumulato della simulazione campionato ogni passo_serie secondi
+  bobine.npy  (opzionale) grammatura, peso, qualità, ordine, tempi, feltro ed efficienze delle prime max_bobine bobine
+  ordini.npy  (opzionale) prodotto, target e tonnellate prodotte dei primi max_ordini ordini
+  meta.json   schema, semi e scenario del batch
+
+I worker del pool aprono gli stessi file in lettura/scrittura (mappatura condivisa) e scrivono
+direttamente la riga del proprio run: al processo principale torna solo la conclusione del Future,
+senza serializzare KPI, serie o log. Le aggregazioni leggono le colonne sul posto, senza copie.
+"""
+import json
+import os
+
+import numpy as np
+
+from core.bobina import EFFICIENZE_BOBINA
+from core.evento import ORDINE_EVENTI
+from core.feltro import Feltro
+
+TIPI_EVENTO = ORDINE_EVENTI + ("pulizia macchina extra",)
+FASCE_FELTRO = tuple(fascia[1] for fascia in Feltro.FASCE)     # codice della colonna fascia_feltro
+
+SCHEMA_KPI = np.dtype([
+    ("seme", "i8"),
+    ("scritto", "?"),
+    ("completata", "?"),
+    ("tempo_simulato", "f8"),
+    ("tempo_perso", "f8"),
+    ("percentuale_produzione", "f8"),
+    ("peso_totale_t", "f8"),
+    ("bobine_totali", "i4"),
+    ("indice_qualita_medio", "f8"),         # NaN se nessuna bobina è stata completata
+    ("punti_serie", "i4"),
+    ("bobine_archiviate", "i4"),
+    ("ordini_archiviati", "i4"),
+    ("eventi", [(tipo, "i4") for tipo in TIPI_EVENTO]),
+    ("tempo_perso_per_evento", [(tipo, "f8") for tipo in TIPI_EVENTO]),
+])
+
+SCHEMA_BOBINA = np.dtype([
+    ("grammatura_ottenuta", "f8"),
+    ("grammatura_target", "f8"),
+    ("peso_bobina", "f8"),
+    ("indice_qualita", "f8"),
+    ("ordine", "i2"),
+    ("tempo_inizio", "f8"),
+    ("tempo_completamento", "f8"),
+    ("usura_feltro", "f4"),
+    ("fascia_feltro", "i1"),
+    ("efficienze", [(nome, "f4") for nome in EFFICIENZE_BOBINA]),
+])
+
+SCHEMA_ORDINE = np.dtype([
+    ("prodotto", "S32"),
+    ("grammatura_target", "f8"),
+    ("peso_target", "f8"),
+    ("bobine", "i4"),
+    ("peso_prodotto_t", "f8"),
+])
+
+CHIAVI_RIEPILOGO = ("tempo_simulato", "tempo_perso", "percentuale_produzione", "peso_totale_t", "bobine_totali")
+
+
+def peso_per_ordine(macchina):
+    """Tonnellate di bobine completate per ciascun ordine del programma."""
+    pesi = np.array([bobina["peso_bobina"] for bobina in macchina.log_bobine], dtype=float)
+    ordini = np.array([bobina["ordine"] for bobina in macchina.log_bobine], dtype=np.int64)
+    return np.bincount(ordini, weights=pesi,
+                       minlength=len(macchina.bobine_tot_prodotte)) / 1000
+
+
+class VistaSerie:
+    """
+    Serie di un run dell'archivio con l'interfaccia di ProgressTracker (nome, get_data): può essere
+    passata a plot_progress e ai grafici di ReportStatistica. y è una vista sulla riga del memmap.
+    """
+    def __init__(self, nome, x, y):
+        self.nome = nome
+        self.x = x
+        self.y = y
+
+    def get_data(self):
+        return self.x, self.y
+
+
+class ArchivioRisultati:
+    """
+    Archivio su disco di n_run righe di risultati. Si crea con ArchivioRisultati.crea() e si riapre
+    con ArchivioRisultati(cartella) in sola lettura ("r") o in lettura/scrittura ("r+", nei worker).
+    """
+    def __init__(self, cartella, modalita="r"):
+        self.cartella = cartella
+        with open(os.path.join(cartella, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.n_run = self.meta["n_run"]
+        self.tick_reale = self.meta["tick_reale"]
+        self.passo_serie = self.meta["passo_serie"]
+        self.kpi = np.load(os.path.join(cartella, "kpi.npy"), mmap_mode=modalita)
+        self.serie = self._carica("serie.npy", modalita) if self.meta["punti_serie"] else None
+        self.bobine = self._carica("bobine.npy", modalita) if self.meta["max_bobine"] else None
+        self.ordini = self._carica("ordini.npy", modalita) if self.meta.get("max_ordini") else None
+
+    def _carica(self, nome, modalita):
+        return np.load(os.path.join(self.cartella, nome), mmap_mode=modalita)
+
+    @classmethod
+    def crea(cls, cartella, semi, tick_reale, durata_serie=0, passo_serie=60, max_bobine=0, max_ordini=0,
+             scenario=None):
+        """
+        Prealloca l'archivio per un run per seme. durata_serie (secondi simulati, 0 = nessuna serie) fissa
+        la lunghezza delle serie: i run più lunghi vengono troncati. passo_serie deve essere multiplo del tick.
+        """
+        if passo_serie % tick_reale:
+            raise ValueError(f"passo_serie ({passo_serie}) deve essere multiplo del tick ({tick_reale})")
+        os.makedirs(cartella, exist_ok=True)
+        semi = [int(seme) for seme in semi]
+        punti_serie = int(durata_serie // passo_serie) + 1 if durata_serie else 0
+        meta = {
+            "n_run": len(semi), "semi": semi, "tick_reale": tick_reale,
+            "passo_serie": passo_serie, "punti_serie": punti_serie, "max_bobine": max_bobine,
+            "max_ordini": max_ordini,
+            "tipi_evento": list(TIPI_EVENTO),
+            "scenario": scenario.to_dict() if scenario is not None else None,
+        }
+        kpi = np.lib.format.open_memmap(os.path.join(cartella, "kpi.npy"), mode="w+",
+                                        dtype=SCHEMA_KPI, shape=(len(semi),))
+        kpi["seme"] = semi
+        kpi.flush()
+        if punti_serie:
+            serie = np.lib.format.open_memmap(os.path.join(cartella, "serie.npy"), mode="w+",
+                                              dtype="f8", shape=(len(semi), punti_serie))
+            serie[:] = np.nan
+            serie.flush()
+        if max_bobine:
+            np.lib.format.open_memmap(os.path.join(cartella, "bobine.npy"), mode="w+",
+                                      dtype=SCHEMA_BOBINA, shape=(len(semi), max_bobine)).flush()
+        if max_ordini:
+            np.lib.format.open_memmap(os.path.join(cartella, "ordini.npy"), mode="w+",
+                                      dtype=SCHEMA_ORDINE, shape=(len(semi), max_ordini)).flush()
+        with open(os.path.join(cartella, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        return cls(cartella, "r+")
+
+    def scrivi_run(self, indice, kpi, macchina):
+        """Scrive nella riga `indice` i KPI (dizionario di kpi_macchina), la serie e le bobine del run."""
+        riga = self.kpi[indice]
+        for chiave in ("completata", "tempo_simulato", "tempo_perso", "percentuale_produzione",
+                       "peso_totale_t", "bobine_totali"):
+            riga[chiave] = kpi[chiave]
+        riga["indice_qualita_medio"] = np.nan if kpi["indice_qualita_medio"] is None else kpi["indice_qualita_medio"]
+        for tipo in TIPI_EVENTO:
+            riga["eventi"][tipo] = kpi["eventi"].get(tipo, 0)
+            riga["tempo_perso_per_evento"][tipo] = kpi["tempo_perso_per_evento"].get(tipo, 0)
+        if self.serie is not None:
+            passo = self.passo_serie // self.tick_reale
+            campioni = macchina.tracker_simulazione.y[::passo][:self.serie.shape[1]]
+            self.serie[indice, :len(campioni)] = campioni
+            riga["punti_serie"] = len(campioni)
+        if self.bobine is not None:
+            bobine = macchina.log_bobine[:self.bobine.shape[1]]
+            righe = self.bobine[indice]
+            for i, bobina in enumerate(bobine):
+                efficienze = bobina["efficienze"]
+                righe[i] = (bobina["grammatura ottenuta"], bobina["grammatura target"],
+                            bobina["peso_bobina"], bobina["indice_qualita"], bobina["ordine"],
+                            bobina["tempo_inizio"], bobina["tempo_completamento"], bobina["usura_feltro"],
+                            FASCE_FELTRO.index(bobina["fascia_feltro"]),
+                            tuple(np.nan if efficienze[nome] is None else efficienze[nome] for nome in EFFICIENZE_BOBINA))
+            riga["bobine_archiviate"] = len(bobine)
+        if self.ordini is not None:
+            ordini = macchina.programma.lista_ordini[:self.ordini.shape[1]]
+            righe = self.ordini[indice]
+            for i, (ordine, peso) in enumerate(zip(ordini, peso_per_ordine(macchina))):
+                righe[i] = (ordine.prodotto.encode(), ordine.grammatura_target, ordine.peso_target,
+                            macchina.bobine_tot_prodotte[i], peso)
+            riga["ordini_archiviati"] = len(ordini)
+        riga["scritto"] = True
+
+    def flush(self):
+        for array in (self.kpi, self.serie, self.bobine, self.ordini):
+            if array is not None and array.flags.writeable:
+                array.flush()
+
+    def completi(self):
+        """Maschera dei run già scritti (un batch interrotto lascia righe vuote)."""
+        return self.kpi["scritto"]
+
+    def riepilogo(self):
+        """Come riepilogo_batch, calcolato sulle colonne dei run scritti."""
+        kpi = self.kpi[self.completi()] if not self.completi().all() else self.kpi
+        riepilogo = {"n_run": len(kpi)}
+        if not len(kpi):
+            return riepilogo
+        for chiave in CHIAVI_RIEPILOGO:
+            valori = kpi[chiave]
+            riepilogo[chiave] = {"media": float(valori.mean()), "min": float(valori.min()), "max": float(valori.max())}
+        perso = kpi["tempo_perso_per_evento"]
+        riepilogo["tempo_perso_per_evento"] = {tipo: float(perso[tipo].mean()) for tipo in TIPI_EVENTO}
+        return riepilogo
+
+    def tracker(self, indice):
+        """Serie del run `indice` come tracker (per plot_progress / ReportStatistica.grafico_simulazione)."""
+        if self.serie is None:
+            raise ValueError("L'archivio non contiene serie temporali")
+        punti = int(self.kpi["punti_serie"][indice])
+        x = np.arange(punti) * self.passo_serie
+        return VistaSerie(f"simulazione seme {self.kpi['seme'][indice]}", x, self.serie[indice, :punti])
+
+    def run(self, indice):
+        """Riga `indice` come dizionario (stesse chiavi di kpi_macchina dove presenti)."""
+        riga = self.kpi[indice]
+        risultato = {nome: riga[nome].item() for nome in SCHEMA_KPI.names
+                     if nome not in ("eventi", "tempo_perso_per_evento")}
+        if np.isnan(risultato["indice_qualita_medio"]):
+            risultato["indice_qualita_medio"] = None
+        for nome in ("eventi", "tempo_perso_per_evento"):
+            risultato[nome] = {tipo: riga[nome][tipo].item() for tipo in TIPI_EVENTO if riga[nome][tipo]}
+        return risultato
@@ -0,0 +1,256 @@
+"""
+Esecuzione batch di uno scenario su più semi.
+
+Lo Scenario viene caricato e validato una sola volta nel processo principale e consegnato ad ogni
+processo worker tramite l'initializer del pool: i singoli run ricevono solo il seme e non
+ripetono parsing né copie dello scenario. I run sono senza grafici e senza output (logger silenzioso).
+Con un ArchivioRisultati (core.archivio) i worker scrivono i risultati direttamente nei file mappati
+in memoria dell'archivio invece di restituirli al processo principale. Con una CacheRisultati
+(core.cacherisultati) i semi già simulati con gli stessi ingressi vengono letti dalla cache e solo
+i run mancanti vengono simulati (e aggiunti alla cache).
+
+Avvio: python -m core.batch scenari/base.toml --processi 4 --uscita risultati.json
+"""
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from core.archivio import ArchivioRisultati
+from core.cacherisultati import CacheRisultati, RisultatoRun
+from core.console import configura_output, silenzia_output
+from core.dashboard import STATO_FINE
+from core.kernel import avanza
+from core.macchinacontinua import MacchinaContinua
+from core.scenario import carica_scenario
+
+logger = logging.getLogger("core.batch")  # nome fisso: anche con python -m resta sotto il logger "core"
+
+_scenario_worker = None   # Scenario condiviso dai run di un processo worker
+_archivio_worker = None   # ArchivioRisultati aperto in scrittura dal processo worker (se presente)
+_cache_worker = None      # CacheRisultati condivisa dai run del processo worker (se presente)
+
+
+def tempo_perso_per_evento(log_eventi, tick_reale, tempo_finale):
+    """
+    Ripartisce il tempo perso tra i tipi di evento. Gli eventi registrati allo stesso tempo simulato
+    sono un unico fermo: la pulizia extra pesa la propria durata, il resto (arrotondato al tick come
+    in esegui_tick) va all'evento di durata maggiore. Un fermo non ancora concluso a tempo_finale
+    (es. l'ultimo cambio produzione) conta solo per la parte trascorsa.
+    """
+    fermi = {}
+    for voce in log_eventi:
+        fermi.setdefault(voce["tempo_simulato"], []).append(voce)
+    ripartizione = {}
+    for tempo, voci in fermi.items():
+        extra = sum(v["durata"] for v in voci if v["evento"] == "pulizia macchina extra")
+        principali = [v for v in voci if v["evento"] != "pulizia macchina extra"]
+        dominante = max(principali, key=lambda v: v["durata"]) if principali else None
+        durata = max(0, dominante["durata"] if dominante else 0) + extra
+        perso = min(-(-durata // tick_reale) * tick_reale, max(0, tempo_finale - tempo))
+        quota_extra = min(extra, perso)
+        if quota_extra:
+            ripartizione["pulizia macchina extra"] = ripartizione.get("pulizia macchina extra", 0) + quota_extra
+        if dominante and perso - quota_extra:
+            ripartizione[dominante["evento"]] = ripartizione.get(dominante["evento"], 0) + perso - quota_extra
+    return ripartizione
+
+
+def kpi_macchina(macchina):
+    """Indicatori sintetici di un run concluso (o interrotto)."""
+    tempo_simulato = macchina.simclock.get_time()
+    qualita = [bobina["indice_qualita"] for bobina in macchina.log_bobine]
+    return {
+        "tempo_simulato": tempo_simulato,
+        "tempo_perso": macchina.tempo_perso,
+        "percentuale_produzione": 100 - round(macchina.tempo_perso / tempo_simulato * 100, 1) if tempo_simulato else 0.0,
+        "peso_totale_t": macchina.programma.peso_accumulato / 1000,
+        "bobine_per_ordine": list(macchina.bobine_tot_prodotte),
+        "bobine_totali": sum(macchina.bobine_tot_prodotte),
+        "indice_qualita_medio": float(np.mean(qualita)) if qualita else None,
+        "eventi": dict(Counter(evento["evento"] for evento in macchina.evento.log_eventi)),
+        "tempo_perso_per_evento": tempo_perso_per_evento(macchina.evento.log_eventi, macchina.tick_reale, tempo_simulato),
+        "completata": macchina.stato == STATO_FINE,
+    }
+
+
+def simula_run(scenario, seme, max_tick=None, politica_feltro=None):
+    """
+    Simula lo scenario con il seme indicato e restituisce la macchina a fine run e gli ordini generati.
+    max_tick limita la durata (None = fino al termine degli ordini); politica_feltro sostituisce
+    quella dello scenario.
+    """
+    np.random.seed(seme)
+    ordini = scenario.genera_ordini()
+    macchina = MacchinaContinua(ordini, tick_visivo=scenario.tick_reale, grafici=False, scenario=scenario,
+                                politica_feltro=politica_feltro, seme=seme)
+    macchina.setup_bobina()
+    avanza(macchina, math.inf if max_tick is None else max_tick)
+    return macchina, ordini
+
+
+def esegui_run(scenario, seme, max_tick=None, politica_feltro=None, cache=None):
+    """
+    Esegue un run completo dello scenario con il seme indicato e restituisce i KPI.
+    Con una CacheRisultati il run viene simulato solo se non è già in cache.
+    """
+    return risultato_run(scenario, seme, max_tick, politica_feltro, cache).kpi
+
+
+def risultato_run(scenario, seme, max_tick=None, politica_feltro=None, cache=None):
+    """
+    Come esegui_run, ma restituisce il RisultatoRun completo: KPI, serie del peso cumulato, log delle
+    bobine e degli eventi, riepilogo OEE. Con una cache una richiesta ripetuta non simula di nuovo.
+    """
+    chiave = cache.chiave(scenario, seme, max_tick, politica_feltro) if cache is not None else None
+    if cache is not None:
+        risultato = cache.carica(chiave)
+        if risultato is not None:
+            return risultato
+    macchina, ordini = simula_run(scenario, seme, max_tick, politica_feltro)
+    kpi = kpi_macchina(macchina)
+    kpi["seme"] = seme
+    kpi["ordini"] = [ordine.to_dict() for ordine in ordini]
+    risultato = RisultatoRun.da_macchina(macchina, kpi)
+    if cache is not None:
+        cache.salva(chiave, risultato)
+    return risultato
+
+
+def archivia_run(archivio, indice, scenario, seme, max_tick=None, politica_feltro=None):
+    """Esegue un run e ne scrive i risultati nella riga `indice` dell'archivio."""
+    macchina, _ = simula_run(scenario, seme, max_tick, politica_feltro)
+    archivio.scrivi_run(indice, kpi_macchina(macchina), macchina)
+
+
+def _inizializza_worker(scenario, cartella_archivio=None, cache=None):
+    global _scenario_worker, _archivio_worker, _cache_worker
+    configura_output("silenziosa")
+    _scenario_worker = scenario
+    _archivio_worker = ArchivioRisultati(cartella_archivio, "r+") if cartella_archivio else None
+    _cache_worker = cache
+
+
+def _esegui_run_worker(seme, max_tick=None, politica_feltro=None):
+    return esegui_run(_scenario_worker, seme, max_tick, politica_feltro, _cache_worker)
+
+
+def _archivia_run_worker(indice, seme, max_tick=None, politica_feltro=None):
+    archivia_run(_archivio_worker, indice, _scenario_worker, seme, max_tick, politica_feltro)
+
+
+def crea_pool(scenario, processi=None, cartella_archivio=None, cache=None):
+    """
+    Pool di processi worker che hanno già ricevuto lo scenario (da usare come context manager).
+    Con cartella_archivio ogni worker apre anche l'archivio in scrittura; con una CacheRisultati
+    i run accodati con sottometti_run consultano e riempiono la cache.
+    """
+    contesto = multiprocessing.get_context(
+        "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    )
+    return ProcessPoolExecutor(max_workers=processi, mp_context=contesto,
+                               initializer=_inizializza_worker, initargs=(scenario, cartella_archivio, cache))
+
+
+def sottometti_run(pool, seme, max_tick=None, politica_feltro=None):
+    """Accoda un run sul pool di crea_pool(); restituisce il Future con i KPI."""
+    return pool.submit(_esegui_run_worker, seme, max_tick, politica_feltro)
+
+
+def esegui_batch(scenario, semi=None, processi=None, max_tick=None, politica_feltro=None, archivio=None,
+                 cache=None):
+    """
+    Esegue lo scenario per ogni seme (default: scenario.semi) e restituisce la lista dei KPI
+    nello stesso ordine dei semi. processi=1 esegue tutto nel processo corrente.
+    Con un archivio (creato sugli stessi semi) i run vengono scritti nell'archivio, che è restituito.
+    Con una CacheRisultati si simulano solo i semi non ancora in cache.
+    """
+    semi = list(scenario.semi if semi is None else semi)
+    if archivio is not None:
+        return _esegui_batch_archivio(scenario, semi, processi, max_tick, politica_feltro, archivio)
+    risultati = {}
+    if cache is not None:
+        for seme in semi:
+            risultato = cache.carica(cache.chiave(scenario, seme, max_tick, politica_feltro))
+            if risultato is not None:
+                risultati[seme] = risultato.kpi
+    mancanti = list(dict.fromkeys(seme for seme in semi if seme not in risultati))
+    if processi == 1 or len(mancanti) <= 1:
+        with silenzia_output():
+            risultati.update((seme, esegui_run(scenario, seme, max_tick, politica_feltro, cache)) for seme in mancanti)
+    else:
+        with crea_pool(scenario, processi, cache=cache) as pool:
+            futuri = [sottometti_run(pool, seme, max_tick, politica_feltro) for seme in mancanti]
+            risultati.update((seme, futuro.result()) for seme, futuro in zip(mancanti, futuri))
+    if cache is not None:
+        logger.info("Cache %s: %d run riusati, %d simulati", cache.cartella, len(semi) - len(mancanti), len(mancanti))
+    return [risultati[seme] for seme in semi]
+
+
+def _esegui_batch_archivio(scenario, semi, processi, max_tick, politica_feltro, archivio):
+    if list(archivio.kpi["seme"]) != semi:
+        raise ValueError("L'archivio è stato creato per semi diversi da quelli del batch")
+    if processi == 1 or len(semi) <= 1:
+        with silenzia_output():
+            for indice, seme in enumerate(semi):
+                archivia_run(archivio, indice, scenario, seme, max_tick, politica_feltro)
+    else:
+        with crea_pool(scenario, processi, archivio.cartella) as pool:
+            futuri = [pool.submit(_archivia_run_worker, indice, seme, max_tick, politica_feltro)
+                      for indice, seme in enumerate(semi)]
+            for futuro in futuri:
+                futuro.result()
+    archivio.flush()
+    return archivio
+
+
+def riepilogo_batch(risultati):
+    """Media, minimo e massimo dei KPI numerici principali sull'insieme dei run."""
+    riepilogo = {"n_run": len(risultati)}
+    for chiave in ("tempo_simulato", "tempo_perso", "percentuale_produzione", "peso_totale_t", "bobine_totali"):
+        valori = np.array([r[chiave] for r in risultati], dtype=float)
+        riepilogo[chiave] = {"media": float(valori.mean()), "min": float(valori.min()), "max": float(valori.max())}
+    return riepilogo
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Esecuzione batch di uno scenario su più semi")
+    parser.add_argument("scenario", help="file scenario (.json, .toml, .yaml)")
+    parser.add_argument("--processi", type=int, default=None, help="processi worker (default: CPU disponibili)")
+    parser.add_argument("--uscita", default="risultati_batch.json", help="file JSON dei risultati")
+    parser.add_argument("--archivio", default=None,
+                        help="cartella di un archivio memmap: i run vi vengono scritti e il JSON contiene solo il riepilogo")
+    parser.add_argument("--durata-serie-ore", type=float, default=72, help="lunghezza delle serie archiviate (ore)")
+    parser.add_argument("--max-bobine", type=int, default=200, help="bobine archiviate per run")
+    parser.add_argument("--max-ordini", type=int, default=20, help="ordini archiviati per run")
+    parser.add_argument("--cache", default=None, help="cartella della cache dei run (core.cacherisultati)")
+    parser.add_argument("--cache-mb", type=float, default=1024, help="dimensione massima della cache (MB)")
+    argomenti = parser.parse_args()
+    configura_output("console")
+    scenario = carica_scenario(argomenti.scenario)
+    logger.info("Scenario %s: %d run", scenario.nome, len(scenario.semi))
+    if argomenti.archivio:
+        archivio = ArchivioRisultati.crea(argomenti.archivio, scenario.semi, scenario.tick_reale,
+                                          durata_serie=argomenti.durata_serie_ore * 3600,
+                                          max_bobine=argomenti.max_bobine, max_ordini=argomenti.max_ordini,
+                                          scenario=scenario)
+        esegui_batch(scenario, processi=argomenti.processi, archivio=archivio)
+        with open(argomenti.uscita, "w") as f:
+            json.dump({"scenario": scenario.to_dict(), "riepilogo": archivio.riepilogo(),
+                       "archivio": argomenti.archivio}, f, indent=2)
+        logger.info("Run archiviati in %s, riepilogo in %s", argomenti.archivio, argomenti.uscita)
+        return
+    cache = CacheRisultati(argomenti.cache, argomenti.cache_mb) if argomenti.cache else None
+    risultati = esegui_batch(scenario, processi=argomenti.processi, cache=cache)
+    with open(argomenti.uscita, "w") as f:
+        json.dump({"scenario": scenario.to_dict(), "riepilogo": riepilogo_batch(risultati), "run": risultati}, f, indent=2)
+    logger.info("Risultati salvati in %s", argomenti.uscita)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,32 @@
 import numpy as np
 
+# Efficienze registrate nelle etichette di ogni bobina (additivi chimici = media degli additivi)
+EFFICIENZE_BOBINA = ("velocita tela", "concentrazione impasto %", "grado raffinazione", "temperatura cappa",
+                     "additivi chimici", "feltro")
+
 class Bobina:
     """
     Crea una nuova bobina da formare da 0
     """
-    def __init__(self, grammatura_target, sigma, indice_qualita, lunghezza_max=50000):
+    def __init__(self, grammatura_target, sigma, indice_qualita, lunghezza_max=50000, grammatura=None):
         self.lunghezza = 0
         self.peso_bobina = 0
         self.delta_peso_bobina = 0 #peso prodotto in un tick
         self.sigma = sigma
         self.grammatura_target = grammatura_target
-        self.grammatura = np.random.normal(self.grammatura_target, self.sigma)
+        # grammatura imposta (replay da log) oppure estratta attorno al target
+        self.grammatura = np.random.normal(self.grammatura_target, self.sigma) if grammatura is None else grammatura
         self.lunghezza_max = lunghezza_max
         self.completata = False
         self.indice_qualita = indice_qualita
+        # contesto per l'analisi qualità (ordine, feltro, efficienze, tempi), vedi MacchinaContinua.etichetta_bobina
+        self.etichette = {}
         
 
-    def aggiorna_peso(self, tick_duration, velocita_tela, larghezza=2.75):
+    def aggiorna_peso(self, tick_duration, velocita_tela, larghezza=2.75, fattore_grammatura=1.0):
         """
         Aggiorna peso bobina di un tick di simulazione (5 sec)
+        fattore_grammatura: scostamento della grammatura nel tick (deriva della concentrazione, core.deriva)
         """
         # velocità pope: si considera che la velocità effettiva sia l'85% della velocità tela
         velocita_pope = velocita_tela * 0.85
@@ -26,7 +34,7 @@ class Bobina:
         delta_lunghezza = velocita_pope * tick_duration
         self.lunghezza += delta_lunghezza
         # Calcolo del peso aggiunto (in kg)
-        self.delta_peso_bobina = delta_lunghezza * self.grammatura * larghezza / 1000
+        self.delta_peso_bobina = delta_lunghezza * self.grammatura * larghezza / 1000 * fattore_grammatura
         self.peso_bobina += self.delta_peso_bobina
         # Controllo completamento bobina
         if self.lunghezza >= self.lunghezza_max:
@@ -35,12 +43,14 @@ class Bobina:
 
     def to_dict(self):
         return {
-            "grammatura ottenuta": round(self.grammatura, 2),
-            "grammatura target": round(self.grammatura_target, 2),
+            # grammature a piena precisione: il replay (core.replay) le riusa per ricostruire il peso esatto
+            "grammatura ottenuta": float(self.grammatura),
+            "grammatura target": float(self.grammatura_target),
             "lunghezza": round(self.lunghezza, 2),
             "peso_bobina": round(self.peso_bobina, 2),
             "completata": self.completata,
-            "indice_qualita": round(self.indice_qualita, 3)
+            "indice_qualita": round(self.indice_qualita, 3),
+            **self.etichette
         }
 
     def __repr__(self):
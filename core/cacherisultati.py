@@ -0,0 +1,183 @@
+"""
+Cache su disco dei run già simulati, indirizzata per contenuto.
+
+La chiave di un run è l'hash di tutto ciò che ne determina il risultato: contenuto dello scenario
+(ordini, ricette, eventi, macchina; i semi del batch esclusi), seme, max_tick, politica del feltro e
+versione del motore, cioè l'hash dei sorgenti dei moduli che simulano (MODULI_MOTORE): modificare il
+codice invalida da sé le voci vecchie. Ogni voce è un file .npz compresso con i KPI del run (come
+esegui_run), la serie del peso cumulato, il log delle bobine, il log degli eventi e il riepilogo OEE.
+
+Le scritture sono atomiche (file temporaneo + rename), quindi più processi, anche worker di un pool,
+possono condividere la stessa cartella. La dimensione è limitata con sfratto LRU: l'ultimo accesso è
+la data di modifica del file, aggiornata a ogni lettura. Ogni istanza controlla il limite con la
+dimensione stimata dalle proprie scritture e fa una scansione completa solo quando lo supera.
+
+Uso:
+    cache = CacheRisultati("cache_run", limite_mb=2048)
+    esegui_batch(scenario, cache=cache)           # simula solo i semi non ancora in cache
+    risultato = risultato_run(scenario, 7, cache=cache)   # KPI, serie, bobine, eventi, OEE
+"""
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from core.archivio import VistaSerie
+from core.feltro import PoliticaFeltro
+
+# Moduli il cui sorgente entra nella versione del motore
+MODULI_MOTORE = ("batch", "bobina", "deriva", "evento", "feltro", "kernel", "macchinacontinua", "oee",
+                 "programmaproduzione", "registroeventi", "reportstatistica", "scenario", "simclock", "tracker")
+
+_versione_motore = None
+
+
+def versione_motore():
+    """Hash dei sorgenti di MODULI_MOTORE (calcolato una volta per processo)."""
+    global _versione_motore
+    if _versione_motore is None:
+        impronta = hashlib.sha256()
+        for nome in MODULI_MOTORE:
+            with open(importlib.util.find_spec(f"core.{nome}").origin, "rb") as f:
+                impronta.update(f.read())
+        _versione_motore = impronta.hexdigest()[:16]
+    return _versione_motore
+
+
+def chiave_run(scenario, seme, max_tick=None, politica_feltro=None):
+    """Chiave (hex) del run: stesso valore per gli stessi ingressi con la stessa versione del motore."""
+    dati = scenario.to_dict()
+    dati.pop("batch")
+    if politica_feltro is None:
+        politica_feltro = PoliticaFeltro(**scenario.politica_feltro)
+    ingressi = {"scenario": dati, "seme": int(seme), "max_tick": max_tick,
+                "politica_feltro": politica_feltro.to_dict(), "motore": versione_motore()}
+    return hashlib.sha256(json.dumps(ingressi, sort_keys=True).encode()).hexdigest()
+
+
+class RisultatoRun:
+    """
+    Risultato completo di un run, letto dalla cache o preso dalla macchina a fine run.
+    kpi: dizionario di esegui_run; tracker: serie del peso cumulato (t) con l'interfaccia di
+    ProgressTracker; bobine ed eventi: log della macchina; oee: MotoreOEE.riepilogo().
+    """
+    def __init__(self, kpi, serie, tick_reale, bobine, eventi, oee):
+        self.kpi = kpi
+        self.serie = serie
+        self.tick_reale = tick_reale
+        self.bobine = bobine
+        self.eventi = eventi
+        self.oee = oee
+
+    @classmethod
+    def da_macchina(cls, macchina, kpi):
+        return cls(kpi, np.asarray(macchina.tracker_simulazione.y, dtype=float), macchina.tick_reale,
+                   macchina.log_bobine, list(macchina.evento.log_eventi), macchina.oee.riepilogo(macchina))
+
+    @property
+    def tracker(self):
+        """Serie come tracker (per plot_progress / ReportStatistica.grafico_simulazione)."""
+        return VistaSerie(f"simulazione seme {self.kpi.get('seme')}",
+                          np.arange(len(self.serie)) * self.tick_reale, self.serie)
+
+    def _dati(self):
+        return {"kpi": self.kpi, "tick_reale": self.tick_reale, "bobine": self.bobine,
+                "eventi": self.eventi, "oee": self.oee}
+
+
+class CacheRisultati:
+    """Cartella di voci <chiave[:2]>/<chiave>.npz con limite di dimensione (MB) e sfratto LRU."""
+    def __init__(self, cartella, limite_mb=1024):
+        self.cartella = cartella
+        self.limite = int(limite_mb * 1024 * 1024)
+        self.colpi = 0
+        self.mancati = 0
+        os.makedirs(cartella, exist_ok=True)
+        self._dimensione = self.dimensione()
+
+    def __getstate__(self):
+        # ai worker del pool arrivano cartella e limite; la stima della dimensione riparte da una scansione
+        return {"cartella": self.cartella, "limite_mb": self.limite / (1024 * 1024)}
+
+    def __setstate__(self, stato):
+        self.__init__(stato["cartella"], stato["limite_mb"])
+
+    chiave = staticmethod(chiave_run)
+
+    def _percorso(self, chiave):
+        return os.path.join(self.cartella, chiave[:2], f"{chiave}.npz")
+
+    def _voci(self):
+        """(percorso, dimensione, ultimo accesso) di ogni voce presente."""
+        voci = []
+        for cartella in os.scandir(self.cartella):
+            if not cartella.is_dir():
+                continue
+            for voce in os.scandir(cartella.path):
+                if voce.name.endswith(".npz"):
+                    try:
+                        info = voce.stat()
+                    except FileNotFoundError:    # sfrattata da un altro processo
+                        continue
+                    voci.append((voce.path, info.st_size, info.st_mtime))
+        return voci
+
+    def dimensione(self):
+        return sum(dimensione for _, dimensione, _ in self._voci())
+
+    def __len__(self):
+        return len(self._voci())
+
+    def __contains__(self, chiave):
+        return os.path.exists(self._percorso(chiave))
+
+    def carica(self, chiave):
+        """RisultatoRun della chiave, o None se il run non è in cache."""
+        percorso = self._percorso(chiave)
+        try:
+            with np.load(percorso) as voce:
+                dati = json.loads(voce["dati"].tobytes())
+                serie = voce["serie"]
+            os.utime(percorso)
+        except (FileNotFoundError, ValueError, OSError):
+            self.mancati += 1
+            return None
+        self.colpi += 1
+        return RisultatoRun(dati["kpi"], serie, dati["tick_reale"], dati["bobine"], dati["eventi"], dati["oee"])
+
+    def salva(self, chiave, risultato):
+        """Scrive la voce (sostituisce atomicamente un'eventuale voce con la stessa chiave)."""
+        percorso = self._percorso(chiave)
+        os.makedirs(os.path.dirname(percorso), exist_ok=True)
+        buffer = io.BytesIO()
+        dati = np.frombuffer(json.dumps(risultato._dati()).encode(), dtype=np.uint8)
+        np.savez_compressed(buffer, dati=dati, serie=risultato.serie)
+        descrittore, temporaneo = tempfile.mkstemp(dir=os.path.dirname(percorso), suffix=".tmp")
+        with os.fdopen(descrittore, "wb") as f:
+            f.write(buffer.getbuffer())
+        os.replace(temporaneo, percorso)
+        self._dimensione += buffer.getbuffer().nbytes
+        if self._dimensione > self.limite:
+            self.pulisci()
+
+    def pulisci(self, limite=None):
+        """Sfratta le voci usate meno di recente fino al 90% del limite; restituisce quante ne ha tolte."""
+        limite = self.limite if limite is None else limite
+        voci = sorted(self._voci(), key=lambda voce: voce[2])
+        totale = sum(dimensione for _, dimensione, _ in voci)
+        sfrattate = 0
+        for percorso, dimensione, _ in voci:
+            if totale <= 0.9 * limite:
+                break
+            try:
+                os.remove(percorso)
+            except FileNotFoundError:
+                pass
+            totale -= dimensione
+            sfrattate += 1
+        self._dimensione = totale
+        return sfrattate
@@ -0,0 +1,452 @@
+"""
+Calibrazione dei parametri degli eventi dai log delle campagne (log_eventi_dettagliati.json, reali o simulate).
+
+I log si leggono in colonne (tempo, durata, tipo) e ogni stima è un'operazione vettoriale sull'intero
+log, quindi anche milioni di voci si calibrano in pochi secondi (il tempo va quasi tutto nella lettura
+del JSON). Le voci allo stesso tempo simulato sono un fermo, come in core.batch.tempo_perso_per_evento;
+un fermo che inizia mentre un altro è in corso (es. rottura durante il cambio bobina) ne fa parte.
+
+Stime (massima verosimiglianza con dati censurati):
+  - guasto macchina, rottura carta: rischio costante per tick di produzione. Il tempo di esposizione è
+    il tempo in produzione, cioè la campagna meno l'unione dei fermi; l'intervallo tra l'ultimo evento
+    e la fine del log è censurato a destra. λ = eventi / tick esposti (p per tick), scritto come
+    probabilità del 50% su periodo_sec = ln 2 / λ. Il controllo dell'ipotesi di rischio costante è una
+    Weibull censurata sugli intervalli in tempo di produzione (rapporto di verosimiglianza sulla forma)
+    più il test di Kolmogorov-Smirnov degli intervalli rispetto all'esponenziale;
+  - rottura carta cambio bobina, pulizia macchina extra: frequenza binomiale (rotture durante un cambio
+    bobina sui cambi bobina, pulizie extra sui fermi che non sono cambi bobina);
+  - pulizia macchina, cambio lama crespatura: intervalli in tempo di produzione dal reset del timer
+    (mediana per la pulizia, minimo e massimo in ore per la lama);
+  - durate: per ogni tipo le distribuzioni del formato scenario (fissa, uniforme, normale) stimate con
+    le durate censurate alla fine del log, scelta per AIC e test KS della scelta.
+Il rischio di rottura del feltro per fascia (Feltro.FASCE) non è un parametro di scenario: gli
+intervalli tra cambi feltro compaiono solo nel rapporto, con la loro Weibull.
+
+Il risultato è una sezione "eventi" (formato PARAMETRI_EVENTI_DEFAULT), scritta come scenario JSON
+(validato con core.scenario) eventualmente sopra uno scenario di partenza, e un rapporto di bontà
+dell'adattamento.
+
+Avvio: python -m core.calibrazione log_eventi_dettagliati.json [altri log...] --output scenari/calibrato.json
+"""
+import argparse
+import json
+import logging
+import math
+
+import numpy as np
+
+from core.console import configura_output
+from core.evento import PARAMETRI_EVENTI_DEFAULT
+from core.registroeventi import EXTRA
+from core.scenario import leggi_file_scenario, scenario_da_dict
+
+logger = logging.getLogger("core.calibrazione")
+
+RISCHI = ("guasto macchina", "rottura carta")
+CAMBIO_BOBINA = "cambio bobina"
+MIN_EVENTI = 2      # eventi minimi per sostituire il valore predefinito
+
+_erfc = np.frompyfunc(math.erfc, 1, 1)
+
+
+class LogEventi:
+    """Colonne di un log eventi in ordine di tempo: tempi, durate e codici del tipo (indici di `tipi`)."""
+    def __init__(self, tempi, durate, codici, tipi, fine=None, tick_reale=5):
+        self.tempi = np.asarray(tempi, dtype=float)
+        self.durate = np.asarray(durate, dtype=float)
+        self.codici = np.asarray(codici, dtype=np.int64)
+        self.tipi = tuple(tipi)
+        self.tick_reale = tick_reale
+        # senza fine esplicita il log termina all'ultima voce (con main.py è il cambio produzione finale)
+        self.fine = float(fine) if fine is not None else (float(self.tempi[-1]) if len(self.tempi) else 0.0)
+        if np.any(np.diff(self.tempi) < 0):
+            raise ValueError("Log eventi non ordinato per tempo simulato")
+
+    def __len__(self):
+        return len(self.tempi)
+
+    @classmethod
+    def da_voci(cls, voci, fine=None, tick_reale=5):
+        """Dalle voci di Evento.log_eventi (lista di dizionari)."""
+        codici_tipo = {}
+        codici = np.fromiter((codici_tipo.setdefault(voce["evento"], len(codici_tipo)) for voce in voci),
+                             dtype=np.int64, count=len(voci))
+        tempi = np.fromiter((voce["tempo_simulato"] for voce in voci), dtype=float, count=len(voci))
+        durate = np.fromiter((voce["durata"] for voce in voci), dtype=float, count=len(voci))
+        return cls(tempi, durate, codici, codici_tipo, fine, tick_reale)
+
+    @classmethod
+    def da_registro(cls, registro, fine=None):
+        """Dalle colonne di un RegistroEventi (core.registroeventi), senza ripassare le voci."""
+        tipi = sorted(registro.codici_tipo, key=registro.codici_tipo.get)
+        return cls(np.frombuffer(registro.tempi), np.frombuffer(registro.durate),
+                   np.frombuffer(registro.tipi, dtype=np.int8), tipi, fine, registro.tick_reale)
+
+    def codice(self, tipo):
+        return self.tipi.index(tipo) if tipo in self.tipi else -1
+
+
+def leggi_log(percorso, fine=None, tick_reale=5):
+    """Legge log_eventi_dettagliati.json (dizionario con "eventi" o lista di voci) o un NDJSON di voci."""
+    with open(percorso, encoding="utf-8") as f:
+        if percorso.endswith((".ndjson", ".jsonl")):
+            voci = [json.loads(riga) for riga in f if riga.strip()]
+        else:
+            dati = json.load(f)
+            voci = dati["eventi"] if isinstance(dati, dict) else dati
+    return LogEventi.da_voci(voci, fine, tick_reale)
+
+
+class Fermi:
+    """
+    Fermi di un log: voci allo stesso tempo raggruppate, durata come in esegui_tick (durata massima più
+    pulizia extra, arrotondata al tick) e tempo di produzione trascorso all'inizio di ogni fermo.
+    """
+    def __init__(self, log):
+        self.log = log
+        nuovo = np.ones(len(log), dtype=bool)
+        nuovo[1:] = log.tempi[1:] != log.tempi[:-1]
+        self.prima_voce = np.flatnonzero(nuovo)
+        self.fermo_voce = np.cumsum(nuovo) - 1                  # fermo di ogni voce
+        self.inizi = log.tempi[self.prima_voce]
+        extra = log.codici == log.codice(EXTRA)
+        principale = np.maximum.reduceat(np.where(extra, 0, log.durate), self.prima_voce) if len(log) else np.zeros(0)
+        aggiunta = np.add.reduceat(np.where(extra, log.durate, 0), self.prima_voce) if len(log) else np.zeros(0)
+        tick = log.tick_reale
+        self.fini = np.minimum(self.inizi + np.ceil((principale + aggiunta) / tick) * tick, max(log.fine, 0))
+        # unione dei fermi: fine massima raggiunta finora e tratto nuovo coperto da ogni fermo
+        self.fine_corrente = np.maximum.accumulate(self.fini) if len(self.fini) else self.fini
+        precedente = np.concatenate(([-np.inf], self.fine_corrente[:-1]))
+        coperto = np.maximum(0, self.fine_corrente - np.maximum(self.inizi, precedente))
+        cumulato = np.concatenate(([0.0], np.cumsum(coperto)))
+        # un fermo che inizia dentro un fermo in corso non interrompe la produzione
+        self.annidato = self.inizi < precedente
+        fermo_prima = cumulato[:-1] - np.maximum(0, precedente - self.inizi)
+        self.produzione = self.inizi - fermo_prima              # tempo di produzione all'inizio del fermo
+        self.esposizione = log.fine - cumulato[-1]              # tempo in produzione di tutto il log
+
+    def fermi_con(self, tipo):
+        """Indici dei fermi con almeno una voce del tipo."""
+        return np.unique(self.fermo_voce[self.log.codici == self.log.codice(tipo)])
+
+
+# --- distribuzioni ---
+
+def _normale_cdf(z):
+    return 0.5 * _erfc(-np.asarray(z, dtype=float) / math.sqrt(2)).astype(float)
+
+
+def _normale_pdf(z):
+    return np.exp(-0.5 * z * z) / math.sqrt(2 * math.pi)
+
+
+def ks_pvalue(d, n):
+    """p-value asintotico di Kolmogorov per la statistica D su n campioni."""
+    if n == 0:
+        return None
+    x = (math.sqrt(n) + 0.12 + 0.11 / math.sqrt(n)) * d
+    if x < 0.2:
+        return 1.0
+    k = np.arange(1, 101)
+    return float(min(1.0, max(0.0, 2 * np.sum((-1.0) ** (k - 1) * np.exp(-2 * k * k * x * x)))))
+
+
+def statistica_ks(valori, cdf):
+    """
+    Distanza di Kolmogorov-Smirnov tra i valori e la funzione di ripartizione (vettoriale). Il confronto
+    avviene nei valori distinti e subito prima, così vale anche per le distribuzioni discrete (durate intere).
+    """
+    valori = np.sort(valori)
+    n = len(valori)
+    if n == 0:
+        return 0.0
+    distinti = np.unique(valori)
+    empirica = np.searchsorted(valori, distinti, side="right") / n
+    empirica_prima = np.searchsorted(valori, distinti, side="left") / n
+    prima = distinti - 1e-6 * np.maximum(1, np.abs(distinti))
+    return float(max(np.max(np.abs(empirica - cdf(distinti))), np.max(np.abs(empirica_prima - cdf(prima)))))
+
+
+def weibull_censurata(x, osservato, iterazioni=50):
+    """
+    Weibull (forma, scala) di massima verosimiglianza con censura a destra (osservato False), per
+    Newton sull'equazione di profilo della forma. Restituisce (forma, scala, log-verosimiglianza).
+    """
+    x = np.maximum(np.asarray(x, dtype=float), 1e-9)
+    r = int(osservato.sum())
+    if r == 0:
+        return None, None, None
+    unita = x.mean()
+    y = x / unita
+    log_y = np.log(y)
+    media_log = log_y[osservato].mean()
+    forma = 1.0
+    for _ in range(iterazioni):
+        yk = y ** forma
+        s0, s1, s2 = yk.sum(), (yk * log_y).sum(), (yk * log_y * log_y).sum()
+        g = s1 / s0 - 1 / forma - media_log
+        derivata = s2 / s0 - (s1 / s0) ** 2 + 1 / forma ** 2
+        passo = g / derivata
+        forma = max(forma - passo, forma / 2)
+        if abs(passo) < 1e-10 * forma:
+            break
+    scala_y = ((y ** forma).sum() / r) ** (1 / forma)
+    log_x = log_y + math.log(unita)
+    scala = scala_y * unita
+    verosimiglianza = (r * math.log(forma) - r * forma * math.log(scala) + (forma - 1) * log_x[osservato].sum()
+                       - ((x / scala) ** forma).sum())
+    return float(forma), float(scala), float(verosimiglianza)
+
+
+def adatta_durate(durate, censura):
+    """
+    Distribuzioni di durata del formato scenario stimate su `durate` (censura: valore osservato
+    parziale, durata >= valore). Restituisce (migliore, candidati) con log-verosimiglianza, AIC e KS.
+    """
+    complete = durate[~censura]
+    parziali = durate[censura]
+    candidati = {}
+    if len(complete) == 0:
+        return None, candidati
+    if np.all(complete == complete[0]) and np.all(parziali <= complete[0]):
+        valore = int(complete[0])
+        candidati["fissa"] = {"parametri": {"distribuzione": "fissa", "valore": valore},
+                              "log_verosimiglianza": 0.0, "aic": 2.0, "ks": 0.0,
+                              "cdf": lambda v: (v >= valore).astype(float)}
+    else:
+        # uniforme discreta [a, b]: a è il minimo; b massimizza -n log(b-a+1) + Σ log(b-c) dei censurati
+        a = int(complete.min())
+        b0 = int(max(complete.max(), parziali.max() + 1 if len(parziali) else 0))
+        griglia = b0 + np.arange(max(1, b0 - a + 1))
+        verosimiglianze = -len(durate) * np.log(griglia - a + 1.0)
+        if len(parziali):
+            verosimiglianze = verosimiglianze + np.log(np.maximum(griglia[:, None] - parziali[None, :], 1e-300)).sum(axis=1)
+        b = int(griglia[np.argmax(verosimiglianze)])
+        candidati["uniforme"] = {"parametri": {"distribuzione": "uniforme", "min": a, "max": b},
+                                 "log_verosimiglianza": float(verosimiglianze.max()),
+                                 "aic": 4 - 2 * float(verosimiglianze.max()),
+                                 "cdf": lambda v: np.clip((np.floor(v) - a + 1) / (b - a + 1), 0, 1)}
+        # normale: EM con le durate censurate sostituite dai momenti della normale troncata
+        media, sigma = complete.mean(), max(complete.std(), 1e-6)
+        for _ in range(100 if len(parziali) else 1):
+            if len(parziali):
+                z = (parziali - media) / sigma
+                coda = np.maximum(1 - _normale_cdf(z), 1e-300)
+                hazard = _normale_pdf(z) / coda
+                primo = media + sigma * hazard
+                secondo = media ** 2 + sigma ** 2 + sigma * (parziali + media) * hazard
+            else:
+                primo = secondo = np.zeros(0)
+            n = len(durate)
+            nuova_media = (complete.sum() + primo.sum()) / n
+            sigma = math.sqrt(max(((complete ** 2).sum() + secondo.sum()) / n - nuova_media ** 2, 1e-12))
+            if abs(nuova_media - media) < 1e-9 * max(1, abs(media)):
+                media = nuova_media
+                break
+            media = nuova_media
+        z = (complete - media) / sigma
+        verosimiglianza = float(np.sum(np.log(np.maximum(_normale_pdf(z), 1e-300)) - math.log(sigma)))
+        if len(parziali):
+            verosimiglianza += float(np.log(np.maximum(1 - _normale_cdf((parziali - media) / sigma), 1e-300)).sum())
+        candidati["normale"] = {"parametri": {"distribuzione": "normale", "media": round(float(media), 1),
+                                              "sigma": round(float(sigma), 1)},
+                                "log_verosimiglianza": verosimiglianza, "aic": 4 - 2 * verosimiglianza,
+                                "cdf": lambda v: _normale_cdf((v - media) / sigma)}
+    for candidato in candidati.values():
+        candidato["ks"] = statistica_ks(complete, candidato.pop("cdf"))
+        candidato["ks_pvalue"] = ks_pvalue(candidato["ks"], len(complete))
+    migliore = min(candidati, key=lambda nome: candidati[nome]["aic"])
+    return migliore, candidati
+
+
+# --- stime sui log ---
+
+def _intervalli(fermi, indici):
+    """Intervalli in tempo di produzione tra gli eventi (fermi `indici`) e ultimo intervallo censurato."""
+    tempi = fermi.produzione[indici]
+    x = np.diff(np.concatenate(([0.0], tempi, [fermi.esposizione])))
+    osservato = np.ones(len(x), dtype=bool)
+    osservato[-1] = False
+    return x, osservato
+
+
+def calibra(logs):
+    """
+    Stime su uno o più log (campagne indipendenti). Restituisce (eventi, rapporto): eventi è la sezione
+    "eventi" calibrata (solo i tipi con dati sufficienti), rapporto contiene stime e bontà di adattamento.
+    """
+    if isinstance(logs, LogEventi):
+        logs = [logs]
+    tick = logs[0].tick_reale
+    esposizione = 0.0
+    intervalli = {tipo: [] for tipo in (*RISCHI, "cambio feltro")}
+    timer = {"pulizia macchina": [], "cambio lama crespatura": []}
+    cambi_bobina = rotture_cambio = fermi_senza_cambio = fermi_con_extra = 0
+    durate, censure = {}, {}
+    for log in logs:
+        fermi = Fermi(log)
+        esposizione += fermi.esposizione
+        liberi = ~fermi.annidato
+        for tipo in intervalli:
+            indici = fermi.fermi_con(tipo)
+            indici = indici[liberi[indici]]
+            if len(indici) or tipo in RISCHI:
+                intervalli[tipo].append(_intervalli(fermi, indici))
+        # timer di pulizia: riparte a ogni pulizia e a ogni pulizia extra
+        pulizie = fermi.fermi_con("pulizia macchina")
+        reset = np.union1d(pulizie, fermi.fermi_con(EXTRA))
+        if len(pulizie):
+            posizione = np.searchsorted(reset, pulizie)
+            precedente = np.where(posizione > 0, fermi.produzione[reset[np.maximum(posizione - 1, 0)]], 0.0)
+            timer["pulizia macchina"].append(fermi.produzione[pulizie] - precedente)
+        lame = fermi.fermi_con("cambio lama crespatura")
+        if len(lame):
+            timer["cambio lama crespatura"].append(np.diff(np.concatenate(([0.0], fermi.produzione[lame]))))
+        # frequenze binomiali
+        con_bobina = np.zeros(len(fermi.inizi), dtype=bool)
+        con_bobina[fermi.fermi_con(CAMBIO_BOBINA)] = True
+        con_rottura = np.zeros(len(fermi.inizi), dtype=bool)
+        con_rottura[fermi.fermi_con("rottura carta")] = True
+        con_extra = np.zeros(len(fermi.inizi), dtype=bool)
+        con_extra[fermi.fermi_con(EXTRA)] = True
+        cambi_bobina += int(np.sum(con_bobina & liberi))
+        rotture_cambio += int(np.sum(con_rottura & fermi.annidato))
+        fermi_senza_cambio += int(np.sum(~con_bobina))
+        fermi_con_extra += int(np.sum(con_extra & ~con_bobina))
+        # durate, censurate alla fine del log
+        for codice, tipo in enumerate(log.tipi):
+            voci = log.codici == codice
+            osservabile = log.fine - log.tempi[voci]
+            durate.setdefault(tipo, []).append(np.minimum(log.durate[voci], osservabile))
+            censure.setdefault(tipo, []).append(log.durate[voci] > osservabile)
+
+    eventi, rapporto = {}, {"esposizione_sec": esposizione, "log": len(logs), "voci": int(sum(map(len, logs))),
+                            "rischi": {}, "binomiali": {}, "timer": {}, "durate": {}}
+    for tipo, serie in intervalli.items():
+        if not serie:
+            continue
+        x = np.concatenate([s[0] for s in serie])
+        osservato = np.concatenate([s[1] for s in serie])
+        r = int(osservato.sum())
+        p_tick = r * tick / esposizione if esposizione > 0 else 0.0
+        tasso = -math.log1p(-min(p_tick, 1 - 1e-12)) / tick
+        voce = {"eventi": r, "tasso_per_ora": tasso * 3600, "mtbf_ore": 1 / tasso / 3600 if tasso else None}
+        if r:
+            errore = tasso / math.sqrt(r)
+            voce["ic95_tasso_per_ora"] = [max(0.0, tasso - 1.96 * errore) * 3600, (tasso + 1.96 * errore) * 3600]
+            forma, scala, verosimiglianza_w = weibull_censurata(x, osservato)
+            verosimiglianza_e = r * math.log(tasso) - tasso * x.sum()
+            rapporto_v = max(0.0, 2 * (verosimiglianza_w - verosimiglianza_e))
+            ks = statistica_ks(x[osservato], lambda v: 1 - np.exp(-tasso * v))
+            voce.update({"weibull_forma": forma, "weibull_scala_ore": scala / 3600,
+                         "lr_forma": rapporto_v, "lr_pvalue": math.erfc(math.sqrt(rapporto_v / 2)),
+                         "ks": ks, "ks_pvalue": ks_pvalue(ks, r)})
+        rapporto["rischi"][tipo] = voce
+        if tipo in RISCHI and r >= MIN_EVENTI:
+            eventi[tipo] = {"probabilita": 50, "periodo_sec": max(1, round(math.log(2) / tasso))}
+
+    for tipo, (k, n) in {"rottura carta cambio bobina": (rotture_cambio, cambi_bobina),
+                         EXTRA: (fermi_con_extra, fermi_senza_cambio)}.items():
+        p = k / n if n else None
+        voce = {"successi": k, "prove": n, "probabilita": p}
+        if n:
+            errore = math.sqrt(p * (1 - p) / n)
+            voce["ic95"] = [max(0.0, p - 1.96 * errore), min(1.0, p + 1.96 * errore)]
+        rapporto["binomiali"][tipo] = voce
+        if n >= MIN_EVENTI:
+            eventi[tipo] = {"probabilita": round(100 * min(p, 0.9999), 4)}
+
+    for tipo, serie in timer.items():
+        x = np.concatenate(serie) if serie else np.zeros(0)
+        rapporto["timer"][tipo] = {"n": len(x), "min_ore": float(x.min()) / 3600 if len(x) else None,
+                                   "mediana_ore": float(np.median(x)) / 3600 if len(x) else None,
+                                   "max_ore": float(x.max()) / 3600 if len(x) else None}
+        if len(x) >= MIN_EVENTI:
+            if tipo == "pulizia macchina":
+                eventi[tipo] = {"intervallo_sec": max(1, int(round(np.median(x) / tick)) * tick)}
+            else:
+                eventi[tipo] = {"intervallo_ore_min": max(1, int(round(x.min() / 3600))),
+                                "intervallo_ore_max": max(1, int(round(x.max() / 3600)))}
+
+    for tipo in durate:
+        valori = np.concatenate(durate[tipo])
+        censura = np.concatenate(censure[tipo])
+        migliore, candidati = adatta_durate(valori, censura)
+        rapporto["durate"][tipo] = {"n": len(valori), "censurate": int(censura.sum()), "scelta": migliore,
+                                    "candidati": candidati}
+        if migliore is not None and int((~censura).sum()) >= MIN_EVENTI and "durata" in PARAMETRI_EVENTI_DEFAULT.get(tipo, {}):
+            eventi.setdefault(tipo, {})["durata"] = candidati[migliore]["parametri"]
+    if "rottura carta cambio bobina" in eventi:
+        # la probabilità vale sull'intero cambio bobina
+        durata_cambio = eventi.get(CAMBIO_BOBINA, {}).get("durata", PARAMETRI_EVENTI_DEFAULT[CAMBIO_BOBINA]["durata"])
+        eventi["rottura carta cambio bobina"]["periodo_sec"] = max(1, int(durata_cambio.get(
+            "valore", durata_cambio.get("media", (durata_cambio.get("min", 0) + durata_cambio.get("max", 0)) / 2))))
+    return eventi, rapporto
+
+
+def scenario_calibrato(eventi, base=None, nome=None):
+    """Dati dello scenario (dizionario) con la sezione eventi calibrata sopra lo scenario `base` (percorso)."""
+    dati = leggi_file_scenario(base) if base else {}
+    sezione = dict(dati.get("eventi", {}))
+    for tipo, valori in eventi.items():
+        sezione[tipo] = {**sezione.get(tipo, {}), **valori}
+    dati = {**dati, "eventi": sezione}
+    dati["nome"] = nome or f"{dati.get('nome', 'campagna')} (calibrato)"
+    scenario_da_dict(dati)    # solleva ErroreScenario se il risultato non è caricabile
+    return dati
+
+
+def testo_rapporto(rapporto):
+    """Rapporto di bontà dell'adattamento in forma tabellare."""
+    righe = [f"Log: {rapporto['log']}, voci: {rapporto['voci']}, tempo in produzione: "
+             f"{rapporto['esposizione_sec'] / 3600:.1f} h", "", "Rischi (tempo di produzione)"]
+    for tipo, v in rapporto["rischi"].items():
+        if not v["eventi"]:
+            righe.append(f"  {tipo:<24} nessun evento")
+            continue
+        righe.append(f"  {tipo:<24} n={v['eventi']:<8} λ={v['tasso_per_ora']:.4g}/h "
+                     f"[{v['ic95_tasso_per_ora'][0]:.4g}, {v['ic95_tasso_per_ora'][1]:.4g}]  MTBF={v['mtbf_ore']:.2f} h  "
+                     f"Weibull k={v['weibull_forma']:.3f} (LR p={v['lr_pvalue']:.3f})  KS={v['ks']:.3f} (p={v['ks_pvalue']:.3f})")
+    righe += ["", "Probabilità"]
+    for tipo, v in rapporto["binomiali"].items():
+        stima = f"{v['probabilita']:.4f} [{v['ic95'][0]:.4f}, {v['ic95'][1]:.4f}]" if v["prove"] else "n.d."
+        righe.append(f"  {tipo:<28} {v['successi']}/{v['prove']}  p={stima}")
+    righe += ["", "Timer (ore di produzione)"]
+    for tipo, v in rapporto["timer"].items():
+        stima = f"min {v['min_ore']:.2f}  mediana {v['mediana_ore']:.2f}  max {v['max_ore']:.2f}" if v["n"] else "n.d."
+        righe.append(f"  {tipo:<24} n={v['n']:<6} {stima}")
+    righe += ["", "Durate (s)"]
+    for tipo, v in rapporto["durate"].items():
+        righe.append(f"  {tipo}  n={v['n']} censurate={v['censurate']}")
+        for nome, c in v["candidati"].items():
+            segno = "*" if nome == v["scelta"] else " "
+            parametri = {k: p for k, p in c["parametri"].items() if k != "distribuzione"}
+            righe.append(f"   {segno}{nome:<9} {json.dumps(parametri):<36} AIC={c['aic']:<12.1f} "
+                         f"KS={c['ks']:.3f} (p={c['ks_pvalue']:.3f})")
+    return "\n".join(righe)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrazione dei parametri evento dai log delle campagne")
+    parser.add_argument("log", nargs="+", help="log_eventi_dettagliati.json (o NDJSON di voci)")
+    parser.add_argument("--tick", type=int, default=5, help="tick reale (s) della campagna")
+    parser.add_argument("--fine", type=float, default=None,
+                        help="tempo simulato di fine campagna (default: ultima voce del log)")
+    parser.add_argument("--base", default=None, help="scenario di partenza su cui scrivere gli eventi")
+    parser.add_argument("--output", default=None, help="scenario calibrato (JSON)")
+    parser.add_argument("--rapporto", default=None, help="rapporto di adattamento (JSON)")
+    argomenti = parser.parse_args()
+    configura_output("console")
+    logs = [leggi_log(percorso, argomenti.fine, argomenti.tick) for percorso in argomenti.log]
+    eventi, rapporto = calibra(logs)
+    logger.info("%s", testo_rapporto(rapporto))
+    if argomenti.output:
+        with open(argomenti.output, "w", encoding="utf-8") as f:
+            json.dump(scenario_calibrato(eventi, argomenti.base), f, indent=2, ensure_ascii=False)
+    if argomenti.rapporto:
+        with open(argomenti.rapporto, "w", encoding="utf-8") as f:
+            json.dump(rapporto, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
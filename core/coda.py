@@ -0,0 +1,489 @@
+"""
+Esecuzione distribuita di una griglia di scenari × semi tramite una coda di lavoro HTTP.
+
+Il coordinatore espande gli scenari nella griglia dei run (scenario, seme) e la serve su HTTP/JSON
+(stesso server minimale di core.servizio, solo libreria standard). I worker, su qualunque numero di
+macchine, chiedono un lease di alcuni run, li eseguono con core.batch e restituiscono i soli KPI.
+Durante l'esecuzione il worker invia battiti che prolungano il lease; un lease non rinnovato entro
+la scadenza (worker perso) rimette i run non consegnati in coda, fino a max_tentativi assegnazioni.
+I risultati sono deduplicati per (scenario, seme): lo scenario è identificato dall'hash del suo
+contenuto, quindi lo stesso scenario in due file e i risultati tardivi di un lease scaduto contano una volta.
+
+Endpoint (corpo e risposte JSON):
+    GET    /stato                            avanzamento della griglia e run per worker
+    GET    /scenari/<id>                     scenario (to_dict) da ricostruire nel worker
+    POST   /lease                            {"worker": "host-pid", "n": 4} -> lease con i run assegnati
+    POST   /lease/<id>/battito               {"worker": ...} prolunga il lease
+    POST   /lease/<id>/risultati             {"worker": ..., "risultati": [...], "errori": [...]}
+    GET    /risultati                        risultati raccolti finora (stesso formato del file di uscita)
+
+Avvio:
+    python -m core.coda coordinatore scenari/base.toml --host 0.0.0.0 --porta 8090 --uscita risultati_coda.json
+    python -m core.coda worker http://coordinatore:8090 --processi 8
+    python -m core.coda locale scenari/base.toml --worker 4     # coordinatore e worker su localhost
+"""
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, deque
+
+from core.batch import esegui_run, riepilogo_batch
+from core.cacherisultati import CacheRisultati
+from core.console import configura_output, silenzia_output
+from core.scenario import carica_scenario, scenario_da_dict
+from core.servizio import ErroreHTTP, _json_corpo, _leggi_richiesta, _scrivi_json
+
+logger = logging.getLogger("core.coda")  # nome fisso: anche con python -m resta sotto il logger "core"
+
+DIMENSIONE_LEASE = 4           # run per lease
+DURATA_LEASE = 60.0            # secondi reali senza battiti prima che il lease scada
+MAX_TENTATIVI = 3              # assegnazioni di un run prima di considerarlo fallito
+
+
+def id_scenario(scenario):
+    """Hash del contenuto dello scenario, semi esclusi: identifica lo scenario nella griglia."""
+    dati = scenario.to_dict()
+    dati.pop("batch")
+    return hashlib.sha1(json.dumps(dati, sort_keys=True).encode()).hexdigest()[:12]
+
+
+class Lease:
+    __slots__ = ("id", "worker", "run", "scadenza")
+
+    def __init__(self, id_lease, worker, run, scadenza):
+        self.id = id_lease
+        self.worker = worker
+        self.run = set(run)            # chiavi (id scenario, seme) non ancora consegnate
+        self.scadenza = scadenza
+
+
+class Coordinatore:
+    """
+    Stato della coda di lavoro: run in attesa, lease aperti, risultati e run falliti.
+    Tutti i metodi sono chiamati dal loop asyncio del server (nessun lock).
+    semi: se indicato sostituisce i semi di ogni scenario.
+    """
+    def __init__(self, scenari, semi=None, dimensione_lease=DIMENSIONE_LEASE, durata_lease=DURATA_LEASE,
+                 max_tentativi=MAX_TENTATIVI):
+        self.dimensione_lease = dimensione_lease
+        self.durata_lease = durata_lease
+        self.max_tentativi = max_tentativi
+        self.scenari = {}
+        griglia = {}
+        for scenario in scenari:
+            sid = id_scenario(scenario)
+            self.scenari.setdefault(sid, scenario)
+            for seme in (scenario.semi if semi is None else semi):
+                griglia.setdefault((sid, int(seme)), None)
+        self.griglia = frozenset(griglia)   # (id scenario, seme) ammessi in risultati e falliti
+        self.totale = len(griglia)
+        self.in_attesa = deque(griglia)
+        self.tentativi = Counter()
+        self.lease = {}
+        self.risultati = {}            # (id scenario, seme) -> KPI
+        self.falliti = {}              # (id scenario, seme) -> ultimo errore
+        self.run_per_worker = Counter()
+        self.contatore = itertools.count(1)
+        self.inizio = None             # primo lease assegnato: misura il throughput, non l'attesa dei worker
+        self.fine = None
+        self.completato = asyncio.Event()
+
+    def concluso(self):
+        # risultati e falliti contengono solo chiavi della griglia (_chiave, _rimetti)
+        return len(self.risultati) + len(self.falliti) == self.totale
+
+    def _scadi_lease(self):
+        ora = time.monotonic()
+        for lease in [lease for lease in self.lease.values() if lease.scadenza < ora]:
+            del self.lease[lease.id]
+            logger.warning("Lease %s del worker %s scaduto: %d run rimessi in coda",
+                           lease.id, lease.worker, len(lease.run))
+            for chiave in lease.run:
+                self._rimetti(chiave, "lease scaduto")
+
+    def _rimetti(self, chiave, errore):
+        if chiave not in self.griglia or chiave in self.risultati or chiave in self.falliti:
+            return
+        if self.tentativi[chiave] >= self.max_tentativi:
+            self.falliti[chiave] = errore
+            self._verifica_conclusione()
+        else:
+            self.in_attesa.append(chiave)
+
+    def _verifica_conclusione(self):
+        if self.concluso() and not self.completato.is_set():
+            self.fine = time.monotonic()
+            self.completato.set()
+            logger.info("Griglia conclusa: %d run, %d falliti in %.1f s",
+                        len(self.risultati), len(self.falliti), self.fine - (self.inizio or self.fine))
+
+    def assegna(self, worker, n=None):
+        """Nuovo lease con al più n run in attesa; senza run disponibili indica se attendere o terminare."""
+        self._scadi_lease()
+        n = self.dimensione_lease if n is None else max(1, int(n))
+        run = []
+        while self.in_attesa and len(run) < n:
+            chiave = self.in_attesa.popleft()
+            if chiave not in self.risultati and chiave not in self.falliti:
+                run.append(chiave)
+        if not run:
+            # run ancora in lease altrui: il worker riprova, potrebbero tornare in coda alla scadenza
+            return {"lease": None, "finito": self.concluso(), "attendi": 0 if self.concluso() else 1.0}
+        if self.inizio is None:
+            self.inizio = time.monotonic()
+        lease = Lease(str(next(self.contatore)), worker, run, time.monotonic() + self.durata_lease)
+        self.lease[lease.id] = lease
+        self.tentativi.update(run)
+        return {"lease": lease.id, "durata": self.durata_lease,
+                "run": [{"scenario": sid, "seme": seme} for sid, seme in run]}
+
+    def battito(self, id_lease, worker):
+        self._scadi_lease()
+        lease = self.lease.get(id_lease)
+        if lease is None or lease.worker != worker:
+            raise ErroreHTTP(404, f"Lease {id_lease} inesistente o scaduto")
+        lease.scadenza = time.monotonic() + self.durata_lease
+        return {"lease": lease.id, "durata": self.durata_lease}
+
+    def consegna(self, id_lease, worker, risultati, errori=()):
+        """
+        Registra i KPI consegnati (anche da un lease già scaduto: vale il primo risultato di ogni run)
+        e rimette in coda i run con errore. Restituisce quanti risultati erano nuovi.
+        Le voci sono validate tutte prima di modificare lease e risultati: un risultato fuori dalla
+        griglia rende invalida la consegna (400), un errore fuori dalla griglia viene ignorato.
+        """
+        if not isinstance(risultati, list) or not isinstance(errori, (list, tuple)):
+            raise ErroreHTTP(400, "risultati ed errori devono essere liste")
+        for voce in risultati:
+            if not isinstance(voce, dict) or not isinstance(voce.get("kpi"), dict):
+                raise ErroreHTTP(400, "Ogni risultato richiede scenario, seme e kpi (oggetto)")
+        chiavi_risultati = [self._chiave(voce) for voce in risultati]
+        chiavi_errori = [self._chiave(voce, nella_griglia=False) for voce in errori]
+        lease = self.lease.get(id_lease)
+        nuovi = 0
+        for voce, chiave in zip(risultati, chiavi_risultati):
+            if lease is not None:
+                lease.run.discard(chiave)
+            if chiave not in self.risultati and chiave not in self.falliti:
+                self.risultati[chiave] = voce["kpi"]
+                self.run_per_worker[worker] += 1
+                nuovi += 1
+        for voce, chiave in zip(errori, chiavi_errori):
+            if chiave not in self.griglia:
+                logger.warning("Errore ignorato dal worker %s: seme %s fuori dalla griglia", worker, chiave[1])
+                continue
+            if lease is not None:
+                lease.run.discard(chiave)
+            logger.warning("Run %s seme %s fallito sul worker %s: %s", chiave[0], chiave[1], worker, voce.get("errore"))
+            self._rimetti(chiave, str(voce.get("errore")))
+        if lease is not None and not lease.run:
+            del self.lease[lease.id]
+        self._verifica_conclusione()
+        return {"nuovi": nuovi, "duplicati": len(risultati) - nuovi}
+
+    def _chiave(self, voce, nella_griglia=True):
+        """Chiave (id scenario, seme) di una voce; nella_griglia: il seme deve appartenere alla griglia."""
+        if not isinstance(voce, dict):
+            raise ErroreHTTP(400, "Ogni voce deve essere un oggetto JSON")
+        try:
+            chiave = (str(voce["scenario"]), int(voce["seme"]))
+        except (KeyError, TypeError, ValueError):
+            raise ErroreHTTP(400, "Ogni voce richiede scenario e seme")
+        if chiave[0] not in self.scenari:
+            raise ErroreHTTP(404, f"Scenario {chiave[0]} non presente nella griglia")
+        if nella_griglia and chiave not in self.griglia:
+            raise ErroreHTTP(400, f"Seme {chiave[1]} dello scenario {chiave[0]} fuori dalla griglia")
+        return chiave
+
+    def stato(self):
+        self._scadi_lease()
+        durata = (self.fine or time.monotonic()) - self.inizio if self.inizio is not None else 0.0
+        return {
+            "totale": self.totale,
+            "completati": len(self.risultati),
+            "falliti": len(self.falliti),
+            "in_attesa": len(self.in_attesa),
+            "in_lease": sum(len(lease.run) for lease in self.lease.values()),
+            "lease_aperti": len(self.lease),
+            "durata_s": durata,
+            "run_al_secondo": len(self.risultati) / durata if durata > 0 else 0.0,
+            "run_per_worker": dict(self.run_per_worker),
+        }
+
+    def esito(self):
+        """Risultati per scenario (KPI ordinati per seme, con riepilogo_batch) e run falliti."""
+        scenari = {}
+        for sid, scenario in self.scenari.items():
+            run = [dict(kpi, seme=seme) for (s, seme), kpi in sorted(self.risultati.items()) if s == sid]
+            scenari[sid] = {"scenario": scenario.to_dict(), "riepilogo": riepilogo_batch(run) if run else None,
+                            "run": run}
+        falliti = [{"scenario": sid, "seme": seme, "errore": errore}
+                   for (sid, seme), errore in sorted(self.falliti.items())]
+        return {"scenari": scenari, "falliti": falliti, "stato": self.stato()}
+
+    # --- HTTP ---
+
+    async def gestisci_connessione(self, reader, writer):
+        try:
+            metodo, percorso, _, _, corpo = await _leggi_richiesta(reader)
+            try:
+                codice, risposta = self._instrada(metodo, percorso, corpo)
+            except ErroreHTTP as errore:
+                codice, risposta = errore.codice, {"errore": errore.messaggio}
+            await _scrivi_json(writer, codice, risposta)
+        except (ErroreHTTP, asyncio.IncompleteReadError, ConnectionError) as errore:
+            if isinstance(errore, ErroreHTTP):
+                await _scrivi_json(writer, errore.codice, {"errore": errore.messaggio})
+        except Exception as errore:
+            logger.exception("Errore interno nella gestione della richiesta")
+            await _scrivi_json(writer, 500, {"errore": f"Errore interno: {errore!r}"})
+        finally:
+            writer.close()
+
+    def _instrada(self, metodo, percorso, corpo):
+        parti = [parte for parte in percorso.split("/") if parte]
+        dati = _json_corpo(corpo) if metodo == "POST" else {}
+        worker = str(dati.get("worker", "anonimo"))
+        if parti == ["stato"] and metodo == "GET":
+            return 200, self.stato()
+        if parti == ["risultati"] and metodo == "GET":
+            return 200, self.esito()
+        if len(parti) == 2 and parti[0] == "scenari" and metodo == "GET":
+            if parti[1] not in self.scenari:
+                raise ErroreHTTP(404, f"Scenario {parti[1]} inesistente")
+            return 200, self.scenari[parti[1]].to_dict()
+        if parti == ["lease"] and metodo == "POST":
+            return 200, self.assegna(worker, dati.get("n"))
+        if len(parti) == 3 and parti[0] == "lease" and metodo == "POST":
+            if parti[2] == "battito":
+                return 200, self.battito(parti[1], worker)
+            if parti[2] == "risultati":
+                return 200, self.consegna(parti[1], worker, dati.get("risultati", []), dati.get("errori", []))
+        raise ErroreHTTP(404, f"{metodo} non supportato su {percorso}")
+
+    async def avvia_server(self, host="127.0.0.1", porta=8090):
+        server = await asyncio.start_server(self.gestisci_connessione, host, porta)
+        asyncio.get_running_loop().create_task(self._controlla_scadenze())
+        return server
+
+    async def _controlla_scadenze(self):
+        # senza richieste in arrivo i lease scaduti tornerebbero in coda solo alla prossima richiesta
+        while not self.completato.is_set():
+            await asyncio.sleep(min(1.0, self.durata_lease / 4))
+            self._scadi_lease()
+
+
+# --- Worker ---
+
+def _richiesta(indirizzo, metodo, percorso, dati=None, timeout=30):
+    corpo = json.dumps(dati).encode() if dati is not None else None
+    richiesta = urllib.request.Request(indirizzo.rstrip("/") + percorso, data=corpo, method=metodo,
+                                       headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(richiesta, timeout=timeout) as risposta:
+        return json.loads(risposta.read())
+
+
+class Worker:
+    """
+    Ciclo di un worker: chiede un lease, esegue i run (nel processo corrente) mentre un thread invia
+    i battiti, consegna i KPI. Termina quando il coordinatore segnala la griglia conclusa o non risponde
+    per tentativi_connessione volte consecutive. Con una CacheRisultati i run già in cache non vengono simulati.
+    """
+    def __init__(self, indirizzo, nome=None, run_per_lease=None, tentativi_connessione=5, cache=None):
+        self.indirizzo = indirizzo
+        self.cache = cache
+        self.nome = nome or f"{socket.gethostname()}-{os.getpid()}"
+        self.run_per_lease = run_per_lease
+        self.tentativi_connessione = tentativi_connessione
+        self.scenari = {}
+        self.eseguiti = 0
+
+    def _chiama(self, metodo, percorso, dati=None):
+        for tentativo in range(self.tentativi_connessione):
+            try:
+                return _richiesta(self.indirizzo, metodo, percorso, dati)
+            except urllib.error.HTTPError:
+                raise
+            except (urllib.error.URLError, ConnectionError, TimeoutError):
+                if tentativo + 1 == self.tentativi_connessione:
+                    raise
+                time.sleep(min(2 ** tentativo * 0.2, 5))
+
+    def _scenario(self, sid):
+        if sid not in self.scenari:
+            self.scenari[sid] = scenario_da_dict(self._chiama("GET", f"/scenari/{sid}"), sorgente=f"coda:{sid}")
+        return self.scenari[sid]
+
+    def esegui(self):
+        """Esegue lease finché la griglia non è conclusa; restituisce il numero di run eseguiti."""
+        while True:
+            try:
+                risposta = self._chiama("POST", "/lease", {"worker": self.nome, "n": self.run_per_lease})
+            except (urllib.error.URLError, ConnectionError, TimeoutError):
+                logger.info("Coordinatore %s non raggiungibile: worker %s terminato", self.indirizzo, self.nome)
+                return self.eseguiti
+            if risposta["lease"] is None:
+                if risposta["finito"]:
+                    return self.eseguiti
+                time.sleep(risposta["attendi"])
+                continue
+            self._esegui_lease(risposta)
+
+    def _esegui_lease(self, lease):
+        id_lease = lease["lease"]
+        fermo = threading.Event()
+        battiti = threading.Thread(target=self._battiti, args=(id_lease, lease["durata"] / 3, fermo), daemon=True)
+        battiti.start()
+        risultati, errori = [], []
+        try:
+            for run in lease["run"]:
+                try:
+                    with silenzia_output():
+                        kpi = esegui_run(self._scenario(run["scenario"]), run["seme"], cache=self.cache)
+                    # solo KPI: seme e ordini generati restano fuori dalla consegna
+                    risultati.append({**run, "kpi": {chiave: valore for chiave, valore in kpi.items()
+                                                     if chiave not in ("seme", "ordini")}})
+                except Exception as errore:
+                    errori.append({**run, "errore": f"{type(errore).__name__}: {errore}"})
+        finally:
+            fermo.set()
+            battiti.join()
+        try:
+            self._chiama("POST", f"/lease/{id_lease}/risultati",
+                         {"worker": self.nome, "risultati": risultati, "errori": errori})
+        except urllib.error.HTTPError as errore:
+            logger.warning("Consegna del lease %s rifiutata: %s", id_lease, errore)
+        self.eseguiti += len(risultati)
+
+    def _battiti(self, id_lease, intervallo, fermo):
+        while not fermo.wait(intervallo):
+            try:
+                self._chiama("POST", f"/lease/{id_lease}/battito", {"worker": self.nome})
+            except urllib.error.HTTPError:
+                return      # lease scaduto: i run tornano in coda, la consegna resta valida se arriva prima
+            except (urllib.error.URLError, ConnectionError, TimeoutError):
+                continue
+
+
+def _processo_worker(indirizzo, run_per_lease=None, cache=None):
+    configura_output("silenziosa")
+    return Worker(indirizzo, run_per_lease=run_per_lease, cache=cache).esegui()
+
+
+def avvia_worker(indirizzo, processi=None, run_per_lease=None, cache=None):
+    """Avvia `processi` worker indipendenti (default: CPU disponibili) e restituisce i processi."""
+    contesto = multiprocessing.get_context(
+        "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    )
+    processi_worker = [contesto.Process(target=_processo_worker, args=(indirizzo, run_per_lease, cache),
+                                       daemon=True)
+                       for _ in range(processi or os.cpu_count() or 1)]
+    for processo in processi_worker:
+        processo.start()
+    return processi_worker
+
+
+# --- Avvio ---
+
+async def servi_griglia(coordinatore, host="127.0.0.1", porta=8090, attesa_chiusura=None):
+    """
+    Serve la griglia fino alla conclusione, poi per attesa_chiusura secondi (default: durata del lease)
+    continua a rispondere "finito" ai worker ancora attivi. Restituisce l'esito.
+    """
+    server = await coordinatore.avvia_server(host, porta)
+    porta = server.sockets[0].getsockname()[1]
+    logger.info("Coordinatore in ascolto su http://%s:%s (%d run)", host, porta, coordinatore.totale)
+    async with server:
+        if not coordinatore.concluso():
+            await coordinatore.completato.wait()
+        esito = coordinatore.esito()
+        await asyncio.sleep(coordinatore.durata_lease if attesa_chiusura is None else attesa_chiusura)
+    return esito
+
+
+def esegui_locale(scenari, worker=None, semi=None, dimensione_lease=DIMENSIONE_LEASE, durata_lease=DURATA_LEASE,
+                  cache=None):
+    """Coordinatore e `worker` processi su localhost (porta libera); restituisce l'esito della griglia."""
+    async def principale():
+        coordinatore = Coordinatore(scenari, semi, dimensione_lease, durata_lease)
+        server = await coordinatore.avvia_server("127.0.0.1", 0)
+        porta = server.sockets[0].getsockname()[1]
+        processi = avvia_worker(f"http://127.0.0.1:{porta}", worker, cache=cache)
+        async with server:
+            await coordinatore.completato.wait()
+            esito = coordinatore.esito()
+            # il server resta aperto finché i worker non ricevono "finito" e terminano
+            while any(processo.is_alive() for processo in processi):
+                await asyncio.sleep(0.05)
+        return esito
+
+    return asyncio.run(principale())
+
+
+def _semi(argomenti):
+    if argomenti.n_run is None:
+        return None
+    return range(argomenti.seme_iniziale, argomenti.seme_iniziale + argomenti.n_run)
+
+
+def _salva(esito, uscita):
+    with open(uscita, "w") as f:
+        json.dump(esito, f, indent=2)
+    stato = esito["stato"]
+    logger.info("Risultati salvati in %s: %d run (%d falliti) in %.1f s, %.2f run/s", uscita,
+                stato["completati"], stato["falliti"], stato["durata_s"], stato["run_al_secondo"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Esecuzione distribuita di griglie scenario × seme")
+    comandi = parser.add_subparsers(dest="comando", required=True)
+    for nome in ("coordinatore", "locale"):
+        comando = comandi.add_parser(nome)
+        comando.add_argument("scenari", nargs="+", help="file scenario (.json, .toml, .yaml)")
+        comando.add_argument("--n-run", type=int, default=None, help="semi per scenario (default: quelli dello scenario)")
+        comando.add_argument("--seme-iniziale", type=int, default=0)
+        comando.add_argument("--dimensione-lease", type=int, default=DIMENSIONE_LEASE, help="run per lease")
+        comando.add_argument("--durata-lease", type=float, default=DURATA_LEASE,
+                             help="secondi senza battiti prima che un lease scada")
+        comando.add_argument("--uscita", default="risultati_coda.json", help="file JSON dei risultati")
+    coordinatore = comandi.choices["coordinatore"]
+    coordinatore.add_argument("--host", default="127.0.0.1")
+    coordinatore.add_argument("--porta", type=int, default=8090)
+    comandi.choices["locale"].add_argument("--worker", type=int, default=None, help="processi worker (default: CPU)")
+    worker = comandi.add_parser("worker")
+    worker.add_argument("indirizzo", help="URL del coordinatore, es. http://host:8090")
+    worker.add_argument("--processi", type=int, default=None, help="processi worker (default: CPU disponibili)")
+    worker.add_argument("--run-per-lease", type=int, default=None, help="run richiesti per lease")
+    for comando in (worker, comandi.choices["locale"]):
+        comando.add_argument("--cache", default=None, help="cartella della cache dei run (core.cacherisultati)")
+        comando.add_argument("--cache-mb", type=float, default=1024, help="dimensione massima della cache (MB)")
+    argomenti = parser.parse_args()
+    configura_output("console")
+    cache = CacheRisultati(argomenti.cache, argomenti.cache_mb) if getattr(argomenti, "cache", None) else None
+
+    if argomenti.comando == "worker":
+        for processo in avvia_worker(argomenti.indirizzo, argomenti.processi, argomenti.run_per_lease, cache):
+            processo.join()
+        return
+    scenari = [carica_scenario(percorso) for percorso in argomenti.scenari]
+    if argomenti.comando == "locale":
+        esito = esegui_locale(scenari, argomenti.worker, _semi(argomenti), argomenti.dimensione_lease,
+                              argomenti.durata_lease, cache)
+    else:
+        griglia = Coordinatore(scenari, _semi(argomenti), argomenti.dimensione_lease, argomenti.durata_lease)
+        esito = asyncio.run(servi_griglia(griglia, argomenti.host, argomenti.porta))
+    _salva(esito, argomenti.uscita)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Configurazione dell'output a console della simulazione.
+
+Tutti i moduli di core scrivono tramite il modulo logging (logger "core.*") invece di print():
+chi usa la simulazione sceglie la modalità con configura_output().
+
+Modalità disponibili:
+    - "console":    ogni messaggio viene stampato su stdout, come in origine.
+    - "silenziosa": nessun handler e livello sopra CRITICAL; le viste di ReportStatistica
+                    controllano isEnabledFor() prima di formattare, quindi il costo è nullo (run batch).
+    - "dashboard":  come "console" finché la dashboard (core.dashboard) non si collega al logger:
+                    da lì i messaggi di stato compaiono in un riquadro del RendererDashboard.
+"""
+import logging
+import sys
+from contextlib import contextmanager
+
+LOGGER_RADICE = "core"
+MODALITA = ("console", "silenziosa", "dashboard")
+
+
+def configura_output(modalita="console", stream=None):
+    """
+    Configura il logger radice "core" secondo la modalità richiesta e lo restituisce.
+    Può essere richiamata più volte: gli handler precedenti vengono rimossi.
+    """
+    if modalita not in MODALITA:
+        raise ValueError(f"Modalità di output sconosciuta: {modalita!r} (ammesse: {', '.join(MODALITA)})")
+    logger = logging.getLogger(LOGGER_RADICE)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.propagate = False
+
+    if modalita == "silenziosa":
+        logger.setLevel(logging.CRITICAL + 1)
+        return logger
+
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+@contextmanager
+def silenzia_output():
+    """Silenzia temporaneamente il logger "core" (run eseguiti nel processo chiamante), poi lo ripristina."""
+    logger = logging.getLogger(LOGGER_RADICE)
+    livello = logger.level
+    logger.setLevel(logging.CRITICAL + 1)
+    try:
+        yield
+    finally:
+        logger.setLevel(livello)
@@ -0,0 +1,231 @@
+"""
+Dashboard da terminale disaccoppiata dalla simulazione.
+
+La simulazione gira in un thread dedicato (SimulazioneInThread) che pubblica snapshot immutabili
+dello stato in un PubblicatoreStato; il RendererDashboard, nel thread principale, ridisegna il
+terminale a frequenza fissa leggendo sempre l'ultimo snapshot disponibile.
+La velocità della simulazione (ritmo in secondi simulati per secondo reale, oppure massima)
+è quindi indipendente dalla frequenza di aggiornamento a video.
+"""
+import logging
+import sys
+import threading
+import time
+from collections import deque
+
+from core.console import LOGGER_RADICE
+from core.reportstatistica import ReportStatistica, formatta_tempo
+
+STATO_FINE = "Tutti gli ordini completati. Termine Simulazione"
+PULISCI_SCHERMO = "\x1b[2J\x1b[H"
+
+
+class PubblicatoreStato:
+    """
+    Contenitore dell'ultimo snapshot pubblicato.
+    Lo snapshot è un dizionario nuovo ad ogni pubblicazione e non viene più modificato:
+    l'assegnazione di un attributo è atomica, quindi lettore e scrittore non condividono lock.
+    """
+    def __init__(self):
+        self.snapshot = None
+        self.versione = 0
+
+    def pubblica(self, snapshot):
+        self.snapshot = snapshot
+        self.versione += 1
+
+    def ultimo(self):
+        return self.snapshot
+
+
+class MessaggiRecenti(logging.Handler):
+    """Handler che conserva gli ultimi messaggi del core, mostrati in un riquadro della dashboard."""
+    def __init__(self, massimo=6):
+        super().__init__(logging.INFO)
+        self.messaggi = deque(maxlen=massimo)
+
+    def emit(self, record):
+        if getattr(record, "vista", False):
+            return
+        self.messaggi.append(record.getMessage().strip())
+
+
+def collega_messaggi_recenti(massimo=6):
+    """Sostituisce gli handler del logger "core" con un MessaggiRecenti e lo restituisce."""
+    logger = logging.getLogger(LOGGER_RADICE)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.propagate = False
+    handler = MessaggiRecenti(massimo)
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    return handler
+
+
+def snapshot_macchina(macchina, tempo_reale=0.0):
+    """
+    Snapshot leggero per la dashboard: gli stessi dati di json_rapida, ma con i soli ultimi
+    tre eventi (copiare l'intero log ad ogni frame costerebbe O(eventi)).
+    """
+    ordine_attivo = macchina.indice < len(macchina.bobine_tot_prodotte)
+    return {
+        "stato": macchina.stato,
+        "tempo_simulato": macchina.simclock.get_time(),
+        "tempo_reale": tempo_reale,
+        "tempo_fermo": macchina.evento.tot_timer,
+        "tempo_perso": macchina.tempo_perso,
+        "bobina": ReportStatistica.json_bobina(macchina.bobina),
+        "macchina": ReportStatistica.json_efficienze_macchina(macchina),
+        "avanzamento_ordine": ReportStatistica.json_avanzamento_ordine(macchina) if ordine_attivo else None,
+        "eventi_attivi": list(macchina.eventi_attivi),
+        "ultimi_eventi": [dict(evento) for evento in macchina.evento.log_eventi[-3:]],
+        "peso_totale_t": macchina.programma.peso_accumulato / 1000,
+        "oee": oee_macchina(macchina),
+    }
+
+
+def oee_macchina(macchina):
+    """OEE di campagna, turno e ordine in corso letto dai contatori incrementali (core.oee)."""
+    oee = macchina.oee
+    oee.aggiorna(macchina)
+    return {"campagna": oee.campagna(), "turno": oee.turno_corrente(), "ordine": oee.ordine_corrente()}
+
+
+class SimulazioneInThread(threading.Thread):
+    """
+    Esegue la simulazione fino al termine degli ordini in un thread separato.
+
+    tick_visivo: secondi simulati tra due snapshot (anche per log_simulazione.json).
+    ritmo: secondi simulati per secondo reale; None = massima velocità (nessuna attesa).
+    """
+    def __init__(self, macchina, pubblicatore, tick_visivo, ritmo=None):
+        super().__init__(name="simulazione", daemon=True)
+        self.macchina = macchina
+        self.pubblicatore = pubblicatore
+        self.n_tick_per_visivo = max(1, tick_visivo // macchina.tick_reale)
+        self.ritmo = ritmo
+        self.log_snapshots = []
+        self.log_snapshots_settings_macchina = []
+        self.errore = None
+        self.tempo_reale = 0.0
+        self.interrompi = threading.Event()
+
+    def run(self):
+        try:
+            self._esegui()
+        except BaseException as errore:  # riportato al thread principale da attendi()
+            self.errore = errore
+        finally:
+            self.pubblicatore.pubblica(snapshot_macchina(self.macchina, self.tempo_reale))
+
+    def _esegui(self):
+        macchina = self.macchina
+        inizio = time.monotonic()
+        self.log_snapshots_settings_macchina.append(ReportStatistica.json_efficienze_macchina(macchina))
+        self.pubblicatore.pubblica(snapshot_macchina(macchina))
+        while not self.interrompi.is_set():
+            for _ in range(self.n_tick_per_visivo):
+                macchina.esegui_tick()
+                if macchina.stato == STATO_FINE:
+                    break
+                if macchina.stato == "Cambio produzione in corso":
+                    self.log_snapshots_settings_macchina.append(ReportStatistica.json_efficienze_macchina(macchina))
+                    break
+            self.tempo_reale = time.monotonic() - inizio
+            if macchina.stato == STATO_FINE:
+                return
+            self.log_snapshots.append(ReportStatistica.json_rapida(macchina))
+            self.pubblicatore.pubblica(snapshot_macchina(macchina, self.tempo_reale))
+            if self.ritmo:
+                # Attende solo quanto serve per non superare il ritmo richiesto
+                anticipo = macchina.simclock.get_time() / self.ritmo - (time.monotonic() - inizio)
+                if anticipo > 0:
+                    self.interrompi.wait(anticipo)
+
+    def attendi(self):
+        """Attende la fine del thread e rilancia l'eventuale eccezione della simulazione."""
+        self.join()
+        if self.errore is not None:
+            raise self.errore
+
+
+def testo_snapshot(snapshot, messaggi=()):
+    """Compone il testo della dashboard a partire da uno snapshot (mai dalla macchina viva)."""
+    righe = [
+        "==== SIMULAZIONE PRODUZIONE CARTIERA – DASHBOARD ====",
+        f"Stato: {snapshot['stato']}",
+        f"Tempo simulato: {formatta_tempo(snapshot['tempo_simulato'])} --- tempo reale: {snapshot['tempo_reale']:.1f} s"
+        f" --- tempo di fermo: {formatta_tempo(snapshot['tempo_fermo'])}",
+        f"Tempo totale perso: {formatta_tempo(snapshot['tempo_perso'])} --- carta prodotta: {snapshot['peso_totale_t']:.1f} t",
+        "OEE " + " | ".join(f"{nome}: " + ("n.d." if valori["oee"] is None else f"{valori['oee']*100:.1f}%")
+                            for nome, valori in snapshot["oee"].items()),
+        "",
+        "=== Bobina corrente ===",
+    ]
+    bobina = snapshot["bobina"]
+    righe.append(
+        f"grammatura {bobina['grammatura ottenuta']:.2f} g/m2 (target {bobina['grammatura target']:g})"
+        f" | lunghezza {bobina['lunghezza']:.0f} m | peso {bobina['peso_bobina']:.1f} kg"
+        f" | indice qualità {bobina['indice_qualita']:.3f}"
+    )
+    righe += ["", "=== Macchina ==="]
+    for chiave, info in snapshot["macchina"].items():
+        if chiave == "additivi_chimici":
+            for additivo in info:
+                righe.append(f"  - {additivo['tipologia']:<30} | efficienza: {additivo['efficienza']:.3f}")
+        elif chiave == "feltro":
+            righe.append(f"{'Usura feltro':<30}: {info['usura']*100:.1f}% | efficienza: {info['efficienza']:.3f}")
+        else:
+            righe.append(f"{chiave:<30}: {info['valore']} | efficienza: {info['efficienza']:.3f}")
+    righe.append(f"Eventi attivi: {snapshot['eventi_attivi']}")
+    avanzamento = snapshot["avanzamento_ordine"]
+    if avanzamento:
+        righe += [
+            "",
+            "=== Avanzamento ordine ===",
+            f"{avanzamento['prodotto']}: {avanzamento['peso_attuale_kg']:.1f} / {avanzamento['peso_target_kg']:.1f} kg"
+            f" ({avanzamento['avanzamento_percentuale']:.2f}%) | bobine completate: {avanzamento['Bobine completate']}",
+        ]
+    righe += ["", "=== Ultimi eventi ==="]
+    if not snapshot["ultimi_eventi"]:
+        righe.append("(Nessun evento registrato)")
+    for evento in snapshot["ultimi_eventi"]:
+        righe.append(
+            f"[{evento['evento'].upper()}] durata: {formatta_tempo(evento['durata'])}, "
+            f"tempo simulato: {formatta_tempo(evento['tempo_simulato'])}, ordine: {evento['ordine_corrente']}"
+        )
+    if messaggi:
+        righe += ["", "=== Messaggi ==="] + list(messaggi)
+    return "\n".join(righe)
+
+
+class RendererDashboard:
+    """
+    Ridisegna la dashboard ogni `intervallo` secondi reali finché il thread di simulazione è vivo.
+    pulisci=True usa le sequenze ANSI per ridisegnare sul posto; False accoda i fotogrammi (log su file/pipe).
+    """
+    def __init__(self, pubblicatore, intervallo=0.5, stream=None, pulisci=True, messaggi=None):
+        self.pubblicatore = pubblicatore
+        self.intervallo = intervallo
+        self.stream = stream or sys.stdout
+        self.pulisci = pulisci
+        self.messaggi = messaggi
+
+    def disegna(self, snapshot):
+        testo = testo_snapshot(snapshot, self.messaggi.messaggi if self.messaggi else ())
+        self.stream.write((PULISCI_SCHERMO if self.pulisci else "\n") + testo + "\n")
+        self.stream.flush()
+
+    def esegui(self, thread):
+        """Loop di rendering; ridisegna solo quando è disponibile uno snapshot nuovo."""
+        ultima_versione = -1
+        while True:
+            vivo = thread.is_alive()
+            versione = self.pubblicatore.versione
+            snapshot = self.pubblicatore.ultimo()
+            if snapshot is not None and versione != ultima_versione:
+                self.disegna(snapshot)
+                ultima_versione = versione
+            if not vivo:
+                return
+            time.sleep(self.intervallo)
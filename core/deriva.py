@@ -0,0 +1,187 @@
+"""
+Deriva nel tempo dei parametri di processo (opzionale, sezione [deriva] dello scenario).
+
+Senza deriva le efficienze estratte da ProgrammaProduzione.imposta_parametri_per_ordine restano
+costanti per tutto l'ordine. Con DerivaProcesso le efficienze di velocità tela, concentrazione
+impasto, grado di raffinazione e temperatura cappa oscillano attorno al valore estratto per l'ordine
+con processi di Ornstein-Uhlenbeck indipendenti (ritorno alla media in tau_sec, deviazione stazionaria
+sigma), nel tempo simulato e anche durante i fermi:
+  - setup_bobina legge le efficienze correnti (applica), quindi sigma della grammatura e indice di
+    qualità di ogni bobina seguono la deriva;
+  - ogni tick di produzione la velocità tela è moltiplicata per 1 + scarto della velocità e il peso
+    per 1 + scarto della concentrazione (fattori_tick, incrementi); la grammatura ottenuta della bobina
+    è quella media effettiva (peso / superficie).
+
+I percorsi sono generati in anticipo a blocchi di tick_per_blocco tick per tutti i parametri insieme,
+con un generatore proprio, figlio (SeedSequence.spawn) del seme del run: il generatore globale dei
+roll degli eventi non viene toccato, quindi aggiungere [deriva] non cambia la sequenza degli eventi. La
+ricorrenza x[n] = a x[n-1] + b ε[n] si risolve per tratti con una somma cumulativa scalata, senza
+cicli per tick. Il processo è campionato esattamente ogni passo_sec (60 s, molto meno di tau_sec) e
+tenuto costante tra due campioni, così il costo per tick si riduce alla copia dei valori. I blocchi
+dipendono solo dal seme, quindi kernel a blocchi e tick singoli vedono gli stessi valori.
+
+Esempio (TOML):
+
+    [deriva]
+    tau_sec = 7200        # ritorno alla media in circa 2 ore
+    sigma = 0.02          # oppure una tabella per parametro: sigma = { "velocita tela" = 0.03 }
+"""
+import math
+
+import numpy as np
+
+PARAMETRI_DERIVA = ("velocita tela", "concentrazione impasto %", "grado raffinazione", "temperatura cappa")
+VELOCITA, CONCENTRAZIONE = 0, 1    # righe dei percorsi usate come fattori di produzione
+TICK_PER_BLOCCO = 4096
+TICK_INCREMENTI = 1024             # tick minimi calcolati in anticipo da incrementi()
+_ESPONENTE_MASSIMO = 20.0          # a^-n entro e^20 nei tratti della somma cumulativa
+
+
+def percorso_ou(x0, a, b, rumore):
+    """
+    Percorsi di Ornstein-Uhlenbeck x[n] = a x[n-1] + b ε[n] (una riga per parametro) dai valori
+    iniziali x0 e dal rumore standard (parametri × n). Per tratti di lunghezza con a^-n limitato:
+    x[n] = a^n (x0 + Σ_k≤n a^-k b ε[k]).
+    """
+    righe, n = rumore.shape
+    decadimento = -np.log(a)
+    lunghezza = max(1, min(n, int(_ESPONENTE_MASSIMO / max(decadimento.max(), 1e-300))))
+    percorso = np.empty((righe, n))
+    x = np.asarray(x0, dtype=float)
+    for inizio in range(0, n, lunghezza):
+        k = np.arange(1, min(lunghezza, n - inizio) + 1)
+        potenze = np.exp(-decadimento[:, None] * k)          # a^k
+        somma = np.cumsum(b[:, None] * rumore[:, inizio:inizio + len(k)] / potenze, axis=1)
+        percorso[:, inizio:inizio + len(k)] = potenze * (x[:, None] + somma)
+        x = percorso[:, inizio + len(k) - 1]
+    return percorso
+
+
+class DerivaProcesso:
+    """
+    Scarti dalla media delle efficienze di PARAMETRI_DERIVA per tick simulato (tick n: fine al tempo
+    n·tick_reale). Le letture devono procedere in avanti nel tempo: i blocchi già superati si scartano.
+
+    tau_sec: tempo di ritorno alla media; sigma: deviazione stazionaria (numero o dizionario per
+    parametro); seme: generatore dei percorsi; passo_sec: intervallo tra due campioni del processo.
+    """
+    def __init__(self, tick_reale, tau_sec=7200, sigma=0.02, seme=None, tick_per_blocco=TICK_PER_BLOCCO, passo_sec=60):
+        if not isinstance(sigma, dict):
+            sigma = {parametro: sigma for parametro in PARAMETRI_DERIVA}
+        self.tick_reale = tick_reale
+        self.tau_sec = tau_sec
+        self.sigma = np.array([float(sigma.get(parametro, 0.0)) for parametro in PARAMETRI_DERIVA])
+        self.passo = max(1, round(passo_sec / tick_reale))           # tick per campione
+        self.campioni_per_blocco = -(-tick_per_blocco // self.passo)
+        self.a = np.full(len(PARAMETRI_DERIVA), math.exp(-self.passo * tick_reale / tau_sec))
+        self.b = self.sigma * np.sqrt(1 - self.a ** 2)
+        self.rng = np.random.default_rng(seme)
+        self.x = self.rng.standard_normal(len(PARAMETRI_DERIVA)) * self.sigma   # partenza stazionaria
+        self.primo = 0                                      # indice del primo campione in memoria
+        self.campioni = np.empty((len(PARAMETRI_DERIVA), 0))   # campione k: tick [k·passo, (k+1)·passo)
+        self._parametri = None                              # parametri_processo dell'ordine corrente
+        self._medie = None
+        self._incrementi = None                             # finestra corrente di incrementi()
+
+    @classmethod
+    def da_scenario(cls, scenario, seme=None):
+        """
+        DerivaProcesso della sezione deriva dello scenario (None se assente). seme è il seme del run: i
+        percorsi usano un generatore figlio, riproducibile e indipendente dal generatore globale degli
+        eventi; senza seme i percorsi non sono riproducibili.
+        """
+        if scenario is None or scenario.deriva is None:
+            return None
+        if seme is not None:
+            seme = np.random.SeedSequence(seme).spawn(1)[0]
+        return cls(scenario.tick_reale, scenario.deriva["tau_sec"], dict(scenario.deriva["sigma"]), seme)
+
+    def scarti(self, tick):
+        """Scarti (parametri × 1) del tick."""
+        primo = tick // self.passo
+        return self._campioni(primo, primo)
+
+    def _campioni(self, primo, ultimo):
+        """Campioni (parametri × ...) di indice da primo a ultimo compreso, generando i blocchi mancanti."""
+        if primo < self.primo:
+            raise ValueError(f"Tick {primo * self.passo} già scartato (primo disponibile: {self.primo * self.passo})")
+        while self.primo + self.campioni.shape[1] <= ultimo:
+            # i campioni già superati si lasciano solo quando serve un nuovo blocco
+            scartati = min(primo - self.primo, self.campioni.shape[1])
+            self.campioni = self.campioni[:, scartati:]
+            self.primo += scartati
+            self._genera()
+        return self.campioni[:, primo - self.primo:ultimo - self.primo + 1]
+
+    def _genera(self):
+        """Aggiunge i campioni del blocco successivo dei percorsi."""
+        campioni = percorso_ou(self.x, self.a, self.b,
+                               self.rng.standard_normal((len(PARAMETRI_DERIVA), self.campioni_per_blocco)))
+        self.x = campioni[:, -1]
+        self.campioni = np.concatenate([self.campioni, campioni], axis=1)
+
+    def fattori_tick(self, tick):
+        """Fattori di velocità tela e di grammatura (1 + scarto) del tick, come float (un tick di esegui_tick)."""
+        scarti = self.scarti(tick)
+        return 1 + float(scarti[VELOCITA, 0]), 1 + float(scarti[CONCENTRAZIONE, 0])
+
+    def incrementi(self, tick, n, velocita, grammatura, larghezza):
+        """
+        Incrementi di lunghezza e peso della bobina nei tick [tick, tick + n) con le operazioni di
+        Bobina.aggiorna_peso. I conti si fanno sui campioni e il risultato si ripete per passo tick.
+        Le lunghezze coprono almeno TICK_INCREMENTI tick alla volta e restano valide finché la velocità
+        dell'ordine non cambia; i pesi si ricalcolano sulla stessa finestra quando cambia la grammatura
+        (a ogni bobina). I blocchi successivi del kernel, e la ricerca della fine bobina che li precede,
+        li leggono senza ricalcolo.
+        """
+        finestra = self._finestra(tick, n, velocita)
+        _, primo, delta_lunghezza, lunghezze, fattore_grammatura, chiave, delta_peso, _ = finestra
+        if chiave != (grammatura, larghezza):
+            delta_peso = np.repeat(lunghezze * grammatura * larghezza / 1000 * fattore_grammatura, self.passo)
+            finestra[5:7] = (grammatura, larghezza), delta_peso
+        inizio = tick - primo
+        return delta_lunghezza[inizio:inizio + n], delta_peso[inizio:inizio + n]
+
+    def tick_fine_bobina(self, tick, n, velocita, lunghezza, lunghezza_max):
+        """
+        Primo dei tick [tick, tick + n), contato da 1, alla cui fine la bobina che parte da lunghezza
+        raggiunge lunghezza_max (n + 1 se non la raggiunge), con le somme tick per tick del kernel.
+        La lunghezza cumulata della finestra di incrementi() si calcola una volta per finestra e la
+        ricerca è un searchsorted; solo se la soglia cade entro l'errore di arrotondamento delle due
+        somme si rifà la somma tick per tick.
+        """
+        finestra = self._finestra(tick, n, velocita)
+        if finestra[7] is None:
+            finestra[7] = np.add.accumulate(np.concatenate(([0.0], finestra[2])))
+        cumulate, inizio = finestra[7], tick - finestra[1]
+        soglia = lunghezza_max - lunghezza + cumulate[inizio]
+        margine = 1e-9 * (abs(lunghezza_max) + abs(lunghezza) + cumulate[-1])
+        primo, ultimo = cumulate[inizio + 1:inizio + n + 1].searchsorted((soglia - margine, soglia + margine)).tolist()
+        if primo == ultimo:
+            return primo + 1
+        lunghezze = np.add.accumulate(np.concatenate(([lunghezza], finestra[2][inizio:inizio + n])))[1:]
+        return int(lunghezze.searchsorted(lunghezza_max)) + 1
+
+    def _finestra(self, tick, n, velocita):
+        """Finestra corrente di incrementi(), ricalcolata se non copre i tick [tick, tick + n) alla velocità data."""
+        finestra = self._incrementi
+        if (finestra is None or finestra[0] != velocita
+                or not finestra[1] <= tick <= tick + n <= finestra[1] + len(finestra[2])):
+            primo = tick // self.passo
+            campioni = self._campioni(primo, (tick + max(n, TICK_INCREMENTI) - 1) // self.passo)
+            lunghezze = velocita * (1 + campioni[VELOCITA]) * 0.85 * self.tick_reale
+            finestra = self._incrementi = [velocita, primo * self.passo, np.repeat(lunghezze, self.passo),
+                                           lunghezze, 1 + campioni[CONCENTRAZIONE], None, None, None]
+        return finestra
+
+    def applica(self, parametri, tick):
+        """
+        Porta le efficienze di parametri_processo al valore del tick: media dell'ordine (l'efficienza
+        estratta da imposta_parametri_per_ordine, rilevata al primo uso di un nuovo dizionario) più lo
+        scarto, entro [0, 1].
+        """
+        if parametri is not self._parametri:
+            self._parametri = parametri
+            self._medie = [parametri[parametro]["efficienza"] for parametro in PARAMETRI_DERIVA]
+        for parametro, media, scarto in zip(PARAMETRI_DERIVA, self._medie, self.scarti(tick)[:, 0].tolist()):
+            parametri[parametro]["efficienza"] = min(1.0, max(0.0, media + scarto))
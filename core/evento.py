@@ -1,5 +1,7 @@
 import numpy as np
 
+from core.registroeventi import RegistroEventi
+
 def roll_evento(probabilita):
     """
     Esegue un roll su una probabilità (tra 0 e 1).
@@ -37,36 +39,82 @@ def calcolo_probabilita_per_tick(tick_reale_sec, prob_evento, range_tempo_sec):
     return p_tick
 
 
+# Parametri predefiniti degli eventi: probabilità (%) su un periodo, intervalli dei timer e
+# distribuzioni delle durate (secondi). Un file scenario può sovrascriverli (vedi core.scenario).
+PARAMETRI_EVENTI_DEFAULT = {
+    # in media si verifica al 50% in 10 giorni
+    "guasto macchina": {"probabilita": 50, "periodo_sec": 10*24*3600,
+                        "durata": {"distribuzione": "uniforme", "min": 300, "max": 21600}},  #tra i 5 minuti e le 6 ore
+    #50% ogni 4 ore
+    "rottura carta": {"probabilita": 50, "periodo_sec": 4*3600,
+                      "durata": {"distribuzione": "uniforme", "min": 60, "max": 420}},  #tra 1 e 7 minuti
+    #probabilita di rottura specifico durante ogni cambio bobina, estremamente più elevato rispetto al solito
+    "rottura carta cambio bobina": {"probabilita": 10, "periodo_sec": 15},
+    "cambio feltro": {"durata": {"distribuzione": "normale", "media": 7200, "sigma": 900}},  #gaussiana attorno alle 2 ore con sigma di 15 minuti
+    "pulizia macchina": {"intervallo_sec": 28800,  #secondi, 8 ore
+                         "durata": {"distribuzione": "uniforme", "min": 210, "max": 390}},  #tra 3.5 e 6.5 minuti
+    "cambio lama crespatura": {"intervallo_ore_min": 22, "intervallo_ore_max": 27,  #tra le 22 e le 27 ore
+                               "durata": {"distribuzione": "uniforme", "min": 240, "max": 360}},  #tra 4 e 6 minuti
+    "cambio bobina": {"durata": {"distribuzione": "fissa", "valore": 15}},
+    "cambio produzione": {"durata": {"distribuzione": "uniforme", "min": 900, "max": 1500}},  #tra 15 e 25 minuti
+    # dopo un fermo (non cambio bobina) nel 40% dei casi serve una pulizia aggiuntiva
+    "pulizia macchina extra": {"probabilita": 40,
+                               "durata": {"distribuzione": "uniforme", "min": 210, "max": 360}}  #tra i 3.5 minuti e 6 minuti
+}
+
+# Ordine in cui gestione_attivi registra gli eventi e ne estrae le durate
+ORDINE_EVENTI = ("cambio feltro", "guasto macchina", "rottura carta", "pulizia macchina",
+                 "cambio lama crespatura", "cambio bobina", "cambio produzione")
+
+
+def campiona_durata(distribuzione):
+    """Estrae una durata intera (secondi) dalla distribuzione descritta nei parametri evento."""
+    tipo = distribuzione["distribuzione"]
+    if tipo == "uniforme":
+        return np.random.randint(distribuzione["min"], distribuzione["max"]+1)
+    if tipo == "normale":
+        return int(np.random.normal(distribuzione["media"], distribuzione["sigma"]))
+    return distribuzione["valore"]
+
 
 
 class Evento:
-    def __init__(self, tick_reale, macchina):
+    def __init__(self, tick_reale, macchina, parametri=None):
         self.tipo = None                 # es: "rottura_feltro", "guasto_generale"
         self.cambio_feltro = None        # durata residua evento se attivo (in tick)
         self.tick_reale = tick_reale
+        self.parametri = parametri if parametri is not None else PARAMETRI_EVENTI_DEFAULT
+        guasto = self.parametri["guasto macchina"]
+        rottura = self.parametri["rottura carta"]
+        rottura_cambio = self.parametri["rottura carta cambio bobina"]
         # Calcolo della probabilità  in un tick da 5 secondi che si verifichi un guasto macchina...  
         # ...che in media si verifica al 50% in 10 giorni convertito in secondi
-        self.probabilita_tick_guasto = calcolo_probabilita_per_tick(self.tick_reale, 50 , 10*24*3600) 
+        self.probabilita_tick_guasto = calcolo_probabilita_per_tick(self.tick_reale, guasto["probabilita"], guasto["periodo_sec"]) 
         #50% ogni 4 ore
-        self.probabilita_tick_rottura_carta = calcolo_probabilita_per_tick(self.tick_reale, 50 , 4*3600)
+        self.probabilita_tick_rottura_carta = calcolo_probabilita_per_tick(self.tick_reale, rottura["probabilita"], rottura["periodo_sec"])
         #probabilita di rottura specifico durante ogni cambio bobina, estremamente più elevato rispetto al solito
-        self.probabilita_tick_carta_special = calcolo_probabilita_per_tick(self.tick_reale, 10 , 15)
+        self.probabilita_tick_carta_special = calcolo_probabilita_per_tick(self.tick_reale, rottura_cambio["probabilita"], rottura_cambio["periodo_sec"])
         self.eventi_attivi = []
         # timer che rapresentano il tempo ogni quanto la quale è necessario cambiare il componente
-        self.timer_lama_crespatura = np.random.randint(22,27+1)*3600 #tra le 22 e le 27 ore
+        self.timer_lama_crespatura = self.estrai_timer_lama() #tra le 22 e le 27 ore
         self.timer_rimanente_LC = self.timer_lama_crespatura
-        self.timer_pulizia_macchina = 28800 #secondi, 8 ore
+        self.timer_pulizia_macchina = self.parametri["pulizia macchina"]["intervallo_sec"] #secondi, 8 ore
         self.timer_rimanente_pulizia = self.timer_pulizia_macchina
         self.timer_fine_vita_feltro = int((macchina.feltro.ore_vita-macchina.feltro.ore_uso)*3600)
         self.timer_rimanente_feltro = self.timer_fine_vita_feltro
         self.tot_timer = 0
-        self.log_eventi = []
+        self.log_eventi = RegistroEventi(tick_reale, orologio=macchina.simclock)
         self.macchina = macchina
 
+    def estrai_timer_lama(self):
+        lama = self.parametri["cambio lama crespatura"]
+        return np.random.randint(lama["intervallo_ore_min"], lama["intervallo_ore_max"]+1)*3600
+
     def pulizia_macchina_extra (self):
-        if np.random.random() > 0.60 :
+        extra = self.parametri["pulizia macchina extra"]
+        if np.random.random() > 1 - extra["probabilita"]/100 :
             self.timer_rimanente_pulizia = self.timer_pulizia_macchina
-            return np.random.randint(210, 360+1) #tra i 3.5 minuti e 6 minuti
+            return campiona_durata(extra["durata"]) #tra i 3.5 minuti e 6 minuti
         else:
             return 0
 
@@ -108,7 +156,7 @@ class Evento:
         if "pulizia macchina" in self.eventi_attivi:
             self.timer_rimanente_pulizia = self.timer_pulizia_macchina
         if "cambio lama crespatura" in self.eventi_attivi:
-            self.timer_lama_crespatura = np.random.randint(22,27+1)*3600 
+            self.timer_lama_crespatura = self.estrai_timer_lama()
             self.timer_rimanente_LC = self.timer_lama_crespatura
         self.eventi_attivi = []
 
@@ -117,82 +165,18 @@ class Evento:
         ordine_corrente = self.macchina.programma.ordine_corrente.prodotto
         indice_bobina = self.macchina.bobine_tot_prodotte[self.macchina.indice]
         tempo_simulato_corrente = self.macchina.simclock.get_time()
-        if "cambio feltro" in self.eventi_attivi:
-            tempo_effetivo_cambio_feltro = int(np.random.normal(7200, 900)) #gaussiana attorno alle 2 ore con sigma di 15 minuti
-            self.tot_timer = max(self.tot_timer, tempo_effetivo_cambio_feltro)
-            self.log_eventi.append({
-                "evento": "cambio feltro",
-                "durata": tempo_effetivo_cambio_feltro,
-                "tempo_simulato": tempo_simulato_corrente,
-                "ordine_corrente": ordine_corrente,
-                "indice_bobina": indice_bobina
-            })
-
-        if "guasto macchina" in self.eventi_attivi:
-            tempo_effetivo_riparazione_macchina = np.random.randint(300, 21600+1) #tra i 5 minuti e le 6 ore
-            self.tot_timer = max(self.tot_timer, tempo_effetivo_riparazione_macchina)
-            self.log_eventi.append({
-                "evento": "guasto macchina",
-                "durata": tempo_effetivo_riparazione_macchina,
-                "tempo_simulato": tempo_simulato_corrente,
-                "ordine_corrente": ordine_corrente,
-                "indice_bobina": indice_bobina
-            })
-
-        if "rottura carta" in self.eventi_attivi:
-            tempo_rottura_carta = np.random.randint(60, 420+1) #tra 1 e 7 minuti
-            self.tot_timer = max(self.tot_timer, tempo_rottura_carta)
-            self.log_eventi.append({
-                "evento": "rottura carta",
-                "durata": tempo_rottura_carta,
-                "tempo_simulato": tempo_simulato_corrente,
-                "ordine_corrente": ordine_corrente,
-                "indice_bobina": indice_bobina
-            })
-
-        if "pulizia macchina" in self.eventi_attivi:
-            tempo_pulizia_macchina = np.random.randint(210, 390+1) #tra 3.5 e 6.5 minuti
-            self.tot_timer = max(self.tot_timer, tempo_pulizia_macchina)
-            self.log_eventi.append({
-                "evento": "pulizia macchina",
-                "durata": tempo_pulizia_macchina,
-                "tempo_simulato": tempo_simulato_corrente,
-                "ordine_corrente": ordine_corrente,
-                "indice_bobina": indice_bobina
-            })
-
-        if "cambio lama crespatura" in self.eventi_attivi:
-            tempo_cambio_lama_crespatura = np.random.randint(240, 360+1) #tra 4 e 6 minuti
-            self.tot_timer = max(self.tot_timer, tempo_cambio_lama_crespatura)
-            self.log_eventi.append({
-                "evento": "cambio lama crespatura",
-                "durata": tempo_cambio_lama_crespatura,
-                "tempo_simulato": tempo_simulato_corrente,
-                "ordine_corrente": ordine_corrente,
-                "indice_bobina": indice_bobina
-            })
-
-        if "cambio bobina" in self.eventi_attivi:
-            tempo_cambio_bobina = 15
-            self.tot_timer = max(self.tot_timer, tempo_cambio_bobina)
-            self.log_eventi.append({
-                "evento": "cambio bobina",
-                "durata": tempo_cambio_bobina,
-                "tempo_simulato": tempo_simulato_corrente,
-                "ordine_corrente": ordine_corrente,
-                "indice_bobina": indice_bobina
-            })
-
-        if "cambio produzione" in self.eventi_attivi:
-            tempo_cambio_produzione = np.random.randint(900, 1500+1) #tra 15 e 25 minuti
-            self.tot_timer = max(self.tot_timer, tempo_cambio_produzione)
-            self.log_eventi.append({
-                "evento": "cambio produzione",
-                "durata": tempo_cambio_produzione,
-                "tempo_simulato": tempo_simulato_corrente,
-                "ordine_corrente": ordine_corrente,
-                "indice_bobina": indice_bobina
-            })
+        for tipo in ORDINE_EVENTI:
+            if tipo in self.eventi_attivi:
+                durata = campiona_durata(self.parametri[tipo]["durata"])
+                self.tot_timer = max(self.tot_timer, durata)
+                self.log_eventi.append({
+                    "evento": tipo,
+                    "durata": durata,
+                    "tempo_simulato": tempo_simulato_corrente,
+                    "ordine_corrente": ordine_corrente,
+                    "indice_ordine": self.macchina.indice,
+                    "indice_bobina": indice_bobina
+                })
 
         if self.tot_timer != 0 and "cambio bobina" not in self.eventi_attivi:
             tempo_extra = self.pulizia_macchina_extra()
@@ -203,8 +187,10 @@ class Evento:
                     "durata": tempo_extra,
                     "tempo_simulato": tempo_simulato_corrente,
                     "ordine_corrente": ordine_corrente,
+                    "indice_ordine": self.macchina.indice,
                     "indice_bobina": indice_bobina
                 })
+        self.macchina.oee.fermo(tempo_simulato_corrente)
 
          
 
@@ -1,3 +1,5 @@
+import math
+
 import numpy as np
 
 def calcolo_probabilita_rottura_per_tick(tick_reale_sec, prob_rottura_percentuale, delta_tempo):
@@ -35,48 +37,118 @@ def calcolo_probabilita_rottura_per_tick(tick_reale_sec, prob_rottura_percentual
 class Feltro:
     MIN_ORE_VITA = 432   # 18 giorni 
     MAX_ORE_VITA = 480   # 20 giorni
+    # Fasce di usura dalla più alta: (usura minima, stato, efficienza, probabilità di rottura % sulla vita)
+    FASCE = (
+        (0.90, "critica", 0.6, 99.99),
+        (0.8, "non-ideale", 0.80, 10),
+        (0.5, "buono", 0.95, 5),
+        (0.0, "eccellente", 1, 1),
+    )
 
-    def __init__(self, tick_reale):
+    def __init__(self, tick_reale, ore_vita_min=None, ore_vita_max=None):
+        # Limiti di vita configurabili (scenario), di default quelli di classe
+        self.ore_vita_min = ore_vita_min if ore_vita_min is not None else self.MIN_ORE_VITA
+        self.ore_vita_max = ore_vita_max if ore_vita_max is not None else self.MAX_ORE_VITA
         self.usura = np.random.random()
-        self.ore_vita = np.random.randint(self.MIN_ORE_VITA, self.MAX_ORE_VITA + 1)
+        self.ore_vita = np.random.randint(self.ore_vita_min, self.ore_vita_max + 1)
         self.ore_uso = int(self.usura * self.ore_vita)
         self.tick_reale = tick_reale
+        self.calcola_rischi()
         self.stato = self.calcola_stato()
-        
+
+    def calcola_rischi(self):
+        """
+        Probabilità di rottura per tick di ogni fascia: dipendono solo da ore_vita e tick, quindi si
+        calcolano alla creazione e al cambio del feltro invece che ad ogni tick.
+        """
+        self.probabilita_fasce = [
+            calcolo_probabilita_rottura_per_tick(self.tick_reale, prob_rottura, self.ore_vita*3600)
+            for _, _, _, prob_rottura in self.FASCE
+        ]
+
+    @classmethod
+    def indice_fascia(cls, usura):
+        for indice, fascia in enumerate(cls.FASCE):
+            if usura >= fascia[0]:
+                return indice
+        return len(cls.FASCE) - 1
+
     def calcola_stato(self):
-        """Calcola lo stato attuale in base all'usura."""
-        if self.usura >= 0.90:
-            self.efficienza = 0.6
-            self.prob_rottura = 99.99 #%
-            self.probabilita_per_tick = calcolo_probabilita_rottura_per_tick(self.tick_reale, self.prob_rottura, self.ore_vita*3600)
-            return "critica"
-        elif self.usura >= 0.8:
-            self.efficienza = 0.80
-            self.prob_rottura = 10 #%
-            self.probabilita_per_tick = calcolo_probabilita_rottura_per_tick(self.tick_reale, self.prob_rottura, self.ore_vita*3600)
-            return "non-ideale"
-        elif self.usura >= 0.5:
-            self.efficienza = 0.95
-            self.prob_rottura = 5 #%
-            self.probabilita_per_tick = calcolo_probabilita_rottura_per_tick(self.tick_reale, self.prob_rottura, self.ore_vita*3600)
-            return "buono"
-        else:
-            self.efficienza = 1
-            self.prob_rottura = 1 #%
-            self.probabilita_per_tick = calcolo_probabilita_rottura_per_tick(self.tick_reale, self.prob_rottura, self.ore_vita*3600)
-            return "eccellente"
+        """Calcola lo stato attuale in base all'usura e i limiti di usura della fascia corrente."""
+        indice = self.indice_fascia(self.usura)
+        soglia, stato, self.efficienza, self.prob_rottura = self.FASCE[indice]
+        self.probabilita_per_tick = self.probabilita_fasce[indice]
+        self.limiti_fascia = (soglia, self.FASCE[indice - 1][0] if indice else math.inf)
+        return stato
 
     def aggiorna_usura(self):
         """
         Aggiorna l'usura e lo stato del feltro in base alle ore di utilizzo aggiunte.
+        Lo stato viene ricalcolato solo quando l'usura esce dai limiti della fascia corrente.
         """
         self.ore_uso += self.tick_reale/3600  #per convertire tick_reale da secondi ad ore
         self.usura = min(self.ore_uso / self.ore_vita, 1.0)
+        if not self.limiti_fascia[0] <= self.usura < self.limiti_fascia[1]:
+            self.stato = self.calcola_stato()
+
+    def tick_alla_prossima_soglia(self, limite):
+        """
+        Numero di chiamate di aggiorna_usura dopo le quali il feltro cambia fascia, se entro `limite`
+        (altrimenti None). La stima analitica dalla soglia superiore evita il calcolo quando il cambio è
+        lontano; altrimenti il tick esatto si ricava con le stesse somme sequenziali di aggiorna_usura.
+        """
+        passo = self.tick_reale / 3600
+        inferiore, superiore = self.limiti_fascia
+        stima = (superiore * self.ore_vita - self.ore_uso) / passo
+        if stima > limite + 1 and self.ore_uso / self.ore_vita >= inferiore:
+            return None
+        n = limite if stima > limite else max(1, int(stima) + 2)
+        ore_uso = np.add.accumulate(np.concatenate(([self.ore_uso], np.full(n, passo))))[1:]
+        usura = np.minimum(ore_uso / self.ore_vita, 1.0)
+        fuori = (usura < inferiore) | (usura >= superiore)
+        return int(np.argmax(fuori)) + 1 if fuori.any() else None
+
+    def imposta_usura(self, usura):
+        """Porta il feltro a un'usura data (0-1), es. per analisi what-if."""
+        self.usura = min(max(usura, 0.0), 1.0)
+        self.ore_uso = self.usura * self.ore_vita
         self.stato = self.calcola_stato()
 
     def reset(self):
         self.usura = 0.0
-        self.ore_vita = np.random.randint(self.MIN_ORE_VITA, self.MAX_ORE_VITA + 1)
+        self.ore_vita = np.random.randint(self.ore_vita_min, self.ore_vita_max + 1)
         self.ore_uso = 0
+        self.calcola_rischi()
         self.stato = self.calcola_stato()
 
+
+class PoliticaFeltro:
+    """
+    Politica di sostituzione preventiva del feltro (oltre a fine vita e rotture).
+    soglia_cambio_bobina: usura oltre la quale il feltro viene cambiato al cambio bobina
+    (default 0.90 = fascia critica, comportamento originale).
+    soglia_cambio_ordine: usura oltre la quale il feltro viene cambiato durante il cambio
+    produzione tra due ordini (None = mai).
+    """
+    def __init__(self, soglia_cambio_bobina=0.90, soglia_cambio_ordine=None):
+        self.soglia_cambio_bobina = soglia_cambio_bobina
+        self.soglia_cambio_ordine = soglia_cambio_ordine
+
+    def cambio_al_cambio_bobina(self, feltro):
+        return feltro.usura >= self.soglia_cambio_bobina
+
+    def cambio_al_cambio_ordine(self, feltro):
+        return self.soglia_cambio_ordine is not None and feltro.usura >= self.soglia_cambio_ordine
+
+    def to_dict(self):
+        return {"soglia_cambio_bobina": self.soglia_cambio_bobina, "soglia_cambio_ordine": self.soglia_cambio_ordine}
+
+    def __eq__(self, altra):
+        return isinstance(altra, PoliticaFeltro) and self.to_dict() == altra.to_dict()
+
+    def __hash__(self):
+        return hash((self.soglia_cambio_bobina, self.soglia_cambio_ordine))
+
+    def __repr__(self):
+        return (f"PoliticaFeltro(cambio bobina >= {self.soglia_cambio_bobina}, "
+                f"cambio ordine >= {self.soglia_cambio_ordine})")
@@ -0,0 +1,270 @@
+"""
+Indice colonnare delle bobine completate per le analisi qualità.
+
+Ogni bobina del log (MacchinaContinua.log_bobine, log_bobine.json o un ArchivioRisultati) diventa una
+riga di array numpy, una colonna per campo: run, ordine, prodotto, fascia del feltro, tempi, usura,
+grammatura, peso, indice di qualità ed efficienze di processo. Le righe sono ordinate per tempo di
+completamento, così un intervallo di tempo è una fetta contigua trovata con searchsorted; prodotto,
+fascia del feltro, ordine e run hanno indici bitmap (maschere booleane) costruiti alla prima richiesta
+e riusati dalle query successive. Un filtro combina fetta e bitmap, e le aggregazioni lavorano
+solo sulle colonne richieste.
+
+Esempio: bobine fuori ±5% dal target durante la fascia non-ideale del feltro negli ordini Tovaglioli
+    indice.seleziona(prodotto="Tovaglioli", fascia_feltro="non-ideale", fuori_tolleranza=5).aggrega("indice_qualita")
+
+Avvio: python -m core.indicebobine archivio_base --prodotto Tovaglioli --fascia non-ideale --fuori-tolleranza 5
+"""
+import argparse
+import json
+import logging
+import os
+
+import numpy as np
+
+from core.archivio import FASCE_FELTRO, ArchivioRisultati
+from core.bobina import EFFICIENZE_BOBINA
+from core.console import configura_output
+
+logger = logging.getLogger("core.indicebobine")
+
+COLONNE_EFFICIENZA = tuple(f"efficienza {nome}" for nome in EFFICIENZE_BOBINA)
+COLONNE = ("run", "ordine", "prodotto", "fascia_feltro", "tempo_inizio", "tempo_completamento", "usura_feltro",
+           "grammatura_ottenuta", "grammatura_target", "scostamento_grammatura", "peso_bobina",
+           "indice_qualita") + COLONNE_EFFICIENZA
+CATEGORIE = ("prodotto", "fascia_feltro")       # colonne codificate: il valore è l'indice nella lista delle categorie
+
+
+class IndiceBobine:
+    """
+    Colonne delle bobine ordinate per tempo_completamento (secondi simulati dall'inizio del run).
+    scostamento_grammatura è lo scarto percentuale della grammatura ottenuta dal target.
+    """
+    def __init__(self, colonne, prodotti):
+        self.colonne = colonne
+        self.categorie = {"prodotto": list(prodotti), "fascia_feltro": list(FASCE_FELTRO)}
+        self.n = len(colonne["run"])
+        self._bitmap = {}
+
+    @classmethod
+    def da_colonne(cls, colonne, prodotti):
+        """Costruisce l'indice da colonne non ordinate (stesse chiavi di COLONNE)."""
+        ordine = np.argsort(colonne["tempo_completamento"], kind="stable")
+        return cls({nome: np.ascontiguousarray(colonne[nome][ordine]) for nome in COLONNE}, prodotti)
+
+    @classmethod
+    def da_log(cls, log_per_run):
+        """Da coppie (run, log_bobine) con le etichette di MacchinaContinua.etichetta_bobina."""
+        righe = [(run, bobina) for run, log in log_per_run for bobina in log]
+        prodotti = sorted({bobina["prodotto"] for _, bobina in righe})
+        colonne = {
+            "run": np.array([run for run, _ in righe], dtype=np.int64),
+            "ordine": np.array([b["ordine"] for _, b in righe], dtype=np.int16),
+            "prodotto": np.array([prodotti.index(b["prodotto"]) for _, b in righe], dtype=np.int8),
+            "fascia_feltro": np.array([FASCE_FELTRO.index(b["fascia_feltro"]) for _, b in righe], dtype=np.int8),
+            "grammatura_ottenuta": np.array([b["grammatura ottenuta"] for _, b in righe], dtype=float),
+            "grammatura_target": np.array([b["grammatura target"] for _, b in righe], dtype=float),
+        }
+        for nome in ("tempo_inizio", "tempo_completamento", "usura_feltro", "peso_bobina", "indice_qualita"):
+            colonne[nome] = np.array([b[nome] for _, b in righe], dtype=float)
+        for nome, colonna in zip(EFFICIENZE_BOBINA, COLONNE_EFFICIENZA):
+            colonne[colonna] = np.array([b["efficienze"][nome] for _, b in righe], dtype=float)
+        colonne["scostamento_grammatura"] = _scostamento(colonne)
+        return cls.da_colonne(colonne, prodotti)
+
+    @classmethod
+    def da_archivio(cls, archivio, blocco=1000):
+        """Da un ArchivioRisultati con bobine e ordini archiviati, leggendo il memmap a blocchi di run."""
+        if archivio.bobine is None or archivio.ordini is None:
+            raise ValueError("L'archivio non contiene bobine e ordini (max_bobine / max_ordini)")
+        parti, prodotti = [], []
+        for inizio in range(0, archivio.n_run, blocco):
+            righe = slice(inizio, inizio + blocco)
+            kpi = archivio.kpi[righe]
+            scritti = kpi["scritto"]
+            kpi = kpi[scritti]
+            valide = np.arange(archivio.bobine.shape[1]) < kpi["bobine_archiviate"][:, None]
+            bobine = archivio.bobine[righe][scritti][valide]
+            run = np.broadcast_to(kpi["seme"][:, None], valide.shape)[valide]
+            # prodotto della bobina dalla tabella ordini del suo run (ordini oltre max_ordini: prodotto sconosciuto)
+            ordini = archivio.ordini[righe][scritti]["prodotto"]
+            riga_run = np.broadcast_to(np.arange(len(kpi))[:, None], valide.shape)[valide]
+            nomi = np.where(bobine["ordine"] < ordini.shape[1],
+                            ordini[riga_run, np.minimum(bobine["ordine"], ordini.shape[1] - 1)], b"?")
+            nuovi, codici = np.unique(nomi, return_inverse=True)
+            for nome in nuovi.astype(str).tolist():
+                if nome not in prodotti:
+                    prodotti.append(nome)
+            mappa = np.array([prodotti.index(nome) for nome in nuovi.astype(str).tolist()], dtype=np.int8)
+            parte = {
+                "run": run.astype(np.int64),
+                "ordine": bobine["ordine"],
+                "prodotto": mappa[codici.ravel()],
+                "fascia_feltro": bobine["fascia_feltro"],
+            }
+            for nome in ("tempo_inizio", "tempo_completamento", "usura_feltro", "grammatura_ottenuta",
+                         "grammatura_target", "peso_bobina", "indice_qualita"):
+                parte[nome] = bobine[nome]
+            for nome, colonna in zip(EFFICIENZE_BOBINA, COLONNE_EFFICIENZA):
+                parte[colonna] = bobine["efficienze"][nome]
+            parte["scostamento_grammatura"] = _scostamento(parte)
+            parti.append(parte)
+        colonne = {nome: np.concatenate([parte[nome] for parte in parti]) for nome in COLONNE} if parti else \
+            {nome: np.zeros(0) for nome in COLONNE}
+        return cls.da_colonne(colonne, prodotti)
+
+    def salva(self, cartella):
+        """Salva le colonne in file .npy (riaperti in memmap da carica)."""
+        os.makedirs(cartella, exist_ok=True)
+        for nome in COLONNE:
+            np.save(os.path.join(cartella, f"{nome}.npy"), self.colonne[nome])
+        with open(os.path.join(cartella, "indice.json"), "w", encoding="utf-8") as f:
+            json.dump({"n": self.n, "prodotti": self.categorie["prodotto"]}, f, indent=2)
+
+    @classmethod
+    def carica(cls, cartella):
+        with open(os.path.join(cartella, "indice.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        colonne = {nome: np.load(os.path.join(cartella, f"{nome}.npy"), mmap_mode="r") for nome in COLONNE}
+        return cls(colonne, meta["prodotti"])
+
+    def codice(self, colonna, valore):
+        """Codice di un valore: indice nelle categorie per prodotto e fascia_feltro, il valore stesso altrimenti."""
+        if colonna in CATEGORIE:
+            categorie = self.categorie[colonna]
+            return categorie.index(valore) if valore in categorie else -1
+        return valore
+
+    def bitmap(self, colonna, valore):
+        """Maschera delle righe con colonna == valore, calcolata una volta e poi riusata."""
+        chiave = (colonna, valore)
+        if chiave not in self._bitmap:
+            self._bitmap[chiave] = self.colonne[colonna] == self.codice(colonna, valore)
+        return self._bitmap[chiave]
+
+    def intervallo(self, da=None, a=None):
+        """Fetta di righe con tempo_completamento in [da, a) (secondi)."""
+        tempi = self.colonne["tempo_completamento"]
+        inizio = 0 if da is None else int(np.searchsorted(tempi, da, side="left"))
+        fine = self.n if a is None else int(np.searchsorted(tempi, a, side="left"))
+        return slice(inizio, max(inizio, fine))
+
+    def seleziona(self, tempo=None, fuori_tolleranza=None, **uguaglianze):
+        """
+        Bobine che soddisfano tutti i filtri. uguaglianze: colonna=valore o colonna=[valori] (in OR),
+        con indici bitmap per prodotto, fascia_feltro, ordine e run. tempo=(da, a) in secondi di
+        completamento. fuori_tolleranza=p tiene le bobine con |scostamento di grammatura| > p %.
+        """
+        fetta = self.intervallo(*tempo) if tempo else slice(0, self.n)
+        maschera = None
+        for colonna, valori in uguaglianze.items():
+            if colonna not in self.colonne:
+                raise KeyError(f"Colonna sconosciuta: {colonna}")
+            valori = valori if isinstance(valori, (list, tuple, set)) else [valori]
+            filtro = None
+            for valore in valori:
+                bitmap = self.bitmap(colonna, valore)[fetta]
+                filtro = bitmap if filtro is None else filtro | bitmap
+            maschera = filtro if maschera is None else maschera & filtro
+        if fuori_tolleranza is not None:
+            filtro = np.abs(self.colonne["scostamento_grammatura"][fetta]) > fuori_tolleranza
+            maschera = filtro if maschera is None else maschera & filtro
+        return SelezioneBobine(self, fetta, maschera)
+
+
+class SelezioneBobine:
+    """Risultato di IndiceBobine.seleziona: fetta per tempo più maschera opzionale degli altri filtri."""
+    def __init__(self, indice, fetta, maschera):
+        self.indice = indice
+        self.fetta = fetta
+        self.maschera = maschera
+
+    def conta(self):
+        if self.maschera is None:
+            return self.fetta.stop - self.fetta.start
+        return int(np.count_nonzero(self.maschera))
+
+    def colonna(self, nome):
+        valori = self.indice.colonne[nome][self.fetta]
+        return valori if self.maschera is None else valori[self.maschera]
+
+    def aggrega(self, nome, percentili=(5, 50, 95)):
+        """Numero, media, minimo, massimo e percentili di una colonna numerica sulle bobine selezionate."""
+        valori = self.colonna(nome)
+        valori = valori[~np.isnan(valori)] if valori.dtype.kind == "f" else valori
+        if not len(valori):
+            return {"n": 0}
+        return {
+            "n": int(len(valori)), "media": float(valori.mean()), "min": float(valori.min()), "max": float(valori.max()),
+            **{f"p{p}": float(v) for p, v in zip(percentili, np.percentile(valori, percentili))},
+        }
+
+    def per(self, gruppo, nome):
+        """Numero e media di una colonna per valore di una colonna di gruppo (es. per prodotto o fascia)."""
+        codici = self.colonna(gruppo).astype(np.int64)
+        valori = self.colonna(nome).astype(float)
+        if not len(codici):
+            return {}
+        base = codici.min()
+        conteggi = np.bincount(codici - base)
+        somme = np.bincount(codici - base, weights=valori)
+        categorie = self.indice.categorie.get(gruppo)
+        return {
+            (categorie[base + i] if categorie else int(base + i)): {"n": int(n), "media": float(somme[i] / n)}
+            for i, n in enumerate(conteggi) if n
+        }
+
+    def righe(self, limite=100):
+        """Prime bobine selezionate come dizionari (categorie decodificate)."""
+        colonne = {nome: self.colonna(nome)[:limite] for nome in COLONNE}
+        righe = []
+        for i in range(len(colonne["run"])):
+            riga = {nome: colonne[nome][i].item() for nome in COLONNE}
+            for nome in CATEGORIE:
+                riga[nome] = self.indice.categorie[nome][riga[nome]]
+            righe.append(riga)
+        return righe
+
+
+def _scostamento(colonne):
+    return (colonne["grammatura_ottenuta"] - colonne["grammatura_target"]) / colonne["grammatura_target"] * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query sull'indice delle bobine completate")
+    parser.add_argument("sorgente", help="cartella di un ArchivioRisultati, di un indice salvato o log_bobine.json")
+    parser.add_argument("--prodotto", action="append", help="prodotto (ripetibile)")
+    parser.add_argument("--fascia", action="append", help="fascia del feltro (ripetibile)")
+    parser.add_argument("--ordine", type=int, action="append", help="indice dell'ordine nel run (ripetibile)")
+    parser.add_argument("--fuori-tolleranza", type=float, default=None, help="scostamento di grammatura minimo (%%)")
+    parser.add_argument("--tempo-ore", type=float, nargs=2, default=None, metavar=("DA", "A"),
+                        help="intervallo del tempo di completamento (ore)")
+    parser.add_argument("--salva", default=None, help="cartella in cui salvare l'indice costruito")
+    argomenti = parser.parse_args()
+    configura_output("console")
+    if os.path.isfile(argomenti.sorgente):
+        with open(argomenti.sorgente, encoding="utf-8") as f:
+            indice = IndiceBobine.da_log([(0, json.load(f))])
+    elif os.path.exists(os.path.join(argomenti.sorgente, "indice.json")):
+        indice = IndiceBobine.carica(argomenti.sorgente)
+    else:
+        indice = IndiceBobine.da_archivio(ArchivioRisultati(argomenti.sorgente))
+    if argomenti.salva:
+        indice.salva(argomenti.salva)
+    filtri = {nome: valori for nome, valori in (("prodotto", argomenti.prodotto), ("fascia_feltro", argomenti.fascia),
+                                                 ("ordine", argomenti.ordine)) if valori}
+    tempo = tuple(ore * 3600 for ore in argomenti.tempo_ore) if argomenti.tempo_ore else None
+    selezione = indice.seleziona(tempo=tempo, fuori_tolleranza=argomenti.fuori_tolleranza, **filtri)
+    risultato = {
+        "bobine_indice": indice.n,
+        "bobine_selezionate": selezione.conta(),
+        "indice_qualita": selezione.aggrega("indice_qualita"),
+        "scostamento_grammatura": selezione.aggrega("scostamento_grammatura"),
+        "peso_bobina": selezione.aggrega("peso_bobina"),
+        "qualita_per_prodotto": selezione.per("prodotto", "indice_qualita"),
+        "qualita_per_fascia_feltro": selezione.per("fascia_feltro", "indice_qualita"),
+    }
+    logger.info(json.dumps(risultato, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Kernel compatto per l'avanzamento a blocchi di MacchinaContinua.
+
+esegui_tick attraversa a ogni tick clock, timer degli eventi, tre roll casuali, usura del feltro,
+peso della bobina, produzione dell'ordine e due tracker. Nei tick di sola produzione (nessun fermo in
+corso, nessun timer in scadenza, bobina non ancora completa) lo stato che conta sta in pochi numeri:
+avanza() lo impacchetta in un array float64 e fa avanzare fino a K tick per chiamata con un kernel
+compilato con Numba se installato (import e compilazione al primo uso, con cache su disco), altrimenti
+con operazioni NumPy vettoriali; CARTIERA_KERNEL=numpy forza la versione NumPy. I tick di fermo
+vengono saltati in blocco; i tick "speciali" (evento, fine bobina, cambio ordine) passano ancora da
+esegui_tick. Un blocco termina anche al cambio di fascia di usura del feltro
+(Feltro.tick_alla_prossima_soglia), così nel kernel la probabilità di rottura del feltro è costante.
+Lunghezza e peso di ogni tick arrivano al kernel come array: costanti, o dai percorsi precalcolati
+della deriva dei parametri di processo (core.deriva) se attiva.
+
+Le traiettorie sono identiche al modello a oggetti con lo stesso seme: i numeri casuali dei roll
+sono estratti dal generatore globale NumPy (tre per tick, come gestione_passivi) e, se un roll scatta
+a metà blocco, il generatore viene riportato al tick dell'evento prima di lasciarlo a esegui_tick.
+Le somme cumulative sono sequenziali e con le stesse operazioni in virgola mobile degli oggetti.
+
+Uso: n = avanza(macchina, 10000)   # equivale a 10000 chiamate di macchina.esegui_tick()
+"""
+import os
+
+import numpy as np
+
+from core.dashboard import STATO_FINE
+
+TICK_PER_BLOCCO = 4096
+
+# Disposizione dell'array di stato del kernel
+(ORE_USO, ORE_TICK, P_FELTRO, P_GUASTO, P_CARTA, LUNGHEZZA, PESO_BOBINA, PESO_ACCUMULATO, PESO_PARZIALE,
+ PESO_TARGET, DIMENSIONE_STATO) = range(11)
+
+
+def _avanza_ciclo(stato, uniformi, n_tick, delta_lunghezza, delta_peso, progresso, peso_simulazione):
+    """
+    Versione a ciclo (compilata con Numba): avanza al più n_tick tick di produzione e si ferma prima
+    del primo tick in cui un roll scatta. delta_lunghezza e delta_peso sono gli incrementi di ogni tick.
+    Restituisce i tick prodotti; progresso e peso_simulazione ricevono i valori dei due tracker.
+    """
+    ore_uso, ore_tick = stato[ORE_USO], stato[ORE_TICK]
+    p_feltro, p_guasto, p_carta = stato[P_FELTRO], stato[P_GUASTO], stato[P_CARTA]
+    lunghezza, peso_bobina = stato[LUNGHEZZA], stato[PESO_BOBINA]
+    accumulato, parziale = stato[PESO_ACCUMULATO], stato[PESO_PARZIALE]
+    peso_target = stato[PESO_TARGET]
+    prodotti = n_tick
+    for i in range(n_tick):
+        if uniformi[3*i] < p_feltro or uniformi[3*i + 1] < p_guasto or uniformi[3*i + 2] < p_carta:
+            prodotti = i
+            break
+        ore_uso += ore_tick
+        lunghezza += delta_lunghezza[i]
+        peso_bobina += delta_peso[i]
+        accumulato += delta_peso[i]
+        parziale += delta_peso[i]
+        progresso[i] = min(100.0, 100*parziale/peso_target)
+        peso_simulazione[i] = accumulato/1000
+    stato[ORE_USO] = ore_uso
+    stato[LUNGHEZZA], stato[PESO_BOBINA] = lunghezza, peso_bobina
+    stato[PESO_ACCUMULATO], stato[PESO_PARZIALE] = accumulato, parziale
+    return prodotti
+
+
+def _avanza_numpy(stato, uniformi, n_tick, delta_lunghezza, delta_peso, progresso, peso_simulazione):
+    """Stessa semantica di _avanza_ciclo con somme cumulative NumPy (senza Numba)."""
+    def cumula(iniziale, delta, n):
+        return np.add.accumulate(np.concatenate(([iniziale], delta[:n] if np.ndim(delta) else np.full(n, delta))))[1:]
+
+    roll = uniformi[:3*n_tick].reshape(n_tick, 3)
+    scatta = (roll[:, 0] < stato[P_FELTRO]) | (roll[:, 1] < stato[P_GUASTO]) | (roll[:, 2] < stato[P_CARTA])
+    prodotti = int(np.argmax(scatta)) if scatta.any() else n_tick
+    if prodotti == 0:
+        return 0
+    accumulato = cumula(stato[PESO_ACCUMULATO], delta_peso, prodotti)
+    parziale = cumula(stato[PESO_PARZIALE], delta_peso, prodotti)
+    progresso[:prodotti] = np.minimum(100.0, 100*parziale/stato[PESO_TARGET])
+    peso_simulazione[:prodotti] = accumulato/1000
+    stato[ORE_USO] = cumula(stato[ORE_USO], stato[ORE_TICK], prodotti)[-1]
+    stato[LUNGHEZZA] = cumula(stato[LUNGHEZZA], delta_lunghezza, prodotti)[-1]
+    stato[PESO_BOBINA] = cumula(stato[PESO_BOBINA], delta_peso, prodotti)[-1]
+    stato[PESO_ACCUMULATO], stato[PESO_PARZIALE] = accumulato[-1], parziale[-1]
+    return prodotti
+
+
+_kernel_produzione = None   # scelto al primo uso da kernel_produzione()
+
+
+def kernel_produzione():
+    """
+    Kernel di produzione in uso: _avanza_ciclo compilato con Numba se installato, altrimenti
+    _avanza_numpy. Numba viene importato solo qui, non all'import del modulo.
+    """
+    global _kernel_produzione
+    if _kernel_produzione is None:
+        _kernel_produzione = _avanza_numpy
+        if os.environ.get("CARTIERA_KERNEL", "").lower() != "numpy":
+            try:
+                from numba import njit
+            except ImportError:
+                pass
+            else:
+                _kernel_produzione = njit(cache=True)(_avanza_ciclo)
+    return _kernel_produzione
+
+
+def _impacchetta(macchina):
+    """Stato del kernel letto dagli oggetti della macchina."""
+    feltro, bobina, programma, evento = macchina.feltro, macchina.bobina, macchina.programma, macchina.evento
+    stato = np.empty(DIMENSIONE_STATO)
+    stato[ORE_USO], stato[ORE_TICK] = feltro.ore_uso, feltro.tick_reale/3600
+    stato[P_FELTRO] = feltro.probabilita_per_tick
+    stato[P_GUASTO], stato[P_CARTA] = evento.probabilita_tick_guasto, evento.probabilita_tick_rottura_carta
+    stato[LUNGHEZZA], stato[PESO_BOBINA] = bobina.lunghezza, bobina.peso_bobina
+    stato[PESO_ACCUMULATO], stato[PESO_PARZIALE] = programma.peso_accumulato, programma.peso_parziale
+    stato[PESO_TARGET] = programma.ordine_corrente.peso_target
+    return stato
+
+
+def _delta_tick(macchina, n_tick):
+    """
+    Incrementi di lunghezza e peso della bobina nei prossimi n_tick tick di produzione, con le stesse
+    operazioni di Bobina.aggiorna_peso (con la deriva, la velocità e la grammatura di ogni tick).
+    """
+    velocita = macchina.programma.parametri_processo['velocita tela']['valore']
+    grammatura, larghezza, tick = macchina.bobina.grammatura, macchina.larghezza_macchina, macchina.tick_reale
+    if macchina.deriva is None:
+        delta_lunghezza = velocita * 0.85 * tick
+        return np.full(n_tick, delta_lunghezza), np.full(n_tick, delta_lunghezza * grammatura * larghezza / 1000)
+    return macchina.deriva.incrementi(macchina.simclock.tempo_simulato // tick + 1, n_tick, velocita, grammatura, larghezza)
+
+
+def _tick_liberi(macchina, limite):
+    """
+    Tick di sola produzione (al più limite) prima della scadenza di un timer, del tick che completa la
+    bobina o del cambio di fascia del feltro.
+    """
+    evento, bobina, tick = macchina.evento, macchina.bobina, macchina.tick_reale
+    if evento.tot_timer != 0 or evento.eventi_attivi or bobina.completata:
+        return 0
+    # un timer T scade al tick ceil(T/tick): liberi i tick precedenti
+    liberi = min(-(-timer // tick) - 1 for timer in
+                 (evento.timer_rimanente_feltro, evento.timer_rimanente_pulizia, evento.timer_rimanente_LC))
+    liberi = min(liberi, limite)
+    velocita = macchina.programma.parametri_processo['velocita tela']['valore']
+    delta_lunghezza = velocita * 0.85 * tick
+    stima = int((bobina.lunghezza_max - bobina.lunghezza) // delta_lunghezza) + 2
+    if macchina.deriva is None:
+        lunghezze = np.add.accumulate(np.concatenate(([bobina.lunghezza], np.full(stima, delta_lunghezza))))[1:]
+        tick_bobina = int(np.searchsorted(lunghezze >= bobina.lunghezza_max, True)) + 1
+    else:
+        # con la deriva la stima a velocità nominale (più un margine) limita solo la ricerca: se la
+        # bobina non si completa entro i tick esaminati, il blocco si ferma prima
+        tick_bobina = macchina.deriva.tick_fine_bobina(macchina.simclock.tempo_simulato // tick + 1,
+                                                       max(0, min(liberi, stima + stima // 4)) + 1,
+                                                       velocita, bobina.lunghezza, bobina.lunghezza_max)
+    liberi = max(0, min(liberi, tick_bobina - 1))
+    # il blocco si chiude al tick in cui il feltro cambia fascia di usura
+    cambio_fascia = macchina.feltro.tick_alla_prossima_soglia(liberi) if liberi else None
+    return liberi if cambio_fascia is None else cambio_fascia
+
+
+def _produci(macchina, n_tick):
+    """Fino a n_tick tick di produzione col kernel; si ferma prima del tick in cui scatta un roll."""
+    stato = _impacchetta(macchina)
+    rng = np.random.get_state()
+    uniformi = np.random.random(3 * n_tick)
+    progresso, peso_simulazione = np.empty(n_tick), np.empty(n_tick)
+    delta_lunghezza, delta_peso = _delta_tick(macchina, n_tick)
+    prodotti = kernel_produzione()(stato, uniformi, n_tick, delta_lunghezza, delta_peso, progresso, peso_simulazione)
+    if prodotti < n_tick:
+        # il tick dell'evento ripete i suoi roll in esegui_tick
+        np.random.set_state(rng)
+        np.random.random(3 * prodotti)
+    if prodotti == 0:
+        return 0
+    feltro, bobina, programma = macchina.feltro, macchina.bobina, macchina.programma
+    feltro.ore_uso = float(stato[ORE_USO])
+    feltro.usura = min(feltro.ore_uso / feltro.ore_vita, 1.0)
+    feltro.stato = feltro.calcola_stato()
+    bobina.lunghezza, bobina.peso_bobina = float(stato[LUNGHEZZA]), float(stato[PESO_BOBINA])
+    bobina.delta_peso_bobina = 0
+    programma.peso_accumulato, programma.peso_parziale = float(stato[PESO_ACCUMULATO]), float(stato[PESO_PARZIALE])
+    evento = macchina.evento
+    trascorso = prodotti * macchina.tick_reale
+    evento.timer_rimanente_feltro -= trascorso
+    evento.timer_rimanente_pulizia -= trascorso
+    evento.timer_rimanente_LC -= trascorso
+    macchina.simclock.tempo_simulato += trascorso
+    macchina.stato = "Produzione"
+    macchina.tracker_ordine.aggiorna_blocco(progresso[:prodotti].tolist())
+    macchina.tracker_simulazione.aggiorna_blocco(peso_simulazione[:prodotti].tolist())
+    return prodotti
+
+
+def _salta_fermo(macchina, n_tick):
+    """Fino a n_tick tick di fermo (come esegui_tick con tot_timer > 0). Restituisce i tick eseguiti."""
+    evento, tick = macchina.evento, macchina.tick_reale
+    n_tick = min(n_tick, -(-evento.tot_timer // tick))
+    macchina.stato = "non in Produzione: cambio, manutenzione o guasto"
+    macchina.simclock.tempo_simulato += n_tick * tick
+    macchina.tempo_perso += n_tick * tick
+    evento.tot_timer = max(0, evento.tot_timer - n_tick * tick)
+    programma = macchina.programma
+    progresso = min(100.0, 100*programma.peso_parziale/programma.ordine_corrente.peso_target)
+    macchina.tracker_ordine.aggiorna_blocco([progresso] * n_tick)
+    macchina.tracker_simulazione.aggiorna_blocco([programma.peso_accumulato/1000] * n_tick)
+    if evento.tot_timer == 0:
+        evento.reset()
+        macchina.eventi_attivi = evento.eventi_attivi
+    return n_tick
+
+
+def avanza(macchina, n_tick, blocco=TICK_PER_BLOCCO):
+    """
+    Esegue n_tick tick della macchina (meno se la simulazione termina prima), con lo stesso risultato
+    di altrettante chiamate di esegui_tick; n_tick=math.inf esegue fino al termine degli ordini.
+    blocco limita i tick di una chiamata al kernel. Restituisce i tick eseguiti.
+    I blocchi si fermano anche al confine dell'ora dell'OEE, che viene chiuso come in esegui_tick.
+    """
+    eseguiti, oee = 0, macchina.oee
+    while eseguiti < n_tick and macchina.stato != STATO_FINE:
+        if macchina.simclock.tempo_simulato >= oee.confine:
+            oee.aggiorna(macchina)
+        restanti = min(n_tick - eseguiti, oee.tick_al_confine(macchina.simclock.tempo_simulato))
+        if macchina.evento.tot_timer != 0:
+            eseguiti += _salta_fermo(macchina, restanti)
+            continue
+        liberi = _tick_liberi(macchina, min(restanti, blocco))
+        if liberi > 0:
+            prodotti = _produci(macchina, liberi)
+            eseguiti += prodotti
+            if prodotti == liberi:
+                continue
+        if eseguiti < n_tick:
+            macchina.esegui_tick()
+            eseguiti += 1
+    return eseguiti
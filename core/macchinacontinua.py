@@ -1,28 +1,37 @@
 from core.bobina import Bobina                # Gestione singola bobina prodotta
-from core.feltro import Feltro                # Gestione feltro/sezione presse
+from core.deriva import DerivaProcesso        # Deriva opzionale dei parametri di processo
+from core.feltro import Feltro, PoliticaFeltro  # Gestione feltro/sezione presse
 from core.evento import Evento                # Gestione eventi (guasti, fermi, ecc.)
+from core.oee import MotoreOEE                # OEE incrementale per campagna, ordine, turno e ora
 from core.programmaproduzione import ProgrammaProduzione, Ordine  # Logica ordini e gestione processo
 from core.reportstatistica import ReportStatistica 
 from core.simclock import SimClock
-from core.tracker import ProgressTracker
+from core.tracker import ProgressTracker, TrackerMultirisoluzione
 
 
-def calcola_media_ponderata_efficienze(parametri, efficienza_feltro):
+# Scelta arbitraria dei pesi (core.sensibilita ne misura l'effetto sulla qualità)
+PESI_EFFICIENZE = {
+    'velocita tela': 3,
+    'concentrazione impasto %': 2,
+    'grado raffinazione': 4,
+    'temperatura cappa': 1,
+    'additivo_0': 1,
+    'additivo_1': 1,
+    'additivo_2': 1,
+    'feltro': 3  # peso speciale per l’efficienza feltro
+}
+# Parametri di sigma_grammatura_solo_eff usati da setup_bobina
+COEFF_SIGMA = 0.6
+ESPONENTE_SIGMA = 2
+
+
+def calcola_media_ponderata_efficienze(parametri, efficienza_feltro, pesi=None):
     """
     Calcola la media ponderata delle efficienze dei parametri di processo,
     includendo anche l’efficienza del feltro con peso specifico.
+    pesi: pesi per chiave (default PESI_EFFICIENZE; chiavi mancanti pesano 1).
     """
-    # Scelta arbitraria dei pesi 
-    pesi_default = {
-        'velocita tela': 3,
-        'concentrazione impasto %': 2,
-        'grado raffinazione': 4,
-        'temperatura cappa': 1,
-        'additivo_0': 1,
-        'additivo_1': 1,
-        'additivo_2': 1,
-        'feltro': 3  # peso speciale per l’efficienza feltro
-    }
+    pesi_default = PESI_EFFICIENZE if pesi is None else pesi
     efficienze = []
     pesi_eff = []
     # Parametri principali
@@ -53,29 +62,72 @@ def sigma_grammatura_solo_eff(grammatura_target, efficienza_media, coeff, p):
 
 
 class MacchinaContinua:
-    def __init__(self, lista_ordini, tick_visivo,  tick_reale=5, larghezza_macchina=2.75):
+    # Pipeline della qualità (sostituibili per istanza, es. nell'analisi di sensibilità)
+    pesi_efficienze = PESI_EFFICIENZE
+    coeff_sigma = COEFF_SIGMA
+    esponente_sigma = ESPONENTE_SIGMA
+
+    def __init__(self, lista_ordini, tick_visivo,  tick_reale=5, larghezza_macchina=2.75, grafici=True, scenario=None,
+                 politica_feltro=None, tracker_multirisoluzione=False, deriva=None, seme=None):
+        """
+        scenario: Scenario compilato (core.scenario) con ricette, parametri eventi, limiti feltro e
+        larghezza macchina; se presente sostituisce tick_reale e larghezza_macchina.
+        politica_feltro: PoliticaFeltro per la sostituzione preventiva del feltro; se None quella
+        dello scenario o, in mancanza, cambio in fascia critica al cambio bobina.
+        tracker_multirisoluzione: tracker a memoria costante (TrackerMultirisoluzione) invece della
+        serie completa tick per tick, per run senza fine prevista.
+        deriva: DerivaProcesso delle efficienze entro l'ordine (core.deriva); None quella della sezione
+        deriva dello scenario, se presente; False nessuna deriva.
+        seme: seme del run, da cui la deriva dello scenario ricava il proprio generatore.
+        """
+        if scenario is not None:
+            tick_reale = scenario.tick_reale
+            larghezza_macchina = scenario.larghezza_macchina
+        self.scenario = scenario
         self.stato = "Produzione"
         self.tick_reale = tick_reale                # Esempio: 5 secondi per tick
         self.tick_visivo = tick_visivo               
-        self.feltro = Feltro(tick_reale)            # Feltro iniziale
+        if scenario is not None:
+            self.feltro = Feltro(tick_reale, scenario.ore_vita_feltro_min, scenario.ore_vita_feltro_max)
+        else:
+            self.feltro = Feltro(tick_reale)        # Feltro iniziale
+        if politica_feltro is None:
+            politica_feltro = PoliticaFeltro(**scenario.politica_feltro) if scenario is not None else PoliticaFeltro()
+        self.politica_feltro = politica_feltro
         self.bobina = None                          # Bobina inizializzata in seguito  
         self.sigma = None                          
-        self.programma = ProgrammaProduzione(lista_ordini) 
+        if scenario is not None:
+            self.programma = ProgrammaProduzione(
+                lista_ordini, scenario.sigma_velocita, scenario.sigma_efficienza,
+                ricette=scenario.ricette, larghezza=larghezza_macchina
+            )
+        else:
+            self.programma = ProgrammaProduzione(lista_ordini, larghezza=larghezza_macchina)
         self.programma.avvia_produzione()           # Oggetto ProgrammaProduzione già avviato
         self.report = ReportStatistica()     
         self.simclock = SimClock(tick_interno=self.tick_reale, tick_visivo=self.tick_visivo) # Clock simulato: usi solo il tick interno, che rappresenta il tempo reale di simulazione
         self.larghezza_macchina = larghezza_macchina    # Statico, tipico 2.75 m
-        self.tracker_ordine = ProgressTracker("Tracker produzione ordine corrente", self.tick_reale)
-        self.tracker_simulazione = ProgressTracker("tracker produzione simulazione", self.tick_reale)
+        classe_tracker = TrackerMultirisoluzione if tracker_multirisoluzione else ProgressTracker
+        self.tracker_ordine = classe_tracker("Tracker produzione ordine corrente", self.tick_reale)
+        self.tracker_simulazione = classe_tracker("tracker produzione simulazione", self.tick_reale)
         self.indice = 0 
-        self.bobine_tot_prodotte = [0, 0, 0]  
+        self.bobine_tot_prodotte = [0] * len(lista_ordini)  
         self.log_bobine = []                         
         self.tempo_perso = 0                        #  contatore tempo perso totale
-        self.evento = Evento(tick_reale, self)
+        self.oee = MotoreOEE(self.tick_reale)       # disponibilità × prestazioni × qualità, aggiornato durante la simulazione
+        self.evento = Evento(tick_reale, self, scenario.eventi if scenario is not None else None)
         self.eventi_attivi = self.evento.eventi_attivi     
+        self.grafici = grafici                      # False: nessun grafico a fine ordine (run batch, matplotlib mai importato)
+        self.deriva = DerivaProcesso.da_scenario(scenario, seme) if deriva is None else (deriva or None)
         
         
 
+    def imposta_usura_feltro(self, usura):
+        """Imposta l'usura del feltro e riallinea il timer di fine vita del feltro in Evento."""
+        self.feltro.imposta_usura(usura)
+        self.evento.timer_fine_vita_feltro = int((self.feltro.ore_vita-self.feltro.ore_uso)*3600)
+        self.evento.timer_rimanente_feltro = self.evento.timer_fine_vita_feltro
+
     def setup_ordine(self):
         """
         Setup parametri per il nuovo ordine (solo al cambio ordine).
@@ -92,14 +144,41 @@ class MacchinaContinua:
         ordine = self.programma.ordine_corrente
         grammatura = ordine.grammatura_target
         lunghezza_max = getattr(ordine, "lunghezza_max", 50000) # Ottiene ordine.lunghezza_max se esiste, altrimenti assegna 50000.
-        eff_media = calcola_media_ponderata_efficienze(self.programma.parametri_processo, self.feltro.efficienza)
-        sigma = sigma_grammatura_solo_eff(grammatura, eff_media, coeff=0.6, p=2)
+        if self.deriva is not None:
+            self.deriva.applica(self.programma.parametri_processo, self.simclock.tempo_simulato // self.tick_reale)
+        eff_media = calcola_media_ponderata_efficienze(self.programma.parametri_processo, self.feltro.efficienza,
+                                                       self.pesi_efficienze)
+        sigma = sigma_grammatura_solo_eff(grammatura, eff_media, coeff=self.coeff_sigma, p=self.esponente_sigma)
         self.bobina = Bobina(grammatura, sigma, eff_media, lunghezza_max) # Funziona anche come reset per la nuova bobina
+        self.etichetta_bobina()
+
+    def etichetta_bobina(self):
+        """
+        Registra sulla bobina appena creata il contesto che ne determina la qualità: ordine, stato del
+        feltro ed efficienze di processo all'avvio della bobina (il tempo di completamento si aggiunge a fine bobina).
+        """
+        parametri = self.programma.parametri_processo
+        efficienze = {chiave: round(info["efficienza"], 4) for chiave, info in parametri.items()
+                      if chiave != "additivi chimici"}
+        additivi = [additivo["efficienza"] for additivo in parametri.get("additivi chimici", [])]
+        efficienze["additivi chimici"] = round(sum(additivi) / len(additivi), 4) if additivi else None
+        efficienze["feltro"] = self.feltro.efficienza
+        self.bobina.etichette = {
+            "ordine": self.indice,
+            "prodotto": self.programma.ordine_corrente.prodotto,
+            "tempo_inizio": self.simclock.get_time(),
+            "usura_feltro": round(self.feltro.usura, 4),
+            "fascia_feltro": self.feltro.stato,
+            "efficienze": efficienze,
+        }
 
 
 
     def esegui_tick(self):
         """Avanza l'intera simulazione di un tick (5 sec)"""
+        # 0. Chiude l'ora (e il turno) dell'OEE al confine
+        if self.simclock.tempo_simulato >= self.oee.confine:
+            self.oee.aggiorna(self)
         # 1. Aggiorna clock simulato
         self.simclock.advance_internal()
         
@@ -130,7 +209,11 @@ class MacchinaContinua:
                 # Avanza usura feltro PRIMA di produrre (così il nuovo sigma sarà aggiornato)
                 self.stato = "Produzione"
                 self.feltro.aggiorna_usura()
-                self.bobina.aggiorna_peso(self.tick_reale, self.programma.parametri_processo['velocita tela']['valore'], larghezza=self.larghezza_macchina)
+                velocita, fattore_grammatura = self.programma.parametri_processo['velocita tela']['valore'], 1.0
+                if self.deriva is not None:
+                    fattore_velocita, fattore_grammatura = self.deriva.fattori_tick(self.simclock.tempo_simulato // self.tick_reale)
+                    velocita *= fattore_velocita
+                self.bobina.aggiorna_peso(self.tick_reale, velocita, self.larghezza_macchina, fattore_grammatura)
                 self.programma.aggiorna_produzione(self.bobina.delta_peso_bobina, self.bobina.completata)
                 self.bobina.delta_peso_bobina = 0
                 progresso = min(100.0, 100*self.programma.peso_parziale/self.programma.ordine_corrente.peso_target)
@@ -141,7 +224,12 @@ class MacchinaContinua:
             elif self.bobina.completata :
                 self.programma.aggiorna_produzione(self.bobina.delta_peso_bobina, self.bobina.completata)
                 self.bobine_tot_prodotte[self.indice] += 1
+                if self.deriva is not None:
+                    # grammatura media effettiva con la deriva della concentrazione
+                    self.bobina.grammatura = self.bobina.peso_bobina * 1000 / (self.bobina.lunghezza * self.larghezza_macchina)
+                self.bobina.etichette["tempo_completamento"] = self.simclock.get_time()
                 self.log_bobine.append(ReportStatistica.json_bobina(self.bobina))
+                self.oee.bobina_completata(self.bobina)
                 # Aggiorna usura feltro per l'ultimo tick di produzione
                 self.feltro.aggiorna_usura()
                 progresso = min(100.0, 100*self.programma.peso_parziale/self.programma.ordine_corrente.peso_target)
@@ -149,7 +237,7 @@ class MacchinaContinua:
                 self.tracker_simulazione.aggiorna_di_un_tick(self.programma.peso_accumulato/1000)
                 if self.programma.stato_macchina == "produzione":
                     self.stato = "cambio bobina"
-                    if self.feltro.stato == "critica": # cambia bobina e feltro
+                    if self.politica_feltro.cambio_al_cambio_bobina(self.feltro): # cambia bobina e feltro
                         self.evento.eventi_attivi.append ("cambio feltro") 
                         self.evento.eventi_attivi.append ("cambio bobina")
                     else:
@@ -159,14 +247,20 @@ class MacchinaContinua:
                     self.setup_bobina() # cambia solo la bobina
        
                 elif self.programma.stato_macchina == "ferma":
+                    # sostituzione preventiva durante il cambio produzione (non dopo l'ultimo ordine)
+                    ordini_restanti = self.programma.indice_ordine_corrente + 1 < len(self.programma.lista_ordini)
+                    if ordini_restanti and self.politica_feltro.cambio_al_cambio_ordine(self.feltro):
+                        self.evento.eventi_attivi.append("cambio feltro")
                     self.evento.eventi_attivi.append("cambio produzione")
                     self.eventi_attivi = self.evento.eventi_attivi
                     self.evento.gestione_attivi()
                     nome_ordine = self.programma.ordine_corrente
-                    ReportStatistica.grafico_avanzamento_ordine(
-                        self.tracker_ordine,
-                        nome_file=f"grafico_ordine_{self.indice+1}_{nome_ordine.prodotto}.png"
-                    )
+                    if self.grafici:
+                        ReportStatistica.grafico_avanzamento_ordine(
+                            self.tracker_ordine,
+                            nome_file=f"grafico_ordine_{self.indice+1}_{nome_ordine.prodotto}.png"
+                        )
+                    self.oee.chiudi_ordine(self)
                     self.stato = self.programma.prepara_prossimo_ordine()
                     self.indice += 1
                     self.setup_ordine()  # cambia ordine e bobina
@@ -0,0 +1,203 @@
+"""
+OEE incrementale della macchina continua: disponibilità × prestazioni × qualità.
+
+MotoreOEE è alimentato dalla simulazione stessa, senza rileggere log o tracker:
+  - esegui_tick (e i blocchi del kernel / del replay) chiamano aggiorna() al confine di ogni periodo:
+    tempo trascorso, tempo perso e peso prodotto arrivano come differenza rispetto all'ultimo aggiornamento;
+  - Evento.gestione_attivi segnala ogni fermo con fermo();
+  - il completamento di una bobina (bobina_completata) e il cambio ordine (chiudi_ordine) dal passo 4
+    di esegui_tick.
+
+Disponibilità = tempo in produzione / tempo trascorso.
+Prestazioni   = peso prodotto / peso teorico alla velocità tela dell'ordine e grammatura target
+                (stesse operazioni di Bobina.aggiorna_peso con la velocità pope all'85%).
+Qualità       = somma di peso × indice_qualita delle bobine entro tolleranza di grammatura / peso delle bobine.
+
+I contatori aperti (campagna, ordine, turno, ora) sono righe di un array: ogni aggiornamento è una
+somma vettoriale. Ore, turni e ordini chiusi finiscono in buffer circolari di dimensione fissa
+(FinestraMobile) che tengono la somma dei periodi presenti: la finestra mobile si legge in O(1).
+"""
+import numpy as np
+
+# Contatori di un periodo
+(TEMPO, PRODUZIONE, PESO, PESO_TEORICO, FERMI, BOBINE, BOBINE_CONFORMI, PESO_BOBINE, PESO_BUONO,
+ N_CAMPI) = range(10)
+
+# Righe dei contatori aperti
+CAMPAGNA, ORDINE, TURNO, ORA = range(4)
+
+
+def indicatori(contatori):
+    """Disponibilità, prestazioni, qualità e OEE di un vettore di contatori (None se non definiti)."""
+    def rapporto(a, b):
+        return float(contatori[a] / contatori[b]) if contatori[b] > 0 else None
+
+    disponibilita = rapporto(PRODUZIONE, TEMPO)
+    prestazioni = rapporto(PESO, PESO_TEORICO)
+    qualita = rapporto(PESO_BUONO, PESO_BOBINE)
+    fattori = (disponibilita, prestazioni, qualita)
+    return {
+        "disponibilita": disponibilita,
+        "prestazioni": prestazioni,
+        "qualita": qualita,
+        "oee": None if None in fattori else disponibilita * prestazioni * qualita,
+        "tempo_s": float(contatori[TEMPO]),
+        "tempo_produzione_s": float(contatori[PRODUZIONE]),
+        "peso_t": float(contatori[PESO]) / 1000,
+        "fermi": int(contatori[FERMI]),
+        "bobine": int(contatori[BOBINE]),
+        "bobine_conformi": int(contatori[BOBINE_CONFORMI]),
+    }
+
+
+class FinestraMobile:
+    """
+    Ultimi `capacita` periodi chiusi in un buffer circolare, con la somma dei periodi presenti.
+    aggiungi() sovrascrive il periodo più vecchio e aggiorna la somma in O(1).
+    """
+    def __init__(self, capacita):
+        self.capacita = capacita
+        self.righe = np.zeros((capacita, N_CAMPI))
+        self.etichette = [None] * capacita
+        self.somma = np.zeros(N_CAMPI)
+        self.testa = 0          # posizione del prossimo periodo
+        self.n = 0
+
+    def aggiungi(self, contatori, etichetta):
+        riga = self.righe[self.testa]
+        self.somma += contatori - riga
+        riga[:] = contatori
+        self.etichette[self.testa] = etichetta
+        self.testa = (self.testa + 1) % self.capacita
+        self.n = min(self.n + 1, self.capacita)
+
+    def periodi(self, n=None):
+        """Ultimi n periodi (tutti se None) come coppie (etichetta, contatori), dal più vecchio."""
+        n = self.n if n is None else min(n, self.n)
+        posizioni = [(self.testa - n + k) % self.capacita for k in range(n)]
+        return [(self.etichette[p], self.righe[p]) for p in posizioni]
+
+
+class MotoreOEE:
+    """
+    OEE per campagna (tutta la simulazione), ordine, turno e ora.
+
+    tolleranza: scostamento di grammatura (%) oltre il quale una bobina non è conforme.
+    passo: durata (secondi simulati) dei periodi della finestra mobile oraria; durata_turno ne è un multiplo.
+    ore, turni, ordini: capacità dei buffer circolari dei periodi chiusi.
+    """
+    def __init__(self, tick_reale, tolleranza=5.0, passo=3600, durata_turno=8*3600, ore=24, turni=21, ordini=64):
+        if durata_turno % passo:
+            raise ValueError(f"durata_turno ({durata_turno}) deve essere multiplo di passo ({passo})")
+        self.tick_reale = tick_reale
+        self.tolleranza = tolleranza
+        self.passo = passo
+        self.durata_turno = durata_turno
+        self.aperti = np.zeros((4, N_CAMPI))
+        self.ore = FinestraMobile(ore)
+        self.turni = FinestraMobile(turni)
+        self.ordini = FinestraMobile(ordini)
+        self.confine = passo                 # tempo simulato di chiusura dell'ora in corso
+        self._tempo = 0.0                    # tempo simulato, tempo perso e peso all'ultimo aggiornamento
+        self._perso = 0.0
+        self._peso = 0.0
+        self._ultimo_fermo = None
+        self._delta = np.zeros(N_CAMPI)
+
+    def tick_al_confine(self, tempo):
+        """Tick da eseguire per raggiungere il confine dell'ora in corso (almeno 1)."""
+        return max(1, int(-(-(self.confine - tempo) // self.tick_reale)))
+
+    def aggiorna(self, macchina):
+        """Somma ai contatori aperti quanto accaduto dall'ultimo aggiornamento e chiude i periodi scaduti."""
+        tempo, perso = macchina.simclock.tempo_simulato, macchina.tempo_perso
+        peso = macchina.programma.peso_accumulato
+        delta = self._delta
+        delta[TEMPO] = tempo - self._tempo
+        delta[PRODUZIONE] = delta[TEMPO] - (perso - self._perso)
+        delta[PESO] = peso - self._peso
+        delta[PESO_TEORICO] = delta[PRODUZIONE] * self.portata_teorica(macchina)
+        self.aperti += delta
+        self._tempo, self._perso, self._peso = tempo, perso, peso
+        while tempo >= self.confine:
+            self.ore.aggiungi(self.aperti[ORA], self.confine - self.passo)
+            self.aperti[ORA] = 0
+            if self.confine % self.durata_turno == 0:
+                self.turni.aggiungi(self.aperti[TURNO], self.confine // self.durata_turno - 1)
+                self.aperti[TURNO] = 0
+            self.confine += self.passo
+
+    @staticmethod
+    def portata_teorica(macchina):
+        """
+        Peso (kg/s) alla velocità tela dell'ordine corrente e grammatura target. Se la velocità è
+        misurata (core.storico) il riferimento è la velocità della ricetta, non quella misurata.
+        """
+        programma = macchina.programma
+        velocita = programma.parametri_processo['velocita tela']
+        velocita_pope = velocita.get('riferimento', velocita['valore']) * 0.85
+        return velocita_pope * programma.ordine_corrente.grammatura_target * macchina.larghezza_macchina / 1000
+
+    def fermo(self, tempo):
+        """Un fermo iniziato a `tempo` (più eventi allo stesso tempo sono un unico fermo)."""
+        if tempo != self._ultimo_fermo:
+            self._ultimo_fermo = tempo
+            self.aperti[:, FERMI] += 1
+
+    def bobina_completata(self, bobina):
+        peso = bobina.peso_bobina
+        scostamento = abs(bobina.grammatura - bobina.grammatura_target) / bobina.grammatura_target * 100
+        self.aperti[:, BOBINE] += 1
+        self.aperti[:, PESO_BOBINE] += peso
+        if scostamento <= self.tolleranza:
+            self.aperti[:, BOBINE_CONFORMI] += 1
+            self.aperti[:, PESO_BUONO] += peso * bobina.indice_qualita
+
+    def chiudi_ordine(self, macchina):
+        """Chiude l'ordine corrente (chiamata prima del passaggio all'ordine successivo)."""
+        self.aggiorna(macchina)
+        self.ordini.aggiungi(self.aperti[ORDINE], (macchina.indice, macchina.programma.ordine_corrente.prodotto))
+        self.aperti[ORDINE] = 0
+
+    # --- letture ---
+
+    def campagna(self):
+        return indicatori(self.aperti[CAMPAGNA])
+
+    def ordine_corrente(self):
+        return indicatori(self.aperti[ORDINE])
+
+    def turno_corrente(self):
+        return indicatori(self.aperti[TURNO])
+
+    def ultime_ore(self):
+        """Finestra mobile delle ultime ore chiuse più l'ora in corso."""
+        return indicatori(self.ore.somma + self.aperti[ORA])
+
+    def ultimi_turni(self):
+        """Finestra mobile dei turni chiusi presenti nel buffer più il turno in corso."""
+        return indicatori(self.turni.somma + self.aperti[TURNO])
+
+    def turni_chiusi(self, n=None):
+        return [{"turno": int(etichetta), **indicatori(contatori)} for etichetta, contatori in self.turni.periodi(n)]
+
+    def ordini_chiusi(self, n=None):
+        return [{"ordine": etichetta[0], "prodotto": etichetta[1], **indicatori(contatori)}
+                for etichetta, contatori in self.ordini.periodi(n)]
+
+    def riepilogo(self, macchina=None):
+        """
+        Indicatori di campagna, ordine e turno in corso, finestre mobili e periodi chiusi.
+        Con macchina aggiorna prima i contatori al tempo corrente (lettura dal thread della simulazione).
+        """
+        if macchina is not None:
+            self.aggiorna(macchina)
+        return {
+            "campagna": self.campagna(),
+            "ordine_corrente": self.ordine_corrente(),
+            "turno_corrente": self.turno_corrente(),
+            "ultime_ore": self.ultime_ore(),
+            "ultimi_turni": self.ultimi_turni(),
+            "turni": self.turni_chiusi(),
+            "ordini": self.ordini_chiusi(),
+        }
@@ -0,0 +1,197 @@
+"""
+Ottimizzazione della politica di sostituzione del feltro tramite simulazione.
+
+Lo spazio di ricerca è una griglia di PoliticaFeltro: soglia di usura per il cambio al cambio bobina
+(0.90 = comportamento originale, fascia critica) e soglia opzionale per il cambio preventivo durante
+il cambio produzione tra due ordini, dove il fermo del cambio feltro si sovrappone a quello del cambio
+produzione. Ogni politica viene valutata con run seminati dello scenario (core.batch) e l'obiettivo
+predefinito sono le tonnellate prodotte per ora di campagna.
+
+Ricerca con successive halving a budget fisso di run: a ogni turno le politiche rimaste vengono
+simulate su altri semi e si tiene la metà migliore. Tutte le politiche sono valutate sugli stessi
+semi (numeri casuali comuni): stessi ordini, stesso feltro iniziale e stessa sequenza di eventi finché
+le politiche non divergono, così il confronto a coppie ha varianza molto minore di quello tra
+campioni indipendenti. Il risultato riporta la differenza rispetto alla politica originale con
+l'errore standard appaiato e quello che si avrebbe con campioni indipendenti.
+
+Avvio: python -m core.ottimizzatore scenari/base.toml --budget 600 --orizzonte-ore 240 --processi 4
+"""
+import argparse
+import json
+import logging
+import math
+
+import numpy as np
+
+from core.batch import crea_pool, esegui_run, sottometti_run
+from core.cacherisultati import CacheRisultati
+from core.console import configura_output, silenzia_output
+from core.feltro import PoliticaFeltro
+from core.scenario import carica_scenario
+
+logger = logging.getLogger("core.ottimizzatore")
+
+SOGLIE_CAMBIO_BOBINA = (0.6, 0.7, 0.8, 0.85, 0.9, 0.95)
+SOGLIE_CAMBIO_ORDINE = (None, 0.5, 0.6, 0.7, 0.8, 0.9)
+
+
+def tonnellate_ora(kpi):
+    return kpi["peso_totale_t"] / (kpi["tempo_simulato"] / 3600) if kpi["tempo_simulato"] else 0.0
+
+
+def tonnellate_qualita_ora(kpi):
+    """Tonnellate per ora pesate con l'indice di qualità medio delle bobine."""
+    return tonnellate_ora(kpi) * (kpi["indice_qualita_medio"] or 0.0)
+
+
+OBIETTIVI = {
+    "tonnellate_ora": tonnellate_ora,
+    "tonnellate_qualita_ora": tonnellate_qualita_ora,
+}
+
+
+def griglia_politiche(soglie_bobina=SOGLIE_CAMBIO_BOBINA, soglie_ordine=SOGLIE_CAMBIO_ORDINE):
+    """
+    Politiche candidate. Le soglie al cambio ordine superiori a quella al cambio bobina sono escluse:
+    il feltro verrebbe comunque sostituito prima al cambio bobina.
+    """
+    return [
+        PoliticaFeltro(bobina, ordine)
+        for bobina in soglie_bobina
+        for ordine in soglie_ordine
+        if ordine is None or ordine <= bobina
+    ]
+
+
+class Valutatore:
+    """
+    Esegue e memorizza i run (politica, seme): un run già simulato non viene ripetuto nei turni
+    successivi. Con un pool i run di un turno sono accodati tutti insieme. Con una CacheRisultati
+    (la stessa passata a crea_pool) anche i run di ricerche precedenti non vengono ripetuti.
+    """
+    def __init__(self, scenario, obiettivo, max_tick=None, pool=None, cache=None):
+        self.scenario = scenario
+        self.obiettivo = obiettivo
+        self.max_tick = max_tick
+        self.pool = pool
+        self.cache = cache
+        self.valori = {}        # (politica, seme) -> valore dell'obiettivo
+        self.run_eseguiti = 0
+
+    def valuta(self, politiche, semi):
+        """Restituisce la matrice politiche x semi dei valori dell'obiettivo."""
+        mancanti = [(politica, seme) for politica in politiche for seme in semi if (politica, seme) not in self.valori]
+        if self.pool is not None:
+            futuri = [sottometti_run(self.pool, seme, self.max_tick, politica) for politica, seme in mancanti]
+            risultati = [futuro.result() for futuro in futuri]
+        else:
+            with silenzia_output():
+                risultati = [esegui_run(self.scenario, seme, self.max_tick, politica, self.cache)
+                             for politica, seme in mancanti]
+        for chiave, kpi in zip(mancanti, risultati):
+            self.valori[chiave] = self.obiettivo(kpi)
+        self.run_eseguiti += len(mancanti)
+        return np.array([[self.valori[(politica, seme)] for seme in semi] for politica in politiche])
+
+
+def successive_halving(valutatore, politiche, budget, semi_iniziali=0, semi_minimi=2):
+    """
+    Successive halving: ceil(log2(n)) turni con budget/turni run ciascuno, divisi tra le politiche rimaste
+    (almeno semi_minimi semi nuovi per turno). A parità di valore resta avanti la politica che precede
+    nella lista. Restituisce la classifica dell'ultimo turno, i semi usati e lo storico dei turni.
+    """
+    rimaste = list(politiche)
+    turni = max(1, math.ceil(math.log2(len(rimaste))))
+    n_semi = 0
+    storico = []
+    while True:
+        n_semi += max(semi_minimi, budget // (turni * len(rimaste)))
+        semi = list(range(semi_iniziali, semi_iniziali + n_semi))
+        medie = valutatore.valuta(rimaste, semi).mean(axis=1)
+        classifica = sorted(zip(rimaste, medie), key=lambda voce: -voce[1])   # sort stabile
+        storico.append({
+            "politiche": len(rimaste), "semi": n_semi,
+            "classifica": [{"politica": p.to_dict(), "obiettivo": float(m)} for p, m in classifica],
+        })
+        logger.info("Turno %d: %d politiche su %d semi, migliore %s (%.4f)",
+                    len(storico), len(rimaste), n_semi, classifica[0][0], classifica[0][1])
+        rimaste = [politica for politica, _ in classifica[:math.ceil(len(rimaste) / 2)]]
+        if len(rimaste) == 1:
+            return classifica, semi, storico
+
+
+def ottimizza(scenario, politiche=None, budget=600, obiettivo="tonnellate_ora", orizzonte_ore=None, processi=None,
+              cache=None):
+    """
+    Cerca la politica che massimizza l'obiettivo (chiave di OBIETTIVI) con circa `budget` run, più quelli
+    della politica originale sui semi finali se era stata scartata prima. La politica originale è in
+    testa alla lista: a parità di valore viene preferita, e resta la migliore se sui semi finali la
+    vincitrice non la supera. orizzonte_ore limita ogni run (None = fino al termine degli ordini).
+    processi=1 esegue tutto nel processo corrente. cache: CacheRisultati consultata prima di ogni run.
+    """
+    politiche = griglia_politiche() if politiche is None else list(politiche)
+    riferimento = PoliticaFeltro()
+    politiche = [riferimento] + [politica for politica in politiche if politica != riferimento]
+    max_tick = int(orizzonte_ore * 3600 / scenario.tick_reale) if orizzonte_ore else None
+    semi_iniziali = scenario.semi[0] if scenario.semi else 0
+    funzione = OBIETTIVI[obiettivo]
+    if processi == 1:
+        valutatore = Valutatore(scenario, funzione, max_tick, cache=cache)
+        return _ottimizza(valutatore, politiche, riferimento, budget, semi_iniziali, obiettivo)
+    with crea_pool(scenario, processi, cache=cache) as pool:
+        valutatore = Valutatore(scenario, funzione, max_tick, pool, cache)
+        return _ottimizza(valutatore, politiche, riferimento, budget, semi_iniziali, obiettivo)
+
+
+def _ottimizza(valutatore, politiche, riferimento, budget, semi_iniziali, obiettivo):
+    classifica, semi, storico = successive_halving(valutatore, politiche, budget, semi_iniziali)
+    migliore = classifica[0][0]
+    valori = valutatore.valuta([migliore, riferimento], semi)
+    if valori[0].mean() <= valori[1].mean():
+        migliore, valori = riferimento, valori[[1, 1]]
+    differenze = valori[0] - valori[1]
+    n = len(semi)
+    errore_appaiato = differenze.std(ddof=1) / math.sqrt(n) if n > 1 else None
+    errore_indipendente = math.sqrt((valori[0].var(ddof=1) + valori[1].var(ddof=1)) / n) if n > 1 else None
+    return {
+        "obiettivo": obiettivo,
+        "migliore": {"politica": migliore.to_dict(), "valore": float(valori[0].mean())},
+        "riferimento": {"politica": riferimento.to_dict(), "valore": float(valori[1].mean())},
+        "differenza": float(differenze.mean()),
+        "errore_standard_appaiato": errore_appaiato,
+        "errore_standard_indipendente": errore_indipendente,
+        "semi": n,
+        "run_eseguiti": valutatore.run_eseguiti,
+        "turni": storico,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ottimizzazione della politica di sostituzione del feltro")
+    parser.add_argument("scenario", help="file scenario (.json, .toml, .yaml)")
+    parser.add_argument("--budget", type=int, default=600, help="run della ricerca (circa)")
+    parser.add_argument("--obiettivo", choices=sorted(OBIETTIVI), default="tonnellate_ora")
+    parser.add_argument("--orizzonte-ore", type=float, default=None, help="durata massima di ogni run (ore)")
+    parser.add_argument("--processi", type=int, default=None, help="processi worker (default: CPU disponibili)")
+    parser.add_argument("--uscita", default="politica_feltro.json", help="file JSON del risultato")
+    parser.add_argument("--cache", default=None, help="cartella della cache dei run (core.cacherisultati)")
+    parser.add_argument("--cache-mb", type=float, default=1024, help="dimensione massima della cache (MB)")
+    argomenti = parser.parse_args()
+    configura_output("console")
+    scenario = carica_scenario(argomenti.scenario)
+    cache = CacheRisultati(argomenti.cache, argomenti.cache_mb) if argomenti.cache else None
+    risultato = ottimizza(scenario, budget=argomenti.budget, obiettivo=argomenti.obiettivo,
+                          orizzonte_ore=argomenti.orizzonte_ore, processi=argomenti.processi, cache=cache)
+    with open(argomenti.uscita, "w") as f:
+        json.dump(risultato, f, indent=2)
+    politica = risultato["migliore"]["politica"]
+    logger.info("Politica migliore: %s = %.4f (originale %.4f, differenza %.4f ± %.4f)",
+                politica, risultato["migliore"]["valore"], risultato["riferimento"]["valore"],
+                risultato["differenza"], risultato["errore_standard_appaiato"] or 0.0)
+    logger.info("Sezione scenario:\n[feltro]\n%s", "\n".join(
+        f"{chiave} = {valore}" for chiave, valore in politica.items() if valore is not None))
+    logger.info("Risultato salvato in %s", argomenti.uscita)
+
+
+if __name__ == "__main__":
+    main()
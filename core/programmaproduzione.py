@@ -1,5 +1,62 @@
+import logging
+import math
+
 import numpy as np
 
+logger = logging.getLogger(__name__)
+
+# Ricette di processo per prodotto. Un ordine usa la prima ricetta il cui nome è contenuto nel nome del prodotto.
+RICETTE_DEFAULT = {
+    "Carta igienica": {
+        "additivi": ["sbiancante"],  #non vuole il KIMENE, intaserebbe il tubo di scarico
+        #Semplificato da 0 a 100, ove 0 è non raffinata e 100 estremamente raffinata, 
+        #l'efficacia dipende dalla efficenza dei raffinatori e della cellolusa stessa, 
+        "grado_raffinazione": 20,
+        "temperatura_cappa": 410     #°C circa. 
+    },
+    "Tovaglioli": {
+        "additivi": ["sbiancante", "resistenza ad umido (KIMENE)"],
+        "grado_raffinazione": 30,
+        "temperatura_cappa": 400
+    },
+    "Asciugatutto": {
+        "additivi": ["sbiancante", "resistenza ad umido (KIMENE)"],
+        "grado_raffinazione": 60,
+        "temperatura_cappa": 450
+    }
+}
+PRODOTTI = tuple(RICETTE_DEFAULT)  # prodotti con ricetta predefinita
+
+
+def trova_ricetta(prodotto, ricette):
+    """Restituisce la ricetta associata al prodotto (ricerca per sottostringa, come in origine)."""
+    for nome, ricetta in ricette.items():
+        if nome in prodotto:
+            return ricetta
+    raise ValueError(f"Nessuna ricetta per il prodotto {prodotto!r} (disponibili: {', '.join(ricette)})")
+
+
+def velocita_teorica(grammatura, larghezza=2.75):
+    """
+    Calcola la velocità teorica della tela (in m/sec) per una data grammatura,
+    scegliendo la concentrazione tra 0,5%, 0,4%, 0,3%, 0,2% che porta la velocità
+    più vicina possibile al massimo (senza superare 1800 m/min).
+    Restituisce velocità teorica, concentrazione.
+    """
+    portata = 616.67  # L/s (37.000 L/min)
+    vel_max = 30    # m/sec (1800 m/min)
+    concentrazioni = [0.005, 0.004, 0.003, 0.002]
+
+    for conc in concentrazioni:
+        portata_secca = portata * conc  # kg/s
+        # Calcola velocità in m/s
+        velocita = portata_secca / ((grammatura / 1000) * larghezza)
+        # Solo se NON supera la massima
+        if velocita <= vel_max:
+            break
+
+    return velocita, conc
+
 
 class Ordine:
     def __init__(self, prodotto, grammatura_target, peso_target, altri_parametri=None):
@@ -8,12 +65,41 @@ class Ordine:
         self.peso_target = peso_target
         self.altri_parametri = altri_parametri or {}
 
+    def to_dict(self):
+        return {
+            "prodotto": self.prodotto,
+            "grammatura_target": self.grammatura_target,
+            "peso_target": self.peso_target,
+            "altri_parametri": self.altri_parametri
+        }
+
+    @classmethod
+    def from_dict(cls, dati):
+        """Crea un Ordine da un dizionario (es. JSON ricevuto dal servizio o letto da file)."""
+        try:
+            grammatura_target = float(dati["grammatura_target"])
+            peso_target = float(dati["peso_target"])
+            ordine = cls(
+                prodotto=str(dati["prodotto"]),
+                grammatura_target=grammatura_target,
+                peso_target=peso_target,
+                altri_parametri=dati.get("altri_parametri")
+            )
+        except (KeyError, TypeError, ValueError) as errore:
+            raise ValueError(f"Ordine non valido: {dati!r}") from errore
+        # float() accetta "nan" e "inf": un target non finito bloccherebbe la bobina
+        if not (math.isfinite(grammatura_target) and math.isfinite(peso_target)):
+            raise ValueError(f"Ordine non valido (valori non finiti): {dati!r}")
+        return ordine
+
 class ProgrammaProduzione:
-    def __init__(self, lista_ordini, sigma_velocita=0.10, sigma_efficienza=0.05):
+    def __init__(self, lista_ordini, sigma_velocita=0.10, sigma_efficienza=0.05, ricette=None, larghezza=2.75):
         """
         lista_ordini: lista di oggetti Ordine (o dict)
         sigma_velocita: deviazione standard efficienza velocità
         sigma_efficienza: deviazione standard su parametri 
+        ricette: ricette di processo per prodotto (default RICETTE_DEFAULT)
+        larghezza: larghezza macchina in m, usata per la velocità teorica della tela
         """
         self.lista_ordini = lista_ordini
         self.indice_ordine_corrente = 0
@@ -25,6 +111,8 @@ class ProgrammaProduzione:
         self.stato_macchina = "ferma"
         self.parametri_processo = {}
         self.transizione_in_corso = False
+        self.ricette = ricette if ricette is not None else RICETTE_DEFAULT
+        self.larghezza = larghezza
         
 
     @staticmethod
@@ -45,22 +133,10 @@ class ProgrammaProduzione:
         # Calcolo della velocità teorica target
         vel_target, conc_impasto = self.calcola_velocita_teorica(ordine.grammatura_target)
         vel_target = round(vel_target,2)
-        prodotto = ordine.prodotto
-        if "Carta igienica" in prodotto:
-            additivi_chimici = ["sbiancante"] #non vuole il KIMENE, intaserebbe il tubo di scarico
-            #Semplificato da 0 a 100, ove 0 è non raffinata e 100 estremamente raffinata, 
-            #l'efficacia dipende dalla efficenza dei raffinatori e della cellolusa stessa, 
-            grado_raffinazione = 20 
-            #°C circa. 
-            temperatura_cappa = 410 
-        elif "Tovaglioli" in prodotto:
-            additivi_chimici = ["sbiancante", "resistenza ad umido (KIMENE)"]
-            grado_raffinazione = 30 
-            temperatura_cappa = 400
-        elif "Asciugatutto" in prodotto:
-            additivi_chimici = ["sbiancante", "resistenza ad umido (KIMENE)"]
-            grado_raffinazione = 60 
-            temperatura_cappa = 450
+        ricetta = trova_ricetta(ordine.prodotto, self.ricette)
+        additivi_chimici = ricetta["additivi"]
+        grado_raffinazione = ricetta["grado_raffinazione"]
+        temperatura_cappa = ricetta["temperatura_cappa"]
         # Assegnazione dizionario parametri
         self.parametri_processo = {
             'velocita tela': {
@@ -91,26 +167,8 @@ class ProgrammaProduzione:
 
 
     def calcola_velocita_teorica(self, grammatura):
-        """
-        Calcola la velocità teorica della tela (in m/sec) per una data grammatura,
-        scegliendo la concentrazione tra 0,5%, 0,4%, 0,3%, 0,2% che porta la velocità
-        più vicina possibile al massimo (senza superare 1800 m/min).
-        Restituisce velocità teorica, concentrazione.
-        """
-        portata = 616.67  # L/s (37.000 L/min)
-        larghezza = 2.75  # m
-        vel_max = 30    # m/sec (1800 m/min)
-        concentrazioni = [0.005, 0.004, 0.003, 0.002]
-    
-        for conc in concentrazioni:
-            portata_secca = portata * conc  # kg/s
-            # Calcola velocità in m/s
-            velocita = portata_secca / ((grammatura / 1000) * larghezza)
-            # Solo se NON supera la massima
-            if velocita <= vel_max:
-                break
-
-        return velocita, conc
+        """Velocità teorica della tela e concentrazione per la larghezza di questa macchina."""
+        return velocita_teorica(grammatura, self.larghezza)
     
     def avvia_produzione(self):
         """
@@ -119,11 +177,13 @@ class ProgrammaProduzione:
         """
         self.stato_macchina = "produzione"
         self.imposta_parametri_per_ordine()
-        print(
-            f"Avvio produzione: {self.ordine_corrente.prodotto} | "
-            f"Grammatura target: {self.ordine_corrente.grammatura_target} | "
-            f"Velocità tela: {self.parametri_processo['velocita tela']['valore']:.1f} m/min | "
-            f"Concentrazione impasto: {self.parametri_processo['concentrazione impasto %']['valore']*100:.2f}%"
+        logger.info(
+            "Avvio produzione: %s | Grammatura target: %s | Velocità tela: %.1f m/min | "
+            "Concentrazione impasto: %.2f%%",
+            self.ordine_corrente.prodotto,
+            self.ordine_corrente.grammatura_target,
+            self.parametri_processo['velocita tela']['valore'],
+            self.parametri_processo['concentrazione impasto %']['valore']*100
         )
 
 
@@ -138,17 +198,14 @@ class ProgrammaProduzione:
             self.transizione_in_corso = True
             self.ferma_produzione()
             self.peso_parziale = 0
-            print(
-                f"\nOrdine completato: {self.ordine_corrente.prodotto}. "
-                f"Peso richiesto raggiunto"
-            )
+            logger.info("\nOrdine completato: %s. Peso richiesto raggiunto", self.ordine_corrente.prodotto)
         else:
             self.peso_accumulato += delta_peso_bobina
             self.peso_parziale += delta_peso_bobina
 
     def ferma_produzione(self):
         self.stato_macchina = "ferma"
-        print("\nProduzione FERMA. Setup nuovo ordine in corso...\n")
+        logger.info("\nProduzione FERMA. Setup nuovo ordine in corso...\n")
 
     def prepara_prossimo_ordine(self):
         """Passa al prossimo ordine, o termina."""
@@ -0,0 +1,228 @@
+"""
+Registro degli eventi indicizzato per tempo.
+
+RegistroEventi è la lista Evento.log_eventi (stessi dizionari, serializzabile con json) con in più
+colonne tipizzate (array.array) aggiornate a ogni append: tempo, durata, tipo, ordine e tempo perso
+attribuito a ogni voce. Le voci arrivano in ordine di tempo simulato, quindi le colonne sono già
+ordinate e le finestre temporali si trovano con bisect. Ogni indice (tutte le voci, per tipo, per
+ordine, per tipo e ordine) tiene i tempi delle proprie voci e la somma cumulata del tempo perso:
+totali e conteggi su una finestra costano O(log n) qualunque sia la lunghezza del log.
+
+Il tempo perso segue la regola di core.batch.tempo_perso_per_evento: le voci allo stesso tempo sono un
+unico fermo di durata arrotondata al tick; la pulizia extra pesa la propria durata (e occupa l'inizio
+del fermo), il resto va alla voce di durata maggiore. Un fermo a cavallo del limite di una finestra
+conta solo per la parte che vi ricade; senza limite superiore la finestra arriva al tempo simulato
+corrente dell'orologio del registro, quindi l'ultimo fermo conta solo per la parte già trascorsa.
+"""
+from array import array
+from bisect import bisect_left
+
+EXTRA = "pulizia macchina extra"
+
+
+class _Indice:
+    """Voci di un sottoinsieme del registro: posizione, tempo e tempo perso cumulato."""
+    __slots__ = ("voci", "tempi", "cumulata")
+
+    def __init__(self):
+        self.voci = array("q")
+        self.tempi = array("d")
+        self.cumulata = array("d")
+
+    def aggiungi(self, voce, tempo, perso):
+        self.voci.append(voce)
+        self.tempi.append(tempo)
+        self.cumulata.append((self.cumulata[-1] if self.cumulata else 0.0) + perso)
+
+    def correggi_coda(self, da, registro):
+        """Ricalcola la cumulata dalle voci di posizione >= da (il fermo in corso) in poi."""
+        j = len(self.voci)
+        while j and self.voci[j - 1] >= da:
+            j -= 1
+        for k in range(j, len(self.voci)):
+            self.cumulata[k] = (self.cumulata[k - 1] if k else 0.0) + registro.perso[self.voci[k]]
+
+    def cumulata_prima(self, tempo):
+        j = bisect_left(self.tempi, tempo)
+        return self.cumulata[j - 1] if j else 0.0, j
+
+
+class RegistroEventi(list):
+    """
+    Lista delle voci evento in ordine di tempo simulato con indici per tipo e per ordine.
+    Le voci si aggiungono solo con append (o extend, +=); un tempo precedente all'ultimo è un errore.
+    Le altre modifiche della lista (inserimento, sostituzione, rimozione, riordino) lascerebbero gli
+    indici non allineati e sollevano TypeError.
+    orologio: SimClock della macchina (tempo_simulato), fine delle finestre aperte; None = fine del registro.
+    """
+    def __init__(self, tick_reale, voci=(), orologio=None):
+        super().__init__()
+        self.tick_reale = tick_reale
+        self.orologio = orologio
+        self.codici_tipo = {}                # tipo di evento -> codice della colonna tipi
+        self.tempi = array("d")
+        self.durate = array("d")
+        self.tipi = array("b")
+        self.ordini = array("i")
+        self.perso = array("d")              # tempo perso attribuito alla voce
+        self.scarto = array("d")             # inizio della quota della voce rispetto all'inizio del fermo
+        self.fermi_inizio = array("d")
+        self.fermi_prima_voce = array("q")
+        self.fermi_perdita = array("d")
+        self.fermi_cumulata = array("d")
+        self.indici = {None: _Indice()}
+        self.extend(voci)
+
+    def __reduce__(self):
+        # copia e pickle ricostruiscono colonne e indici riaggiungendo le voci
+        return type(self), (self.tick_reale, list(self), self.orologio)
+
+    def append(self, voce):
+        tempo = voce["tempo_simulato"]
+        if self.tempi and tempo < self.tempi[-1]:
+            raise ValueError(f"Voce evento a {tempo}s precedente all'ultima registrata ({self.tempi[-1]}s)")
+        posizione = len(self)
+        super().append(voce)
+        tipo = self.codici_tipo.setdefault(voce["evento"], len(self.codici_tipo))
+        ordine = voce.get("indice_ordine", -1)
+        self.tempi.append(tempo)
+        self.durate.append(voce["durata"])
+        self.tipi.append(tipo)
+        self.ordini.append(ordine)
+        self.perso.append(0.0)
+        self.scarto.append(0.0)
+        nuovo_fermo = not self.fermi_inizio or self.fermi_inizio[-1] != tempo
+        if nuovo_fermo:
+            self.fermi_inizio.append(tempo)
+            self.fermi_prima_voce.append(posizione)
+            self.fermi_perdita.append(0.0)
+            self.fermi_cumulata.append(self.fermi_cumulata[-1] if self.fermi_cumulata else 0.0)
+        for chiave in self._chiavi(tipo, ordine):
+            indice = self.indici.get(chiave)
+            if indice is None:
+                indice = self.indici[chiave] = _Indice()
+            indice.aggiungi(posizione, tempo, 0.0)
+        self._ripartisci_fermo()
+
+    def extend(self, voci):
+        for voce in voci:
+            self.append(voce)
+
+    def __iadd__(self, voci):
+        self.extend(voci)
+        return self
+
+    def _solo_aggiunte(self, *_, **__):
+        raise TypeError("RegistroEventi accetta solo nuove voci in coda (append, extend)")
+
+    insert = __setitem__ = __delitem__ = pop = remove = clear = sort = reverse = __imul__ = _solo_aggiunte
+
+    def _ripartisci_fermo(self):
+        """Ripartisce il tempo perso dell'ultimo fermo tra le sue voci e aggiorna le cumulate."""
+        prima = self.fermi_prima_voce[-1]
+        voci = range(prima, len(self))
+        codice_extra = self.codici_tipo.get(EXTRA)
+        extra = sum(self.durate[v] for v in voci if self.tipi[v] == codice_extra)
+        principali = [v for v in voci if self.tipi[v] != codice_extra]
+        dominante = max(principali, key=lambda v: self.durate[v]) if principali else None
+        durata = max(0, self.durate[dominante] if dominante is not None else 0) + extra
+        perdita = -(-durata // self.tick_reale) * self.tick_reale
+        scarto = 0.0
+        for v in voci:
+            self.perso[v] = 0.0
+            if self.tipi[v] == codice_extra:
+                self.perso[v] = min(self.durate[v], max(0.0, perdita - scarto))
+                self.scarto[v] = scarto
+                scarto += self.perso[v]
+        if dominante is not None:
+            self.perso[dominante] = perdita - scarto
+            self.scarto[dominante] = scarto
+        self.fermi_perdita[-1] = perdita
+        self.fermi_cumulata[-1] = (self.fermi_cumulata[-2] if len(self.fermi_cumulata) > 1 else 0.0) + perdita
+        chiavi = {chiave for v in voci for chiave in self._chiavi(self.tipi[v], self.ordini[v])}
+        for chiave in chiavi:
+            self.indici[chiave].correggi_coda(prima, self)
+
+    @staticmethod
+    def _chiavi(tipo, ordine):
+        return None, ("tipo", tipo), ("ordine", ordine), ("tipo_ordine", tipo, ordine)
+
+    # --- query ---
+
+    def _chiave(self, tipo, ordine):
+        if tipo is None:
+            return None if ordine is None else ("ordine", ordine)
+        codice = self.codici_tipo.get(tipo, -1)
+        return ("tipo", codice) if ordine is None else ("tipo_ordine", codice, ordine)
+
+    def _perso_fino_a(self, tempo, chiave):
+        """Tempo perso delle voci dell'indice trascorso prima di `tempo` (secondi)."""
+        indice = self.indici.get(chiave)
+        if indice is None or tempo is None:
+            return 0.0 if indice is None else (indice.cumulata[-1] if indice.cumulata else 0.0)
+        totale, _ = indice.cumulata_prima(tempo)
+        k = bisect_left(self.fermi_inizio, tempo) - 1
+        if k >= 0 and self.fermi_inizio[k] + self.fermi_perdita[k] > tempo:
+            # fermo in corso a `tempo`: si toglie la parte non ancora trascorsa delle sue voci
+            trascorso = tempo - self.fermi_inizio[k]
+            fine = self.fermi_prima_voce[k + 1] if k + 1 < len(self.fermi_prima_voce) else len(self)
+            for v in range(self.fermi_prima_voce[k], fine):
+                if self._appartiene(v, chiave):
+                    quota = min(self.perso[v], max(0.0, trascorso - self.scarto[v]))
+                    totale -= self.perso[v] - quota
+        return totale
+
+    def _appartiene(self, voce, chiave):
+        if chiave is None:
+            return True
+        if chiave[0] == "tipo":
+            return self.tipi[voce] == chiave[1]
+        if chiave[0] == "ordine":
+            return self.ordini[voce] == chiave[1]
+        return self.tipi[voce] == chiave[1] and self.ordini[voce] == chiave[2]
+
+    def tempo_perso(self, da=None, a=None, tipo=None, ordine=None):
+        """
+        Tempo perso (secondi) trascorso nella finestra [da, a) di tempo simulato, opzionalmente solo per un
+        tipo di evento e/o un ordine (indice nel programma). da None = inizio del registro; a None =
+        tempo simulato corrente dell'orologio (fine del registro se il registro non ha orologio).
+        """
+        if a is None and self.orologio is not None:
+            a = self.orologio.tempo_simulato
+        chiave = self._chiave(tipo, ordine)
+        return self._perso_fino_a(a, chiave) - (self._perso_fino_a(da, chiave) if da is not None else 0.0)
+
+    def conta(self, da=None, a=None, tipo=None, ordine=None):
+        """Numero di voci registrate con tempo in [da, a)."""
+        indice = self.indici.get(self._chiave(tipo, ordine))
+        if indice is None:
+            return 0
+        inizio = bisect_left(indice.tempi, da) if da is not None else 0
+        fine = bisect_left(indice.tempi, a) if a is not None else len(indice.tempi)
+        return max(0, fine - inizio)
+
+    def tempo_perso_per_tipo(self, da=None, a=None, ordine=None):
+        """Tempo perso nella finestra per ciascun tipo di evento presente (solo valori non nulli)."""
+        risultato = {}
+        for tipo in self.codici_tipo:
+            perso = self.tempo_perso(da, a, tipo, ordine)
+            if perso:
+                risultato[tipo] = perso
+        return risultato
+
+    def conteggi_per_tipo(self, da=None, a=None, ordine=None):
+        risultato = {}
+        for tipo in self.codici_tipo:
+            n = self.conta(da, a, tipo, ordine)
+            if n:
+                risultato[tipo] = n
+        return risultato
+
+    def voci(self, da=None, a=None, tipo=None, ordine=None):
+        """Voci (dizionari) registrate con tempo in [da, a), opzionalmente per tipo e/o ordine."""
+        indice = self.indici.get(self._chiave(tipo, ordine))
+        if indice is None:
+            return []
+        inizio = bisect_left(indice.tempi, da) if da is not None else 0
+        fine = bisect_left(indice.tempi, a) if a is not None else len(indice.tempi)
+        return [self[v] for v in indice.voci[inizio:fine]]
@@ -0,0 +1,360 @@
+"""
+Replay deterministico di una campagna registrata.
+
+A partire dai log di una simulazione (log_eventi_dettagliati.json e log_bobine.json) la campagna
+viene ri-simulata senza ri-estrarre guasti, rotture e durate: Evento consuma la timeline registrata
+e Bobina le grammature registrate. Cambiando ricette, larghezza macchina o parametri di processo
+(scenario) si ottiene un confronto controfattuale esatto a parità di eventi.
+
+Regole del replay:
+    - gli eventi registrati sono raggruppati per tempo simulato (un gruppo = un fermo);
+    - i gruppi con "cambio bobina" o "cambio produzione" sono endogeni: vengono consumati in sequenza
+      alla k-esima fine bobina / fine ordine del replay, con composizione e durate registrate;
+      oltre la registrazione si usano le durate attese dei parametri evento;
+    - gli altri gruppi (guasti, rotture, fermi temporizzati) sono esogeni: avvengono al tempo
+      simulato registrato o, se la macchina è già ferma, al primo tick utile successivo;
+    - la k-esima bobina di ogni ordine riceve la grammatura registrata (a piena precisione in
+      log_bobine) se il target dell'ordine è invariato, altrimenti lo scarto registrato dal target.
+
+Il tempo è indicizzato: tra un evento e l'altro la produzione avanza a blocchi (somme cumulative
+NumPy, stesso risultato dei tick singoli) e i fermi vengono saltati in un solo passo.
+
+Avvio: python -m core.replay log_eventi_dettagliati.json log_bobine.json --larghezza 3.0
+"""
+import argparse
+import bisect
+import json
+import logging
+
+import numpy as np
+
+from core.batch import kpi_macchina
+from core.bobina import Bobina
+from core.console import configura_output
+from core.dashboard import STATO_FINE
+from core.evento import ORDINE_EVENTI, Evento
+from core.macchinacontinua import MacchinaContinua, calcola_media_ponderata_efficienze, sigma_grammatura_solo_eff
+from core.programmaproduzione import Ordine
+from core.scenario import carica_scenario, scenario_da_dict
+
+logger = logging.getLogger("core.replay")
+
+EVENTI_ENDOGENI = ("cambio bobina", "cambio produzione")
+
+
+def durata_attesa(distribuzione):
+    """Durata deterministica (valore atteso) di una distribuzione dei parametri evento."""
+    tipo = distribuzione["distribuzione"]
+    if tipo == "uniforme":
+        return (distribuzione["min"] + distribuzione["max"]) // 2
+    if tipo == "normale":
+        return int(distribuzione["media"])
+    return distribuzione["valore"]
+
+
+class GruppoEventi:
+    """Eventi registrati allo stesso tempo simulato, cioè un unico fermo macchina."""
+    __slots__ = ("tempo", "voci")
+
+    def __init__(self, tempo, voci):
+        self.tempo = tempo
+        self.voci = voci          # lista di (evento, durata) nell'ordine di registrazione
+
+    @property
+    def tipi(self):
+        return [evento for evento, _ in self.voci]
+
+    def durata_fermo(self):
+        """Come Evento.gestione_attivi: massimo delle durate, più l'eventuale pulizia extra."""
+        principali = [durata for evento, durata in self.voci if evento != "pulizia macchina extra"]
+        extra = sum(durata for evento, durata in self.voci if evento == "pulizia macchina extra")
+        return max(principali, default=0) + extra
+
+
+class TimelineEventi:
+    """
+    Timeline degli eventi registrati, indicizzata per tempo simulato.
+    tempi_esogeni è ordinato: la ricerca del prossimo evento è un bisect, non una scansione.
+    """
+    def __init__(self, eventi):
+        gruppi = []
+        for voce in sorted(eventi, key=lambda e: e["tempo_simulato"]):
+            if gruppi and gruppi[-1].tempo == voce["tempo_simulato"]:
+                gruppi[-1].voci.append((voce["evento"], voce["durata"]))
+            else:
+                gruppi.append(GruppoEventi(voce["tempo_simulato"], [(voce["evento"], voce["durata"])]))
+        self.cambi_bobina = [g for g in gruppi if "cambio bobina" in g.tipi]
+        self.cambi_produzione = [g for g in gruppi if "cambio produzione" in g.tipi]
+        self.esogeni = [g for g in gruppi if not any(tipo in EVENTI_ENDOGENI for tipo in g.tipi)]
+        self.tempi_esogeni = [g.tempo for g in self.esogeni]
+        # bobine prodotte in ciascun ordine concluso (indice_bobina del cambio produzione)
+        self.bobine_per_ordine = [
+            voce["indice_bobina"] for voce in eventi if voce["evento"] == "cambio produzione"
+        ]
+
+    def primo_esogeno_da(self, tempo):
+        """Indice del primo gruppo esogeno con tempo >= tempo."""
+        return bisect.bisect_left(self.tempi_esogeni, tempo)
+
+    def esogeni_tra(self, inizio, fine):
+        """Gruppi esogeni con inizio <= tempo < fine."""
+        return self.esogeni[self.primo_esogeno_da(inizio):self.primo_esogeno_da(fine)]
+
+
+class Registrazione:
+    """Timeline eventi, grammature per ordine e ordini di una campagna registrata."""
+    def __init__(self, eventi, bobine, ordini):
+        self.timeline = TimelineEventi(eventi)
+        self.ordini = [o if isinstance(o, dict) else o.to_dict() for o in ordini]
+        self.bobine = bobine
+        # Divide le bobine registrate per ordine
+        self.bobine_per_ordine = []
+        inizio = 0
+        for n_bobine in self.timeline.bobine_per_ordine:
+            self.bobine_per_ordine.append(bobine[inizio:inizio + n_bobine])
+            inizio += n_bobine
+        self.bobine_per_ordine.append(bobine[inizio:])
+
+    def nuovi_ordini(self):
+        return [Ordine.from_dict(ordine) for ordine in self.ordini]
+
+    def grammatura(self, indice_ordine, indice_bobina, grammatura_target):
+        """
+        Grammatura della bobina per un ordine con grammatura_target: quella registrata se il target è lo
+        stesso, altrimenti il target più lo scarto registrato; il target se la bobina non è registrata.
+        """
+        if indice_ordine >= len(self.bobine_per_ordine) or indice_bobina >= len(self.bobine_per_ordine[indice_ordine]):
+            return grammatura_target
+        bobina = self.bobine_per_ordine[indice_ordine][indice_bobina]
+        if bobina["grammatura target"] == grammatura_target:
+            return bobina["grammatura ottenuta"]
+        return grammatura_target + bobina["grammatura ottenuta"] - bobina["grammatura target"]
+
+
+def carica_registrazione(percorso_eventi, percorso_bobine, ordini=None):
+    """
+    Legge i log di una campagna. Gli ordini sono presi dal log eventi (chiave "ordini", scritta da
+    main.py) oppure passati esplicitamente (lista di Ordine o dizionari).
+    """
+    with open(percorso_eventi) as f:
+        dati_eventi = json.load(f)
+    with open(percorso_bobine) as f:
+        bobine = json.load(f)
+    eventi = dati_eventi["eventi"] if isinstance(dati_eventi, dict) else dati_eventi
+    if ordini is None:
+        ordini = dati_eventi.get("ordini") if isinstance(dati_eventi, dict) else None
+    if not ordini:
+        raise ValueError(f"{percorso_eventi}: ordini assenti, passarli esplicitamente (ordini=...)")
+    return Registrazione(eventi, bobine, ordini)
+
+
+class EventoReplay(Evento):
+    """Evento che applica la timeline registrata invece di estrarre eventi e durate."""
+    def __init__(self, tick_reale, macchina, timeline, parametri=None):
+        super().__init__(tick_reale, macchina, parametri)
+        self.timeline = timeline
+        self.prossimo_esogeno = 0
+        self.cambi_bobina_usati = 0
+        self.cambi_produzione_usati = 0
+
+    def tempo_prossimo_esogeno(self):
+        if self.prossimo_esogeno < len(self.timeline.esogeni):
+            return self.timeline.tempi_esogeni[self.prossimo_esogeno]
+        return None
+
+    def eventi_temporali(self):
+        # I fermi temporizzati (feltro, pulizia, lama) sono già nella timeline registrata
+        pass
+
+    def gestione_passivi(self):
+        tempo = self.tempo_prossimo_esogeno()
+        if self.eventi_attivi or tempo is None or tempo > self.macchina.simclock.get_time():
+            return
+        gruppo = self.timeline.esogeni[self.prossimo_esogeno]
+        self.prossimo_esogeno += 1
+        self.applica(gruppo.voci)
+
+    def gestione_attivi(self):
+        if "cambio produzione" in self.eventi_attivi:
+            gruppi, usati = self.timeline.cambi_produzione, self.cambi_produzione_usati
+            self.cambi_produzione_usati += 1
+        else:
+            gruppi, usati = self.timeline.cambi_bobina, self.cambi_bobina_usati
+            self.cambi_bobina_usati += 1
+        if usati < len(gruppi):
+            self.applica(gruppi[usati].voci)
+        else:
+            # Oltre la registrazione: stessi eventi richiesti dalla macchina, con durata attesa
+            self.applica([(tipo, durata_attesa(self.parametri[tipo]["durata"]))
+                          for tipo in ORDINE_EVENTI if tipo in self.eventi_attivi])
+
+    def applica(self, voci):
+        ordine_corrente = self.macchina.programma.ordine_corrente.prodotto
+        indice_bobina = self.macchina.bobine_tot_prodotte[self.macchina.indice]
+        tempo_simulato_corrente = self.macchina.simclock.get_time()
+        self.eventi_attivi[:] = [evento for evento, _ in voci if evento != "pulizia macchina extra"]
+        self.tot_timer = max(self.tot_timer, GruppoEventi(tempo_simulato_corrente, voci).durata_fermo())
+        for evento, durata in voci:
+            self.log_eventi.append({
+                "evento": evento,
+                "durata": durata,
+                "tempo_simulato": tempo_simulato_corrente,
+                "ordine_corrente": ordine_corrente,
+                "indice_ordine": self.macchina.indice,
+                "indice_bobina": indice_bobina
+            })
+        self.macchina.oee.fermo(tempo_simulato_corrente)
+
+
+class MacchinaReplay(MacchinaContinua):
+    """
+    MacchinaContinua guidata da una Registrazione. Le variazioni controfattuali si passano come per
+    MacchinaContinua (scenario, larghezza_macchina, ordini); seme fissa le estrazioni residue
+    (stato iniziale del feltro, efficienze di processo), che influenzano solo l'indice di qualità.
+    La deriva dei parametri di processo (core.deriva) non si applica: la registrazione fissa la produzione.
+    """
+    def __init__(self, registrazione, tick_visivo=5, larghezza_macchina=2.75, scenario=None, ordini=None, seme=0):
+        np.random.seed(seme)
+        self.registrazione = registrazione
+        if ordini is None:
+            ordini = registrazione.nuovi_ordini()
+        super().__init__(ordini, tick_visivo, larghezza_macchina=larghezza_macchina, grafici=False, scenario=scenario,
+                         deriva=False)
+        self.evento = EventoReplay(self.tick_reale, self, registrazione.timeline, self.evento.parametri)
+        self.eventi_attivi = self.evento.eventi_attivi
+
+    def setup_bobina(self):
+        """Come MacchinaContinua.setup_bobina, con la grammatura registrata per la bobina."""
+        ordine = self.programma.ordine_corrente
+        lunghezza_max = getattr(ordine, "lunghezza_max", 50000)
+        eff_media = calcola_media_ponderata_efficienze(self.programma.parametri_processo, self.feltro.efficienza,
+                                                       self.pesi_efficienze)
+        sigma = sigma_grammatura_solo_eff(ordine.grammatura_target, eff_media, coeff=self.coeff_sigma,
+                                          p=self.esponente_sigma)
+        grammatura = ordine.grammatura_target
+        if self.indice < len(self.bobine_tot_prodotte):
+            grammatura = self.registrazione.grammatura(self.indice, self.bobine_tot_prodotte[self.indice], grammatura)
+        self.bobina = Bobina(ordine.grammatura_target, sigma, eff_media, lunghezza_max, grammatura=grammatura)
+        self.etichetta_bobina()
+
+    def esegui(self):
+        """Esegue il replay fino al termine degli ordini, saltando direttamente tra gli eventi."""
+        while self.stato != STATO_FINE:
+            if self.simclock.tempo_simulato >= self.oee.confine:
+                self.oee.aggiorna(self)
+            if self.evento.tot_timer != 0:
+                self._salta_fermo()
+                continue
+            if not self.bobina.completata and not self.evento.eventi_attivi:
+                n_tick = self._tick_liberi()
+                if n_tick > 0:
+                    self._produci_blocco(n_tick)
+                    continue
+            self.esegui_tick()
+        return self
+
+    def _salta_fermo(self):
+        """Equivale ai tick di fermo di esegui_tick fino all'azzeramento di tot_timer o al confine dell'ora OEE."""
+        n_tick = min(int(-(-self.evento.tot_timer // self.tick_reale)), self.oee.tick_al_confine(self.simclock.tempo_simulato))
+        self.stato = "non in Produzione: cambio, manutenzione o guasto"
+        self.simclock.tempo_simulato += n_tick * self.tick_reale
+        self.tempo_perso += n_tick * self.tick_reale
+        progresso = min(100.0, 100*self.programma.peso_parziale/self.programma.ordine_corrente.peso_target)
+        self.tracker_ordine.aggiorna_blocco([progresso] * n_tick)
+        self.tracker_simulazione.aggiorna_blocco([self.programma.peso_accumulato/1000] * n_tick)
+        self.evento.tot_timer = max(0, self.evento.tot_timer - n_tick * self.tick_reale)
+        if self.evento.tot_timer == 0:
+            self.evento.reset()
+            self.eventi_attivi = self.evento.eventi_attivi
+
+    def _delta_tick(self):
+        """Lunghezza e peso prodotti in un tick, con le stesse operazioni di Bobina.aggiorna_peso."""
+        delta_lunghezza = self.programma.parametri_processo['velocita tela']['valore'] * 0.85 * self.tick_reale
+        return delta_lunghezza, delta_lunghezza * self.bobina.grammatura * self.larghezza_macchina / 1000
+
+    def _tick_liberi(self):
+        """
+        Tick di sola produzione prima del prossimo evento esogeno o del tick che completa la bobina
+        (questi ultimi passano da esegui_tick), al più fino al confine dell'ora OEE.
+        """
+        delta_lunghezza, _ = self._delta_tick()
+        residuo = self.bobina.lunghezza_max - self.bobina.lunghezza
+        # stima per eccesso, poi verifica esatta sulla somma cumulativa
+        stima = int(residuo // delta_lunghezza) + 2
+        lunghezze = np.add.accumulate(np.concatenate(([self.bobina.lunghezza], np.full(stima, delta_lunghezza))))[1:]
+        tick_bobina = int(np.searchsorted(lunghezze >= self.bobina.lunghezza_max, True)) + 1
+        liberi = tick_bobina - 1
+        tempo_evento = self.evento.tempo_prossimo_esogeno()
+        if tempo_evento is not None:
+            tick_evento = max(0, -(-(tempo_evento - self.simclock.get_time()) // self.tick_reale))
+            liberi = min(liberi, tick_evento - 1)
+        liberi = min(liberi, self.oee.tick_al_confine(self.simclock.tempo_simulato))
+        return max(0, int(liberi))
+
+    def _produci_blocco(self, n_tick):
+        """n_tick di produzione senza eventi né fine bobina, con somme cumulative sequenziali."""
+        delta_lunghezza, delta_peso = self._delta_tick()
+        programma, bobina, feltro = self.programma, self.bobina, self.feltro
+
+        def cumula(iniziale, delta):
+            return np.add.accumulate(np.concatenate(([iniziale], np.full(n_tick, delta))))[1:]
+
+        bobina.lunghezza = float(cumula(bobina.lunghezza, delta_lunghezza)[-1])
+        bobina.peso_bobina = float(cumula(bobina.peso_bobina, delta_peso)[-1])
+        bobina.delta_peso_bobina = 0
+        accumulato = cumula(programma.peso_accumulato, delta_peso)
+        parziale = cumula(programma.peso_parziale, delta_peso)
+        programma.peso_accumulato = float(accumulato[-1])
+        programma.peso_parziale = float(parziale[-1])
+        feltro.ore_uso = float(cumula(feltro.ore_uso, feltro.tick_reale / 3600)[-1])
+        feltro.usura = min(feltro.ore_uso / feltro.ore_vita, 1.0)
+        feltro.stato = feltro.calcola_stato()
+        self.simclock.tempo_simulato += n_tick * self.tick_reale
+        self.stato = "Produzione"
+        self.tracker_ordine.aggiorna_blocco(np.minimum(100.0, 100*parziale/programma.ordine_corrente.peso_target).tolist())
+        self.tracker_simulazione.aggiorna_blocco((accumulato/1000).tolist())
+
+
+def esegui_replay(registrazione, **opzioni):
+    """Esegue un replay (opzioni come MacchinaReplay) e ne restituisce i KPI."""
+    macchina = MacchinaReplay(registrazione, **opzioni)
+    macchina.setup_bobina()
+    macchina.esegui()
+    return kpi_macchina(macchina)
+
+
+def confronta(base, variante):
+    """Differenze (variante - base) dei KPI numerici di due replay."""
+    return {
+        chiave: variante[chiave] - base[chiave]
+        for chiave in ("tempo_simulato", "tempo_perso", "percentuale_produzione", "peso_totale_t", "bobine_totali")
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay controfattuale di una campagna registrata")
+    parser.add_argument("eventi", help="log_eventi_dettagliati.json")
+    parser.add_argument("bobine", help="log_bobine.json")
+    parser.add_argument("--scenario", default=None, help="scenario della variante (ricette, parametri processo)")
+    parser.add_argument("--larghezza", type=float, default=None, help="larghezza macchina della variante (m)")
+    argomenti = parser.parse_args()
+    configura_output("console")
+    registrazione = carica_registrazione(argomenti.eventi, argomenti.bobine)
+    base = esegui_replay(registrazione)
+    opzioni = {}
+    if argomenti.scenario:
+        scenario = carica_scenario(argomenti.scenario)
+        if argomenti.larghezza:
+            # con uno scenario vale la sua larghezza macchina: la variante la sostituisce nello scenario
+            dati = scenario.to_dict()
+            dati["macchina"]["larghezza"] = argomenti.larghezza
+            scenario = scenario_da_dict(dati, sorgente=scenario.sorgente)
+        opzioni["scenario"] = scenario
+    elif argomenti.larghezza:
+        opzioni["larghezza_macchina"] = argomenti.larghezza
+    variante = esegui_replay(registrazione, **opzioni)
+    logger.info("%s", json.dumps({"base": base, "variante": variante, "differenze": confronta(base, variante)}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,8 @@
-from core.tracker import plot_progress
+import logging
+
+from core.tracker import carica_pyplot, plot_progress
+
+logger = logging.getLogger(__name__)
 
 def formatta_tempo(secondi):
     ore = int(secondi // 3600)
@@ -10,132 +14,133 @@ def formatta_tempo(secondi):
 class ReportStatistica:
     """
     Classe per la creazione rapida di viste statistiche e grafiche della simulazione cartiera.
+    Le viste vengono emesse sul logger "core.reportstatistica" (vedi core.console.configura_output):
+    in modalità silenziosa il testo non viene nemmeno composto. Lo stato in corsa della simulazione
+    è mostrato dalla dashboard (core.dashboard) a partire dagli snapshot json_*.
     """
 
     @staticmethod
-    def vista_bobina(macchina):
-        """Vista dettagliata della bobina corrente."""
-        print("\n=== Stato Bobina Corrente ===")
-        print(macchina.bobina.__repr__())
-        if macchina.indice < len(macchina.bobine_tot_prodotte):
-            print(f"Bobine prodotte nell'ordine corrente: {macchina.bobine_tot_prodotte[macchina.indice]}")
-        else:
-            print("(fine ordini)")
-        print()
+    def _emetti(testo):
+        """Emette una vista come un unico record di log, marcato come vista (la dashboard non lo mostra)."""
+        logger.info(testo, extra={"vista": True})
 
     @staticmethod
-    def vista_macchina_efficienze(macchina):
-        """
-        Vista dello stato macchina: per ogni variabile, stampa anche l’efficienza associata (se presente), 
-        in formato ordinato e leggibile come da esempio desiderato.
-        """
-        print("=== Stato Macchina Continua (con efficienze) ===")
-        eventi = macchina.eventi_attivi
-        parametri = macchina.programma.parametri_processo
-        feltro = macchina.feltro
-        stato_macchina = macchina.stato
-
-        if ("guasto macchina" in eventi) or ("cambio feltro" in eventi):
-            fermo = True
-        else:
-            fermo = False
-
-        # Velocità, concentrazione, raffinazione, temperatura: stampati con label e unità
-        mapping = {
-            'velocita tela':   ("Velocità tela",         "m/s",        1),
-            'concentrazione impasto %': ("Concentrazione impasto %", "", 3),
-            'grado raffinazione': ("Grado raffinazione (0-100)",      "", 0),
-            'temperatura cappa': ("Temperatura cappa",   "°C",         0)
-        }
-
-        for key, info in parametri.items():
-            if key == "additivi chimici":
-                print("Additivi chimici:")
-                for additivo in info:
-                    print(f"  - {additivo['tipologia']:<30} | efficienza: {additivo['efficienza']:.3f}")
-            else:
-                label, um, nd = mapping.get(key, (key.capitalize(), "", 2))
-                valore = info["valore"]
-                efficienza = info.get("efficienza", None)
-                valore_display = 0 if fermo else valore
-                if nd == 0:
-                    valore_fmt = f"{int(valore_display)}"
-                elif nd == 1:
-                    valore_fmt = f"{valore_display:.1f}"
-                else:
-                    valore_fmt = f"{valore_display:.3f}"
-                unita = f" {um}" if um else ""
-                print(f"{label:<30}: {valore_fmt}{unita:<4} | efficienza: {efficienza:.3f}")
-
-        print(f"Usura feltro: {feltro.usura*100:.1f}% | efficienza: {feltro.efficienza:.3f}")
-        print(f"Stato: {stato_macchina}")
-        print(f"Eventi attivi: {eventi}")
-        print()
+    def testo_archivio(archivio):
+        """Testo di riepilogo di un ArchivioRisultati (core.archivio), letto dalle colonne memmap."""
+        kpi = archivio.kpi[archivio.completi()]
+        righe = [f"\n=== Riepilogo archivio ({len(kpi)}/{archivio.n_run} run) ==="]
+        if not len(kpi):
+            return "\n".join(righe + ["(Nessun run archiviato)"])
+        completati = int(kpi["completata"].sum())
+        righe.append(f"Run completati: {completati}, interrotti: {len(kpi) - completati}")
+        righe.append(f"Tempo simulato medio: {formatta_tempo(kpi['tempo_simulato'].mean())}, "
+                     f"tempo perso medio: {formatta_tempo(kpi['tempo_perso'].mean())}")
+        righe.append(f"Produzione: {kpi['percentuale_produzione'].mean():.1f}% "
+                     f"(min {kpi['percentuale_produzione'].min():.1f}%, max {kpi['percentuale_produzione'].max():.1f}%)")
+        righe.append(f"Peso prodotto medio: {kpi['peso_totale_t'].mean():.2f} t, "
+                     f"bobine medie: {kpi['bobine_totali'].mean():.1f}")
+        perso = kpi["tempo_perso_per_evento"]
+        for tipo in perso.dtype.names:
+            if perso[tipo].any():
+                righe.append(f"  {tipo}: {formatta_tempo(perso[tipo].mean())} medi, "
+                             f"{kpi['eventi'][tipo].mean():.1f} eventi per run")
+        return "\n".join(righe)
 
+    @staticmethod
+    def vista_archivio(archivio):
+        if logger.isEnabledFor(logging.INFO):
+            ReportStatistica._emetti(ReportStatistica.testo_archivio(archivio))
 
+    
+    # --- METODI GRAFICI (INTEGRAZIONE CON TRACKER) ---
     @staticmethod
-    def vista_avanzamento_ordine(macchina):
+    def grafico_avanzamento_ordine(progress_tracker, nome_file=None):
         """
-        Vista avanzamento ordine: percentuale completata, target vs attuale.
+        Genera e salva/mostra il grafico di avanzamento ordine corrente.
         """
-        ordine = macchina.programma.ordine_corrente
-        peso_parziale = macchina.programma.peso_parziale
-        peso_target = ordine.peso_target
-        progresso = min(100.0, 100 * peso_parziale / peso_target) if peso_target else 0.0 
-        print("=== Avanzamento Ordine Corrente ===")
-        print(f"Prodotto: {ordine.prodotto}")
-        print(f"Peso attuale: {peso_parziale:.1f} kg / Target: {peso_target:.1f} kg")
-        print(f"Avanzamento: {progresso:.2f}%")
-        if macchina.indice < len(macchina.bobine_tot_prodotte):
-            print(f"Bobine completate: {macchina.bobine_tot_prodotte[macchina.indice]}")
-        else:
-            print()
-        print()
+        plot_progress(progress_tracker, ylabel="Completamento (%)", savefile=nome_file, show_target=100)
 
     @staticmethod
-    def vista_rapida(macchina):
+    def grafico_simulazione(progress_tracker, peso_totale=None, nome_file=None):
         """
-        Stampa tutte le viste essenziali con un unico comando.
+        Genera e salva/mostra il grafico di avanzamento per l'intera simulazione.
+        Accetta anche la serie di un run archiviato: archivio.tracker(indice).
         """
-        ReportStatistica.vista_bobina(macchina)
-        ReportStatistica.vista_macchina_efficienze(macchina)
-        ReportStatistica.vista_avanzamento_ordine(macchina)
-        ReportStatistica.vista_eventi(macchina)
+        label = "Peso prodotto (t)"
+        plot_progress(progress_tracker, ylabel=label, savefile=nome_file, show_target=peso_totale)
 
-    
     @staticmethod
-    def vista_eventi(macchina):
-        if macchina.stato == "Tutti gli ordini completati. Termine Simulazione":
-            return
-        print("\n=== Ultimi 3 Eventi (Guasti/Cambi/Manutenzione) ===")
-        eventi = macchina.evento.log_eventi[-3:]  # prendi ultimi tre (o tutti se <3)
-        if not eventi:
-            print("(Nessun evento registrato)")
+    def _salva_o_mostra(plt, nome_file):
+        if nome_file:
+            plt.savefig(nome_file, bbox_inches="tight")
+            logger.info("Grafico salvato come %s", nome_file)
+            plt.close()
         else:
-            for evento in eventi:
-                print(
-                    f"[{evento['evento'].upper()}] durata: {formatta_tempo(evento['durata'])}, "
-                    f"tempo simulato: {formatta_tempo(evento['tempo_simulato'])}, "
-                    f"ordine: {evento['ordine_corrente']}, bobina n°: {evento['indice_bobina']}"
-                )
-        print(f"\nTempo totale perso: {formatta_tempo(macchina.tempo_perso)}\n")
+            plt.show()
 
-    
-    # --- METODI GRAFICI (INTEGRAZIONE CON TRACKER) ---
     @staticmethod
-    def grafico_avanzamento_ordine(progress_tracker, nome_file=None):
+    def grafico_ventaglio(aggregatore, nome_file=None):
         """
-        Genera e salva/mostra il grafico di avanzamento ordine corrente.
+        Grafico a ventaglio del peso cumulato di un AggregatoreMultiRun (core.aggregatore): mediana e
+        bande tra i percentili simmetrici (5-95, 25-75).
         """
-        plot_progress(progress_tracker, ylabel="Completamento (%)", savefile=nome_file, show_target=100)
+        plt = carica_pyplot()
+        ore, bande = aggregatore.bande_serie()
+        plt.figure(figsize=(20, 6))
+        ax = plt.gca()
+        ax.fill_between(ore, bande[:, 0], bande[:, 4], color="tab:blue", alpha=0.18, label="5-95 percentile")
+        ax.fill_between(ore, bande[:, 1], bande[:, 3], color="tab:blue", alpha=0.35, label="25-75 percentile")
+        ax.plot(ore, bande[:, 2], color="tab:blue", linewidth=1.5, label="mediana")
+        ax.set_xlabel("Tempo simulato (ore)", fontsize=13)
+        ax.set_ylabel("Peso prodotto (t)", fontsize=13)
+        ax.set_title(f"Avanzamento simulazione su {aggregatore.n_run} run", fontsize=16, pad=18)
+        ax.grid(True, linestyle="-", alpha=0.18)
+        ax.legend(loc="upper left", fontsize=11)
+        plt.tight_layout(pad=2)
+        ReportStatistica._salva_o_mostra(plt, nome_file)
 
     @staticmethod
-    def grafico_simulazione(progress_tracker, peso_totale=None, nome_file=None):
+    def grafico_distribuzioni(aggregatore, nome_file=None):
         """
-        Genera e salva/mostra il grafico di avanzamento per l'intera simulazione.
+        Distribuzioni di un AggregatoreMultiRun: percentili del tempo perso per tipo di evento e delle
+        tonnellate per ordine, istogrammi dello scostamento di grammatura e dell'indice di qualità.
         """
-        label = "Peso prodotto (t)"
-        plot_progress(progress_tracker, ylabel=label, savefile=nome_file, show_target=peso_totale)
+        plt = carica_pyplot()
+        figura, assi = plt.subplots(2, 2, figsize=(16, 10))
+
+        def ventaglio_orizzontale(ax, etichette, riepiloghi, scala, titolo, unita):
+            for i, riepilogo in enumerate(riepiloghi):
+                if not riepilogo["n"]:
+                    continue
+                p = {chiave: valore * scala for chiave, valore in riepilogo["percentili"].items()}
+                ax.plot([p["p5"], p["p95"]], [i, i], color="tab:blue", alpha=0.4, linewidth=2)
+                ax.plot([p["p25"], p["p75"]], [i, i], color="tab:blue", linewidth=6)
+                ax.plot(p["p50"], i, "o", color="white", markeredgecolor="tab:blue")
+            ax.set_yticks(range(len(etichette)), etichette)
+            ax.set_xlabel(unita)
+            ax.set_title(titolo)
+            ax.grid(True, axis="x", alpha=0.18)
+
+        riepilogo = aggregatore.riepilogo()
+        tipi = list(riepilogo["tempo_perso_per_evento"])
+        ventaglio_orizzontale(assi[0][0], tipi, [riepilogo["tempo_perso_per_evento"][t] for t in tipi],
+                              1 / 60, "Tempo perso per run e tipo di evento", "minuti")
+        prodotti = list(riepilogo["tonnellate_per_ordine"])
+        ventaglio_orizzontale(assi[0][1], prodotti, [riepilogo["tonnellate_per_ordine"][p] for p in prodotti],
+                              1, "Tonnellate per ordine", "t")
+        for ax, sketch, titolo, unita in (
+            (assi[1][0], aggregatore.scostamento_grammatura, "Scostamento grammatura dal target", "%"),
+            (assi[1][1], aggregatore.indice_qualita, "Indice di qualità delle bobine", "indice"),
+        ):
+            conteggi, bordi = sketch.istogramma(classi=60)
+            if len(conteggi):
+                ax.stairs(conteggi, bordi, fill=True, alpha=0.6)
+            ax.set_title(titolo)
+            ax.set_xlabel(unita)
+            ax.grid(True, alpha=0.18)
+        figura.suptitle(f"Distribuzioni su {aggregatore.n_run} run", fontsize=16)
+        plt.tight_layout(pad=2)
+        ReportStatistica._salva_o_mostra(plt, nome_file)
 
     # --- Metodi JSON ---
 
@@ -212,4 +217,53 @@ class ReportStatistica:
         return {
             "eventi": macchina.evento.log_eventi,
             "tempo_totale_perso_sec": macchina.tempo_perso
-        }
\ No newline at end of file
+        }
+
+    @staticmethod
+    def json_fermi_finestra(macchina, da=None, a=None, ordine=None):
+        """
+        Tempo perso e numero di eventi per tipo nella finestra [da, a) di tempo simulato (secondi),
+        opzionalmente per un solo ordine: query O(log n) sul RegistroEventi (core.registroeventi).
+        a None = tempo simulato corrente: un fermo in corso conta solo per la parte già trascorsa.
+        """
+        registro = macchina.evento.log_eventi
+        a = macchina.simclock.tempo_simulato if a is None else a
+        return {
+            "da": da, "a": a, "ordine": ordine,
+            "tempo_perso_sec": registro.tempo_perso(da, a, ordine=ordine),
+            "tempo_perso_per_tipo": registro.tempo_perso_per_tipo(da, a, ordine),
+            "eventi_per_tipo": registro.conteggi_per_tipo(da, a, ordine),
+        }
+
+    @staticmethod
+    def json_oee(macchina):
+        """OEE di campagna, ordine e turno in corso, finestre mobili e periodi chiusi (core.oee), senza rileggere i log."""
+        return macchina.oee.riepilogo(macchina)
+
+    @staticmethod
+    def testo_oee(macchina):
+        """Testo dell'OEE (disponibilità × prestazioni × qualità) per campagna, turno e ordine."""
+        def riga(nome, valori):
+            if valori["oee"] is None:
+                return f"{nome:<16}: n.d. ({formatta_tempo(valori['tempo_s'])})"
+            return (f"{nome:<16}: OEE {valori['oee']*100:.1f}% = disponibilità {valori['disponibilita']*100:.1f}%"
+                    f" × prestazioni {valori['prestazioni']*100:.1f}% × qualità {valori['qualita']*100:.1f}%"
+                    f" | fermi {valori['fermi']}, bobine {valori['bobine_conformi']}/{valori['bobine']} conformi")
+        riepilogo = ReportStatistica.json_oee(macchina)
+        righe = ["\n=== OEE ===", riga("Campagna", riepilogo["campagna"]),
+                 riga("Ultime ore", riepilogo["ultime_ore"]), riga("Turno in corso", riepilogo["turno_corrente"])]
+        for turno in riepilogo["turni"]:
+            righe.append(riga(f"  Turno {turno['turno'] + 1}", turno))
+        for ordine in riepilogo["ordini"]:
+            righe.append(riga(f"  Ordine {ordine['ordine'] + 1}", ordine))
+        return "\n".join(righe)
+
+    @staticmethod
+    def vista_oee(macchina):
+        if logger.isEnabledFor(logging.INFO):
+            ReportStatistica._emetti(ReportStatistica.testo_oee(macchina))
+
+    @staticmethod
+    def json_multirun(aggregatore):
+        """Riepilogo compatto di un AggregatoreMultiRun: percentili delle distribuzioni e bande del peso cumulato."""
+        return aggregatore.riepilogo()
@@ -0,0 +1,410 @@
+"""
+Formato scenario e caricatore.
+
+Uno scenario descrive in un file dati (JSON, TOML o YAML) tutto ciò che in origine era scritto nel
+codice: ordini (espliciti o generati a caso entro intervalli), ricette di processo per prodotto,
+probabilità e durate degli eventi, limiti di vita del feltro, larghezza macchina e i semi di un batch.
+La sezione facoltativa [deriva] attiva la deriva dei parametri di processo entro l'ordine (core.deriva).
+Le sezioni omesse ereditano i valori predefiniti di RICETTE_DEFAULT, PARAMETRI_EVENTI_DEFAULT e Feltro.
+
+Il caricatore valida il file una sola volta e lo compila in uno Scenario con tabelle immutabili:
+lo stesso oggetto può essere passato ai processi worker (pickle una volta per worker) e condiviso
+in sola lettura da tutte le MacchinaContinua, senza ulteriori parsing per run.
+
+Esempio (TOML):
+
+    nome = "campagna base"
+
+    [macchina]
+    larghezza = 2.75
+
+    [feltro]
+    ore_vita_min = 432
+    ore_vita_max = 480
+    soglia_cambio_bobina = 0.9      # usura di sostituzione al cambio bobina
+    soglia_cambio_ordine = 0.8      # opzionale: sostituzione al cambio produzione
+
+    [[ordini]]
+    prodotto = "Tovaglioli"
+    grammatura_target = 15.0
+    peso_target = 30000
+
+    [ricette.Tovaglioli]
+    additivi = ["sbiancante", "resistenza ad umido (KIMENE)"]
+    grado_raffinazione = 30
+    temperatura_cappa = 400
+
+    [eventi."guasto macchina"]
+    probabilita = 50
+    periodo_sec = 864000
+    durata = { distribuzione = "uniforme", min = 300, max = 21600 }
+
+    [batch]
+    n_run = 100
+    seme_iniziale = 1
+"""
+import copy
+import json
+import os
+
+import numpy as np
+
+from core.deriva import PARAMETRI_DERIVA
+from core.evento import PARAMETRI_EVENTI_DEFAULT
+from core.feltro import Feltro, PoliticaFeltro
+from core.programmaproduzione import RICETTE_DEFAULT, Ordine
+
+
+class ErroreScenario(ValueError):
+    """Scenario non valido; il messaggio indica il campo che ha causato l'errore."""
+
+
+class TabellaCongelata(dict):
+    """Dizionario in sola lettura (resta serializzabile con pickle, a differenza di MappingProxyType)."""
+    def _sola_lettura(self, *args, **kwargs):
+        raise TypeError("Le tabelle di uno Scenario sono in sola lettura")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _sola_lettura
+
+    def __reduce__(self):
+        return (TabellaCongelata, (dict(self),))
+
+    def __hash__(self):
+        return hash(tuple(sorted(self.items())))
+
+
+def congela(valore):
+    """Converte ricorsivamente dict e liste in TabellaCongelata e tuple."""
+    if isinstance(valore, dict):
+        return TabellaCongelata({chiave: congela(v) for chiave, v in valore.items()})
+    if isinstance(valore, (list, tuple)):
+        return tuple(congela(v) for v in valore)
+    return valore
+
+
+# Generazione casuale predefinita (stessi intervalli di main.genera_ordini_randomici)
+ORDINI_CASUALI_DEFAULT = {
+    "mescola": True,
+    "prodotti": [
+        {"prodotto": "Carta igienica", "grammatura": [16, 19], "peso": [20000, 45000]},
+        {"prodotto": "Tovaglioli", "grammatura": [14, 16], "peso": [20000, 45000]},
+        {"prodotto": "Asciugatutto", "grammatura": [26, 30 + 1], "peso": [20000, 45000]},
+    ]
+}
+
+
+class Scenario:
+    """
+    Scenario compilato. Tutti gli attributi sono valori semplici o tabelle congelate.
+    Usare carica_scenario() o scenario_da_dict() per costruirlo.
+    """
+    __slots__ = ("nome", "tick_reale", "larghezza_macchina", "ore_vita_feltro_min", "ore_vita_feltro_max",
+                 "politica_feltro", "sigma_velocita", "sigma_efficienza", "ricette", "eventi", "ordini",
+                 "ordini_casuali", "semi", "deriva", "sorgente")
+
+    def __init__(self, **campi):
+        for nome in self.__slots__:
+            object.__setattr__(self, nome, campi[nome])
+
+    def __setattr__(self, nome, valore):
+        raise AttributeError("Scenario è immutabile")
+
+    def __reduce__(self):
+        return (_ricostruisci_scenario, ({nome: getattr(self, nome) for nome in self.__slots__},))
+
+    def genera_ordini(self):
+        """
+        Restituisce la lista di Ordine di un run. Con ordini espliciti è sempre la stessa lista
+        (nuovi oggetti), altrimenti viene estratta dal generatore globale come genera_ordini_randomici.
+        """
+        if self.ordini:
+            return [Ordine(o["prodotto"], o["grammatura_target"], o["peso_target"]) for o in self.ordini]
+        ordini = [
+            Ordine(
+                prodotto=voce["prodotto"],
+                grammatura_target=round(np.random.uniform(*voce["grammatura"]), 1),
+                peso_target=np.random.randint(voce["peso"][0], voce["peso"][1] + 1)
+            )
+            for voce in self.ordini_casuali["prodotti"]
+        ]
+        if self.ordini_casuali["mescola"]:
+            np.random.shuffle(ordini)
+        return ordini
+
+    def to_dict(self):
+        """Forma dati dello scenario (stesso schema del file), utile per hash e serializzazione."""
+        dati = {
+            "nome": self.nome,
+            "macchina": {"larghezza": self.larghezza_macchina, "tick_reale": self.tick_reale},
+            "feltro": {"ore_vita_min": self.ore_vita_feltro_min, "ore_vita_max": self.ore_vita_feltro_max,
+                       **{chiave: valore for chiave, valore in self.politica_feltro.items() if valore is not None}},
+            "processo": {"sigma_velocita": self.sigma_velocita, "sigma_efficienza": self.sigma_efficienza},
+            "ricette": _scongela(self.ricette),
+            "eventi": _scongela(self.eventi),
+            "ordini": _scongela(self.ordini),
+            "ordini_casuali": _scongela(self.ordini_casuali),
+            "batch": {"semi": list(self.semi)},
+        }
+        if self.deriva is not None:
+            dati["deriva"] = _scongela(self.deriva)
+        return dati
+
+    def __repr__(self):
+        return f"Scenario({self.nome!r}, ordini={len(self.ordini) or 'casuali'}, semi={len(self.semi)})"
+
+
+def _ricostruisci_scenario(campi):
+    return Scenario(**campi)
+
+
+def _scongela(valore):
+    if isinstance(valore, dict):
+        return {chiave: _scongela(v) for chiave, v in valore.items()}
+    if isinstance(valore, tuple):
+        return [_scongela(v) for v in valore]
+    return valore
+
+
+# --- Validazione ---
+
+def _numero(valore, campo, minimo=None, intero=False):
+    if isinstance(valore, bool) or not isinstance(valore, (int, float)):
+        raise ErroreScenario(f"{campo}: atteso un numero, trovato {valore!r}")
+    if intero and int(valore) != valore:
+        raise ErroreScenario(f"{campo}: atteso un intero, trovato {valore!r}")
+    if minimo is not None and valore < minimo:
+        raise ErroreScenario(f"{campo}: deve essere >= {minimo}, trovato {valore!r}")
+    return int(valore) if intero else valore
+
+
+def _sezione(dati, nome):
+    sezione = dati.get(nome, {})
+    if not isinstance(sezione, dict):
+        raise ErroreScenario(f"{nome}: attesa una tabella/oggetto")
+    return sezione
+
+
+def _intervallo(valore, campo):
+    if not isinstance(valore, (list, tuple)) or len(valore) != 2:
+        raise ErroreScenario(f"{campo}: atteso [minimo, massimo]")
+    minimo, massimo = (_numero(v, campo, minimo=0) for v in valore)
+    if minimo > massimo:
+        raise ErroreScenario(f"{campo}: minimo maggiore del massimo")
+    return [minimo, massimo]
+
+
+def _valida_durata(durata, campo):
+    if not isinstance(durata, dict):
+        raise ErroreScenario(f"{campo}: attesa una tabella con 'distribuzione'")
+    tipo = durata.get("distribuzione")
+    if tipo == "uniforme":
+        minimo = _numero(durata.get("min"), f"{campo}.min", minimo=0, intero=True)
+        massimo = _numero(durata.get("max"), f"{campo}.max", minimo=minimo, intero=True)
+        return {"distribuzione": tipo, "min": minimo, "max": massimo}
+    if tipo == "normale":
+        return {"distribuzione": tipo,
+                "media": _numero(durata.get("media"), f"{campo}.media", minimo=0),
+                "sigma": _numero(durata.get("sigma"), f"{campo}.sigma", minimo=0)}
+    if tipo == "fissa":
+        return {"distribuzione": tipo, "valore": _numero(durata.get("valore"), f"{campo}.valore", minimo=0, intero=True)}
+    raise ErroreScenario(f"{campo}.distribuzione: attesa 'uniforme', 'normale' o 'fissa', trovato {tipo!r}")
+
+
+def _valida_eventi(sezione):
+    eventi = copy.deepcopy(PARAMETRI_EVENTI_DEFAULT)
+    for tipo, valori in sezione.items():
+        if tipo not in eventi:
+            raise ErroreScenario(f"eventi: tipo evento sconosciuto {tipo!r} (ammessi: {', '.join(eventi)})")
+        if not isinstance(valori, dict):
+            raise ErroreScenario(f"eventi.{tipo}: attesa una tabella")
+        for chiave, valore in valori.items():
+            campo = f"eventi.{tipo}.{chiave}"
+            if chiave not in eventi[tipo]:
+                raise ErroreScenario(f"{campo}: parametro sconosciuto (ammessi: {', '.join(eventi[tipo])})")
+            if chiave == "durata":
+                eventi[tipo][chiave] = _valida_durata(valore, campo)
+            elif chiave == "probabilita":
+                probabilita = _numero(valore, campo, minimo=0)
+                if probabilita >= 100 and tipo != "pulizia macchina extra":
+                    raise ErroreScenario(f"{campo}: deve essere < 100 (probabilità sull'intero periodo)")
+                eventi[tipo][chiave] = probabilita
+            else:
+                eventi[tipo][chiave] = _numero(valore, campo, minimo=1, intero=True)
+    lama = eventi["cambio lama crespatura"]
+    if lama["intervallo_ore_min"] > lama["intervallo_ore_max"]:
+        raise ErroreScenario("eventi.cambio lama crespatura: intervallo_ore_min maggiore di intervallo_ore_max")
+    return eventi
+
+
+def _valida_ricette(sezione):
+    ricette = copy.deepcopy(RICETTE_DEFAULT)
+    for prodotto, ricetta in sezione.items():
+        campo = f"ricette.{prodotto}"
+        if not isinstance(ricetta, dict):
+            raise ErroreScenario(f"{campo}: attesa una tabella")
+        base = ricette.get(prodotto, {})
+        unita = dict(base, **ricetta)
+        mancanti = {"additivi", "grado_raffinazione", "temperatura_cappa"} - unita.keys()
+        if mancanti:
+            raise ErroreScenario(f"{campo}: campi mancanti {sorted(mancanti)}")
+        additivi = unita["additivi"]
+        if not isinstance(additivi, list) or not all(isinstance(a, str) for a in additivi):
+            raise ErroreScenario(f"{campo}.additivi: attesa una lista di nomi")
+        ricette[prodotto] = {
+            "additivi": list(additivi),
+            "grado_raffinazione": _numero(unita["grado_raffinazione"], f"{campo}.grado_raffinazione", minimo=0),
+            "temperatura_cappa": _numero(unita["temperatura_cappa"], f"{campo}.temperatura_cappa", minimo=0),
+        }
+    return ricette
+
+
+def _valida_ordini(lista, ricette):
+    if not isinstance(lista, list):
+        raise ErroreScenario("ordini: attesa una lista")
+    ordini = []
+    for indice, ordine in enumerate(lista):
+        campo = f"ordini[{indice}]"
+        if not isinstance(ordine, dict):
+            raise ErroreScenario(f"{campo}: attesa una tabella")
+        prodotto = ordine.get("prodotto")
+        if not isinstance(prodotto, str) or not any(nome in prodotto for nome in ricette):
+            raise ErroreScenario(f"{campo}.prodotto: nessuna ricetta per {prodotto!r}")
+        ordini.append({
+            "prodotto": prodotto,
+            "grammatura_target": _numero(ordine.get("grammatura_target"), f"{campo}.grammatura_target", minimo=1),
+            "peso_target": _numero(ordine.get("peso_target"), f"{campo}.peso_target", minimo=1),
+        })
+    return ordini
+
+
+def _valida_ordini_casuali(sezione, ricette):
+    if not sezione:
+        return copy.deepcopy(ORDINI_CASUALI_DEFAULT)
+    prodotti = sezione.get("prodotti")
+    if not isinstance(prodotti, list) or not prodotti:
+        raise ErroreScenario("ordini_casuali.prodotti: attesa una lista non vuota")
+    voci = []
+    for indice, voce in enumerate(prodotti):
+        campo = f"ordini_casuali.prodotti[{indice}]"
+        prodotto = voce.get("prodotto") if isinstance(voce, dict) else None
+        if not isinstance(prodotto, str) or not any(nome in prodotto for nome in ricette):
+            raise ErroreScenario(f"{campo}.prodotto: nessuna ricetta per {prodotto!r}")
+        peso = _intervallo(voce.get("peso"), f"{campo}.peso")
+        voci.append({
+            "prodotto": prodotto,
+            "grammatura": _intervallo(voce.get("grammatura"), f"{campo}.grammatura"),
+            "peso": [int(peso[0]), int(peso[1])],
+        })
+    return {"mescola": bool(sezione.get("mescola", True)), "prodotti": voci}
+
+
+def _valida_politica_feltro(feltro):
+    politica = PoliticaFeltro().to_dict()
+    for chiave in politica:
+        if chiave in feltro:
+            soglia = _numero(feltro[chiave], f"feltro.{chiave}", minimo=0)
+            if soglia > 1:
+                raise ErroreScenario(f"feltro.{chiave}: deve essere <= 1 (usura), trovato {soglia!r}")
+            politica[chiave] = soglia
+    return politica
+
+
+def _valida_deriva(sezione):
+    if not sezione:
+        return None
+    sconosciute = sezione.keys() - {"tau_sec", "sigma"}
+    if sconosciute:
+        raise ErroreScenario(f"deriva: parametri sconosciuti {sorted(sconosciute)} (ammessi: tau_sec, sigma)")
+    sigma = sezione.get("sigma", 0.02)
+    if isinstance(sigma, dict):
+        sconosciuti = sigma.keys() - set(PARAMETRI_DERIVA)
+        if sconosciuti:
+            raise ErroreScenario(f"deriva.sigma: parametri sconosciuti {sorted(sconosciuti)} "
+                                 f"(ammessi: {', '.join(PARAMETRI_DERIVA)})")
+        sigma = {parametro: _numero(sigma.get(parametro, 0), f"deriva.sigma.{parametro}", minimo=0)
+                 for parametro in PARAMETRI_DERIVA}
+    else:
+        valore = _numero(sigma, "deriva.sigma", minimo=0)
+        sigma = {parametro: valore for parametro in PARAMETRI_DERIVA}
+    return {"tau_sec": _numero(sezione.get("tau_sec", 7200), "deriva.tau_sec", minimo=1), "sigma": sigma}
+
+
+def _valida_semi(sezione):
+    if "semi" in sezione:
+        semi = sezione["semi"]
+        if not isinstance(semi, list):
+            raise ErroreScenario("batch.semi: attesa una lista di interi")
+        return [_numero(seme, "batch.semi", minimo=0, intero=True) for seme in semi]
+    n_run = _numero(sezione.get("n_run", 1), "batch.n_run", minimo=1, intero=True)
+    seme_iniziale = _numero(sezione.get("seme_iniziale", 0), "batch.seme_iniziale", minimo=0, intero=True)
+    return list(range(seme_iniziale, seme_iniziale + n_run))
+
+
+def scenario_da_dict(dati, sorgente=None):
+    """Valida i dati di uno scenario e li compila in uno Scenario immutabile."""
+    if not isinstance(dati, dict):
+        raise ErroreScenario("Lo scenario deve essere una tabella/oggetto")
+    sconosciute = dati.keys() - {"nome", "macchina", "feltro", "processo", "ricette", "eventi",
+                                 "ordini", "ordini_casuali", "batch", "deriva"}
+    if sconosciute:
+        raise ErroreScenario(f"Sezioni sconosciute: {sorted(sconosciute)}")
+    macchina = _sezione(dati, "macchina")
+    feltro = _sezione(dati, "feltro")
+    processo = _sezione(dati, "processo")
+    ricette = _valida_ricette(_sezione(dati, "ricette"))
+    ore_min = _numero(feltro.get("ore_vita_min", Feltro.MIN_ORE_VITA), "feltro.ore_vita_min", minimo=1, intero=True)
+    ore_max = _numero(feltro.get("ore_vita_max", Feltro.MAX_ORE_VITA), "feltro.ore_vita_max", minimo=ore_min, intero=True)
+    tick_reale = _numero(macchina.get("tick_reale", 5), "macchina.tick_reale", minimo=1, intero=True)
+    return Scenario(
+        nome=str(dati.get("nome", os.path.basename(sorgente) if sorgente else "scenario")),
+        tick_reale=tick_reale,
+        larghezza_macchina=_numero(macchina.get("larghezza", 2.75), "macchina.larghezza", minimo=0.1),
+        ore_vita_feltro_min=ore_min,
+        ore_vita_feltro_max=ore_max,
+        politica_feltro=congela(_valida_politica_feltro(feltro)),
+        sigma_velocita=_numero(processo.get("sigma_velocita", 0.10), "processo.sigma_velocita", minimo=0),
+        sigma_efficienza=_numero(processo.get("sigma_efficienza", 0.05), "processo.sigma_efficienza", minimo=0),
+        ricette=congela(ricette),
+        eventi=congela(_valida_eventi(_sezione(dati, "eventi"))),
+        ordini=congela(_valida_ordini(dati.get("ordini", []), ricette)),
+        ordini_casuali=congela(_valida_ordini_casuali(_sezione(dati, "ordini_casuali"), ricette)),
+        semi=tuple(_valida_semi(_sezione(dati, "batch"))),
+        deriva=congela(_valida_deriva(_sezione(dati, "deriva"))),
+        sorgente=sorgente,
+    )
+
+
+def leggi_file_scenario(percorso):
+    """Legge un file scenario (.json, .toml, .yaml/.yml) e restituisce i dati grezzi."""
+    estensione = os.path.splitext(percorso)[1].lower()
+    if estensione == ".json":
+        with open(percorso, encoding="utf-8") as f:
+            return json.load(f)
+    if estensione == ".toml":
+        import tomllib
+        with open(percorso, "rb") as f:
+            return tomllib.load(f)
+    if estensione in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError as errore:
+            raise ErroreScenario("Per gli scenari YAML serve PyYAML (pip install pyyaml)") from errore
+        with open(percorso, encoding="utf-8") as f:
+            return yaml.safe_load(f)
+    raise ErroreScenario(f"Formato scenario non riconosciuto: {percorso} (usare .json, .toml o .yaml)")
+
+
+def carica_scenario(percorso):
+    """Legge, valida e compila un file scenario."""
+    try:
+        dati = leggi_file_scenario(percorso)
+    except (json.JSONDecodeError, ValueError) as errore:
+        if isinstance(errore, ErroreScenario):
+            raise
+        raise ErroreScenario(f"{percorso}: {errore}") from errore
+    return scenario_da_dict(dati, sorgente=percorso)
+
+
+def scenario_predefinito():
+    """Scenario con i soli valori predefiniti e ordini casuali (equivalente a main.py)."""
+    return scenario_da_dict({})
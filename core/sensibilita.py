@@ -0,0 +1,272 @@
+"""
+Analisi di sensibilità globale (Sobol, schema di Saltelli) della pipeline di qualità delle bobine.
+
+Fattori: i pesi di calcola_media_ponderata_efficienze (velocità tela, concentrazione, raffinazione,
+temperatura cappa, additivi, feltro), coeff ed esponente p di sigma_grammatura_solo_eff e le sigma di
+gauss_riflessa (velocità e altri parametri). Ogni fattore varia in un intervallo attorno al valore
+nominale del codice (±50% di default), uniforme.
+
+Uscite, per bobina: indice di qualità (media ponderata delle efficienze), sigma della grammatura
+relativa al target e frazione di bobine fuori tolleranza di grammatura (5%, come MotoreOEE).
+
+Modello vettoriale (modello_qualita): le efficienze estratte per ordine non dipendono dai fattori se non
+attraverso le sigma, quindi si usano le stesse `estrazioni` per ogni riga (numeri casuali comuni):
+gauss_riflessa(σ) = 1 - σ|z|, raffinazione uniforme in [0.6, 1], efficienza del feltro dalla fascia di
+un'usura uniforme (come Feltro alla creazione), fuori tolleranza = erfc(tolleranza / (√2 σ)). Ogni
+valutazione è la media sulle estrazioni: milioni di righe si valutano a blocchi in pochi secondi.
+modello_campagna valuta invece le stesse righe con simulazioni complete in un pool di processi.
+
+Indici (Saltelli 2010): con A, B matrici N×k e AB_i = A con la colonna i di B,
+    S_i  = mean(f(B) (f(AB_i) - f(A))) / Var(Y)           primo ordine
+    ST_i = mean((f(A) - f(AB_i))²) / (2 Var(Y))           totale
+con intervalli di confidenza bootstrap (percentili) ricampionando le N righe.
+
+Avvio: python -m core.sensibilita --campioni 16384
+       python -m core.sensibilita --campagna scenari/base.toml --campioni 64 --ore 48
+"""
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from core.console import configura_output
+from core.feltro import Feltro
+from core.kernel import avanza
+from core.macchinacontinua import COEFF_SIGMA, ESPONENTE_SIGMA, PESI_EFFICIENZE, MacchinaContinua
+from core.programmaproduzione import RICETTE_DEFAULT, ProgrammaProduzione, trova_ricetta
+from core.scenario import carica_scenario
+
+logger = logging.getLogger("core.sensibilita")
+
+USCITE = ("indice_qualita", "sigma_relativa", "fuori_tolleranza")
+# Pesi per fattore: chiavi di PESI_EFFICIENZE (un unico fattore per tutti gli additivi)
+PESI_FATTORI = (("peso velocita tela", ("velocita tela",)),
+                ("peso concentrazione impasto", ("concentrazione impasto %",)),
+                ("peso grado raffinazione", ("grado raffinazione",)),
+                ("peso temperatura cappa", ("temperatura cappa",)),
+                ("peso additivi", ("additivo_0", "additivo_1", "additivo_2")),
+                ("peso feltro", ("feltro",)))
+(PESO_VELOCITA, PESO_CONCENTRAZIONE, PESO_RAFFINAZIONE, PESO_TEMPERATURA, PESO_ADDITIVI, PESO_FELTRO,
+ COEFF, ESPONENTE, SIGMA_VELOCITA, SIGMA_EFFICIENZA) = range(10)
+RIGHE_PER_BLOCCO = 16384
+
+
+def fattori(ampiezza=0.5, sigma_velocita=None, sigma_efficienza=None):
+    """Nomi, valori nominali e intervalli (minimo, massimo) dei fattori: nominale × (1 ± ampiezza)."""
+    nomi = [nome for nome, _ in PESI_FATTORI] + ["coeff", "p", "sigma velocita", "sigma efficienza"]
+    predefiniti = ProgrammaProduzione.__init__.__defaults__
+    nominali = np.array([PESI_EFFICIENZE[chiavi[0]] for _, chiavi in PESI_FATTORI] + [
+        COEFF_SIGMA, ESPONENTE_SIGMA,
+        predefiniti[0] if sigma_velocita is None else sigma_velocita,
+        predefiniti[1] if sigma_efficienza is None else sigma_efficienza,
+    ], dtype=float)
+    return nomi, nominali, np.stack([nominali * (1 - ampiezza), nominali * (1 + ampiezza)], axis=1)
+
+
+def _erfc(x):
+    """erfc per x >= 0 (Abramowitz-Stegun 7.1.26, errore assoluto < 1.5e-7), vettoriale."""
+    t = 1 / (1 + 0.3275911 * x)
+    polinomio = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return polinomio * np.exp(-x * x)
+
+
+def estrazioni(n, n_additivi, seme=0):
+    """Numeri casuali comuni del modello vettoriale: |z| delle gauss_riflessa, raffinazione, feltro."""
+    rng = np.random.default_rng(seme)
+    usura = rng.random(n)
+    efficienze_fasce = np.array([fascia[2] for fascia in Feltro.FASCE])
+    return {
+        "z": np.abs(rng.standard_normal((3 + n_additivi, n))),  # velocità, concentrazione, temperatura, additivi
+        "raffinazione": rng.uniform(0.60, 1, n),
+        "feltro": efficienze_fasce[[Feltro.indice_fascia(u) for u in usura]],
+    }
+
+
+def modello_qualita(X, estrazioni, tolleranza=5.0):
+    """
+    Uscite medie (righe di X × USCITE) della pipeline di qualità: media ponderata delle efficienze
+    (calcola_media_ponderata_efficienze), sigma relativa (sigma_grammatura_solo_eff / target) e
+    probabilità di fuori tolleranza, sulle stesse estrazioni per ogni riga.
+    """
+    z = estrazioni["z"]
+    n_additivi = len(z) - 3
+    colonna = lambda j: X[:, j, None]    # noqa: E731
+    numeratore = (colonna(PESO_VELOCITA) * (1 - colonna(SIGMA_VELOCITA) * z[0])
+                  + colonna(PESO_CONCENTRAZIONE) * (1 - colonna(SIGMA_EFFICIENZA) * z[1])
+                  + colonna(PESO_RAFFINAZIONE) * estrazioni["raffinazione"]
+                  + colonna(PESO_TEMPERATURA) * (1 - colonna(SIGMA_EFFICIENZA) * z[2])
+                  + colonna(PESO_ADDITIVI) * (n_additivi - colonna(SIGMA_EFFICIENZA) * z[3:].sum(axis=0))
+                  + colonna(PESO_FELTRO) * estrazioni["feltro"])
+    denominatore = (X[:, [PESO_VELOCITA, PESO_CONCENTRAZIONE, PESO_RAFFINAZIONE, PESO_TEMPERATURA, PESO_FELTRO]].sum(axis=1)
+                    + n_additivi * X[:, PESO_ADDITIVI])
+    media = numeratore / denominatore[:, None]
+    sigma = colonna(COEFF) * np.maximum(0, 1 - media) ** colonna(ESPONENTE)
+    with np.errstate(divide="ignore"):
+        fuori = _erfc(tolleranza / 100 / (math.sqrt(2) * sigma))
+    return np.stack([media.mean(axis=1), sigma.mean(axis=1), fuori.mean(axis=1)], axis=1)
+
+
+def matrici_saltelli(n, intervalli, seme=0):
+    """Righe [A; B; AB_1; ...; AB_k] ((k+2)·n × k) nei valori dei fattori."""
+    rng = np.random.default_rng(seme)
+    k = len(intervalli)
+    A, B = rng.random((n, k)), rng.random((n, k))
+    AB = np.repeat(A[None], k, axis=0)
+    AB[np.arange(k), :, np.arange(k)] = B.T
+    unitarie = np.concatenate([A, B, AB.reshape(k * n, k)])
+    return intervalli[:, 0] + unitarie * (intervalli[:, 1] - intervalli[:, 0])
+
+
+def valuta_a_blocchi(modello, righe, righe_per_blocco=RIGHE_PER_BLOCCO):
+    """Applica modello(X) a blocchi di righe (memoria limitata anche con milioni di righe)."""
+    return np.concatenate([modello(righe[i:i + righe_per_blocco]) for i in range(0, len(righe), righe_per_blocco)])
+
+
+def _stime(fA, fB, fAB):
+    """S e ST (k × uscite) da f(A), f(B) (n × uscite) e f(AB) (k × n × uscite); ricampionamenti in testa."""
+    tutte = np.concatenate([fA, fB], axis=-2)
+    centro = tutte.mean(axis=-2, keepdims=True)    # uscite centrate: meno varianza della stima di S
+    fA, fB, fAB = fA - centro, fB - centro, fAB - centro[..., None, :, :]
+    varianza = tutte.var(axis=-2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        primo = (fB[..., None, :, :] * (fAB - fA[..., None, :, :])).mean(axis=-2) / varianza[..., None, :]
+        totale = ((fA[..., None, :, :] - fAB) ** 2).mean(axis=-2) / (2 * varianza[..., None, :])
+    return primo, totale
+
+
+def indici_sobol(uscite, n, ricampionamenti=200, livello=0.95, seme=0):
+    """
+    Indici del primo ordine e totali con intervalli bootstrap dalle uscite di matrici_saltelli
+    ((k+2)·n × uscite). Restituisce (S, ST, S_ic, ST_ic): k × uscite e k × uscite × 2.
+    """
+    fA, fB = uscite[:n], uscite[n:2 * n]
+    fAB = uscite[2 * n:].reshape(-1, n, uscite.shape[1])
+    primo, totale = _stime(fA, fB, fAB)
+    rng = np.random.default_rng(seme)
+    campioni_primo, campioni_totale = [], []
+    passo = max(1, 2_000_000 // (n * fAB.shape[0] * uscite.shape[1]))    # ricampionamenti per blocco
+    for inizio in range(0, ricampionamenti, passo):
+        indici = rng.integers(0, n, (min(passo, ricampionamenti - inizio), n))
+        p, t = _stime(fA[indici], fB[indici], fAB[:, indici].swapaxes(0, 1))
+        campioni_primo.append(p)
+        campioni_totale.append(t)
+    quantili = [(1 - livello) / 2 * 100, (1 + livello) / 2 * 100]
+    ic_primo = np.moveaxis(np.percentile(np.concatenate(campioni_primo), quantili, axis=0), 0, -1)
+    ic_totale = np.moveaxis(np.percentile(np.concatenate(campioni_totale), quantili, axis=0), 0, -1)
+    return primo, totale, ic_primo, ic_totale
+
+
+def _run_campagna(argomenti):
+    """Simulazione completa con i fattori di una riga; uscite dal log delle bobine."""
+    riga, seme, scenario, max_tick, tolleranza = argomenti
+    np.random.seed(seme)
+    ordini = scenario.genera_ordini()
+    macchina = MacchinaContinua(ordini, tick_visivo=scenario.tick_reale, grafici=False, scenario=scenario, seme=seme)
+    macchina.pesi_efficienze = {chiave: riga[j] for j, (_, chiavi) in enumerate(PESI_FATTORI) for chiave in chiavi}
+    macchina.coeff_sigma, macchina.esponente_sigma = riga[COEFF], riga[ESPONENTE]
+    macchina.programma.sigma_velocita, macchina.programma.sigma_efficienza = riga[SIGMA_VELOCITA], riga[SIGMA_EFFICIENZA]
+    macchina.programma.imposta_parametri_per_ordine()
+    macchina.setup_bobina()
+    avanza(macchina, math.inf if max_tick is None else max_tick)
+    if not macchina.log_bobine:
+        return [np.nan] * len(USCITE)
+    qualita = np.array([bobina["indice_qualita"] for bobina in macchina.log_bobine])
+    scarti = np.array([(bobina["grammatura ottenuta"] - bobina["grammatura target"]) / bobina["grammatura target"]
+                       for bobina in macchina.log_bobine])
+    return [qualita.mean(), scarti.std(), np.mean(np.abs(scarti) * 100 > tolleranza)]
+
+
+def modello_campagna(righe, scenario, seme=0, max_tick=None, processi=None, tolleranza=5.0):
+    """
+    Uscite (righe × USCITE) da simulazioni complete in un pool di processi. La riga j di A, B e di ogni
+    AB_i usa lo stesso seme (numeri casuali comuni), così le differenze misurano solo i fattori.
+    """
+    n = len(righe) // (len(righe[0]) + 2)
+    compiti = [(riga, seme + j % n, scenario, max_tick, tolleranza) for j, riga in enumerate(righe)]
+    if processi == 1:
+        configura_output("silenziosa")
+        return np.array([_run_campagna(compito) for compito in compiti])
+    contesto = multiprocessing.get_context(
+        "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    )
+    with ProcessPoolExecutor(max_workers=processi, mp_context=contesto,
+                             initializer=configura_output, initargs=("silenziosa",)) as pool:
+        return np.array(list(pool.map(_run_campagna, compiti, chunksize=4)))
+
+
+def analisi(n=16384, prodotto="Tovaglioli", ampiezza=0.5, estrazioni_per_riga=64, ricampionamenti=200, seme=0,
+            scenario=None, campagna=False, max_tick=None, processi=None):
+    """
+    Analisi completa: matrici di Saltelli, valutazione (vettoriale o a campagne) e indici con
+    intervalli di confidenza al 95%. Restituisce un dizionario {uscita: {fattore: indici}}.
+    """
+    nomi, nominali, intervalli = fattori(ampiezza, *((scenario.sigma_velocita, scenario.sigma_efficienza)
+                                                     if scenario is not None else ()))
+    righe = matrici_saltelli(n, intervalli, seme)
+    if campagna:
+        uscite = modello_campagna(righe, scenario, seme, max_tick, processi)
+    else:
+        ricette = scenario.ricette if scenario is not None else RICETTE_DEFAULT
+        comuni = estrazioni(estrazioni_per_riga, len(trova_ricetta(prodotto, ricette)["additivi"]), seme)
+        uscite = valuta_a_blocchi(lambda X: modello_qualita(X, comuni), righe)
+    primo, totale, ic_primo, ic_totale = indici_sobol(uscite, n, ricampionamenti, seme=seme)
+    return {
+        uscita: {
+            nome: {
+                "nominale": float(nominali[i]), "intervallo": intervalli[i].tolist(),
+                "S": float(primo[i, u]), "S_ic": ic_primo[i, u].tolist(),
+                "ST": float(totale[i, u]), "ST_ic": ic_totale[i, u].tolist(),
+            }
+            for i, nome in enumerate(nomi)
+        }
+        for u, uscita in enumerate(USCITE)
+    }
+
+
+def testo_analisi(risultato):
+    """Tabella per uscita con i fattori in ordine di indice totale decrescente."""
+    righe = []
+    for uscita, indici in risultato.items():
+        righe.append(f"\n{uscita}")
+        righe.append(f"  {'fattore':<28}{'S':>8}  {'IC 95%':<17}{'ST':>8}  {'IC 95%':<17}")
+        for nome, valori in sorted(indici.items(), key=lambda voce: -voce[1]["ST"]):
+            righe.append(f"  {nome:<28}{valori['S']:>8.3f}  [{valori['S_ic'][0]:6.3f},{valori['S_ic'][1]:6.3f}]  "
+                         f"{valori['ST']:>8.3f}  [{valori['ST_ic'][0]:6.3f},{valori['ST_ic'][1]:6.3f}]")
+    return "\n".join(righe)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Indici di Sobol della pipeline di qualità delle bobine")
+    parser.add_argument("--campioni", type=int, default=16384, help="righe N delle matrici A e B")
+    parser.add_argument("--prodotto", default="Tovaglioli", help="ricetta (numero di additivi) del modello vettoriale")
+    parser.add_argument("--ampiezza", type=float, default=0.5, help="intervallo dei fattori: nominale × (1 ± ampiezza)")
+    parser.add_argument("--estrazioni", type=int, default=64, help="estrazioni comuni mediate per riga")
+    parser.add_argument("--bootstrap", type=int, default=200)
+    parser.add_argument("--seme", type=int, default=0)
+    parser.add_argument("--scenario", default=None, help="scenario per sigma nominali e ricette")
+    parser.add_argument("--campagna", default=None, metavar="SCENARIO",
+                        help="valuta con simulazioni complete dello scenario invece del modello vettoriale")
+    parser.add_argument("--ore", type=float, default=None, help="durata massima di ogni campagna (ore simulate)")
+    parser.add_argument("--processi", type=int, default=None)
+    parser.add_argument("--output", default=None, help="file JSON con gli indici")
+    argomenti = parser.parse_args()
+    configura_output("console")
+    percorso = argomenti.campagna or argomenti.scenario
+    scenario = carica_scenario(percorso) if percorso else None
+    max_tick = int(argomenti.ore * 3600 / scenario.tick_reale) if argomenti.ore and scenario is not None else None
+    risultato = analisi(argomenti.campioni, argomenti.prodotto, argomenti.ampiezza, argomenti.estrazioni,
+                        argomenti.bootstrap, argomenti.seme, scenario, argomenti.campagna is not None, max_tick,
+                        argomenti.processi)
+    configura_output("console")
+    logger.info("%s", testo_analisi(risultato))
+    if argomenti.output:
+        with open(argomenti.output, "w", encoding="utf-8") as f:
+            json.dump(risultato, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
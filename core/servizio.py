@@ -0,0 +1,601 @@
+"""
+Servizio asyncio per osservare e comandare più simulazioni da browser.
+
+Solo libreria standard: un piccolo server HTTP/1.1 (JSON) e WebSocket (RFC 6455) su asyncio.
+Ogni sessione ospita una MacchinaContinua che vive in uno dei processi worker (assegnato alla
+creazione, il meno carico): l'avanzamento (CPU-bound) avviene a blocchi di tick nel worker, così il
+loop degli eventi resta reattivo anche con decine di sessioni. Macchina e stato del generatore
+casuale restano nel worker tra un blocco e l'altro: a ogni blocco viaggiano solo il comando e lo
+snapshot, quindi il costo di un blocco non cresce con la storia (log eventi e bobine) della sessione.
+Ogni sessione è riproducibile dal suo seme anche se più sessioni condividono un worker.
+
+Endpoint REST (corpo e risposte JSON):
+    GET    /sessioni                         elenco sessioni
+    POST   /sessioni                         crea sessione {"ordini": [...], "seme": 1, "ritmo": 3600}
+    GET    /sessioni/<id>                    ultimo snapshot della sessione
+    GET    /sessioni/<id>/serie?orizzonte=3600
+                                             peso cumulato (t) degli ultimi `orizzonte` secondi simulati
+                                             con minimo e massimo per punto (tracker multirisoluzione)
+    DELETE /sessioni/<id>                    chiude la sessione
+    POST   /sessioni/<id>/avvia              avvia o riprende la simulazione
+    POST   /sessioni/<id>/pausa              mette in pausa al termine del blocco corrente
+    POST   /sessioni/<id>/checkpoint         salva macchina e stato casuale su file {"nome": "...", "percorso": "..."}
+    POST   /sessioni/<id>/ordini             accoda ordini {"ordini": [...]}
+    POST   /sessioni/ripristina              crea una sessione da checkpoint {"nome": "..."}; solo file
+                                             della cartella dei checkpoint del servizio
+WebSocket:
+    GET    /sessioni/<id>/stream?frequenza=2 delta dello snapshot (stile json_rapida), al massimo
+                                             `frequenza` messaggi al secondo; un client lento riceve
+                                             solo l'ultimo stato (nessuna coda illimitata).
+
+Avvio: python -m core.servizio --porta 8080
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from core.console import configura_output
+from core.dashboard import STATO_FINE, snapshot_macchina
+from core.kernel import avanza
+from core.macchinacontinua import MacchinaContinua
+from core.programmaproduzione import PRODOTTI, Ordine
+from core.tracker import TrackerMultirisoluzione
+
+logger = logging.getLogger("core.servizio")  # nome fisso: anche con python -m resta sotto il logger "core"
+
+GUID_WEBSOCKET = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+TICK_PER_BLOCCO = 720          # 1 ora simulata per ogni comando al worker della sessione
+MAX_CORPO = 1_000_000          # byte, limite del corpo delle richieste
+
+
+class ErroreHTTP(Exception):
+    def __init__(self, codice, messaggio):
+        super().__init__(messaggio)
+        self.codice = codice
+        self.messaggio = messaggio
+
+
+# --- Lavoro eseguito nei processi worker ---
+
+_SESSIONI = {}                 # nel processo worker: id sessione -> [macchina, stato del generatore]
+
+
+def _inizializza_worker():
+    configura_output("silenziosa")
+
+
+def installa_sessione(id_sessione, macchina, stato_rng):
+    """Affida la macchina della sessione al processo worker; restituisce lo snapshot."""
+    _SESSIONI[id_sessione] = [macchina, stato_rng]
+    return snapshot_macchina(macchina)
+
+
+def avanza_sessione(id_sessione, n_tick):
+    """
+    Avanza la macchina della sessione di n_tick (o fino al termine degli ordini) nel processo worker.
+    Lo stato del generatore è per sessione: più sessioni nello stesso worker restano riproducibili.
+    """
+    voce = _SESSIONI[id_sessione]
+    np.random.set_state(voce[1])
+    avanza(voce[0], n_tick)
+    voce[1] = np.random.get_state()
+    return snapshot_macchina(voce[0])
+
+
+def esporta_sessione(id_sessione, ritmo):
+    """Checkpoint serializzato (macchina, stato del generatore, ritmo) della sessione."""
+    macchina, stato_rng = _SESSIONI[id_sessione]
+    return pickle.dumps((macchina, stato_rng, ritmo))
+
+
+def accoda_ordini_sessione(id_sessione, ordini):
+    macchina = _SESSIONI[id_sessione][0]
+    macchina.programma.lista_ordini.extend(ordini)
+    macchina.bobine_tot_prodotte.extend([0] * len(ordini))
+    return snapshot_macchina(macchina)
+
+
+def serie_sessione(id_sessione, orizzonte=None):
+    """Serie del peso cumulato della sessione per un grafico (orizzonte in secondi simulati)."""
+    tracker = _SESSIONI[id_sessione][0].tracker_simulazione
+    if isinstance(tracker, TrackerMultirisoluzione):
+        x, y, minimo, massimo = tracker.get_data(orizzonte, bande=True)
+    else:                                   # checkpoint con la serie completa
+        x, y = (np.asarray(colonna, dtype=float) for colonna in tracker.get_data(orizzonte))
+        minimo = massimo = y
+    return {"orizzonte": orizzonte, "tempo_s": x.tolist(), "peso_t": y.tolist(),
+            "minimo_t": minimo.tolist(), "massimo_t": massimo.tolist()}
+
+
+def rimuovi_sessione(id_sessione):
+    _SESSIONI.pop(id_sessione, None)
+
+
+# --- Sessioni ---
+
+def ordini_da_json(lista):
+    if not isinstance(lista, list) or not lista:
+        raise ErroreHTTP(400, "'ordini' deve essere una lista non vuota")
+    try:
+        ordini = [Ordine.from_dict(dati) for dati in lista]
+    except (ValueError, AttributeError) as errore:
+        raise ErroreHTTP(400, str(errore))
+    for ordine in ordini:
+        if not any(prodotto in ordine.prodotto for prodotto in PRODOTTI):
+            raise ErroreHTTP(400, f"Prodotto sconosciuto: {ordine.prodotto!r} (ammessi: {', '.join(PRODOTTI)})")
+        if ordine.peso_target <= 0 or ordine.grammatura_target <= 0:
+            raise ErroreHTTP(400, f"Grammatura e peso target devono essere positivi: {ordine.prodotto!r}")
+    return ordini
+
+
+def nuova_macchina(ordini, seme=None):
+    """Macchina di una nuova sessione e stato del generatore dopo il setup (riproducibile dal seme)."""
+    if seme is not None and (type(seme) is not int or not 0 <= seme < 2**32):
+        raise ErroreHTTP(400, f"'seme' deve essere un intero tra 0 e 2^32-1, trovato {seme!r}")
+    stato_precedente = np.random.get_state()
+    np.random.seed(seme)
+    macchina = MacchinaContinua(ordini, tick_visivo=5, grafici=False, tracker_multirisoluzione=True, seme=seme)
+    macchina.setup_bobina()
+    stato_rng = np.random.get_state()
+    np.random.set_state(stato_precedente)
+    return macchina, stato_rng
+
+
+def valida_ritmo(ritmo):
+    if ritmo is not None and (type(ritmo) not in (int, float) or not ritmo > 0 or ritmo == float("inf")):
+        raise ErroreHTTP(400, f"'ritmo' deve essere un numero positivo, trovato {ritmo!r}")
+    return ritmo
+
+
+class Sessione:
+    """Stato lato server di una sessione; la macchina è nel processo worker `worker` (indice)."""
+    def __init__(self, id_sessione, worker, snapshot, ritmo=None):
+        self.id = id_sessione
+        self.worker = worker
+        self.ritmo = ritmo                  # secondi simulati per secondo reale, None = massima velocità
+        self.stato = "creata"
+        self.snapshot = snapshot
+        self.versione = 0
+        self.lock = asyncio.Lock()          # serializza blocchi di simulazione, checkpoint e modifiche
+        self.compito = None
+        self.cambiamento = asyncio.Event()
+
+    def aggiorna_snapshot(self, snapshot):
+        self.snapshot = snapshot
+        self.versione += 1
+        self.cambiamento.set()
+        self.cambiamento = asyncio.Event()
+
+    def descrizione(self):
+        return {
+            "id": self.id,
+            "stato": self.stato,
+            "ritmo": self.ritmo,
+            "tempo_simulato": self.snapshot["tempo_simulato"],
+            "stato_macchina": self.snapshot["stato"],
+            "peso_totale_t": self.snapshot["peso_totale_t"],
+        }
+
+
+def leggi_orizzonte(orizzonte):
+    try:
+        return float(orizzonte[0]) if orizzonte else None
+    except ValueError:
+        raise ErroreHTTP(400, f"orizzonte non valido: {orizzonte[0]!r}")
+
+
+def differenza(precedente, attuale):
+    """
+    Delta ricorsivo tra due snapshot: solo le chiavi cambiate; le chiavi rimosse valgono None.
+    Liste e valori semplici vengono sostituiti interamente.
+    """
+    if not isinstance(precedente, dict) or not isinstance(attuale, dict):
+        return attuale
+    delta = {}
+    for chiave, valore in attuale.items():
+        if chiave not in precedente:
+            delta[chiave] = valore
+        elif precedente[chiave] != valore:
+            delta[chiave] = differenza(precedente[chiave], valore)
+    for chiave in precedente.keys() - attuale.keys():
+        delta[chiave] = None
+    return delta
+
+
+class ServizioSimulazione:
+    def __init__(self, processi=None, cartella_checkpoint="checkpoint"):
+        self.sessioni = {}
+        self.contatore = itertools.count(1)
+        # forkserver/spawn: un fork dal processo del server erediterebbe i socket dei client aperti
+        contesto = multiprocessing.get_context(
+            "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        )
+        # un processo per executor: le sessioni restano nel worker a cui sono assegnate
+        self.worker = [ProcessPoolExecutor(max_workers=1, mp_context=contesto, initializer=_inizializza_worker)
+                       for _ in range(processi or os.cpu_count() or 1)]
+        self.cartella_checkpoint = cartella_checkpoint
+        self.server = None
+
+    # --- ciclo di vita delle sessioni ---
+
+    def _nel_worker(self, sessione, funzione, *argomenti):
+        """Esegue funzione(id sessione, *argomenti) nel processo worker della sessione."""
+        return asyncio.get_running_loop().run_in_executor(
+            self.worker[sessione.worker], funzione, sessione.id, *argomenti
+        )
+
+    async def crea_sessione(self, macchina, stato_rng, ritmo=None):
+        """Registra una sessione e ne affida la macchina al worker con meno sessioni."""
+        carico = [0] * len(self.worker)
+        for sessione in self.sessioni.values():
+            carico[sessione.worker] += 1
+        sessione = Sessione(str(next(self.contatore)), carico.index(min(carico)), None, ritmo)
+        sessione.snapshot = await self._nel_worker(sessione, installa_sessione, macchina, stato_rng)
+        self.sessioni[sessione.id] = sessione
+        return sessione
+
+    def chiudi_sessione(self, sessione):
+        sessione.stato = "chiusa"
+        if sessione.compito:
+            sessione.compito.cancel()
+        self.sessioni.pop(sessione.id, None)
+        # accodato dopo l'eventuale blocco in corso nello stesso worker
+        self.worker[sessione.worker].submit(rimuovi_sessione, sessione.id)
+
+    async def _esegui_sessione(self, sessione):
+        inizio_reale = time.monotonic()
+        inizio_simulato = sessione.snapshot["tempo_simulato"]
+        while sessione.stato == "in esecuzione":
+            async with sessione.lock:
+                snapshot = await self._nel_worker(sessione, avanza_sessione, TICK_PER_BLOCCO)
+                sessione.aggiorna_snapshot(snapshot)
+            if snapshot["stato"] == STATO_FINE:
+                sessione.stato = "completata"
+                break
+            if sessione.ritmo:
+                anticipo = (snapshot["tempo_simulato"] - inizio_simulato) / sessione.ritmo - (time.monotonic() - inizio_reale)
+                if anticipo > 0:
+                    await asyncio.sleep(anticipo)
+
+    def _compito_terminato(self, sessione, compito):
+        if not compito.cancelled() and compito.exception() is not None:
+            sessione.stato = "errore"
+            logger.error("Sessione %s interrotta: %r", sessione.id, compito.exception())
+
+    def avvia(self, sessione):
+        if sessione.stato == "completata":
+            raise ErroreHTTP(409, "Sessione già completata")
+        if sessione.stato != "in esecuzione":
+            sessione.stato = "in esecuzione"
+            if sessione.compito is not None and not sessione.compito.done():
+                # pausa non ancora raggiunta (blocco o attesa in corso): il ciclo esistente prosegue
+                return
+            sessione.compito = asyncio.create_task(self._esegui_sessione(sessione))
+            sessione.compito.add_done_callback(lambda compito: self._compito_terminato(sessione, compito))
+
+    async def checkpoint(self, sessione):
+        os.makedirs(self.cartella_checkpoint, exist_ok=True)
+        async with sessione.lock:
+            contenuto = await self._nel_worker(sessione, esporta_sessione, sessione.ritmo)
+            percorso = os.path.join(
+                self.cartella_checkpoint, f"sessione_{sessione.id}_{sessione.snapshot['tempo_simulato']}.pkl"
+            )
+        await asyncio.get_running_loop().run_in_executor(None, _scrivi_file, percorso, contenuto)
+        return percorso
+
+    def percorso_checkpoint(self, nome):
+        """
+        Percorso del checkpoint `nome` nella cartella dei checkpoint. Solo nomi di file di quella
+        cartella: il contenuto viene deserializzato con pickle, quindi mai percorsi scelti dal client.
+        """
+        cartella = os.path.realpath(self.cartella_checkpoint)
+        percorso = os.path.realpath(os.path.join(cartella, nome))
+        if not nome or os.path.dirname(percorso) != cartella:
+            raise ErroreHTTP(400, f"Nome di checkpoint non valido: {nome!r}")
+        return percorso
+
+    async def ripristina(self, nome):
+        percorso = self.percorso_checkpoint(nome)
+        try:
+            contenuto = await asyncio.get_running_loop().run_in_executor(None, _leggi_file, percorso)
+        except OSError as errore:
+            raise ErroreHTTP(404 if isinstance(errore, FileNotFoundError) else 400, f"Checkpoint non leggibile: {errore}")
+        try:
+            macchina, stato_rng, ritmo = pickle.loads(contenuto)
+        except Exception as errore:     # file vuoto o troncato (EOFError), classi mancanti, tupla diversa
+            raise ErroreHTTP(400, f"Checkpoint non valido: {errore!r}")
+        if not isinstance(macchina, MacchinaContinua):
+            raise ErroreHTTP(400, "Checkpoint non valido: non contiene una MacchinaContinua")
+        sessione = await self.crea_sessione(macchina, stato_rng, ritmo)
+        sessione.stato = "in pausa"
+        return sessione
+
+    async def accoda_ordini(self, sessione, ordini):
+        async with sessione.lock:
+            if sessione.snapshot["stato"] == STATO_FINE:
+                raise ErroreHTTP(409, "Sessione già completata: crearne una nuova")
+            sessione.aggiorna_snapshot(await self._nel_worker(sessione, accoda_ordini_sessione, ordini))
+
+    # --- HTTP ---
+
+    async def gestisci_connessione(self, reader, writer):
+        try:
+            metodo, percorso, query, intestazioni, corpo = await _leggi_richiesta(reader)
+            if intestazioni.get("upgrade", "").lower() == "websocket":
+                await self._websocket(reader, writer, percorso, query, intestazioni)
+                return
+            try:
+                codice, risposta = await self._instrada(metodo, percorso, corpo, query)
+            except ErroreHTTP as errore:
+                codice, risposta = errore.codice, {"errore": errore.messaggio}
+            await _scrivi_json(writer, codice, risposta)
+        except (ErroreHTTP, asyncio.IncompleteReadError, ConnectionError) as errore:
+            if isinstance(errore, ErroreHTTP):
+                await _scrivi_json(writer, errore.codice, {"errore": errore.messaggio})
+        except Exception as errore:
+            logger.exception("Errore interno nella gestione della richiesta")
+            await _scrivi_json(writer, 500, {"errore": f"Errore interno: {errore!r}"})
+        finally:
+            writer.close()
+
+    def _sessione(self, id_sessione):
+        if id_sessione not in self.sessioni:
+            raise ErroreHTTP(404, f"Sessione {id_sessione} inesistente")
+        return self.sessioni[id_sessione]
+
+    async def _instrada(self, metodo, percorso, corpo, query=None):
+        parti = [parte for parte in percorso.split("/") if parte]
+        if not parti or parti[0] != "sessioni":
+            raise ErroreHTTP(404, "Risorsa inesistente")
+        dati = _json_corpo(corpo) if metodo == "POST" else {}
+
+        if len(parti) == 1:
+            if metodo == "GET":
+                return 200, [sessione.descrizione() for sessione in self.sessioni.values()]
+            if metodo == "POST":
+                ordini = ordini_da_json(dati.get("ordini"))
+                ritmo = valida_ritmo(dati.get("ritmo"))
+                macchina, stato_rng = nuova_macchina(ordini, dati.get("seme"))
+                sessione = await self.crea_sessione(macchina, stato_rng, ritmo)
+                if dati.get("avvia", False):
+                    self.avvia(sessione)
+                return 201, sessione.descrizione()
+        elif len(parti) == 2 and parti[1] == "ripristina" and metodo == "POST":
+            sessione = await self.ripristina(str(dati.get("nome", "")))
+            return 201, sessione.descrizione()
+        elif len(parti) == 2:
+            sessione = self._sessione(parti[1])
+            if metodo == "GET":
+                return 200, {"sessione": sessione.descrizione(), "snapshot": sessione.snapshot}
+            if metodo == "DELETE":
+                self.chiudi_sessione(sessione)
+                return 200, {"id": sessione.id, "stato": "chiusa"}
+        elif len(parti) == 3 and parti[2] == "serie" and metodo == "GET":
+            sessione = self._sessione(parti[1])
+            orizzonte = leggi_orizzonte((query or {}).get("orizzonte"))
+            return 200, await self._nel_worker(sessione, serie_sessione, orizzonte)
+        elif len(parti) == 3 and metodo == "POST":
+            sessione = self._sessione(parti[1])
+            azione = parti[2]
+            if azione == "avvia":
+                self.avvia(sessione)
+                return 200, sessione.descrizione()
+            if azione == "pausa":
+                if sessione.stato == "in esecuzione":
+                    sessione.stato = "in pausa"
+                return 200, sessione.descrizione()
+            if azione == "checkpoint":
+                percorso = await self.checkpoint(sessione)
+                return 200, {"nome": os.path.basename(percorso), "percorso": percorso}
+            if azione == "ordini":
+                await self.accoda_ordini(sessione, ordini_da_json(dati.get("ordini")))
+                return 200, sessione.descrizione()
+        raise ErroreHTTP(405 if parti[0] == "sessioni" else 404, f"{metodo} non supportato su {percorso}")
+
+    # --- WebSocket ---
+
+    async def _websocket(self, reader, writer, percorso, query, intestazioni):
+        parti = [parte for parte in percorso.split("/") if parte]
+        if len(parti) != 3 or parti[0] != "sessioni" or parti[2] != "stream":
+            raise ErroreHTTP(404, "Stream inesistente")
+        sessione = self._sessione(parti[1])
+        chiave = intestazioni.get("sec-websocket-key")
+        if not chiave:
+            raise ErroreHTTP(400, "Sec-WebSocket-Key mancante")
+        try:
+            frequenza = float(query.get("frequenza", ["2"])[0])
+        except ValueError:
+            raise ErroreHTTP(400, "frequenza non valida")
+        intervallo = 1 / max(0.1, min(frequenza, 50.0))
+        accetta = base64.b64encode(hashlib.sha1((chiave + GUID_WEBSOCKET).encode()).digest()).decode()
+        writer.write(
+            "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accetta}\r\n\r\n".encode()
+        )
+        await writer.drain()
+
+        lettore = asyncio.create_task(_consuma_frame_client(reader, writer))
+        inviato, versione_inviata = {}, -1
+        try:
+            while not lettore.done() and sessione.id in self.sessioni:
+                cambiamento = sessione.cambiamento
+                if sessione.versione != versione_inviata:
+                    snapshot, versione = sessione.snapshot, sessione.versione
+                    delta = differenza(inviato, snapshot)
+                    messaggio = {"versione": versione, "completo": not inviato, "delta": delta}
+                    _scrivi_frame(writer, 0x1, json.dumps(messaggio).encode())
+                    await writer.drain()        # backpressure: un client lento rallenta solo sé stesso
+                    inviato, versione_inviata = snapshot, versione
+                    await asyncio.sleep(intervallo)  # limita la frequenza dei messaggi
+                    continue
+                # Nessuna novità: attende il prossimo snapshot o la chiusura del client
+                attesa = asyncio.create_task(cambiamento.wait())
+                await asyncio.wait({attesa, lettore}, timeout=1.0, return_when=asyncio.FIRST_COMPLETED)
+                attesa.cancel()
+            if not lettore.done():
+                _scrivi_frame(writer, 0x8, struct.pack("!H", 1000))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            lettore.cancel()
+
+    # --- avvio ---
+
+    async def avvia_server(self, host="127.0.0.1", porta=8080):
+        self.server = await asyncio.start_server(self.gestisci_connessione, host, porta)
+        return self.server
+
+    async def chiudi(self):
+        for sessione in list(self.sessioni.values()):
+            sessione.stato = "chiusa"
+            if sessione.compito:
+                sessione.compito.cancel()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        for worker in self.worker:
+            worker.shutdown(wait=False, cancel_futures=True)
+
+
+# --- Funzioni di supporto HTTP/WebSocket ---
+
+def _scrivi_file(percorso, contenuto):
+    with open(percorso, "wb") as f:
+        f.write(contenuto)
+
+
+def _leggi_file(percorso):
+    with open(percorso, "rb") as f:
+        return f.read()
+
+
+def _json_corpo(corpo):
+    if not corpo:
+        return {}
+    try:
+        dati = json.loads(corpo)
+    except json.JSONDecodeError as errore:
+        raise ErroreHTTP(400, f"JSON non valido: {errore}")
+    if not isinstance(dati, dict):
+        raise ErroreHTTP(400, "Il corpo deve essere un oggetto JSON")
+    return dati
+
+
+async def _leggi_richiesta(reader):
+    riga = (await reader.readuntil(b"\r\n")).decode("latin-1").strip()
+    try:
+        metodo, destinazione, _ = riga.split(" ", 2)
+    except ValueError:
+        raise ErroreHTTP(400, "Richiesta malformata")
+    intestazioni = {}
+    while True:
+        linea = (await reader.readuntil(b"\r\n")).decode("latin-1")
+        if linea in ("\r\n", ""):
+            break
+        nome, _, valore = linea.partition(":")
+        intestazioni[nome.strip().lower()] = valore.strip()
+    try:
+        lunghezza = int(intestazioni.get("content-length", 0) or 0)
+    except ValueError:
+        raise ErroreHTTP(400, f"Content-Length non valido: {intestazioni['content-length']!r}")
+    if lunghezza < 0:
+        raise ErroreHTTP(400, f"Content-Length non valido: {lunghezza}")
+    if lunghezza > MAX_CORPO:
+        raise ErroreHTTP(413, "Corpo della richiesta troppo grande")
+    corpo = await reader.readexactly(lunghezza) if lunghezza else b""
+    url = urlsplit(destinazione)
+    return metodo.upper(), url.path, parse_qs(url.query), intestazioni, corpo
+
+
+async def _scrivi_json(writer, codice, dati):
+    corpo = json.dumps(dati).encode()
+    motivi = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found",
+              405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error"}
+    writer.write(
+        f"HTTP/1.1 {codice} {motivi.get(codice, '')}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(corpo)}\r\nConnection: close\r\n\r\n".encode() + corpo
+    )
+    try:
+        await writer.drain()
+    except ConnectionError:
+        pass
+
+
+def _scrivi_frame(writer, opcode, payload):
+    """Frame WebSocket server -> client (FIN=1, non mascherato)."""
+    lunghezza = len(payload)
+    if lunghezza < 126:
+        intestazione = struct.pack("!BB", 0x80 | opcode, lunghezza)
+    elif lunghezza < 1 << 16:
+        intestazione = struct.pack("!BBH", 0x80 | opcode, 126, lunghezza)
+    else:
+        intestazione = struct.pack("!BBQ", 0x80 | opcode, 127, lunghezza)
+    writer.write(intestazione + payload)
+
+
+async def _leggi_frame(reader):
+    """Legge un frame client -> server (mascherato). Restituisce (opcode, payload)."""
+    primo, secondo = await reader.readexactly(2)
+    opcode = primo & 0x0F
+    lunghezza = secondo & 0x7F
+    if lunghezza == 126:
+        (lunghezza,) = struct.unpack("!H", await reader.readexactly(2))
+    elif lunghezza == 127:
+        (lunghezza,) = struct.unpack("!Q", await reader.readexactly(8))
+    if lunghezza > MAX_CORPO:
+        raise ConnectionError("Frame WebSocket troppo grande")
+    maschera = await reader.readexactly(4) if secondo & 0x80 else b"\x00\x00\x00\x00"
+    dati = await reader.readexactly(lunghezza)
+    return opcode, bytes(b ^ maschera[i % 4] for i, b in enumerate(dati))
+
+
+async def _consuma_frame_client(reader, writer):
+    """Risponde ai ping e termina alla chiusura del client (il flusso è solo server -> client)."""
+    try:
+        while True:
+            opcode, payload = await _leggi_frame(reader)
+            if opcode == 0x8:
+                return
+            if opcode == 0x9:
+                _scrivi_frame(writer, 0xA, payload)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return
+
+
+async def _servi(host, porta, processi, cartella_checkpoint):
+    servizio = ServizioSimulazione(processi=processi, cartella_checkpoint=cartella_checkpoint)
+    server = await servizio.avvia_server(host, porta)
+    logger.info("Servizio simulazione in ascolto su http://%s:%s", host, porta)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await servizio.chiudi()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servizio HTTP/WebSocket per simulazioni MacchinaContinua")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8080)
+    parser.add_argument("--processi", type=int, default=None, help="processi worker delle sessioni (default: numero di CPU)")
+    parser.add_argument("--checkpoint", default="checkpoint", help="cartella dei checkpoint")
+    argomenti = parser.parse_args()
+    configura_output("console")
+    try:
+        asyncio.run(_servi(argomenti.host, argomenti.porta, argomenti.processi, argomenti.checkpoint))
+    except KeyboardInterrupt:
+        pass
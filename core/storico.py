@@ -0,0 +1,558 @@
+"""
+Modalità storico: la simulazione segue la macchina reale.
+
+Le misure dello storico di impianto (tipicamente un campione al secondo) arrivano da file CSV/NDJSON
+o da un socket locale (NDJSON) e prendono il posto delle grandezze estratte dal modello:
+    - velocita_tela (m/min) è la velocità con cui si produce; insieme a consistenza (%) e
+      temperatura_cappa (°C) dà le efficienze dei parametri di processo come scarto dal riferimento
+      della ricetta, quindi sigma e qualità delle bobine;
+    - ore_feltro (h) sostituisce l'usura del feltro;
+    - fermo (tipo di evento; vuoto o 0 = in marcia, 1 = fermo generico) sostituisce gli eventi estratti:
+      la macchina resta ferma finché il marcatore è presente e il fermo è registrato con la durata misurata.
+Cambi bobina e cambi ordine restano quelli del modello, a durata nulla (i fermi veri sono nello
+storico); previsione() stima quando finirà l'ordine in corso.
+
+Lettura e applicazione sono a memoria limitata: i lettori producono blocchi colonnari di al più
+`righe_per_blocco` campioni, AllineatoreTick li riduce a un valore per tick (media delle misure,
+campione e mantenimento sui buchi) e MacchinaStorico applica ogni blocco di tick a somme cumulative
+NumPy tra un evento e l'altro, come il replay; i tracker sono a memoria costante (TrackerMultirisoluzione).
+
+Formato (CSV con intestazione, oppure un oggetto JSON per riga con le stesse chiavi). tempo è in
+secondi (anche epoch) o ISO 8601; le colonne assenti o vuote lasciano il valore del modello:
+    tempo,velocita_tela,consistenza,temperatura_cappa,ore_feltro,fermo
+    0,1650.2,0.31,409.5,120.4,
+    1,1650.8,0.31,409.6,120.4,
+    2,0,0.31,409.1,120.4,rottura carta
+
+Avvio: python -m core.storico misure.csv --ordini ordini.json
+       python -m core.storico --socket 127.0.0.1:9500 --scenario scenari/base.toml
+"""
+import argparse
+import csv
+import itertools
+import json
+import logging
+import socket
+import time
+from datetime import datetime
+
+import numpy as np
+
+from core.batch import kpi_macchina
+from core.console import configura_output
+from core.dashboard import STATO_FINE
+from core.evento import ORDINE_EVENTI, Evento
+from core.macchinacontinua import MacchinaContinua
+from core.programmaproduzione import Ordine
+from core.scenario import carica_scenario
+
+logger = logging.getLogger("core.storico")
+
+# Misure lette dallo storico e fattori di conversione nelle unità del modello (m/s, frazione, °C, ore)
+MISURE = ("velocita_tela", "consistenza", "temperatura_cappa", "ore_feltro")
+VELOCITA, CONSISTENZA, TEMPERATURA, ORE_FELTRO = range(len(MISURE))
+FATTORI = np.array([1 / 60, 1 / 100, 1.0, 1.0])
+# Parametri di processo sostituiti dalle misure
+PARAMETRI_MISURATI = (("velocita tela", VELOCITA), ("concentrazione impasto %", CONSISTENZA),
+                      ("temperatura cappa", TEMPERATURA))
+
+FERMO_GENERICO = "fermo macchina"
+RIGHE_PER_BLOCCO = 65536
+TICK_PER_BLOCCO = 4096
+
+
+def tipo_fermo(valore):
+    """Tipo di evento del marcatore di fermo ("" = macchina in marcia)."""
+    testo = str(valore).strip()
+    if testo.lower() in ("", "0", "false", "no", "none", "marcia"):
+        return ""
+    if testo.lower() in ("1", "true", "si", "sì"):
+        return FERMO_GENERICO
+    return testo
+
+
+def _tempi(valori):
+    """Tempi in secondi da numeri o da date ISO 8601."""
+    try:
+        return np.array(valori, dtype=float)
+    except ValueError:
+        return np.array([datetime.fromisoformat(valore).timestamp() for valore in valori])
+
+
+class BloccoMisure:
+    """Campioni consecutivi dello storico: tempo (s), misure (n, len(MISURE), NaN se assenti), marcatori di fermo."""
+    __slots__ = ("tempo", "misure", "fermo")
+
+    def __init__(self, tempo, misure, fermo):
+        self.tempo = tempo
+        self.misure = misure
+        self.fermo = fermo
+
+    def __len__(self):
+        return len(self.tempo)
+
+
+def _blocco_csv(righe, colonne):
+    valori = dict(zip(colonne, itertools.zip_longest(*righe, fillvalue="")))
+    misure = np.full((len(righe), len(MISURE)), np.nan)
+    for j, nome in enumerate(MISURE):
+        if nome in valori:
+            misure[:, j] = np.array([valore or "nan" for valore in valori[nome]], dtype=float)
+    return BloccoMisure(_tempi(valori["tempo"]), misure, valori.get("fermo", ("",) * len(righe)))
+
+
+def _blocco_json(campioni):
+    misure = np.array([[campione.get(nome) for nome in MISURE] for campione in campioni], dtype=float)
+    fermo = ["" if campione.get("fermo") is None else str(campione["fermo"]) for campione in campioni]
+    return BloccoMisure(_tempi([campione["tempo"] for campione in campioni]), misure, fermo)
+
+
+def leggi_csv(percorso, righe_per_blocco=RIGHE_PER_BLOCCO):
+    """BloccoMisure di al più righe_per_blocco campioni da un CSV con intestazione."""
+    with open(percorso, newline="", encoding="utf-8") as f:
+        lettore = csv.reader(f)
+        colonne = [colonna.strip() for colonna in next(lettore)]
+        if "tempo" not in colonne:
+            raise ValueError(f"{percorso}: colonna 'tempo' assente (colonne: {', '.join(colonne)})")
+        while righe := list(itertools.islice(lettore, righe_per_blocco)):
+            yield _blocco_csv(righe, colonne)
+
+
+def leggi_ndjson(percorso, righe_per_blocco=RIGHE_PER_BLOCCO):
+    """BloccoMisure da un file con un oggetto JSON per riga."""
+    with open(percorso, encoding="utf-8") as f:
+        righe = (riga for riga in f if riga.strip())
+        while campioni := [json.loads(riga) for riga in itertools.islice(righe, righe_per_blocco)]:
+            yield _blocco_json(campioni)
+
+
+def leggi_socket(host, porta, righe_per_blocco=RIGHE_PER_BLOCCO, attesa=1.0):
+    """
+    BloccoMisure da una connessione TCP che invia un oggetto JSON per riga. Un blocco parte quando è
+    pieno o dopo `attesa` secondi senza dati, così la simulazione segue la macchina in tempo reale;
+    termina alla chiusura della connessione.
+    """
+    with socket.create_connection((host, porta)) as connessione:
+        connessione.settimeout(attesa)
+        resto, campioni = b"", []
+        while True:
+            try:
+                dati = connessione.recv(1 << 16)
+            except TimeoutError:
+                dati = None
+            if dati:
+                righe = (resto + dati).split(b"\n")
+                resto = righe.pop()
+                campioni.extend(json.loads(riga) for riga in righe if riga.strip())
+            while len(campioni) >= righe_per_blocco:
+                yield _blocco_json(campioni[:righe_per_blocco])
+                del campioni[:righe_per_blocco]
+            if dati is None or dati == b"":
+                if dati == b"" and resto.strip():
+                    campioni.append(json.loads(resto))
+                if campioni:
+                    yield _blocco_json(campioni)
+                    campioni = []
+                if dati == b"":
+                    return
+
+
+def leggi_file(percorso, righe_per_blocco=RIGHE_PER_BLOCCO):
+    """leggi_ndjson per .ndjson/.jsonl/.json, altrimenti leggi_csv."""
+    if percorso.endswith((".ndjson", ".jsonl", ".json")):
+        return leggi_ndjson(percorso, righe_per_blocco)
+    return leggi_csv(percorso, righe_per_blocco)
+
+
+class BloccoTick:
+    """
+    Un valore per tick a partire dal tick `primo`: misure nelle unità del modello (NaN finché una
+    grandezza non è mai stata misurata) e codice del fermo, indice in `tipi` (0 = in marcia).
+    """
+    __slots__ = ("primo", "misure", "fermo", "tipi")
+
+    def __init__(self, primo, misure, fermo, tipi):
+        self.primo = primo
+        self.misure = misure
+        self.fermo = fermo
+        self.tipi = tipi
+
+    def __len__(self):
+        return len(self.fermo)
+
+
+class AllineatoreTick:
+    """
+    Riduce i campioni dello storico ai tick della simulazione. Il tick k copre [inizio + k*tick,
+    inizio + (k+1)*tick): le misure sono la media dei campioni presenti, il fermo è quello di un
+    campione qualsiasi del tick (basta un campione fermo). Un tick senza campioni ripete il precedente.
+    Conserva solo i campioni del tick non ancora completo; quelli fuori ordine sono scartati.
+    """
+    def __init__(self, tick_reale, inizio=None, tick_per_blocco=TICK_PER_BLOCCO):
+        self.tick = tick_reale
+        self.inizio = inizio
+        self.tick_per_blocco = tick_per_blocco
+        self.tipi = [""]                    # codice -> tipo di fermo
+        self._codici = {"": 0}
+        self.prossimo = 0                   # primo tick non ancora emesso
+        self.campioni = 0
+        self.scartati = 0
+        self._massimo = 0
+        self._coda = None                   # (tick, misure, codici) dei campioni dell'ultimo tick
+        self._ultime = np.full(len(MISURE), np.nan)
+        self._ultimo_fermo = 0
+
+    def _codifica(self, fermo):
+        unici, inversi = np.unique(np.asarray(fermo, dtype=str), return_inverse=True)
+        codici = []
+        for valore in unici:
+            tipo = tipo_fermo(valore)
+            if tipo not in self._codici:
+                self._codici[tipo] = len(self.tipi)
+                self.tipi.append(tipo)
+            codici.append(self._codici[tipo])
+        return np.array(codici, dtype=np.int64)[inversi.ravel()]
+
+    def aggiungi(self, blocco):
+        """BloccoTick dei tick completati dai campioni del blocco."""
+        if not len(blocco):
+            return
+        if self.inizio is None:
+            self.inizio = float(blocco.tempo[0])
+        self.campioni += len(blocco)
+        k = np.floor((blocco.tempo - self.inizio) / self.tick).astype(np.int64)
+        precedente = np.maximum.accumulate(np.concatenate(([self._massimo], k)))[:-1]
+        validi = (k >= precedente) & (k >= self.prossimo)
+        self.scartati += int(len(k) - validi.sum())
+        k, misure, codici = k[validi], blocco.misure[validi], self._codifica(blocco.fermo)[validi]
+        if self._coda is not None:
+            k = np.concatenate((self._coda[0], k))
+            misure = np.concatenate((self._coda[1], misure))
+            codici = np.concatenate((self._coda[2], codici))
+        if not len(k):
+            return
+        self._massimo = int(k[-1])
+        completi = k < self._massimo
+        self._coda = (k[~completi], misure[~completi], codici[~completi])
+        yield from self._emetti(k[completi], misure[completi], codici[completi], self._massimo)
+
+    def chiudi(self):
+        """Emette l'ultimo tick (anche se incompleto) a fine storico."""
+        if self._coda is not None and len(self._coda[0]):
+            coda, self._coda = self._coda, None
+            yield from self._emetti(*coda, self._massimo + 1)
+
+    def _emetti(self, k, misure, codici, fine):
+        inizi = np.concatenate(([0], np.flatnonzero(np.diff(k)) + 1)) if len(k) else np.zeros(0, dtype=np.int64)
+        if len(k):
+            presenti = ~np.isnan(misure)
+            somme = np.add.reduceat(np.where(presenti, misure, 0.0), inizi, axis=0)
+            conteggi = np.add.reduceat(presenti, inizi, axis=0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                medie = somme / conteggi
+            fermi = np.maximum.reduceat(codici, inizi)
+        tick_gruppi = k[inizi]
+        colonne = np.arange(len(MISURE))
+        for primo in range(self.prossimo, fine, self.tick_per_blocco):
+            ultimo = min(primo + self.tick_per_blocco, fine)
+            scelti = slice(np.searchsorted(tick_gruppi, primo), np.searchsorted(tick_gruppi, ultimo))
+            posizioni = tick_gruppi[scelti] - primo + 1
+            righe = np.full((ultimo - primo + 1, len(MISURE)), np.nan)
+            fermo = np.full(ultimo - primo + 1, -1, dtype=np.int64)
+            righe[0], fermo[0] = self._ultime, self._ultimo_fermo
+            if len(posizioni):
+                righe[posizioni] = medie[scelti]
+                fermo[posizioni] = fermi[scelti]
+            # campione e mantenimento: ogni tick senza valore prende l'ultimo presente
+            indici = np.where(np.isnan(righe), 0, np.arange(len(righe))[:, None])
+            np.maximum.accumulate(indici, axis=0, out=indici)
+            righe = righe[indici, colonne]
+            indici = np.where(fermo < 0, 0, np.arange(len(fermo)))
+            np.maximum.accumulate(indici, out=indici)
+            fermo = fermo[indici]
+            self._ultime, self._ultimo_fermo = righe[-1], fermo[-1]
+            self.prossimo = ultimo
+            yield BloccoTick(primo, righe[1:] * FATTORI, fermo[1:], self.tipi)
+
+
+class EventoStorico(Evento):
+    """
+    Evento senza estrazioni casuali: i fermi arrivano dallo storico (MacchinaStorico), cambi bobina e
+    cambi ordine del modello sono registrati a durata nulla e il feltro si cambia solo quando lo dicono
+    le ore misurate.
+    """
+    def eventi_temporali(self):
+        pass
+
+    def gestione_passivi(self):
+        pass
+
+    def gestione_attivi(self):
+        tempo_simulato_corrente = self.macchina.simclock.get_time()
+        for tipo in ORDINE_EVENTI:
+            if tipo in self.eventi_attivi and tipo != "cambio feltro":
+                self.log_eventi.append({
+                    "evento": tipo,
+                    "durata": 0,
+                    "tempo_simulato": tempo_simulato_corrente,
+                    "ordine_corrente": self.macchina.programma.ordine_corrente.prodotto,
+                    "indice_ordine": self.macchina.indice,
+                    "indice_bobina": self.macchina.bobine_tot_prodotte[self.macchina.indice]
+                })
+        self.eventi_attivi.clear()
+
+
+class MacchinaStorico(MacchinaContinua):
+    """
+    MacchinaContinua guidata dalle misure dello storico (BloccoTick di AllineatoreTick).
+    seme fissa le estrazioni residue del modello: grammatura delle bobine e parametri non misurati.
+    Senza deriva dei parametri di processo (core.deriva): le variazioni nel tempo sono quelle misurate.
+    """
+    def __init__(self, ordini, tick_visivo=5, larghezza_macchina=2.75, scenario=None, politica_feltro=None, seme=0):
+        np.random.seed(seme)
+        super().__init__(ordini, tick_visivo, larghezza_macchina=larghezza_macchina, grafici=False, scenario=scenario,
+                         politica_feltro=politica_feltro, tracker_multirisoluzione=True, deriva=False)
+        self.evento = EventoStorico(self.tick_reale, self, self.evento.parametri)
+        self.eventi_attivi = self.evento.eventi_attivi
+        self.misura = np.full(len(MISURE), np.nan)     # misure del tick corrente
+        self.fermo_in_corso = None                     # (tipo, inizio, voce di log senza durata)
+
+    def setup_bobina(self):
+        """Come MacchinaContinua.setup_bobina, con le efficienze misurate (anche al cambio ordine)."""
+        self.applica_misura()
+        super().setup_bobina()
+
+    def applica_misura(self):
+        """Sostituisce valore ed efficienza dei parametri di processo misurati con le misure correnti."""
+        parametri = self.programma.parametri_processo
+        for chiave, colonna in PARAMETRI_MISURATI:
+            valore = self.misura[colonna]
+            if np.isnan(valore):
+                continue
+            parametro = parametri[chiave]
+            riferimento = parametro.setdefault("riferimento", parametro["valore"])
+            parametro["valore"] = float(valore)
+            if colonna == VELOCITA:
+                parametro["efficienza"] = min(1.0, valore / riferimento)
+            else:
+                parametro["efficienza"] = max(0.0, 1 - abs(valore - riferimento) / riferimento)
+
+    def imposta_ore_feltro(self, ore):
+        if not np.isnan(ore):
+            feltro = self.feltro
+            feltro.ore_uso = max(0.0, float(ore))
+            feltro.usura = min(feltro.ore_uso / feltro.ore_vita, 1.0)
+            feltro.stato = feltro.calcola_stato()
+
+    def applica(self, blocco):
+        """Applica un BloccoTick; restituisce i tick consumati (meno del blocco se gli ordini finiscono)."""
+        misure, fermo = blocco.misure, blocco.fermo
+        cambi = np.append(np.flatnonzero(np.diff(fermo)) + 1, len(fermo))
+        i = 0
+        while i < len(fermo) and self.stato != STATO_FINE:
+            if self.simclock.tempo_simulato >= self.oee.confine:
+                self.oee.aggiorna(self)
+            fine = min(int(cambi[np.searchsorted(cambi, i, side="right")]),
+                       i + self.oee.tick_al_confine(self.simclock.tempo_simulato))
+            self.misura = misure[i]
+            if fermo[i]:
+                self._ferma(blocco.tipi[fermo[i]], misure[i:fine])
+                i = fine
+                continue
+            self.chiudi_fermo()
+            liberi = self._tick_liberi(misure[i:fine, VELOCITA])
+            if liberi:
+                self._produci_blocco(misure[i:i + liberi])
+                i += liberi
+            else:
+                self.applica_misura()
+                self.esegui_tick()
+                self.imposta_ore_feltro(self.misura[ORE_FELTRO])
+                i += 1
+        return i
+
+    def _ferma(self, tipo, misure):
+        """Tick di fermo dello storico: apre il fermo (o lo cambia di tipo) e fa avanzare il tempo perso."""
+        tempo = self.simclock.tempo_simulato
+        if self.fermo_in_corso is None or self.fermo_in_corso[0] != tipo:
+            self.chiudi_fermo()
+            self.fermo_in_corso = (tipo, tempo, {
+                "evento": tipo,
+                "tempo_simulato": tempo,
+                "ordine_corrente": self.programma.ordine_corrente.prodotto,
+                "indice_ordine": self.indice,
+                "indice_bobina": self.bobine_tot_prodotte[self.indice]
+            })
+            self.eventi_attivi[:] = [tipo]
+            self.oee.fermo(tempo)
+        n_tick = len(misure)
+        self.stato = "non in Produzione: cambio, manutenzione o guasto"
+        self.simclock.tempo_simulato += n_tick * self.tick_reale
+        self.tempo_perso += n_tick * self.tick_reale
+        progresso = min(100.0, 100*self.programma.peso_parziale/self.programma.ordine_corrente.peso_target)
+        self.tracker_ordine.aggiorna_blocco([progresso] * n_tick)
+        self.tracker_simulazione.aggiorna_blocco([self.programma.peso_accumulato/1000] * n_tick)
+        self.imposta_ore_feltro(misure[-1, ORE_FELTRO])
+
+    def chiudi_fermo(self):
+        """Registra il fermo dello storico in corso con la durata misurata (alla ripartenza o a fine storico)."""
+        if self.fermo_in_corso is not None:
+            _, inizio, voce = self.fermo_in_corso
+            self.fermo_in_corso = None
+            self.evento.log_eventi.append({**voce, "durata": self.simclock.tempo_simulato - inizio})
+            self.eventi_attivi.clear()
+
+    def _tick_liberi(self, velocita):
+        """Tick di sola produzione prima del tick che completa la bobina (quello passa da esegui_tick)."""
+        if self.bobina.completata:
+            return 0
+        velocita = np.where(np.isnan(velocita), self.programma.parametri_processo['velocita tela']['valore'], velocita)
+        lunghezze = np.add.accumulate(np.concatenate(([self.bobina.lunghezza], velocita * 0.85 * self.tick_reale)))[1:]
+        completa = np.flatnonzero(lunghezze >= self.bobina.lunghezza_max)
+        return int(completa[0]) if len(completa) else len(velocita)
+
+    def _produci_blocco(self, misure):
+        """Tick di produzione a velocità misurata, con le stesse operazioni di Bobina.aggiorna_peso."""
+        self.misura = misure[-1]
+        programma, bobina, feltro = self.programma, self.bobina, self.feltro
+        velocita = misure[:, VELOCITA]
+        velocita = np.where(np.isnan(velocita), programma.parametri_processo['velocita tela']['valore'], velocita)
+        delta_lunghezza = velocita * 0.85 * self.tick_reale
+        delta_peso = delta_lunghezza * bobina.grammatura * self.larghezza_macchina / 1000
+
+        def cumula(iniziale, delta):
+            return np.add.accumulate(np.concatenate(([iniziale], delta)))[1:]
+
+        n_tick = len(misure)
+        bobina.lunghezza = float(cumula(bobina.lunghezza, delta_lunghezza)[-1])
+        bobina.peso_bobina = float(cumula(bobina.peso_bobina, delta_peso)[-1])
+        bobina.delta_peso_bobina = 0
+        accumulato = cumula(programma.peso_accumulato, delta_peso)
+        parziale = cumula(programma.peso_parziale, delta_peso)
+        programma.peso_accumulato = float(accumulato[-1])
+        programma.peso_parziale = float(parziale[-1])
+        if np.isnan(misure[-1, ORE_FELTRO]):
+            feltro.ore_uso = float(cumula(feltro.ore_uso, np.full(n_tick, feltro.tick_reale / 3600))[-1])
+            feltro.usura = min(feltro.ore_uso / feltro.ore_vita, 1.0)
+            feltro.stato = feltro.calcola_stato()
+        else:
+            self.imposta_ore_feltro(misure[-1, ORE_FELTRO])
+        self.applica_misura()
+        self.simclock.tempo_simulato += n_tick * self.tick_reale
+        self.stato = "Produzione"
+        self.tracker_ordine.aggiorna_blocco(np.minimum(100.0, 100*parziale/programma.ordine_corrente.peso_target))
+        self.tracker_simulazione.aggiorna_blocco(accumulato/1000)
+
+    def previsione(self):
+        """
+        Stima del completamento dell'ordine in corso: peso residuo diviso per la portata media delle
+        ultime ore (fermi compresi) e per la portata di marcia alla velocità misurata.
+        """
+        self.oee.aggiorna(self)
+        programma, tempo = self.programma, self.simclock.tempo_simulato
+        ordine = programma.ordine_corrente
+        residuo = max(0.0, ordine.peso_target - programma.peso_parziale)
+        recenti = self.oee.ultime_ore()
+        media = recenti["peso_t"] * 1000 / recenti["tempo_s"] if recenti["tempo_s"] else 0.0
+        marcia = (programma.parametri_processo['velocita tela']['valore'] * 0.85 * ordine.grammatura_target
+                  * self.larghezza_macchina / 1000)
+        peso_bobina = getattr(ordine, "lunghezza_max", 50000) * ordine.grammatura_target * self.larghezza_macchina / 1000
+        residuo_s = residuo / media if media > 0 else None
+        return {
+            "tempo_simulato": tempo,
+            "ordine": self.indice,
+            "prodotto": ordine.prodotto,
+            "peso_residuo_t": residuo / 1000,
+            "bobine_residue": int(-(-residuo // peso_bobina)),
+            "portata_media_kg_s": media,
+            "tempo_residuo_s": residuo_s,
+            "fine_prevista_s": tempo + residuo_s if residuo_s is not None else None,
+            "tempo_residuo_marcia_s": residuo / marcia if marcia > 0 else None,
+            "fermo_in_corso": self.fermo_in_corso[0] if self.fermo_in_corso else None,
+        }
+
+
+def segui(macchina, sorgente, allineatore=None, al_blocco=None):
+    """
+    Applica alla macchina i BloccoMisure di `sorgente` (lettore di file o socket) finché lo storico o
+    gli ordini finiscono; al_blocco(macchina) è chiamata dopo ogni blocco di tick. Restituisce l'allineatore.
+    """
+    if allineatore is None:
+        allineatore = AllineatoreTick(macchina.tick_reale)
+
+    def blocchi_tick():
+        for blocco in sorgente:
+            yield from allineatore.aggiungi(blocco)
+        yield from allineatore.chiudi()
+
+    for blocco in blocchi_tick():
+        macchina.applica(blocco)
+        if al_blocco is not None:
+            al_blocco(macchina)
+        if macchina.stato == STATO_FINE:
+            break
+    macchina.chiudi_fermo()
+    return allineatore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulazione guidata dallo storico della macchina reale")
+    parser.add_argument("storico", nargs="?", help="file CSV o NDJSON delle misure")
+    parser.add_argument("--socket", default=None, help="host:porta di uno stream NDJSON al posto del file")
+    parser.add_argument("--ordini", default=None, help="file JSON con la lista degli ordini")
+    parser.add_argument("--scenario", default=None, help="scenario (ricette, parametri, ordini se --ordini manca)")
+    parser.add_argument("--seme", type=int, default=0)
+    parser.add_argument("--previsione-ogni", type=float, default=3600,
+                        help="secondi simulati tra due previsioni nel log")
+    parser.add_argument("--output", default=None, help="file JSON con KPI, OEE e previsione finale")
+    argomenti = parser.parse_args()
+    if not argomenti.storico and not argomenti.socket:
+        parser.error("indicare un file di storico o --socket host:porta")
+    configura_output("console")
+    scenario = carica_scenario(argomenti.scenario) if argomenti.scenario else None
+    if argomenti.ordini:
+        with open(argomenti.ordini, encoding="utf-8") as f:
+            ordini = [Ordine.from_dict(dati) for dati in json.load(f)]
+    elif scenario is not None:
+        np.random.seed(argomenti.seme)
+        ordini = scenario.genera_ordini()
+    else:
+        parser.error("indicare --ordini o --scenario")
+    macchina = MacchinaStorico(ordini, scenario=scenario, seme=argomenti.seme)
+    macchina.setup_bobina()
+    if argomenti.socket:
+        host, _, porta = argomenti.socket.rpartition(":")
+        sorgente = leggi_socket(host or "127.0.0.1", int(porta))
+    else:
+        sorgente = leggi_file(argomenti.storico)
+
+    prossima = [argomenti.previsione_ogni]
+
+    def registra_previsione(macchina):
+        if macchina.simclock.tempo_simulato >= prossima[0]:
+            prossima[0] = macchina.simclock.tempo_simulato + argomenti.previsione_ogni
+            logger.info("Previsione: %s", json.dumps(macchina.previsione()))
+
+    inizio = time.perf_counter()
+    allineatore = segui(macchina, sorgente, al_blocco=registra_previsione)
+    durata = time.perf_counter() - inizio
+    previsione = macchina.previsione()
+    if previsione["fine_prevista_s"] is not None and allineatore.inizio is not None:
+        previsione["fine_prevista_storico"] = allineatore.inizio + previsione["fine_prevista_s"]
+    risultato = {
+        "kpi": kpi_macchina(macchina),
+        "oee": macchina.oee.campagna(),
+        "previsione": previsione,
+        "campioni": allineatore.campioni,
+        "campioni_scartati": allineatore.scartati,
+        "secondi": round(durata, 3),
+        "volte_tempo_reale": round(macchina.simclock.tempo_simulato / durata, 1) if durata else None,
+    }
+    logger.info("%s", json.dumps(risultato, indent=2))
+    if argomenti.output:
+        with open(argomenti.output, "w", encoding="utf-8") as f:
+            json.dump(risultato, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
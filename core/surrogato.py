@@ -0,0 +1,296 @@
+"""
+Modello surrogato per previsioni what-if istantanee.
+
+Domande come "con il feltro all'85% di usura e un ordine di Asciugatutto da 28 g/m2, quante
+tonnellate, quanto fermo e che qualità?" richiederebbero un batch di simulazioni complete.
+Il surrogato è una regressione polinomiale di secondo grado (ridge, solo NumPy) addestrata su
+un campionamento di run di MacchinaContinua:
+
+    ingressi: mix ordini (peso e grammatura per prodotto, numero ordini), usura iniziale del feltro,
+              efficienza dei parametri di processo (imposta uguale per tutti i parametri)
+    uscite:   tonnellate prodotte, tempo perso (s), indice di qualità medio delle bobine
+
+predict() costa qualche decina di microsecondi. Fuori dal dominio di addestramento (prodotto mai
+visto, grammatura/peso/usura/efficienza fuori dagli intervalli campionati) la previsione ricade
+automaticamente sulla media di alcune simulazioni complete.
+
+Avvio:
+    python -m core.surrogato addestra --campioni 300 --uscita surrogato.json
+    python -m core.surrogato prevedi surrogato.json --ordine Asciugatutto 28 30000 --usura 0.85
+"""
+import argparse
+import itertools
+import json
+import logging
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from core.console import configura_output, silenzia_output
+from core.kernel import avanza
+from core.macchinacontinua import MacchinaContinua
+from core.programmaproduzione import PRODOTTI, Ordine
+from core.scenario import ORDINI_CASUALI_DEFAULT
+
+logger = logging.getLogger("core.surrogato")
+
+USCITE = ("peso_totale_t", "tempo_perso", "indice_qualita_medio")
+INTERVALLO_USURA = (0.0, 0.95)
+INTERVALLO_EFFICIENZA = (0.75, 1.0)
+
+
+class MacchinaWhatIf(MacchinaContinua):
+    """MacchinaContinua con usura iniziale del feltro ed efficienza di processo imposte."""
+    def __init__(self, lista_ordini, usura_feltro, efficienza, scenario=None):
+        super().__init__(lista_ordini, tick_visivo=5, grafici=False, scenario=scenario)
+        self.efficienza_imposta = efficienza
+        self.imposta_usura_feltro(usura_feltro)
+        self.imponi_efficienza()
+
+    def imponi_efficienza(self):
+        for chiave, info in self.programma.parametri_processo.items():
+            for parametro in (info if chiave == "additivi chimici" else [info]):
+                parametro["efficienza"] = self.efficienza_imposta
+
+    def setup_ordine(self):
+        self.programma.imposta_parametri_per_ordine()
+        self.imponi_efficienza()
+        self.setup_bobina()
+
+
+def simula_whatif(ordini, usura_feltro, efficienza, seme, scenario=None):
+    """Un run completo con ingressi imposti; restituisce le uscite del surrogato."""
+    np.random.seed(seme)
+    macchina = MacchinaWhatIf([Ordine.from_dict(o.to_dict()) for o in ordini], usura_feltro, efficienza, scenario)
+    macchina.setup_bobina()
+    avanza(macchina, math.inf)
+    qualita = [bobina["indice_qualita"] for bobina in macchina.log_bobine]
+    return {
+        "peso_totale_t": macchina.programma.peso_accumulato / 1000,
+        "tempo_perso": macchina.tempo_perso,
+        "indice_qualita_medio": float(np.mean(qualita)) if qualita else 0.0,
+    }
+
+
+def caratteristiche(ordini, usura_feltro, efficienza):
+    """Vettore degli ingressi: per prodotto peso (t) e grammatura media pesata, n. ordini, usura, efficienza."""
+    valori = []
+    for prodotto in PRODOTTI:
+        pesi = [o.peso_target for o in ordini if prodotto in o.prodotto]
+        grammature = [o.grammatura_target for o in ordini if prodotto in o.prodotto]
+        peso = sum(pesi)
+        valori += [peso / 1000, float(np.dot(pesi, grammature) / peso) if peso else 0.0]
+    return np.array(valori + [len(ordini), usura_feltro, efficienza], dtype=float)
+
+
+def campiona_ingressi(rng):
+    """Ingressi casuali nel dominio di addestramento (stessi intervalli di ORDINI_CASUALI_DEFAULT)."""
+    voci = ORDINI_CASUALI_DEFAULT["prodotti"]
+    scelti = rng.choice(len(voci), size=rng.integers(1, len(voci) + 1), replace=False)
+    ordini = [
+        Ordine(voci[i]["prodotto"], round(float(rng.uniform(*voci[i]["grammatura"])), 1),
+               int(rng.integers(voci[i]["peso"][0], voci[i]["peso"][1] + 1)))
+        for i in scelti
+    ]
+    return ordini, float(rng.uniform(*INTERVALLO_USURA)), float(rng.uniform(*INTERVALLO_EFFICIENZA))
+
+
+def _campione(argomenti):
+    seme, scenario = argomenti
+    ordini, usura, efficienza = campiona_ingressi(np.random.default_rng(seme))
+    return {
+        "ordini": [o.to_dict() for o in ordini], "usura_feltro": usura, "efficienza": efficienza,
+        "uscite": simula_whatif(ordini, usura, efficienza, seme, scenario),
+    }
+
+
+def genera_campioni(n_campioni, seme=0, processi=None, scenario=None):
+    """Sweep di n_campioni run con ingressi casuali; processi=1 esegue nel processo corrente."""
+    compiti = [(seme + i, scenario) for i in range(n_campioni)]
+    if processi == 1:
+        with silenzia_output():
+            return [_campione(compito) for compito in compiti]
+    contesto = multiprocessing.get_context(
+        "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    )
+    with ProcessPoolExecutor(max_workers=processi, mp_context=contesto,
+                             initializer=configura_output, initargs=("silenziosa",)) as pool:
+        return list(pool.map(_campione, compiti, chunksize=4))
+
+
+def _matrice(campioni):
+    X = np.array([
+        caratteristiche([Ordine.from_dict(o) for o in c["ordini"]], c["usura_feltro"], c["efficienza"])
+        for c in campioni
+    ])
+    Y = np.array([[c["uscite"][chiave] for chiave in USCITE] for c in campioni], dtype=float)
+    return X, Y
+
+
+class ModelloSurrogato:
+    """Regressione polinomiale di secondo grado con regolarizzazione ridge sugli ingressi standardizzati."""
+    def __init__(self, media, scala, coefficienti, dominio, alfa=1e-3):
+        self.media = np.asarray(media, dtype=float)
+        self.scala = np.asarray(scala, dtype=float)
+        self.coefficienti = np.asarray(coefficienti, dtype=float)
+        self.dominio = dominio
+        self.alfa = alfa
+        n = len(self.media)
+        coppie = list(itertools.combinations_with_replacement(range(n), 2))
+        self._i = np.array([i for i, _ in coppie])
+        self._j = np.array([j for _, j in coppie])
+
+    @staticmethod
+    def _termini(z, i, j):
+        """[1, z, z_i*z_j] per ogni riga di z (2D)."""
+        return np.hstack([np.ones((z.shape[0], 1)), z, z[:, i] * z[:, j]])
+
+    @classmethod
+    def addestra(cls, campioni, alfa=1e-3):
+        X, Y = _matrice(campioni)
+        media = X.mean(axis=0)
+        scala = X.std(axis=0)
+        scala[scala == 0] = 1.0
+        coppie = list(itertools.combinations_with_replacement(range(X.shape[1]), 2))
+        i = np.array([a for a, _ in coppie])
+        j = np.array([b for _, b in coppie])
+        A = cls._termini((X - media) / scala, i, j)
+        regolarizzazione = alfa * len(X) * np.eye(A.shape[1])
+        regolarizzazione[0, 0] = 0.0          # intercetta non penalizzata
+        coefficienti = np.linalg.solve(A.T @ A + regolarizzazione, A.T @ Y)
+        dominio = cls._dominio(campioni)
+        dominio["caratteristiche"] = [X.min(axis=0).tolist(), X.max(axis=0).tolist()]
+        return cls(media, scala, coefficienti, dominio, alfa)
+
+    @staticmethod
+    def _dominio(campioni):
+        prodotti = {}
+        for c in campioni:
+            for o in c["ordini"]:
+                voce = prodotti.setdefault(o["prodotto"], {"grammatura": [np.inf, -np.inf], "peso": [np.inf, -np.inf]})
+                for chiave, valore in (("grammatura", o["grammatura_target"]), ("peso", o["peso_target"])):
+                    voce[chiave] = [min(voce[chiave][0], valore), max(voce[chiave][1], valore)]
+        n_ordini = [len(c["ordini"]) for c in campioni]
+        return {
+            "prodotti": prodotti,
+            "n_ordini": [min(n_ordini), max(n_ordini)],
+            "usura_feltro": [min(c["usura_feltro"] for c in campioni), max(c["usura_feltro"] for c in campioni)],
+            "efficienza": [min(c["efficienza"] for c in campioni), max(c["efficienza"] for c in campioni)],
+        }
+
+    def nel_dominio(self, ordini, usura_feltro, efficienza):
+        """
+        True se tutti gli ingressi cadono negli intervalli visti in addestramento: ogni ordine, e il
+        vettore delle caratteristiche (peso e grammatura per prodotto sommati sugli ordini) entro
+        minimo e massimo di addestramento di ciascuna componente.
+        """
+        d = self.dominio
+        if not d["n_ordini"][0] <= len(ordini) <= d["n_ordini"][1]:
+            return False
+        if not (d["usura_feltro"][0] <= usura_feltro <= d["usura_feltro"][1]
+                and d["efficienza"][0] <= efficienza <= d["efficienza"][1]):
+            return False
+        for ordine in ordini:
+            voce = d["prodotti"].get(ordine.prodotto)
+            if (voce is None or not voce["grammatura"][0] <= ordine.grammatura_target <= voce["grammatura"][1]
+                    or not voce["peso"][0] <= ordine.peso_target <= voce["peso"][1]):
+                return False
+        if "caratteristiche" in d:          # assente nei modelli salvati prima del controllo
+            x = caratteristiche(ordini, usura_feltro, efficienza)
+            minimo, massimo = (np.asarray(limite) for limite in d["caratteristiche"])
+            if np.any(x < minimo) or np.any(x > massimo):
+                return False
+        return True
+
+    def predici_caratteristiche(self, X):
+        """Previsione vettoriale su una matrice di ingressi (una riga per caso)."""
+        z = (np.atleast_2d(X) - self.media) / self.scala
+        return self._termini(z, self._i, self._j) @ self.coefficienti
+
+    def predict(self, ordini, usura_feltro, efficienza=0.9, fallback=True, n_run_fallback=5, scenario=None):
+        """
+        Prevede tonnellate, tempo perso e qualità per un mix di ordini (lista di Ordine).
+        Fuori dominio, con fallback=True, restituisce la media di n_run_fallback simulazioni.
+        La chiave "fonte" indica "surrogato" o "simulazione".
+        """
+        if self.nel_dominio(ordini, usura_feltro, efficienza):
+            y = self.predici_caratteristiche(caratteristiche(ordini, usura_feltro, efficienza))[0]
+            risultato = dict(zip(USCITE, y.tolist()))
+            risultato["fonte"] = "surrogato"
+            return risultato
+        if not fallback:
+            raise ValueError("Ingressi fuori dal dominio di addestramento del surrogato")
+        run = [simula_whatif(ordini, usura_feltro, efficienza, seme, scenario) for seme in range(n_run_fallback)]
+        risultato = {chiave: float(np.mean([r[chiave] for r in run])) for chiave in USCITE}
+        risultato["fonte"] = "simulazione"
+        return risultato
+
+    def to_dict(self):
+        return {
+            "media": self.media.tolist(), "scala": self.scala.tolist(),
+            "coefficienti": self.coefficienti.tolist(), "dominio": self.dominio, "alfa": self.alfa,
+        }
+
+    @classmethod
+    def from_dict(cls, dati):
+        return cls(dati["media"], dati["scala"], dati["coefficienti"], dati["dominio"], dati["alfa"])
+
+    def salva(self, percorso):
+        with open(percorso, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def carica(cls, percorso):
+        with open(percorso) as f:
+            return cls.from_dict(json.load(f))
+
+
+def rapporto_accuratezza(modello, campioni_test):
+    """Errori del surrogato su run di MacchinaContinua non usati in addestramento (MAE, RMSE, R2, MAPE %)."""
+    X, Y = _matrice(campioni_test)
+    previsti = modello.predici_caratteristiche(X)
+    rapporto = {}
+    for k, chiave in enumerate(USCITE):
+        errore = previsti[:, k] - Y[:, k]
+        varianza = np.sum((Y[:, k] - Y[:, k].mean()) ** 2)
+        rapporto[chiave] = {
+            "mae": float(np.mean(np.abs(errore))),
+            "rmse": float(np.sqrt(np.mean(errore ** 2))),
+            "r2": float(1 - np.sum(errore ** 2) / varianza) if varianza else None,
+            "mape_percentuale": float(np.mean(np.abs(errore) / np.maximum(np.abs(Y[:, k]), 1e-9)) * 100),
+        }
+    rapporto["n_test"] = len(campioni_test)
+    return rapporto
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Surrogato what-if della simulazione cartiera")
+    comandi = parser.add_subparsers(dest="comando", required=True)
+    addestra = comandi.add_parser("addestra", help="campiona run, addestra il surrogato e ne misura l'accuratezza")
+    addestra.add_argument("--campioni", type=int, default=300)
+    addestra.add_argument("--test", type=int, default=60, help="run di verifica non usati in addestramento")
+    addestra.add_argument("--processi", type=int, default=None)
+    addestra.add_argument("--uscita", default="surrogato.json")
+    prevedi = comandi.add_parser("prevedi", help="previsione what-if")
+    prevedi.add_argument("modello")
+    prevedi.add_argument("--ordine", nargs=3, action="append", metavar=("PRODOTTO", "GRAMMATURA", "PESO_KG"), required=True)
+    prevedi.add_argument("--usura", type=float, default=0.5)
+    prevedi.add_argument("--efficienza", type=float, default=0.9)
+    argomenti = parser.parse_args()
+    configura_output("console")
+    if argomenti.comando == "addestra":
+        campioni = genera_campioni(argomenti.campioni + argomenti.test, processi=argomenti.processi)
+        modello = ModelloSurrogato.addestra(campioni[:argomenti.campioni])
+        modello.salva(argomenti.uscita)
+        logger.info("Surrogato salvato in %s", argomenti.uscita)
+        logger.info("%s", json.dumps(rapporto_accuratezza(modello, campioni[argomenti.campioni:]), indent=2))
+    else:
+        modello = ModelloSurrogato.carica(argomenti.modello)
+        ordini = [Ordine(prodotto, float(grammatura), float(peso)) for prodotto, grammatura, peso in argomenti.ordine]
+        logger.info("%s", json.dumps(modello.predict(ordini, argomenti.usura, argomenti.efficienza), indent=2))
+
+
+if __name__ == "__main__":
+    main()
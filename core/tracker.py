@@ -1,5 +1,36 @@
-import matplotlib.pyplot as plt
-from matplotlib.ticker import FuncFormatter, MultipleLocator
+import logging
+import os
+import sys
+import threading
+from bisect import bisect_left
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def carica_pyplot():
+    """
+    Importa matplotlib solo al primo grafico richiesto (lazy import).
+    La simulazione pura non carica mai matplotlib: l'import e l'inizializzazione del backend
+    costano qualche centinaio di millisecondi per processo, pagati inutilmente da ogni worker.
+    In assenza di display (esecuzioni batch/headless) forza il backend non interattivo Agg, e così
+    anche fuori dal thread principale (grafici a fine ordine di SimulazioneInThread): i backend GUI
+    vanno usati solo dal thread principale.
+    """
+    fuori_main = threading.current_thread() is not threading.main_thread()
+    if "matplotlib.pyplot" not in sys.modules:
+        import matplotlib
+        senza_display = sys.platform.startswith("linux") and not (
+            os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY")
+        )
+        if senza_display or fuori_main or os.environ.get("CARTIERA_HEADLESS"):
+            matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    if fuori_main and plt.get_backend().lower() != "agg":
+        plt.switch_backend("Agg")
+    return plt
+
 
 class ProgressTracker:
     """
@@ -27,6 +58,16 @@ class ProgressTracker:
         self.x.append(self.x_val)
         self.y.append(y_val)
 
+    def aggiorna_blocco(self, valori_y):
+        """
+        Aggiunge più tick consecutivi in una volta (avanzamento a blocchi, es. replay).
+        Equivale a chiamare aggiorna_di_un_tick per ciascun valore.
+        """
+        inizio = self.x_val
+        self.x.extend(range(inizio + self.tick, inizio + self.tick * (len(valori_y) + 1), self.tick))
+        self.y.extend(valori_y)
+        self.x_val = inizio + self.tick * len(valori_y)
+
     def reset(self):
         """
         Svuota completamente la raccolta dei dati (da usare a fine ordine/simulazione).
@@ -35,13 +76,17 @@ class ProgressTracker:
         self.x = [0]
         self.y = [0]
 
-    def get_data(self):
+    def get_data(self, orizzonte=None):
         """
         Ritorna le liste degli X e Y raccolti.
 
+        :param orizzonte: (opzionale) solo gli ultimi `orizzonte` secondi simulati
         :return: (x, y) tuple di liste
         """
-        return self.x, self.y
+        if orizzonte is None:
+            return self.x, self.y
+        inizio = bisect_left(self.x, self.x_val - orizzonte)
+        return self.x[inizio:], self.y[inizio:]
 
     def to_csv(self, filename):
         """
@@ -53,28 +98,197 @@ class ProgressTracker:
             writer.writerow(["x", "y"])
             for xi, yi in zip(self.x, self.y):
                 writer.writerow([xi, yi])
-        print(f"Dati tracker salvati in {filename}")
+        logger.info("Dati tracker salvati in %s", filename)
+
+
+# Livelli di TrackerMultirisoluzione: (passo in secondi, capacità) = 1 giorno di minuti,
+# 1 settimana di quarti d'ora, 90 giorni di ore
+LIVELLI_TRACKER = ((60, 24 * 60), (15 * 60, 7 * 24 * 4), (3600, 90 * 24))
+
+
+class _Livello:
+    """
+    Buffer circolare di intervalli di `passo` secondi con minimo, massimo e media dei valori.
+    L'intervallo k copre (k*passo, (k+1)*passo] ed è registrato alla sua fine; alla chiusura passa
+    al livello successivo (più grossolano), che lo aggrega allo stesso modo.
+    """
+    def __init__(self, passo, capacita, successivo=None):
+        self.passo = passo
+        self.capacita = capacita
+        self.successivo = successivo
+        self.x = np.zeros(capacita)
+        self.minimo = np.zeros(capacita)
+        self.massimo = np.zeros(capacita)
+        self.media = np.zeros(capacita)
+        self.testa = 0          # posizione del prossimo intervallo chiuso
+        self.n = 0
+        self.aperto = None      # [k, minimo, massimo, somma, conteggio] dell'intervallo in corso
+
+    def aggiungi_punto(self, x, minimo, massimo, somma, conteggio):
+        self._accumula(int(-(-x // self.passo)) - 1, minimo, massimo, somma, conteggio)
+
+    def aggiungi_blocco(self, x, valori):
+        """Punti consecutivi (array ordinati): un'aggregazione vettoriale per intervallo, poi _accumula."""
+        k = -np.floor_divide(-x, self.passo).astype(np.int64) - 1
+        inizi = np.concatenate(([0], np.flatnonzero(np.diff(k)) + 1))
+        gruppi = zip(k[inizi].tolist(), np.minimum.reduceat(valori, inizi).tolist(),
+                     np.maximum.reduceat(valori, inizi).tolist(), np.add.reduceat(valori, inizi).tolist(),
+                     np.diff(np.append(inizi, len(k))).tolist())
+        for gruppo in gruppi:
+            self._accumula(*gruppo)
+
+    def _accumula(self, k, minimo, massimo, somma, conteggio):
+        aperto = self.aperto
+        if aperto is not None and aperto[0] == k:
+            if minimo < aperto[1]:
+                aperto[1] = minimo
+            if massimo > aperto[2]:
+                aperto[2] = massimo
+            aperto[3] += somma
+            aperto[4] += conteggio
+            return
+        if aperto is not None:
+            self._chiudi(*aperto)
+        self.aperto = [k, minimo, massimo, somma, conteggio]
+
+    def _chiudi(self, k, minimo, massimo, somma, conteggio):
+        i = self.testa
+        fine = (k + 1) * self.passo
+        self.x[i] = fine
+        self.minimo[i] = minimo
+        self.massimo[i] = massimo
+        self.media[i] = somma / conteggio
+        self.testa = (i + 1) % self.capacita
+        self.n = min(self.n + 1, self.capacita)
+        if self.successivo is not None:
+            self.successivo.aggiungi_punto(fine, minimo, massimo, somma, conteggio)
+
+    def serie(self):
+        """(x, minimo, massimo, media) degli intervalli chiusi presenti, dal più vecchio."""
+        posizioni = (self.testa - self.n + np.arange(self.n)) % self.capacita
+        return self.x[posizioni], self.minimo[posizioni], self.massimo[posizioni], self.media[posizioni]
+
 
-def plot_progress(tracker, ylabel="Completamento (%)", savefile=None, show_target=None):
+class TrackerMultirisoluzione:
+    """
+    ProgressTracker a memoria costante per run senza fine prevista (sessioni del servizio).
+
+    Gli ultimi `finestra` secondi restano a piena risoluzione (un punto per tick) in un buffer
+    circolare; ogni punto alimenta anche i livelli aggregati di LIVELLI_TRACKER (min/max/media per
+    minuto, quarto d'ora, ora), ciascuno a sua volta circolare. get_data(orizzonte) compone la serie
+    dal livello più fine che copre ciascun tratto: piena risoluzione per il passato recente, medie
+    via via più grossolane andando indietro. Stessa interfaccia di ProgressTracker; x e y sono la
+    serie completa così composta (non più un punto per tick).
+    """
+    def __init__(self, nome, tick_reale, finestra=6 * 3600, livelli=LIVELLI_TRACKER):
+        self.tick = tick_reale
+        self.nome = nome
+        self.capacita = max(1, int(finestra // tick_reale))
+        self.passi_livelli = tuple(livelli)
+        self.reset()
+
+    def reset(self):
+        """Svuota buffer e livelli (fine ordine/simulazione)."""
+        self.x_val = 0
+        self._x = np.zeros(self.capacita)
+        self._y = np.zeros(self.capacita)
+        self._testa = 0
+        self._n = 0
+        self.livelli = []
+        successivo = None
+        for passo, capacita in reversed(self.passi_livelli):
+            successivo = _Livello(passo, capacita, successivo)
+            self.livelli.insert(0, successivo)
+        self._scrivi(np.zeros(1), np.zeros(1))
+
+    def _scrivi(self, x, y):
+        if self.livelli:
+            self.livelli[0].aggiungi_blocco(x, y)
+        if len(x) > self.capacita:
+            x, y = x[-self.capacita:], y[-self.capacita:]
+        posizioni = (self._testa + np.arange(len(x))) % self.capacita
+        self._x[posizioni] = x
+        self._y[posizioni] = y
+        self._testa = (self._testa + len(x)) % self.capacita
+        self._n = min(self._n + len(x), self.capacita)
+
+    def aggiorna_di_un_tick(self, y_val):
+        self.x_val += self.tick
+        i = self._testa
+        self._x[i] = self.x_val
+        self._y[i] = y_val
+        self._testa = (i + 1) % self.capacita
+        if self._n < self.capacita:
+            self._n += 1
+        if self.livelli:
+            self.livelli[0].aggiungi_punto(self.x_val, y_val, y_val, y_val, 1)
+
+    def aggiorna_blocco(self, valori_y):
+        if not len(valori_y):
+            return
+        inizio = self.x_val
+        self.x_val = inizio + self.tick * len(valori_y)
+        self._scrivi(inizio + self.tick * np.arange(1, len(valori_y) + 1, dtype=float),
+                     np.asarray(valori_y, dtype=float))
+
+    def get_data(self, orizzonte=None, bande=False):
+        """
+        Serie degli ultimi `orizzonte` secondi simulati (tutta quella conservata se None).
+        Con bande=True restituisce (x, y, minimo, massimo): sui punti a piena risoluzione minimo e
+        massimo coincidono con y.
+        """
+        inizio = -np.inf if orizzonte is None else self.x_val - orizzonte
+        posizioni = (self._testa - self._n + np.arange(self._n)) % self.capacita
+        x, y = self._x[posizioni], self._y[posizioni]
+        parti = [(x, y, y, y)]
+        copertura = x[0] if len(x) else np.inf
+        for livello in self.livelli:
+            lx, lmin, lmax, lmedia = livello.serie()
+            scelti = lx < copertura
+            if scelti.any():
+                parti.append((lx[scelti], lmedia[scelti], lmin[scelti], lmax[scelti]))
+                copertura = lx[scelti][0]
+        x, y, minimo, massimo = (np.concatenate(colonna) for colonna in zip(*reversed(parti)))
+        dentro = x >= inizio
+        x, y, minimo, massimo = x[dentro], y[dentro], minimo[dentro], massimo[dentro]
+        return (x, y, minimo, massimo) if bande else (x, y)
+
+    @property
+    def x(self):
+        return self.get_data()[0]
+
+    @property
+    def y(self):
+        return self.get_data()[1]
+
+    to_csv = ProgressTracker.to_csv
+
+
+def plot_progress(tracker, ylabel="Completamento (%)", savefile=None, show_target=None, orizzonte=None):
     """
     Plotta l'avanzamento utilizzando i dati X, Y raccolti nel tracker.
     Ogni segmento viene colorato: blu se in salita, rosso se flat, arancione se in discesa.
     L'asse x mostra il tempo simulato in ore con una cifra decimale.
-    La griglia è fitta e il grafico parte SEMPRE da (0,0) .
+    La griglia è fitta e il grafico parte SEMPRE da (0,0), salvo con un orizzonte.
 
-    :param tracker: Istanza di ProgressTracker
+    :param tracker: Istanza di ProgressTracker (o TrackerMultirisoluzione)
     :param ylabel: Etichetta asse Y (es. "Completamento (%)", "Peso cumulato (kg)")
     :param savefile: Percorso file per salvataggio PNG. Se None, mostra a schermo.
     :param show_target: (opzionale) Valore target (orizzontale), es: peso totale, per confronto visivo.
+    :param orizzonte: (opzionale) solo gli ultimi `orizzonte` secondi simulati; TrackerMultirisoluzione
+                      li fornisce dal livello di risoluzione adatto.
     """
-    x, y = tracker.get_data()
+    plt = carica_pyplot()
+    from matplotlib.ticker import FuncFormatter, MultipleLocator
+
+    x, y = tracker.get_data() if orizzonte is None else tracker.get_data(orizzonte)
 
     # -- PATCH: forza origine vera --
-    if len(x) == 0 or x[0] != 0 or y[0] != 0:
+    if orizzonte is None and (len(x) == 0 or x[0] != 0 or y[0] != 0):
         x = [0] + list(x)
         y = [0] + list(y)
     # E anche se per errore ci sono dati negativi, normalizza:
-    if x[0] != 0:
+    if orizzonte is None and x[0] != 0:
         x = [xi - x[0] for xi in x]
 
     plt.figure(figsize=(20, 6))
@@ -99,7 +313,7 @@ def plot_progress(tracker, ylabel="Completamento (%)", savefile=None, show_targe
     # -- GRIGLIA --
     ax.grid(True, which='major', linestyle='-', alpha=0.18, linewidth=1)
     ax.grid(True, which='minor', linestyle='--', alpha=0.14, linewidth=0.8)
-    ax.xaxis.set_minor_locator(MultipleLocator(0.25))  # 15 minuti
+    ax.xaxis.set_minor_locator(MultipleLocator(max(0.25, (x[-1] - x[0]) / 3600 / 200)))  # 15 minuti (o più su orizzonti lunghi)
     ax.yaxis.set_minor_locator(MultipleLocator(max(1, (max(y)-min(y))/40)))  # dinamico
 
     plt.tight_layout(pad=2)
@@ -118,7 +332,7 @@ def plot_progress(tracker, ylabel="Completamento (%)", savefile=None, show_targe
 
     if savefile:
         plt.savefig(savefile, bbox_inches='tight')
-        print(f"Grafico salvato come {savefile}")
+        logger.info("Grafico salvato come %s", savefile)
         plt.close()
     else:
         plt.show()
@@ -3,11 +3,14 @@ MAIN SIMULAZIONE CARTIERA – Project WOrk (UNIPEGASO)
 Gestione completa di una simulazione multi-ordine su MacchinaContinua,
 con logging strutturato e snapshot periodici.
 """
+import argparse
 import numpy as np
-import time
+from core.console import configura_output, MODALITA
+from core.dashboard import PubblicatoreStato, RendererDashboard, SimulazioneInThread, collega_messaggi_recenti
 from core.macchinacontinua import MacchinaContinua
 from core.programmaproduzione import Ordine
 from core.reportstatistica import ReportStatistica
+from core.scenario import carica_scenario
 
 def input_tick_visivo():
     """
@@ -65,10 +68,31 @@ def formatta_tempo(secondi):
     return f"{ore}h {minuti}m {sec}s"
 
 
+def leggi_argomenti():
+    parser = argparse.ArgumentParser(description="Simulazione produzione cartiera tissue")
+    parser.add_argument("--output", choices=MODALITA, default="dashboard",
+                        help="console: stampa tutto; dashboard: ridisegnata sul posto a frequenza fissa; "
+                             "silenziosa: nessun output dal core")
+    parser.add_argument("--intervallo-dashboard", type=float, default=0.5,
+                        help="secondi reali tra due ridisegni della dashboard")
+    parser.add_argument("--massima-velocita", action="store_true",
+                        help="simula alla massima velocità: il tick visivo regola solo snapshot e log")
+    parser.add_argument("--scenario", default=None,
+                        help="file scenario (.json, .toml, .yaml) con ordini, ricette e parametri eventi")
+    return parser.parse_args()
+
+
 def main():
+    argomenti = leggi_argomenti()
+    configura_output(argomenti.output)
     print("\n==== SIMULAZIONE PRODUZIONE CARTIERA – AVVIO ====")
-    print("\n\nGENERAZIONE ORDINI CASUALI:")
-    lista_ordini = genera_ordini_randomici()
+    scenario = carica_scenario(argomenti.scenario) if argomenti.scenario else None
+    if scenario is not None:
+        print(f"\n\nORDINI DALLO SCENARIO '{scenario.nome}':")
+        lista_ordini = scenario.genera_ordini()
+    else:
+        print("\n\nGENERAZIONE ORDINI CASUALI:")
+        lista_ordini = genera_ordini_randomici()
     for idx, ordine in enumerate(lista_ordini, 1):
         print(f" Ordine {idx+1}: {ordine.prodotto} | Grammatura target: {ordine.grammatura_target} g/m2 | Peso target: {ordine.peso_target/1000:.1f} t")
     print("\n--- Simulazione in corso ---\n")
@@ -81,50 +105,40 @@ def main():
     "ogni secondo reale di esecuzione del programma corrisponde a 120 secondi (2 minuti) di produzione simulata.\n"
     "Il fattore minimo di accelerazione è 5x (ogni secondo reale equivale ad almeno 5 secondi simulati), ma può essere impostato su valori più elevati\n"
     "per accelerare l’analisi di scenari produttivi estesi, mantenendo comunque la risoluzione degli eventi a livello di 5 secondi.\n"
+    "Con --massima-velocita la simulazione non attende: l’intervallo regola solo snapshot e log.\n"
     )
     # 1. Input tick visivo
     tick_visivo = input_tick_visivo()
     tick_reale = 5  #sec, fisso
 
     # 2. Istanzia la macchina continua
-    macchina = MacchinaContinua(lista_ordini, tick_visivo=tick_visivo, tick_reale=tick_reale)
+    macchina = MacchinaContinua(lista_ordini, tick_visivo=tick_visivo, tick_reale=tick_reale, scenario=scenario)
     macchina.setup_bobina()
-    # 3. Logging: snapshot periodici
-    log_snapshots = []
-    log_snapshots_settings_macchina = []
-    n_tick_per_visivo = tick_visivo // tick_reale
-    tempo = 0
-    ReportStatistica.vista_macchina_efficienze(macchina)
-    stato_json = ReportStatistica.json_efficienze_macchina(macchina)
-    log_snapshots_settings_macchina.append(stato_json)
-
-    while True:
-        # Esegui tick per tutta la durata del tick visivo
-        for _ in range(n_tick_per_visivo):
-            macchina.esegui_tick()
-            if macchina.stato == "Tutti gli ordini completati. Termine Simulazione":
-                print()
-                print(f"{macchina.stato}")
-                break
-            if macchina.stato == "Cambio produzione in corso":
-                ReportStatistica.vista_macchina_efficienze(macchina)
-                stato_json = ReportStatistica.json_efficienze_macchina(macchina)
-                log_snapshots_settings_macchina.append(stato_json)
-                break
+    # 3. Simulazione in un thread dedicato: pubblica snapshot ad ogni tick visivo,
+    #    la dashboard li ridisegna a frequenza fissa senza rallentare la simulazione
+    pubblicatore = PubblicatoreStato()
+    ritmo = None if argomenti.massima_velocita else tick_visivo
+    simulazione = SimulazioneInThread(macchina, pubblicatore, tick_visivo, ritmo=ritmo)
+    messaggi = collega_messaggi_recenti() if argomenti.output == "dashboard" else None
+    simulazione.start()
+    try:
+        if argomenti.output != "silenziosa":
+            RendererDashboard(
+                pubblicatore,
+                intervallo=argomenti.intervallo_dashboard,
+                pulisci=argomenti.output == "dashboard",
+                messaggi=messaggi
+            ).esegui(simulazione)
+        simulazione.attendi()
+    except KeyboardInterrupt:
+        simulazione.interrompi.set()
+        simulazione.attendi()
+    print()
+    print(f"{macchina.stato}")
+    log_snapshots = simulazione.log_snapshots
+    log_snapshots_settings_macchina = simulazione.log_snapshots_settings_macchina
+    tempo = round(simulazione.tempo_reale)
 
-        # Snapshot a ogni tick visivo
-        print ("\n-----------------------------------------------------------------\n")
-        print(f"{macchina.stato}" )
-        print(f"tempo di fermo: {formatta_tempo(macchina.evento.tot_timer)} --- tempo simulazione {formatta_tempo(tempo+1)} --- tempo simulato: {formatta_tempo(macchina.simclock.get_time())}")
-        print(f"Tempo totale perso: {formatta_tempo(macchina.tempo_perso)}")
-        if macchina.stato == "Tutti gli ordini completati. Termine Simulazione":
-            break
-        ReportStatistica.vista_rapida(macchina)
-        stato_json = ReportStatistica.json_rapida(macchina)
-        log_snapshots.append(stato_json)
-        # *** Pausa reale di un secondo tra un ciclo e l'altro ***
-        time.sleep(1)
-        tempo += 1
     # Salva il grafico finale di tutta la simulazione PRIMA di uscire!
     ReportStatistica.grafico_simulazione(
         macchina.tracker_simulazione,
@@ -144,14 +158,17 @@ def main():
     with open("log_stats_macchina.json", "w") as f:
         json.dump(log_snapshots_settings_macchina, f, indent=2)
 
+    log_eventi = ReportStatistica.json_eventi(macchina)
+    log_eventi["ordini"] = [ordine.to_dict() for ordine in lista_ordini]  # necessari per il replay (core.replay)
     with open("log_eventi_dettagliati.json", "w") as f:
-        json.dump(ReportStatistica.json_eventi(macchina), f, indent=2)
+        json.dump(log_eventi, f, indent=2)
     tempo_simulato = macchina.simclock.get_time()
     print(f"\n\n==== SIMULAZIONE CONCLUSA ====")
     print(f"\nTempo totale Simulazione: {formatta_tempo(tempo)} ({tempo} secondi)")
     print(f"Tempo totale Simulato: {formatta_tempo(tempo_simulato)} ({tempo_simulato} secondi) di cui {formatta_tempo(macchina.tempo_perso)} ({macchina.tempo_perso} secondi) di non produzione continua") 
     print(f"Percentuale tempo in Produzione: {100-round((macchina.tempo_perso/tempo_simulato)*100, 1)}%")
     print(f"Totale tonnellate Carta prodotta: {macchina.programma.peso_accumulato/1000:.1f} t")
+    print(ReportStatistica.testo_oee(macchina))
     # Stampa numero di bobine prodotte per ordine
     print("\nNumero di bobine prodotte per ordine:")
     for idx, n_bobine in enumerate(macchina.bobine_tot_prodotte):